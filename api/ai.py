@@ -9,14 +9,36 @@ import json
 from typing import Dict, Any, List, Optional
 
 from api.llm_client import generate_json, prepare_multimodal_prompt
+from api.ledger import ledger, count_tokens
 from api.models import select_model_for_input
+from api.fastpath import extract as extract_fast_path, is_item_list, split_items
+from api.json_schema import response_format
+from api.compact import (
+    compact_output_format,
+    expand_properties,
+    expand_chat_response,
+    max_tokens_for,
+    response_format as compact_response_format
+)
+from api.config import FASTPATH_ENABLED, EXTRACT_MAX_ITEMS, COMPACT_OUTPUT_ENABLED
+from api.serializers import serialize_properties, simplify_properties
+from api.tracing import span, traced
+from api.loop_monitor import run_blocking
+from api.logger import get_logger
 
+logger = get_logger(__name__)
 
+
+@traced("ai.construct_prompt", kind="analyze")
 def construct_prompt(
     text: str,
     schema: Dict[str, Any],
     recent_examples: List[Dict[str, Any]],
-    system_prompt: str
+    system_prompt: str,
+    hint: str = "",
+    multiple: bool = False,
+    max_items: int = EXTRACT_MAX_ITEMS,
+    compact: bool = False
 ) -> str:
     """
     タスク抽出・プロパティ推定のための完全なプロンプトを構築します。
@@ -24,8 +46,11 @@ def construct_prompt(
     Args:
         text (str): ユーザーの入力テキスト
         schema (Dict): 対象Notionデータベースのスキーマ情報
-        recent_examples (List): データベースの直近の登録データ（Few-shot学習用）
+        recent_examples (List): 入力に類似した過去の登録データ（Few-shot学習用。api/examples_index 参照）
         system_prompt (str): AIへの役割指示（システムプロンプト）
+        hint (str): ルールで抽出済みの値（api/fastpath.py の FastPathResult.hint、任意）
+        multiple (bool): True の場合、入力に含まれる項目ごとのプロパティを配列で返させます（最大 max_items 件）
+        compact (bool): True の場合、短いキーの形式で返させます（api/compact.py。multiple とは併用しません）
         
     Returns:
         str: LLMに送信するプロンプト文字列全体
@@ -47,27 +72,38 @@ def construct_prompt(
     examples_text = ""
     if recent_examples:
         for ex in recent_examples:
-            props = ex.get("properties", {})
-            simple_props = {}
-            # プロパティの型に応じて値を抽出・簡略化
-            for k, v in props.items():
-                p_type = v.get("type")
-                val = "N/A"
-                if p_type == "title":
-                    val = "".join([t.get("plain_text", "") for t in v.get("title", [])])
-                elif p_type == "rich_text":
-                    val = "".join([t.get("plain_text", "") for t in v.get("rich_text", [])])
-                elif p_type == "select":
-                    val = v.get("select", {}).get("name") if v.get("select") else None
-                elif p_type == "multi_select":
-                    val = [o.get("name") for o in v.get("multi_select", [])]
-                elif p_type == "date":
-                    val = v.get("date", {}).get("start") if v.get("date") else None
-                elif p_type == "checkbox":
-                    val = v.get("checkbox")
-                simple_props[k] = val
+            # ページオブジェクト（{"object": "page", "properties": ...}）と
+            # fetch_recent_pages が返すプロパティ辞書の両方を受け付けます
+            props = ex.get("properties", {}) if ex.get("object") == "page" else ex
+            simple_props = simplify_properties(props)
             examples_text += f"- {json.dumps(simple_props, ensure_ascii=False)}\n"
 
+    # ルールで抽出できた値（解決済みの日付など）はユーザー入力に添える
+    user_input = f"{text}\n\n{hint}" if hint else text
+
+    # 複数件の抽出では、項目ごとのプロパティを配列で返させる
+    # （JSONモードでは最上位がオブジェクトである必要があるため {"items": [...]} の形にする）
+    if compact and not multiple:
+        # 短い形式: スキーマの説明はキーの対応表（output_format）に含める
+        return f"""
+{system_prompt}
+
+Recent Examples:
+{examples_text}
+
+User Input:
+{user_input}
+
+{compact_output_format(schema)}
+"""
+    if multiple:
+        output_format = (
+            f"Extract every separate item (task, action item, entry) in the User Input, at most {max_items}.\n"
+            'Output JSON as {"items": [{...properties of item 1...}, {...}]} strictly. NO markdown code blocks.'
+        )
+    else:
+        output_format = "Output JSON format strictly. NO markdown code blocks."
+
     # プロンプトの組み立て
     # システムプロンプト + スキーマ定義 + データ例 + ユーザー入力 を結合
     prompt = f"""
@@ -80,13 +116,14 @@ Recent Examples:
 {examples_text}
 
 User Input:
-{text}
+{user_input}
 
-Output JSON format strictly. NO markdown code blocks.
+{output_format}
 """
     return prompt
 
 
+@traced("ai.construct_prompt", kind="chat")
 def construct_chat_prompt(
     text: str,
     schema: Dict[str, Any],
@@ -157,13 +194,12 @@ Restraints:
     return prompt
 
 
-def validate_and_fix_json(json_str: str, schema: Dict[str, Any]) -> Dict[str, Any]:
+def _parse_json_response(json_str: str) -> Any:
     """
-    AIのJSON応答を解析・検証・修正する関数
-    
-    LLMは時にMarkdownコードブロックを含んだり、不正なJSONを返したりするため、
-    それらをクリーニングしてPython辞書として安全に取り出します。
-    さらに、スキーマ定義に従って型変換（キャスト）を行い、Notion APIでエラーにならない形式に整えます。
+    LLMの応答をJSONとして解析します（解析できない場合は None）。
+
+    LLMは時にMarkdownコードブロックを含んだり、前後に説明文を付けたりするため、
+    それらを取り除いてから解析します。
     """
     # 1. Markdown記法の除去
     # ```json ... ``` のような装飾を取り除きます。
@@ -177,7 +213,7 @@ def validate_and_fix_json(json_str: str, schema: Dict[str, Any]) -> Dict[str, An
     json_str = json_str.strip()
     
     try:
-        data = json.loads(json_str)
+        return json.loads(json_str)
     except json.JSONDecodeError:
         # JSONパース失敗時の簡易リトライ
         # 余計な接頭辞/接尾辞がある場合に、最初の中括弧 { と最後の中括弧 } の間を抽出して再試行します。
@@ -185,83 +221,50 @@ def validate_and_fix_json(json_str: str, schema: Dict[str, Any]) -> Dict[str, An
         end = json_str.rfind("}") + 1
         if start != -1 and end != -1:
             try:
-                data = json.loads(json_str[start:end])
+                return json.loads(json_str[start:end])
             except Exception:
-                # 復旧不能な場合は空の辞書を返して安全に終了
-                return {}
-        else:
-             return {}
+                return None
+        return None
+
+
+@traced("ai.validate_json")
+def validate_and_fix_json(json_str: str, schema: Dict[str, Any], compact: bool = False) -> Dict[str, Any]:
+    """
+    AIのJSON応答を解析・検証・修正する関数
+    
+    LLMは時にMarkdownコードブロックを含んだり、不正なJSONを返したりするため、
+    それらをクリーニングしてPython辞書として安全に取り出します。
+    さらに、スキーマ定義に従って型変換（キャスト）を行い、Notion APIでエラーにならない形式に整えます。
+    compact=True の場合は、短いキー（api/compact.py）をプロパティ名に戻してから変換します。
+    """
+    # 1. 応答の解析（Markdown記法の除去と、前後の余計な文字列の除去を含む）
+    data = _parse_json_response(json_str)
+    if data is None:
+        # 復旧不能な場合は空の辞書を返して安全に終了
+        return {}
+    if compact:
+        data = expand_properties(data, schema)
 
     # 2. プロパティの型検証とキャスト (Robust Property Validation)
     # Notion APIは型に厳格なため、スキーマ情報を基に各値を適切な形式に変換します。
-    validated = {}
-    for k, v in data.items():
-        if k not in schema:
-            continue
-            
-        target_type = schema[k]["type"]
-        
-        # 型ごとの詳細な処理
-        if target_type == "select":
-            # Select型: 文字列に変換
-            if isinstance(v, dict): v = v.get("name")
-            if v:
-                validated[k] = {"select": {"name": str(v)}}
-                
-        elif target_type == "multi_select":
-            # Multi-Select型: 文字列のリストに変換
-            if not isinstance(v, list): v = [v]
-            opts = []
-            for item in v:
-               if isinstance(item, dict): item = item.get("name")
-               if item: opts.append({"name": str(item)})
-            validated[k] = {"multi_select": opts}
-            
-        elif target_type == "status":
-             # Status型
-             if isinstance(v, dict): v = v.get("name")
-             if v:
-                 validated[k] = {"status": {"name": str(v)}}
-                 
-        elif target_type == "date":
-            # Date型: YYYY-MM-DD 文字列を期待
-            if isinstance(v, dict): v = v.get("start")
-            if v:
-                validated[k] = {"date": {"start": str(v)}}
-                
-        elif target_type == "checkbox":
-            # Checkbox型: 真偽値
-            validated[k] = {"checkbox": bool(v)}
-            
-        elif target_type == "number":
-             # Number型: 数値変換
-             try:
-                 if v is not None:
-                     validated[k] = {"number": float(v)}
-             except (ValueError, TypeError):
-                 # 数値変換に失敗した場合はスキップ
-                 # 例: "abc" -> float() は ValueError
-                 pass
-                 
-        elif target_type == "title":
-             # Title型: Rich Text オブジェクト構造
-             if isinstance(v, list): v = "".join([t.get("plain_text","") for t in v if "plain_text" in t])
-             validated[k] = {"title": [{"text": {"content": str(v)}}]}
-             
-        elif target_type == "rich_text":
-             # Rich Text型
-             if isinstance(v, list): v = "".join([t.get("plain_text","") for t in v if "plain_text" in t])
-             validated[k] = {"rich_text": [{"text": {"content": str(v)}}]}
-             
-        elif target_type == "people":
-            # ユーザーIDが必要なため、現在は無視（実装難易度高）
-            pass
-            
-        elif target_type == "files":
-             # ファイルアップロードは複雑なため無視
-             pass
+    # 型ごとの変換ロジックは api/serializers.py に集約しています。
+    return serialize_properties(data, schema)
 
-    return validated
+
+@traced("ai.validate_json", kind="items")
+def validate_and_fix_items(json_str: str, schema: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    複数件の抽出（construct_prompt の multiple=True）の応答を、項目ごとのプロパティのリストにします。
+    各項目は validate_and_fix_json と同じコンパイル済みの変換表で変換し、空になった項目は除きます。
+    """
+    data = _parse_json_response(json_str)
+    if isinstance(data, dict):
+        # {"items": [...]}。1件だけオブジェクトで返された場合はそれを1項目とみなす
+        data = data.get("items", [data])
+    if not isinstance(data, list):
+        return []
+    items = [serialize_properties(item, schema) for item in data if isinstance(item, dict)]
+    return [item for item in items if item]
 
 
 # --- NEW: High-level entry points ---
@@ -271,13 +274,15 @@ async def analyze_text_with_ai(
     schema: Dict[str, Any],
     recent_examples: List[Dict[str, Any]],
     system_prompt: str,
-    model: Optional[str] = None
+    model: Optional[str] = None,
+    compact: Optional[bool] = None
 ) -> Dict[str, Any]:
     """
     テキスト分析とプロパティ抽出のメイン関数
     
+    0. ルールによる抽出（api/fastpath.py）。確信度が高ければLLMを呼ばずにその結果を返す
     1. 最適なモデルの選択（テキストのみ/画像あり）
-    2. プロンプトの構築
+    2. プロンプトの構築（ルールで抽出できた値を添える）
     3. LLMの呼び出し
     4. 結果の解析とプロパティのクリーニング
     を一括して行います。
@@ -288,27 +293,56 @@ async def analyze_text_with_ai(
         recent_examples: 最近の登録データ（コンテキスト用）
         system_prompt: システムからの指示
         model: モデルの明示的な指定（省略時は自動選択）
+        compact: 短いキーの形式で返させるか（省略時は COMPACT_OUTPUT_ENABLED）
     
     Returns:
         {
             "properties": {...},  # Notion登録用プロパティ
             "usage": {...},       # トークン使用量
             "cost": float,        # 推定コスト
-            "model": str          # 使用されたモデル名
+            "model": str          # 使用されたモデル名（ルールで抽出した場合は "fastpath"）
         }
     """
+    hint = ""
+    if FASTPATH_ENABLED:
+        with span("ai.fastpath"):
+            fast = extract_fast_path(text, schema)
+        if fast.can_skip_llm(schema):
+            logger.debug("[AI] Fast path hit: %s", fast.values)
+            return {
+                "properties": serialize_properties(fast.values, schema),
+                "usage": {},
+                "cost": 0.0,
+                "model": "fastpath"
+            }
+        logger.debug("[AI] Fast path miss: %s", ", ".join(fast.reasons) or "title only")
+        hint = fast.hint()
+
     # モデルの自動選択（この関数はテキスト入力のみを想定）
     selected_model = select_model_for_input(has_image=False, user_selection=model)
     
     # プロンプトの構築
-    prompt = construct_prompt(text, schema, recent_examples, system_prompt)
+    if compact is None:
+        compact = COMPACT_OUTPUT_ENABLED
+    prompt = construct_prompt(text, schema, recent_examples, system_prompt, hint=hint, compact=compact)
     
     try:
         # LLM呼び出し
-        result = await generate_json(prompt, model=selected_model)
+        if compact:
+            result = await generate_json(
+                prompt,
+                model=selected_model,
+                response_schema=compact_response_format(schema),
+                max_tokens=max_tokens_for(schema)
+            )
+        else:
+            result = await generate_json(prompt, model=selected_model, response_schema=response_format(schema))
         
         # プロパティの検証と修正
-        properties = validate_and_fix_json(result["content"], schema)
+        # 大きな応答の解析はイベントループの外で行う（api/loop_monitor.py）
+        properties = await run_blocking(
+            validate_and_fix_json, result["content"], schema, compact=compact, size=len(result["content"])
+        )
         
         return {
             "properties": properties,
@@ -318,7 +352,7 @@ async def analyze_text_with_ai(
         }
     
     except Exception as e:
-        print(f"AI Analysis Failed: {e}")
+        logger.warning("AI Analysis Failed: %s", e)
         
         # エラー時のフォールバック処理
         # AI分析に失敗しても、ユーザーの入力テキストをタイトルとして保存できるように
@@ -338,6 +372,103 @@ async def analyze_text_with_ai(
         }
 
 
+async def analyze_items_with_ai(
+    text: str,
+    schema: Dict[str, Any],
+    recent_examples: List[Dict[str, Any]],
+    system_prompt: str,
+    model: Optional[str] = None,
+    max_items: int = EXTRACT_MAX_ITEMS
+) -> Dict[str, Any]:
+    """
+    議事録などに含まれる複数の項目を、1回のLLM呼び出しでまとめて抽出します。
+
+    N件を1件ずつチャットで送る場合と比べて、プロンプト（システム指示・スキーマ・例）の送信と
+    LLMの往復が1回で済みます。入力が箇条書きだけで、すべての項目がルールで解釈できる場合はLLMを呼びません
+    （見出しや参加者などの行がある議事録は、どの行が項目かの判断をLLMに任せます）。
+
+    Returns:
+        {
+            "items": [{...}, ...],  # 項目ごとのNotion登録用プロパティ（最大 max_items 件）
+            "usage": {...},
+            "cost": float,
+            "model": str
+        }
+    """
+    if FASTPATH_ENABLED and is_item_list(text):
+        lines = split_items(text)
+        if len(lines) <= max_items:
+            results = []
+            for line in lines:
+                fast = extract_fast_path(line, schema)
+                if not fast.can_skip_llm(schema):
+                    break
+                results.append(fast)
+            else:
+                return {
+                    "items": [serialize_properties(r.values, schema) for r in results],
+                    "usage": {},
+                    "cost": 0.0,
+                    "model": "fastpath"
+                }
+
+    selected_model = select_model_for_input(has_image=False, user_selection=model)
+    prompt = construct_prompt(text, schema, recent_examples, system_prompt, multiple=True, max_items=max_items)
+    result = await generate_json(prompt, model=selected_model, response_schema=response_format(schema, "items"))
+    items = await run_blocking(validate_and_fix_items, result["content"], schema, size=len(result["content"]))
+    if len(items) > max_items:
+        logger.info("[AI] Extracted %d items, keeping the first %d", len(items), max_items)
+    return {
+        "items": items[:max_items],
+        "usage": result["usage"],
+        "cost": result["cost"],
+        "model": result["model"]
+    }
+
+
+def build_chat_system_message(system_prompt: str, schema: Dict[str, Any], compact: Optional[bool] = None) -> str:
+    """
+    チャット用のシステムメッセージ（システムプロンプト + スキーマ + 出力形式の指示）を構築します。
+
+    入力テキストに依存しないため、ターゲットとシステムプロンプトが同じ間は再利用できます。
+    compact（省略時は COMPACT_OUTPUT_ENABLED）が True でスキーマがある場合は、短いキーの形式を指示します。
+    """
+    if compact is None:
+        compact = COMPACT_OUTPUT_ENABLED
+    if compact and schema:
+        return f"""{system_prompt}
+
+You are a helpful AI assistant.
+{compact_output_format(schema, chat=True)}"""
+
+    # スキーマ情報の整形
+    schema_info = {}
+    for k, v in schema.items():
+        if isinstance(v, dict) and "type" in v:
+            schema_info[k] = v['type']
+            if v['type'] == 'select' and 'select' in v:
+                schema_info[k] += f" options: {[o['name'] for o in v['select']['options']]}"
+            elif v['type'] == 'multi_select' and 'multi_select' in v:
+                schema_info[k] += f" options: {[o['name'] for o in v['multi_select']['options']]}"
+
+    return f"""{system_prompt}
+
+Target Schema:
+{json.dumps(schema_info, indent=2, ensure_ascii=False)}
+
+Restraints:
+- You are a helpful AI assistant.
+- Your output must be valid JSON ONLY.
+- Structure:
+{{
+  "message": "Response to the user",
+  "refined_text": "Refined version of the input, if applicable (or null)",
+  "properties": {{ "Property Name": "Value" }} // Only if user intends to save data
+}}
+- If the user is just chatting, "properties" should be null.
+- If the user wants to save/add data, fill "properties" according to the Schema."""
+
+
 async def chat_analyze_text_with_ai(
     text: str,
     schema: Dict[str, Any],
@@ -345,7 +476,10 @@ async def chat_analyze_text_with_ai(
     session_history: Optional[List[Dict[str, str]]] = None,
     image_data: Optional[str] = None,
     image_mime_type: Optional[str] = None,
-    model: Optional[str] = None
+    model: Optional[str] = None,
+    system_message: Optional[str] = None,
+    history_tokens: Optional[int] = None,
+    compact: Optional[bool] = None
 ) -> Dict[str, Any]:
     """
     インタラクティブチャット分析のメイン関数 (画像対応)
@@ -361,93 +495,87 @@ async def chat_analyze_text_with_ai(
         image_data: Base64エンコードされた画像データ（任意）
         image_mime_type: 画像のMIMEタイプ（任意）
         model: モデル指定
+        system_message: 構築済みのシステムメッセージ（build_chat_system_message の結果、任意）
+        history_tokens: session_history の数え済みトークン数（api/sessions.py、任意）
+        compact: 短いキーの形式で返させるか（省略時は COMPACT_OUTPUT_ENABLED。system_message と揃えること）
     
     Returns:
         dict: メッセージ、精製テキスト、抽出プロパティ、メタデータを含む辞書
     """
+    # 短い形式はスキーマ（データベース）がある場合のみ
+    compact = (COMPACT_OUTPUT_ENABLED if compact is None else compact) and bool(schema)
+
     # 画像の有無に基づくモデル自動選択
     has_image = bool(image_data and image_mime_type)
-    print(f"[Chat AI] Has image: {has_image}, User model selection: {model}")
+    logger.debug("[Chat AI] Has image: %s, User model selection: %s", has_image, model)
     selected_model = select_model_for_input(has_image=has_image, user_selection=model)
-    print(f"[Chat AI] Selected model: {selected_model}")
+    logger.debug("[Chat AI] Selected model: %s", selected_model)
     
     # 会話履歴の準備
-    print(f"[Chat AI] Constructing messages, schema keys: {len(schema)}, history length: {len(session_history) if session_history else 0}")
-    
-    # スキーマ情報の整形
-    schema_info = {}
-    for k, v in schema.items():
-        if isinstance(v, dict) and "type" in v:
-             schema_info[k] = v['type']
-             if v['type'] == 'select' and 'select' in v:
-                schema_info[k] += f" options: {[o['name'] for o in v['select']['options']]}"
-             elif v['type'] == 'multi_select' and 'multi_select' in v:
-                schema_info[k] += f" options: {[o['name'] for o in v['multi_select']['options']]}"
+    logger.debug("[Chat AI] Constructing messages, schema keys: %d, history length: %d", len(schema), len(session_history) if session_history else 0)
     
-    # システムプロンプトの構築
-    system_message_content = f"""{system_prompt}
-
-Target Schema:
-{json.dumps(schema_info, indent=2, ensure_ascii=False)}
-
-Restraints:
-- You are a helpful AI assistant.
-- Your output must be valid JSON ONLY.
-- Structure:
-{{
-  "message": "Response to the user",
-  "refined_text": "Refined version of the input, if applicable (or null)",
-  "properties": {{ "Property Name": "Value" }} // Only if user intends to save data
-}}
-- If the user is just chatting, "properties" should be null.
-- If the user wants to save/add data, fill "properties" according to the Schema."""
+    # 計測: チャット用プロンプト（メッセージ配列）の構築
+    with span("ai.construct_prompt", kind="chat"):
+        # システムプロンプトの構築（先読み済みの場合はそれを使う。api/prefetch.py 参照）
+        system_message_content = system_message or build_chat_system_message(system_prompt, schema, compact=compact)
     
-    # メッセージ配列の構築
-    messages = [{"role": "system", "content": system_message_content}]
+        # メッセージ配列の構築
+        messages = [{"role": "system", "content": system_message_content}]
     
-    # 会話履歴を追加（画像データは含まれない、テキストのみ）
-    if session_history:
-        messages.extend(session_history)
+        # 会話履歴を追加（画像データは含まれない、テキストのみ）
+        if session_history:
+            messages.extend(session_history)
     
-    # 現在のユーザー入力を追加
-    if has_image:
-        #マルチモーダル: 画像データを含むコンテンツパーツを作成
-        print(f"[Chat AI] Preparing multimodal message with image")
-        current_user_content = prepare_multimodal_prompt(
-            text or "(No text provided)",
-            image_data,
-            image_mime_type
-        )
-        messages.append({"role": "user", "content": current_user_content})
-    else:
-        # テキストのみ
-        if text:
-            messages.append({"role": "user", "content": text})
+        # 現在のユーザー入力を追加
+        if has_image:
+            #マルチモーダル: 画像データを含むコンテンツパーツを作成
+            logger.debug("[Chat AI] Preparing multimodal message with image")
+            current_user_content = prepare_multimodal_prompt(
+                text or "(No text provided)",
+                image_data,
+                image_mime_type
+            )
+            messages.append({"role": "user", "content": current_user_content})
         else:
-            messages.append({"role": "user", "content": "(No text provided)"})
+            # テキストのみ
+            if text:
+                messages.append({"role": "user", "content": text})
+            else:
+                messages.append({"role": "user", "content": "(No text provided)"})
     
+    # 予算の確認用のトークン数: 履歴は数え済みの値を使い、システムメッセージと今回の入力だけを数える
+    prompt_tokens = None
+    if history_tokens is not None and ledger.budgets:
+        prompt_tokens = history_tokens + await run_blocking(count_tokens, [messages[0], messages[-1]], selected_model)
+
     # LLMの呼び出し（messages配列を渡す）
-    print(f"[Chat AI] Calling LLM: {selected_model} with {len(messages)} messages")
-    result = await generate_json(messages, model=selected_model)
-    print(f"[Chat AI] LLM response received, length: {len(result['content'])}")
+    logger.debug("[Chat AI] Calling LLM: %s with %d messages", selected_model, len(messages))
+    result = await generate_json(
+        messages,
+        model=selected_model,
+        prompt_tokens=prompt_tokens,
+        response_schema=compact_response_format(schema, chat=True) if compact else response_format(schema, "chat"),
+        max_tokens=max_tokens_for(schema, chat=True) if compact else None
+    )
+    logger.debug("[Chat AI] LLM response received, length: %d", len(result["content"]))
     json_resp = result["content"]
     
     # 応答データの解析
     try:
-        data = json.loads(json_resp)
+        data = await run_blocking(json.loads, json_resp, size=len(json_resp))
         
-        # DEBUG: 生の解析結果をログ出力
-        print(f"[Chat AI] Raw parsed response type: {type(data)}")
-        print(f"[Chat AI] Raw parsed response: {data}")
+        # DEBUG: 生の解析結果をログ出力（DEBUGレベル無効時は文字列化されません）
+        logger.debug("[Chat AI] Raw parsed response type: %s", type(data))
+        logger.debug("[Chat AI] Raw parsed response: %s", data)
         
         # 文字列が返ってきた場合の対応（LLMがJSON形式を返さなかった場合）
         if isinstance(data, str):
-            print(f"[Chat AI] Response is a string, wrapping in message dict")
+            logger.debug("[Chat AI] Response is a string, wrapping in message dict")
             data = {"message": data}
         
         # リスト形式で返ってきた場合の対応（一部のモデルの挙動）
         elif isinstance(data, list):
-            print(f"[Chat AI] Response is a list, extracting first element")
+            logger.debug("[Chat AI] Response is a list, extracting first element")
             if data and isinstance(data[0], dict):
                 data = data[0]
             else:
@@ -456,27 +584,31 @@ Restraints:
         if not data:
             data = {"message": "AIから有効な応答が得られませんでした。"}
             
-        print(f"[Chat AI] After type handling: {data}")
-        print(f"[Chat AI] Message field: {data.get('message') if isinstance(data, dict) else 'N/A'}")
+        logger.debug("[Chat AI] After type handling: %s", data)
+        logger.debug("[Chat AI] Message field: %s", data.get("message") if isinstance(data, dict) else "N/A")
         
     except json.JSONDecodeError:
-        print(f"[Chat AI] JSON decode failed, attempting recovery from: {json_resp[:200]}")
+        logger.info("[Chat AI] JSON decode failed, attempting recovery from: %.200s", json_resp)
         try:
             # 部分的なJSONの抽出によるリカバリ
             start = json_resp.find("{")
             end = json_resp.rfind("}") + 1
             data = json.loads(json_resp[start:end])
-            print(f"[Chat AI] Recovered data: {data}")
+            logger.debug("[Chat AI] Recovered data: %s", data)
         except Exception as e:
-            print(f"[Chat AI] Recovery failed: {e}")
+            logger.warning("[Chat AI] Recovery failed: %s", e)
             data = {
                 "message": "AIの応答を解析できませんでした。",
                 "raw_response": json_resp
             }
     
+    # 短い形式の応答を通常の形に戻す
+    if compact and "raw_response" not in data:
+        data = expand_chat_response(data, schema)
+
     # フロントエンド向けのメッセージフィールド保証
     if "message" not in data or not data["message"]:
-        print(f"[Chat AI] Message missing or empty, generating fallback")
+        logger.debug("[Chat AI] Message missing or empty, generating fallback")
         
         # プロパティが直接返された場合のフォールバックメッセージ生成
         has_properties = any(key in data for key in ["Title", "Content", "properties"])
@@ -493,7 +625,7 @@ Restraints:
                 data["message"] = "プロパティを抽出しました。"
         else:
             data["message"] = "（応答完了）"
-        print(f"[Chat AI] Fallback message: {data['message']}")
+        logger.debug("[Chat AI] Fallback message: %s", data["message"])
 
     
     # データの正規化: AIがプロパティをトップレベルキーとして返した場合の修正
@@ -504,27 +636,26 @@ Restraints:
         property_keys = data_keys.intersection(schema_keys)
         
         if property_keys:
-            print(f"[Chat AI] Normalizing direct properties: {property_keys}")
+            logger.debug("[Chat AI] Normalizing direct properties: %s", property_keys)
             properties = {key: data[key] for key in property_keys}
             # トップレベルから削除して properties キー配下に移動
             for key in property_keys:
                 del data[key]
             data["properties"] = properties
-            print(f"[Chat AI] Normalized properties: {data['properties']}")
+            logger.debug("[Chat AI] Normalized properties: %s", data["properties"])
     
     # プロパティの詳細検証
+    # 解析済みの辞書をそのまま変換します（JSON文字列への再シリアライズは不要）
     if "properties" in data and data["properties"]:
-        data["properties"] = validate_and_fix_json(
-            json.dumps(data["properties"]),
-            schema
-        )
+        with span("ai.validate_json"):
+            data["properties"] = serialize_properties(data["properties"], schema)
     
     # メタデータの付与
     data["usage"] = result["usage"]
     data["cost"] = result["cost"]
     data["model"] = result["model"]
     
-    print(f"[Chat AI] Final response data: {data}")
+    logger.debug("[Chat AI] Final response data: %s", data)
     
     return data
 
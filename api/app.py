@@ -0,0 +1,696 @@
+"""
+FastAPI Application
+バックエンドAPIのエンドポイント定義（ルーティング）です。
+
+各機能のロジックは `api/notion.py`, `api/ai.py` などのモジュールに実装し、
+ここではリクエストの受け付けとレスポンスの整形のみを行います。
+
+起動方法:
+    python -m api.server                       # 本番: マルチワーカー（api/server.py 参照）
+    python -m uvicorn api.app:app --reload     # 開発: 単一プロセス
+"""
+import os
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Dict, Any, List, Optional
+
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from fastapi.staticfiles import StaticFiles
+from pydantic import BaseModel, Field
+
+from api.config import (
+    NOTION_ROOT_PAGE_ID,
+    NOTION_WARMUP_CONNECTIONS,
+    SCHEDULER_ENABLED,
+    TARGETS_REFRESH_INTERVAL,
+    SCHEMA_REFRESH_INTERVAL,
+    MODEL_REGISTRY_CHECK_INTERVAL,
+    SESSION_HISTORY_LIMIT,
+    FASTPATH_ENABLED,
+    EXTRACT_MAX_ITEMS,
+    ROUTER_ENABLED,
+    ROUTER_MIN_CONFIDENCE,
+    ROUTER_RETRAIN_INTERVAL,
+    LOOP_MONITOR_ENABLED,
+    LLM_TRANSPORT_ENABLED,
+    LLM_KEEPWARM_INTERVAL,
+    WEBHOOK_APPLY_INTERVAL,
+    DEBUG_MODE,
+    DEFAULT_SYSTEM_PROMPT,
+    DEFAULT_TEXT_MODEL,
+    DEFAULT_MULTIMODAL_MODEL,
+)
+from api.notion import (
+    warmup,
+    close_client,
+    create_page,
+    create_child_page,
+    append_block,
+)
+from api.ai import chat_analyze_text_with_ai, analyze_items_with_ai
+from api.examples_index import get_examples
+from api.fastpath import extract as extract_fast_path
+from api.models import (
+    MODEL_FIELDS,
+    get_available_models,
+    get_models_version,
+    filter_models,
+    project_models,
+    refresh_model_registry,
+    get_model_registry,
+)
+from api.rate_limiter import rate_limiter
+from api.serializers import simplify_properties, display_value
+from api.tracing import span, render_prometheus
+from api.search_index import search_service
+from api.http_cache import ResponseCacheMiddleware, invalidate_responses
+from api.scheduler import scheduler
+from api.ledger import ledger, usage_scope, BudgetExceededError
+from api.idempotency import derive_key, idempotency_store
+from api.sessions import session_store
+from api.target_router import target_router
+from api.loop_monitor import loop_monitor, run_blocking, shutdown_executor
+from api.transport import provider_transport
+from api.export import DatabaseExport, FORMATS as EXPORT_FORMATS
+from api.webhooks import webhook_service, InvalidSignatureError
+from api.prefetch import (
+    get_target_schema,
+    get_system_message,
+    get_database_pages,
+    get_page_blocks,
+    get_reference_context,
+    invalidate_content,
+    schedule_warmup,
+    list_targets,
+    invalidate_targets,
+    refresh_targets,
+    refresh_recent_schemas,
+)
+from api.logger import get_logger
+
+logger = get_logger(__name__)
+
+PUBLIC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "public")
+
+
+async def _refresh_models() -> None:
+    """モデル情報・認証情報が変わっていれば、モデル一覧と設定のレスポンスを作り直させます"""
+    if await run_blocking(refresh_model_registry):
+        invalidate_responses("/api/models")
+        invalidate_responses("/api/config")
+
+
+async def _cleanup_rate_limiter() -> None:
+    # リクエスト処理と同じイベントループ上で実行する（記録用の辞書はロックで保護していないため）
+    rate_limiter.cleanup()
+
+
+def register_jobs() -> None:
+    """キャッシュを更新する定期ジョブを登録します（api/scheduler.py）"""
+    if NOTION_ROOT_PAGE_ID:
+        scheduler.add("targets", refresh_targets, TARGETS_REFRESH_INTERVAL, initial_delay=0)
+    scheduler.add("schemas", refresh_recent_schemas, SCHEMA_REFRESH_INTERVAL)
+    scheduler.add("models", _refresh_models, MODEL_REGISTRY_CHECK_INTERVAL)
+    scheduler.add("rate_limiter", _cleanup_rate_limiter, rate_limiter.cleanup_interval)
+    scheduler.add("ledger", ledger.flush, 30)
+    scheduler.add("sessions", session_store.purge, 600)
+    if ROUTER_ENABLED:
+        scheduler.add("router", target_router.refresh, ROUTER_RETRAIN_INTERVAL)
+    if LLM_TRANSPORT_ENABLED and LLM_KEEPWARM_INTERVAL > 0:
+        scheduler.add("llm_keepwarm", provider_transport.keep_warm, LLM_KEEPWARM_INTERVAL, initial_delay=0)
+    if webhook_service.enabled:
+        scheduler.add("webhooks", webhook_service.apply, WEBHOOK_APPLY_INTERVAL, jitter=0)
+        scheduler.add("webhooks_prune", webhook_service.prune, 600)
+    rate_limiter.cleanup_scheduled = True
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    ワーカーの起動・終了処理
+
+    起動時にNotionへの接続を確立し、キャッシュを更新する定期ジョブを開始してから ready にします。
+    接続とジョブはプロセス間で共有できないため、fork 後の各ワーカーでここを実行します。
+    """
+    if LOOP_MONITOR_ENABLED:
+        await loop_monitor.start()
+    if NOTION_WARMUP_CONNECTIONS > 0:
+        opened = await warmup(NOTION_WARMUP_CONNECTIONS)
+        logger.info("[Server] Warmed up %d Notion connection(s)", opened)
+    # モデルレジストリ（LiteLLMの全モデルの走査）は、最初のリクエストの処理中ではなくここで作っておく
+    await run_blocking(get_model_registry)
+    if webhook_service.enabled:
+        await run_blocking(webhook_service.start)
+    if SCHEDULER_ENABLED:
+        register_jobs()
+        await scheduler.start()
+    app.state.ready = True
+    yield
+    app.state.ready = False
+    await scheduler.stop()
+    rate_limiter.cleanup_scheduled = False
+    await asyncio.to_thread(ledger.flush)
+    await close_client()
+    await provider_transport.close()
+    await loop_monitor.stop()
+    shutdown_executor()
+
+
+app = FastAPI(title="Memo AI", lifespan=lifespan)
+# ready: 起動処理が完了した / draining: 終了シグナルを受けて処理中のリクエストを完了させている
+app.state.ready = False
+app.state.draining = False
+# 読み取り系エンドポイントのレスポンスキャッシュ（ETag / 304）。トレースの内側に置く
+app.add_middleware(ResponseCacheMiddleware)
+
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """
+    全リクエストをルートスパンで囲み、エンドポイントごとのレイテンシを集計します。
+    下位の notion / llm_client / ai のスパンはこのスパンの子として記録されます。
+    """
+    with span("http.request", method=request.method) as s:
+        response = await call_next(request)
+        # ルーティング後に確定するパステンプレート（/api/schema/{target_id} など）をラベルにする
+        route = request.scope.get("route")
+        s.set_label("route", getattr(route, "path", "unmatched"))
+        s.set_label("status", response.status_code)
+        return response
+
+
+# --- リクエストモデル (Request Models) ---
+
+class ChatRequest(BaseModel):
+    text: str = ""
+    target_id: str
+    system_prompt: Optional[str] = None
+    # サーバー側で保持する会話履歴のID（api/sessions.py）。初回は省略し、応答の session_id を次回から送る
+    session_id: Optional[str] = Field(None, max_length=64)
+    # 旧クライアント向け: ブラウザ側で保持した会話履歴（指定した場合はサーバー側の履歴を使わない）
+    session_history: Optional[List[Dict[str, Any]]] = None
+    # True の場合、ターゲットの内容をサーバー側で抽出してプロンプトに含める（ページを参照）
+    reference_page: bool = False
+    # 旧クライアント向け: ブラウザ側で作成した参照テキスト
+    reference_context: Optional[str] = None
+    image_data: Optional[str] = None
+    image_mime_type: Optional[str] = None
+    model: Optional[str] = None
+
+
+class SaveRequest(BaseModel):
+    target_db_id: str
+    target_type: str = "database"
+    text: str = ""
+    properties: Dict[str, Any] = {}
+
+
+class ExtractRequest(BaseModel):
+    text: str = Field(..., min_length=1, max_length=20000)
+    target_id: str
+    system_prompt: Optional[str] = None
+    model: Optional[str] = None
+
+
+class BatchSaveRequest(BaseModel):
+    target_db_id: str
+    items: List[Dict[str, Any]] = Field(..., min_length=1, max_length=EXTRACT_MAX_ITEMS)
+
+
+class CreatePageRequest(BaseModel):
+    page_name: str
+
+
+class RouteRequest(BaseModel):
+    text: str = Field(..., min_length=1, max_length=2000)
+
+
+class WarmupRequest(BaseModel):
+    system_prompt: Optional[str] = None
+    reference: bool = False
+
+
+# --- 稼働状態 (Health & Readiness) ---
+
+@app.get("/api/health")
+async def health():
+    """プロセスが応答できるかどうか（liveness）"""
+    return {"status": "ok"}
+
+
+@app.get("/api/ready")
+async def ready():
+    """
+    リクエストを受け付けられるかどうか（readiness）
+    起動処理の完了前と、終了処理（ドレイン）中は 503 を返し、ロードバランサーの振り分け対象から外します。
+    """
+    if app.state.draining:
+        return JSONResponse({"status": "draining"}, status_code=503)
+    if not app.state.ready:
+        return JSONResponse({"status": "starting"}, status_code=503)
+    return {"status": "ready", "pid": os.getpid()}
+
+
+@app.get("/api/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Prometheus形式のメトリクスを返します。
+    各ステージ（Notion API、LLM呼び出し、プロンプト構築、JSON検証）の
+    レイテンシヒストグラムと p50/p95/p99、トークン数・コストの累計を含みます。
+    """
+    return PlainTextResponse(
+        render_prometheus(),
+        media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+# --- 設定・ターゲット (Config & Targets) ---
+
+@app.get("/api/config")
+async def get_config():
+    """フロントエンドの初期化に必要な設定"""
+    return {
+        "debug_mode": DEBUG_MODE,
+        "default_system_prompt": DEFAULT_SYSTEM_PROMPT,
+        "models_version": get_models_version(),
+    }
+
+
+@app.get("/api/targets")
+async def get_targets():
+    """ルートページ直下のデータベースとページを、保存先の候補として返します"""
+    if not NOTION_ROOT_PAGE_ID:
+        raise HTTPException(status_code=500, detail="NOTION_ROOT_PAGE_ID が設定されていません")
+
+    return {"targets": await list_targets()}
+
+
+@app.get("/api/schema/{target_id}")
+async def get_schema(target_id: str):
+    """データベースのスキーマを返します（ページの場合は空のスキーマ）"""
+    return await get_target_schema(target_id)
+
+
+@app.post("/api/warmup/{target_id}", status_code=202)
+async def warmup_target(target_id: str, payload: Optional[WarmupRequest] = None):
+    """
+    ターゲット選択時に呼び出され、最初のチャットに必要なデータをバックグラウンドで先読みします。
+    先読みの完了は待たずに応答します（api/prefetch.py 参照）。
+    """
+    payload = payload or WarmupRequest()
+    started = schedule_warmup(
+        target_id,
+        system_prompt=payload.system_prompt or DEFAULT_SYSTEM_PROMPT,
+        reference=payload.reference
+    )
+    return {"status": "accepted" if started else "in_progress"}
+
+
+@app.post("/api/route")
+async def route_memo(payload: RouteRequest):
+    """
+    メモの内容から保存先のデータベースを推定します（api/target_router.py）。
+
+    最も確率の高い保存先が ROUTER_MIN_CONFIDENCE 以上の場合は target_id に返し、
+    送信前にスキーマと例が揃うよう、その保存先の先読みを開始します。
+    """
+    if not ROUTER_ENABLED:
+        raise HTTPException(status_code=404, detail="保存先の自動選択は無効です")
+
+    candidates = await target_router.route(payload.text)
+    titles = {t["id"]: t.get("title", "") for t in await list_targets()}
+    candidates = [(target_id, score) for target_id, score in candidates if target_id in titles]
+
+    target_id, warming = None, False
+    if candidates and candidates[0][1] >= ROUTER_MIN_CONFIDENCE:
+        target_id = candidates[0][0]
+        warming = schedule_warmup(target_id)
+    return {
+        "target_id": target_id,
+        "candidates": [
+            {"id": target_id, "title": titles[target_id], "score": round(score, 4)}
+            for target_id, score in candidates
+        ],
+        "warming": warming
+    }
+
+
+@app.get("/api/models")
+async def get_models(
+    response: Response,
+    capability: Optional[str] = Query(None, pattern="^(vision|text)$"),
+    provider: Optional[str] = Query(None, max_length=50),
+    max_cost: Optional[float] = Query(None, ge=0),
+    fields: Optional[str] = Query(None, max_length=200),
+    v: Optional[str] = Query(None, max_length=64)
+):
+    """
+    利用可能なモデルの一覧と、デフォルトモデルの設定を返します。
+
+    - capability / provider / max_cost（入力1kトークンあたりのUSD）で絞り込み、
+      fields（カンマ区切り）で返す項目を指定できます。
+    - v に /api/config の models_version を指定した場合、内容が変わらないため無期限にキャッシュさせます。
+      モデル構成が変わるとバージョンも変わり、クライアントは新しいURLを取得します。
+    """
+    field_list = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+    unknown = set(field_list or []) - set(MODEL_FIELDS)
+    if unknown:
+        raise HTTPException(status_code=422, detail=f"不明な fields: {', '.join(sorted(unknown))}")
+
+    available = get_available_models()
+    available_ids = {m["id"] for m in available}
+
+    warnings = []
+    for kind, model_id in (("text", DEFAULT_TEXT_MODEL), ("multimodal", DEFAULT_MULTIMODAL_MODEL)):
+        if model_id not in available_ids:
+            warnings.append({
+                "type": "default_model_unavailable",
+                "model": model_id,
+                "message": f"デフォルトの{kind}モデル '{model_id}' は利用できません。APIキーの設定を確認してください。"
+            })
+
+    version = get_models_version()
+    if v == version:
+        response.headers["Cache-Control"] = "private, max-age=31536000, immutable"
+
+    models = filter_models(available, capability=capability, provider=provider, max_cost=max_cost)
+    return {
+        "version": version,
+        "models": project_models(models, field_list),
+        "defaults": {"text": DEFAULT_TEXT_MODEL, "multimodal": DEFAULT_MULTIMODAL_MODEL},
+        "warnings": warnings,
+    }
+
+
+# --- AIチャット・保存 (Chat & Save) ---
+
+@app.post("/api/chat")
+async def chat(request: Request, payload: ChatRequest):
+    """
+    ユーザー入力（テキスト・画像）をAIで解析し、応答メッセージと抽出したプロパティを返します。
+    """
+    await rate_limiter.check_rate_limit(request, endpoint="chat")
+
+    # ターゲット選択時に先読みしていれば、どちらもキャッシュから返る
+    # ページが対象の場合はスキーマが空になり、プロパティを抽出しない
+    system_prompt = payload.system_prompt or DEFAULT_SYSTEM_PROMPT
+    target = await get_target_schema(payload.target_id)
+    system_message = await get_system_message(payload.target_id, system_prompt)
+
+    reference = payload.reference_context
+    if payload.reference_page:
+        try:
+            reference = await get_reference_context(payload.target_id)
+        except Exception as e:
+            # 参照は補助的な情報のため、取得に失敗してもチャットは続ける
+            logger.warning("[Chat] Reference extraction failed for %s: %s", payload.target_id, e)
+
+    text = payload.text
+    if FASTPATH_ENABLED and target["type"] == "database" and text:
+        # チャットはシステムプロンプト（言い換え・絵文字など）に従わせるためLLMを呼ぶが、
+        # ルールで解決できた値（「明日」の日付など）は添えて渡す（api/fastpath.py）
+        hint = extract_fast_path(text, target["schema"]).hint()
+        if hint:
+            text = f"{text}\n\n{hint}"
+    if reference:
+        text = f"{reference}\n\n{text}"
+
+    # 会話履歴: 旧クライアントは毎回送ってくる。それ以外はサーバー側のセッションから直近の分を使う
+    session = None
+    history, history_tokens = payload.session_history, None
+    if history is None:
+        # セッションの読み書きはSQLiteを使うため、イベントループの外で行う
+        if payload.session_id:
+            session = await asyncio.to_thread(session_store.get, payload.session_id)
+        session = session or session_store.create()
+        history, history_tokens = session.recent(SESSION_HISTORY_LIMIT)
+
+    try:
+        # 利用量をターゲット・クライアントごとに記録し、それぞれの予算を適用する
+        with usage_scope(target=payload.target_id, client=rate_limiter.get_client_ip(request)):
+            result = await chat_analyze_text_with_ai(
+                text,
+                target["schema"],
+                system_prompt,
+                session_history=history,
+                image_data=payload.image_data,
+                image_mime_type=payload.image_mime_type,
+                model=payload.model,
+                system_message=system_message,
+                history_tokens=history_tokens
+            )
+    except BudgetExceededError as e:
+        raise HTTPException(status_code=429, detail={"message": str(e)})
+    except Exception as e:
+        logger.exception("[Chat] Failed: %s", e)
+        raise HTTPException(status_code=500, detail={"message": f"AI解析に失敗しました: {e}"})
+
+    if session is not None:
+        # 履歴には参照テキストを含めず、画像は [画像送信] と記録する（画像データは保存しない）
+        user_content = " ".join(t for t in (payload.text, "[画像送信]" if payload.image_data else "") if t)
+        turn = [{"role": "user", "content": user_content}] if user_content else []
+        if result.get("message"):
+            turn.append({"role": "assistant", "content": result["message"]})
+        await asyncio.to_thread(session_store.append, session, turn)
+        result["session_id"] = session.id
+    return result
+
+
+@app.delete("/api/sessions/{session_id}", status_code=204)
+async def delete_session(session_id: str):
+    """サーバー側で保持している会話履歴を削除します（セッションのクリア）"""
+    await asyncio.to_thread(session_store.delete, session_id)
+    return Response(status_code=204)
+
+
+@app.post("/api/extract")
+async def extract_items(request: Request, payload: ExtractRequest):
+    """
+    議事録などのテキストから、複数の項目（行）のプロパティを1回のLLM呼び出しで抽出します。
+    保存は行わず、結果を確認してから /api/save/batch に送ります。
+    """
+    await rate_limiter.check_rate_limit(request, endpoint="extract")
+
+    target = await get_target_schema(payload.target_id)
+    if target["type"] != "database":
+        raise HTTPException(status_code=400, detail="複数件の抽出はデータベースのみ対応しています")
+    examples = await get_examples(payload.target_id, payload.text)
+
+    try:
+        with usage_scope(target=payload.target_id, client=rate_limiter.get_client_ip(request)):
+            return await analyze_items_with_ai(
+                payload.text,
+                target["schema"],
+                examples,
+                payload.system_prompt or DEFAULT_SYSTEM_PROMPT,
+                model=payload.model
+            )
+    except BudgetExceededError as e:
+        raise HTTPException(status_code=429, detail={"message": str(e)})
+    except Exception as e:
+        logger.exception("[Extract] Failed: %s", e)
+        raise HTTPException(status_code=500, detail={"message": f"AI解析に失敗しました: {e}"})
+
+
+def _idempotency_key(request: Request, scope: str, payload: BaseModel) -> str:
+    return derive_key(scope, payload.model_dump(), request.headers.get("Idempotency-Key"))
+
+
+@app.post("/api/save")
+async def save(request: Request, response: Response, payload: SaveRequest):
+    """
+    データベースへの行追加、またはページへのテキスト追記を行います。
+
+    同じ内容の保存（または同じ Idempotency-Key）は IDEMPOTENCY_WINDOW 秒間は1回だけ実行され、
+    繰り返しには最初の結果を返します（レスポンスヘッダー Idempotent-Replayed: true）。
+    """
+    async def _save():
+        if payload.target_type == "database":
+            url = await create_page(payload.target_db_id, payload.properties)
+            return {"status": "success", "url": url}
+        if not await append_block(payload.target_db_id, payload.text):
+            raise HTTPException(status_code=502, detail="ページへの追記に失敗しました")
+        invalidate_content(payload.target_db_id)
+        return {"status": "success"}
+
+    try:
+        result, replayed = await idempotency_store.run(_idempotency_key(request, "save", payload), _save)
+        if replayed:
+            response.headers["Idempotent-Replayed"] = "true"
+        return result
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("[Save] Failed: %s", e)
+        raise HTTPException(status_code=500, detail=f"保存に失敗しました: {e}")
+
+
+@app.post("/api/save/batch")
+async def save_batch(request: Request, payload: BatchSaveRequest):
+    """
+    複数の行をデータベースに並行して作成します（Notionへの送信は notion.throttle の範囲内）。
+
+    重複の防止は行ごとに行うため、一部が失敗した場合に同じ内容を再送信しても、
+    作成済みの行は作り直さずに結果だけを返します。
+    Idempotency-Key ヘッダーを指定した場合は「キー:行番号」を、無い場合は行の内容と行番号のハッシュを
+    各行のキーにします（同じ内容の行が1つのバッチに複数あっても、それぞれ作成されます）。
+    """
+    client_key = request.headers.get("Idempotency-Key")
+
+    async def _save_item(index: int, properties: Dict[str, Any]) -> Dict[str, Any]:
+        item = SaveRequest(target_db_id=payload.target_db_id, properties=properties)
+        key = derive_key("save_batch", {"index": index, "item": item.model_dump()},
+                         f"{client_key}:{index}" if client_key else None)
+        try:
+            result, replayed = await idempotency_store.run(
+                key, lambda: create_page(payload.target_db_id, properties)
+            )
+        except Exception as e:
+            logger.warning("[Save] Batch item %d failed: %s", index, e)
+            return {"status": "error", "error": str(e)}
+        return {"status": "success", "url": result, "replayed": replayed}
+
+    results = await asyncio.gather(*[_save_item(i, p) for i, p in enumerate(payload.items)])
+    failed = sum(1 for r in results if r["status"] != "success")
+    return {"status": "success" if not failed else "partial", "failed": failed, "results": results}
+
+
+@app.post("/api/pages/create")
+async def create_new_page(request: Request, response: Response, payload: CreatePageRequest):
+    """ルートページの直下に新しいページを作成します（/api/save と同じく重複実行を防ぎます）"""
+    if not NOTION_ROOT_PAGE_ID:
+        raise HTTPException(status_code=500, detail="NOTION_ROOT_PAGE_ID が設定されていません")
+
+    async def _create():
+        page = await create_child_page(NOTION_ROOT_PAGE_ID, payload.page_name)
+        return {"id": page["id"], "url": page.get("url")}
+
+    try:
+        result, replayed = await idempotency_store.run(_idempotency_key(request, "pages.create", payload), _create)
+    except Exception as e:
+        logger.exception("[Pages] Create failed: %s", e)
+        raise HTTPException(status_code=500, detail=f"ページ作成に失敗しました: {e}")
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    else:
+        # 新しいページが保存先の候補に加わる
+        invalidate_targets()
+    return result
+
+
+# --- コンテンツ参照 (Content Preview) ---
+
+@app.get("/api/content/database/{database_id}")
+async def get_database_content(database_id: str):
+    """データベースの最新の行を、表示用の文字列に変換して返します"""
+    pages = await get_database_pages(database_id)
+    columns: List[str] = []
+    rows = []
+    for page in pages:
+        values = simplify_properties(page.get("properties", {}))
+        for col in values:
+            if col not in columns:
+                columns.append(col)
+        row = {k: display_value(v) for k, v in values.items()}
+        row["id"] = page.get("id")
+        rows.append(row)
+    return {"type": "database", "columns": columns, "rows": rows}
+
+
+@app.get("/api/content/page/{page_id}")
+async def get_page_content(page_id: str):
+    """ページ内のブロックを、種類とプレーンテキストの組にして返します"""
+    blocks = []
+    for block in await get_page_blocks(page_id):
+        b_type = block.get("type")
+        rich_text = (block.get(b_type) or {}).get("rich_text", [])
+        content = "".join([t.get("plain_text", "") for t in rich_text])
+        blocks.append({"type": b_type, "content": content})
+    return {"type": "page", "blocks": blocks}
+
+
+# --- 利用状況 (Usage) ---
+
+@app.get("/api/usage")
+async def get_usage(
+    period: str = Query("day", pattern="^(day|month)$"),
+    group_by: str = Query("model", pattern="^(model|target)$")
+):
+    """
+    LLMの利用量（リクエスト数・トークン数・コスト）を、期間内でモデル・ターゲットごとに集計します。
+    設定されている全体の予算と、その使用額も返します。
+    クライアント（IPアドレス）ごとの集計は、認証の無いこのエンドポイントでは公開しません。
+    """
+    summary = await asyncio.to_thread(ledger.summary, period, group_by)
+    with usage_scope():
+        summary["budgets"] = [b for b in await asyncio.to_thread(ledger.budget_status) if b["name"] in ("daily", "monthly")]
+    return summary
+
+
+# --- 全文検索 (Search) ---
+
+@app.get("/api/search/{database_id}")
+async def search_database(
+    database_id: str,
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: int = Query(0, ge=0)
+):
+    """
+    データベース内のページをタイトルとテキストプロパティで全文検索します。
+
+    検索はローカルの索引に対して行い、Notionからは前回以降の更新分だけを取り込みます。
+    次のページは、レスポンスの next_cursor を cursor に指定して取得します。
+    """
+    return await search_service.search(database_id, q, limit=limit, offset=cursor)
+
+
+# --- 書き出し (Export) ---
+
+@app.get("/api/export/{database_id}")
+async def export_database(
+    database_id: str,
+    format: str = Query("ndjson", pattern="^(ndjson|csv|parquet)$"),
+    since: Optional[str] = Query(None, description="この日時（ISO 8601）以降に更新されたページだけを書き出す"),
+    cursor: Optional[str] = Query(None, description="再開位置（最後に受け取った行の _cursor）")
+):
+    """
+    データベースの全ページを NDJSON / CSV / Parquet で1行ずつストリーミングして返します（api/export.py）。
+    中断された場合は、最後に受け取った行の _cursor を cursor に指定して（同じ since で）再開できます。
+    """
+    try:
+        exporter = DatabaseExport(database_id, format, since=since, cursor=cursor)
+        await exporter.prepare()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    media_type, extension = EXPORT_FORMATS[format]
+    return StreamingResponse(
+        exporter.stream(),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{database_id}.{extension}"'}
+    )
+
+
+# --- Notion Webhook ---
+
+@app.post("/api/webhooks/notion")
+async def receive_notion_webhook(request: Request):
+    """
+    Notionの変更通知を受け取り、変更された対象のキャッシュを破棄します（api/webhooks.py）。
+    破棄は WEBHOOK_APPLY_INTERVAL 秒ごとにまとめて、すべてのワーカーに反映されます。
+    """
+    body = await request.body()
+    try:
+        return await webhook_service.receive(body, request.headers.get("X-Notion-Signature"))
+    except InvalidSignatureError as e:
+        if not webhook_service.enabled:
+            raise HTTPException(status_code=503, detail="NOTION_WEBHOOK_SECRET が設定されていません")
+        raise HTTPException(status_code=401, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+# フロントエンド（public/）の配信。Vercelでは静的ファイルとして配信されるため、ローカル実行時のみ使われます
+if os.path.isdir(PUBLIC_DIR):
+    app.mount("/", StaticFiles(directory=PUBLIC_DIR, html=True), name="public")
@@ -0,0 +1,103 @@
+"""
+TTL Cache
+有効期限付きのインメモリキャッシュです。
+
+同じキーの取得が同時に要求された場合は、1回の読み込みにまとめます（single-flight）。
+ターゲット選択時の先読み（api/prefetch.py）と、直後のチャットが同時に同じデータを
+要求しても、Notionへのリクエストは1回で済みます。
+読み込みに失敗した結果はキャッシュしません。
+
+refresh はバックグラウンドの定期更新（api/scheduler.py）用で、有効期限に関係なく読み込み直して
+値を置き換えます。読み込み中も古い値を返し続けるため、リクエストは更新を待ちません。
+"""
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from api.tracing import metrics
+
+
+class TTLCache:
+    """有効期限付き・件数上限付きのキャッシュ（古いものから削除）"""
+
+    def __init__(self, name: str, ttl: float, max_entries: int = 256):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            self._entries.pop(key, None)
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, match: Optional[Callable[[Hashable], bool]] = None) -> None:
+        """match が True を返すキー（省略時は全件）を削除します"""
+        if match is None:
+            self._entries.clear()
+            return
+        for key in [k for k in self._entries if match(k)]:
+            self._entries.pop(key, None)
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        キャッシュにあればそれを返し、無ければ loader で読み込んで保存します。
+        同じキーの読み込みが実行中なら、その完了を待ちます。
+        """
+        if self.ttl > 0:
+            value = self.get(key)
+            if value is not None:
+                metrics.incr("memo_ai_cache_total", cache=self.name, outcome="hit")
+                return value
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            metrics.incr("memo_ai_cache_total", cache=self.name, outcome="coalesced")
+            return await asyncio.shield(inflight)
+
+        metrics.incr("memo_ai_cache_total", cache=self.name, outcome="miss")
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await loader()
+        except BaseException as e:
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+                # 待っている呼び出しが無い場合に "exception was never retrieved" を出さない
+                future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+        if self.ttl > 0:
+            self.set(key, value)
+        future.set_result(value)
+        return value
+
+    async def refresh(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """loader で読み込み直して値を置き換えます（同じキーの読み込みが実行中なら、その結果を使います）"""
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+        value = await loader()
+        self.set(key, value)
+        metrics.incr("memo_ai_cache_total", cache=self.name, outcome="refresh")
+        return value
@@ -0,0 +1,151 @@
+"""
+Compact Output Protocol
+抽出呼び出しの出力トークン数を減らすための、短い形式の応答プロトコルです。
+
+LLMの生成時間は出力トークン数にほぼ比例します。通常のプロンプトでは
+"message" / "refined_text" / "properties" を長いプロパティ名付きで返させていますが、
+このモードでは次のように短くします。
+
+- プロパティ名の代わりに、スキーマの並び順から決めた短いキー（a, b, c, ...）を使う
+- チャットの応答文（m）と言い換え（r）は省略可能にする
+- 出力の上限（max_tokens）をスキーマのプロパティ数から決める
+
+応答はサーバー側で通常の形（プロパティ名のキー、"message" など）に戻すため、
+呼び出し側やフロントエンドから見た形は変わりません。COMPACT_OUTPUT_ENABLED で有効にします。
+
+例（キー a = Name, b = Status の場合）:
+    {"p":{"a":"会議の準備","b":"未着手"}}
+    -> {"properties": {"Name": "会議の準備", "Status": "未着手"}}
+"""
+import string
+from functools import lru_cache
+from typing import Any, Dict, Optional, Tuple
+
+from api.config import COMPACT_BASE_TOKENS, COMPACT_TOKENS_PER_PROPERTY, COMPACT_MESSAGE_TOKENS
+from api.json_schema import SchemaVersion, schema_version, property_schema
+
+# 短い形式で返すよう指示したプロンプトであることを示す文（ベンチマークのフェイクLLMも参照）
+COMPACT_INSTRUCTION = "Reply with ONE minified JSON object using only the short keys below. Omit keys that have no value."
+
+
+def _short_key(index: int) -> str:
+    """0, 1, ..., 25, 26, ... -> a, b, ..., z, aa, ..."""
+    letters = string.ascii_lowercase
+    key = ""
+    index += 1
+    while index:
+        index, rem = divmod(index - 1, len(letters))
+        key = letters[rem] + key
+    return key
+
+
+@lru_cache(maxsize=256)
+def _keys(version: SchemaVersion) -> Tuple[Tuple[str, str], ...]:
+    return tuple((name, _short_key(i)) for i, (name, _, _) in enumerate(version))
+
+
+def compact_keys(schema: Dict[str, Any]) -> Dict[str, str]:
+    """プロパティ名 → 短いキー の対応（登録に対応していない型は含めません）"""
+    return dict(_keys(schema_version(schema)))
+
+
+def key_legend(schema: Dict[str, Any]) -> str:
+    """プロンプトに含める、短いキーとプロパティの対応表"""
+    lines = []
+    keys = compact_keys(schema)
+    for name, p_type, options in schema_version(schema):
+        line = f"{keys[name]}: {name} ({p_type})"
+        if p_type == "date":
+            line += " YYYY-MM-DD"
+        elif options:
+            line += f" [{'|'.join(options)}]"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def compact_output_format(schema: Dict[str, Any], chat: bool = False) -> str:
+    """短い形式の出力の指示（キーの対応表を含む）"""
+    if chat:
+        shape = (
+            '{"p":{<properties>},"r":"<refined text>","m":"<short reply>"}\n'
+            'p: only if the user wants to save data. r, m: optional, omit unless needed.'
+        )
+    else:
+        shape = '{<properties>}'
+    return f"{COMPACT_INSTRUCTION}\n{shape}\nProperty keys:\n{key_legend(schema)}"
+
+
+def expand_properties(data: Any, schema: Dict[str, Any]) -> Dict[str, Any]:
+    """短いキーをプロパティ名に戻します（プロパティ名のまま返された値も受け付けます）"""
+    if not isinstance(data, dict):
+        return {}
+    names = {key: name for name, key in compact_keys(schema).items()}
+    result = {}
+    for key, value in data.items():
+        name = names.get(key, key if key in schema else None)
+        if name is not None:
+            result[name] = value
+    return result
+
+
+def compress_properties(values: Dict[str, Any], schema: Dict[str, Any]) -> Dict[str, Any]:
+    """プロパティ名のキーを短いキーにします（expand_properties の逆変換、テスト・ベンチマーク用）"""
+    keys = compact_keys(schema)
+    return {keys[k]: v for k, v in values.items() if k in keys and v is not None}
+
+
+def expand_chat_response(data: Dict[str, Any], schema: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    短い形式のチャット応答を通常の形に戻します。
+    省略された項目は含めません（"message" が無い場合は呼び出し側で補います）。
+    """
+    if "p" not in data and "m" not in data and "r" not in data:
+        # 短い形式を使わずに返された場合はそのまま
+        return data
+    expanded: Dict[str, Any] = {}
+    if data.get("m"):
+        expanded["message"] = data["m"]
+    expanded["refined_text"] = data.get("r") or None
+    expanded["properties"] = expand_properties(data.get("p"), schema) or None
+    return expanded
+
+
+def max_tokens_for(schema: Dict[str, Any], chat: bool = False) -> int:
+    """出力の上限: 基本量 + プロパティ数 × 1件あたりの量（チャットは応答文の分を加算）"""
+    tokens = COMPACT_BASE_TOKENS + COMPACT_TOKENS_PER_PROPERTY * len(schema_version(schema))
+    if chat:
+        tokens += COMPACT_MESSAGE_TOKENS
+    return tokens
+
+
+@lru_cache(maxsize=256)
+def _compile(version: SchemaVersion, chat: bool) -> Dict[str, Any]:
+    keys = dict(_keys(version))
+    properties = {
+        "type": "object",
+        "properties": {keys[name]: property_schema(p_type, options) for name, p_type, options in version},
+        "additionalProperties": False,
+    }
+    if not chat:
+        return properties
+    return {
+        "type": "object",
+        "properties": {"p": properties, "r": {"type": "string"}, "m": {"type": "string"}},
+        "additionalProperties": False,
+    }
+
+
+def response_format(schema: Optional[Dict[str, Any]], chat: bool = False) -> Optional[Dict[str, Any]]:
+    """
+    短い形式の構造化出力の response_format（api/json_schema.py の response_format と同じ使い方）。
+    省略可能な項目を出力させないため、strict モードは使いません（strict ではすべての項目が必須になる）。
+    """
+    version = schema_version(schema or {})
+    if not version:
+        return None
+    return {
+        "type": "json_schema",
+        "json_schema": {"name": "compact_chat" if chat else "compact_properties",
+                        "schema": _compile(version, chat), "strict": False},
+    }
+
@@ -5,6 +5,7 @@ Notion APIや各種AIプロバイダー（Gemini, OpenAI, Anthropic等）の認
 およびデフォルトモデルの設定を集約しています。
 """
 import os
+import tempfile
 from typing import Optional
 
 # 環境変数の読み込み (Load environment variables)
@@ -21,6 +22,14 @@ except ImportError:
 NOTION_API_KEY = os.getenv("NOTION_API_KEY")
 NOTION_ROOT_PAGE_ID = os.getenv("NOTION_ROOT_PAGE_ID")
 
+# Notion APIへの同時接続数の上限（ワーカープロセスごと）と、起動時に確立しておく接続数
+NOTION_MAX_CONNECTIONS = int(os.getenv("NOTION_MAX_CONNECTIONS", "20"))
+NOTION_WARMUP_CONNECTIONS = int(os.getenv("NOTION_WARMUP_CONNECTIONS", "2"))
+# Notion APIへの送信レート（ワーカーごと、件/秒）と、連続で送れる件数。0 で制限なし
+# Notionの上限は1インテグレーションあたり平均3件/秒のため、ワーカー数に応じて下げてください
+NOTION_RATE_LIMIT = float(os.getenv("NOTION_RATE_LIMIT", "3"))
+NOTION_RATE_BURST = int(os.getenv("NOTION_RATE_BURST", "3"))
+
 # --- AIプロバイダー APIキー (AI Provider API Keys) ---
 # 各種LLMプロバイダーのAPIキー。使用しないプロバイダーは未設定で構いません。
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
@@ -76,6 +85,191 @@ LITELLM_VERBOSE = os.getenv("LITELLM_VERBOSE", "False").lower() == "true" # 詳
 LITELLM_TIMEOUT = int(os.getenv("LITELLM_TIMEOUT", "30")) # タイムアウト時間（秒）
 LITELLM_MAX_RETRIES = int(os.getenv("LITELLM_MAX_RETRIES", "1")) # 最大再試行回数
 
+# --- モデル自動選択設定 (Model Routing Settings) ---
+# "static": 固定の優先順リストで選択 / "adaptive": 実測のレイテンシ・コストで選択
+MODEL_ROUTING_MODE = os.getenv("MODEL_ROUTING_MODE", "static").lower()
+# adaptive モードの候補モデル（カンマ区切り、未設定時はフォールバックリストを使用）
+ROUTING_CANDIDATES = [m.strip() for m in os.getenv("ROUTING_CANDIDATES", "").split(",") if m.strip()]
+# 目標レイテンシ（秒）と1回あたりのコスト上限（USD、0で無制限）
+ROUTING_LATENCY_SLO = float(os.getenv("ROUTING_LATENCY_SLO", "5.0"))
+ROUTING_COST_CEILING = float(os.getenv("ROUTING_COST_CEILING", "0.01"))
+# 実績の少ないモデルを試す確率（0.0〜1.0）
+ROUTING_EXPLORATION_RATE = float(os.getenv("ROUTING_EXPLORATION_RATE", "0.1"))
+# モデル統計の保存先（再起動後も引き継ぐため）
+MODEL_STATS_PATH = os.getenv("MODEL_STATS_PATH", os.path.join(tempfile.gettempdir(), "memo_ai_model_stats.json"))
+
+# --- トレーシング設定 (Tracing Settings) ---
+# 各処理ステージのレイテンシ計測と `/api/metrics` での公開
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "True").lower() == "true"
+# スパンをOTLP JSON形式で書き出すファイルパス（未設定の場合は書き出さない）
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH")
+
+# --- ログ設定 (Logging Settings) ---
+# 全体のログレベル（DEBUG / INFO / WARNING / ERROR）
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+# モジュール別のログレベル（例: "api.notion=DEBUG,api.ai=WARNING"）
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+# 出力形式: "json"（1行1レコード）または "text"（開発向け）
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+# 1メッセージの最大文字数（超過分は切り詰め）
+LOG_MAX_MESSAGE_CHARS = int(os.getenv("LOG_MAX_MESSAGE_CHARS", "2000"))
+# DEBUGレコードの出力割合（0.0〜1.0）
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "1.0"))
+
+# --- Few-shot例の選択設定 (Few-shot Example Retrieval) ---
+# similar: 入力に類似した過去データを選ぶ / recent: 直近に作成されたデータを使う（従来の動作）
+EXAMPLE_RETRIEVAL_MODE = os.getenv("EXAMPLE_RETRIEVAL_MODE", "similar").lower()
+# 索引に保持するデータベースごとの最大ページ数（Notion APIの1回の取得上限は100）
+EXAMPLE_INDEX_SIZE = int(os.getenv("EXAMPLE_INDEX_SIZE", "100"))
+# プロンプトに含める例の最大件数と、例全体の推定トークン数の上限
+EXAMPLE_TOP_K = int(os.getenv("EXAMPLE_TOP_K", "3"))
+EXAMPLE_TOKEN_BUDGET = int(os.getenv("EXAMPLE_TOKEN_BUDGET", "600"))
+# 索引をNotionから作り直す間隔（秒）。この間の新規ページは差分で追加されます
+EXAMPLE_INDEX_TTL = int(os.getenv("EXAMPLE_INDEX_TTL", "3600"))
+
+# --- 全文検索設定 (Full-text Search) ---
+# 検索索引（SQLite FTS5）の保存先
+SEARCH_INDEX_PATH = os.getenv("SEARCH_INDEX_PATH", os.path.join(tempfile.gettempdir(), "memo_ai_search.sqlite3"))
+# 検索時にNotionから差分を取り込む最小間隔（秒）
+SEARCH_SYNC_INTERVAL = float(os.getenv("SEARCH_SYNC_INTERVAL", "60"))
+# 全件を取得し直し、削除・アーカイブされたページを索引から取り除く間隔（秒）
+SEARCH_RECONCILE_INTERVAL = float(os.getenv("SEARCH_RECONCILE_INTERVAL", "3600"))
+
+# --- サーバー設定 (Server Settings) ---
+# フロントエンドにデバッグ用UI（モデル選択など）を表示するか
+DEBUG_MODE = os.getenv("DEBUG_MODE", "False").lower() == "true"
+# `python -m api.server` で起動するワーカープロセス数（未設定の場合はCPUコア数）
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "0")) or (os.cpu_count() or 1)
+# SIGTERM 受信後、処理中のリクエストの完了を待つ最大秒数
+GRACEFUL_TIMEOUT = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+# SIGTERM 受信後、/api/ready を 503 にしたまま受け付けを続ける秒数（ロードバランサーの切り離し待ち）
+DRAIN_DELAY = float(os.getenv("DRAIN_DELAY", "0"))
+# X-Forwarded-For を信頼するプロキシのアドレス（カンマ区切り、CIDR可、"*" は直前のプロキシを常に信頼）
+TRUSTED_PROXIES = os.getenv("TRUSTED_PROXIES", "127.0.0.1")
+
+# --- 重複保存の防止設定 (Idempotency) ---
+# 同じ内容の保存を「重複」とみなす期間（秒）。0 で無効
+IDEMPOTENCY_WINDOW = float(os.getenv("IDEMPOTENCY_WINDOW", "60"))
+# 保存結果を記録するSQLiteファイル（ワーカー間で共有）。空文字の場合はメモリのみ
+IDEMPOTENCY_STORE_PATH = os.getenv(
+    "IDEMPOTENCY_STORE_PATH", os.path.join(tempfile.gettempdir(), "memo_ai_idempotency.sqlite3")
+)
+
+# --- ターゲット情報のキャッシュ設定 (Target Cache) ---
+# ターゲット選択時に先読みしたスキーマ・システムメッセージ・参照用コンテンツを保持する秒数（0 で無効）
+TARGET_CACHE_TTL = float(os.getenv("TARGET_CACHE_TTL", "300"))
+
+# --- ページ参照の設定 (Reference Context) ---
+# 「ページを参照」でプロンプトに含める内容の上限（トークン数の概算）と、子ブロックをたどる階層数
+REFERENCE_TOKEN_BUDGET = int(os.getenv("REFERENCE_TOKEN_BUDGET", "2000"))
+REFERENCE_MAX_DEPTH = int(os.getenv("REFERENCE_MAX_DEPTH", "2"))
+# 抽出したページ本文を保持する件数
+REFERENCE_CACHE_SIZE = int(os.getenv("REFERENCE_CACHE_SIZE", "64"))
+
+# --- 利用量・予算設定 (Usage Ledger & Budgets) ---
+# LLMの使用量（トークン数・コスト）を記録するSQLiteファイル（ワーカー間で共有）。空文字の場合はメモリのみ
+LEDGER_PATH = os.getenv("LEDGER_PATH", os.path.join(tempfile.gettempdir(), "memo_ai_ledger.sqlite3"))
+# 予算の上限額（USD、UTCの日・月単位）。0 で無制限
+LLM_DAILY_BUDGET_USD = float(os.getenv("LLM_DAILY_BUDGET_USD", "0"))
+LLM_MONTHLY_BUDGET_USD = float(os.getenv("LLM_MONTHLY_BUDGET_USD", "0"))
+# 保存先（ターゲット）ごと・クライアント（IPアドレス）ごとの1日の上限額
+TARGET_DAILY_BUDGET_USD = float(os.getenv("TARGET_DAILY_BUDGET_USD", "0"))
+CLIENT_DAILY_BUDGET_USD = float(os.getenv("CLIENT_DAILY_BUDGET_USD", "0"))
+# 使用額がこの割合を超えたら、より安いモデルに切り替える
+BUDGET_DOWNGRADE_RATIO = float(os.getenv("BUDGET_DOWNGRADE_RATIO", "0.8"))
+# --- ルールによる抽出の設定 (Fast Path) ---
+# 短いメモをルールで解釈できた場合はLLMを呼ばない（api/fastpath.py）
+FASTPATH_ENABLED = os.getenv("FASTPATH_ENABLED", "true").lower() == "true"
+# ルールで扱う入力の最大文字数と、「明日」などの相対日付を解決するタイムゾーン
+FASTPATH_MAX_CHARS = int(os.getenv("FASTPATH_MAX_CHARS", "40"))
+FASTPATH_TIMEZONE = os.getenv("FASTPATH_TIMEZONE", "Asia/Tokyo")
+
+# --- 構造化出力の設定 (Structured Output) ---
+# 対応モデルでは、Notionのスキーマから生成したJSON Schemaで出力の形を指定する（api/json_schema.py）
+STRUCTURED_OUTPUT_ENABLED = os.getenv("STRUCTURED_OUTPUT_ENABLED", "true").lower() == "true"
+
+# --- 出力トークンの削減設定 (Compact Output) ---
+# 抽出の応答を短いキーの形式で返させ、出力の上限（max_tokens）を設ける（api/compact.py）
+COMPACT_OUTPUT_ENABLED = os.getenv("COMPACT_OUTPUT_ENABLED", "false").lower() == "true"
+# 出力の上限 = 基本量 + プロパティ数 × 1件あたりの量（チャットは応答文の分を加算）
+COMPACT_BASE_TOKENS = int(os.getenv("COMPACT_BASE_TOKENS", "32"))
+COMPACT_TOKENS_PER_PROPERTY = int(os.getenv("COMPACT_TOKENS_PER_PROPERTY", "24"))
+COMPACT_MESSAGE_TOKENS = int(os.getenv("COMPACT_MESSAGE_TOKENS", "64"))
+
+# --- 保存先の自動選択の設定 (Target Routing) ---
+# メモの内容から保存先のデータベースを推定する分類器（api/target_router.py、/api/route）
+ROUTER_ENABLED = os.getenv("ROUTER_ENABLED", "true").lower() == "true"
+# 学習に使うデータベースごとのページ数（Notion APIの上限は100）と、全体を学習し直す間隔（秒）
+ROUTER_PAGES_PER_TARGET = int(os.getenv("ROUTER_PAGES_PER_TARGET", "100"))
+ROUTER_RETRAIN_INTERVAL = float(os.getenv("ROUTER_RETRAIN_INTERVAL", "3600"))
+# 推定した保存先を先読みする確率のしきい値
+ROUTER_MIN_CONFIDENCE = float(os.getenv("ROUTER_MIN_CONFIDENCE", "0.6"))
+# 学習の反復回数と学習率
+ROUTER_EPOCHS = int(os.getenv("ROUTER_EPOCHS", "100"))
+ROUTER_LEARNING_RATE = float(os.getenv("ROUTER_LEARNING_RATE", "2.0"))
+
+# --- 複数件の抽出の設定 (Multi-item Extraction) ---
+# 1回の抽出（/api/extract）と一括保存（/api/save/batch）で扱う最大件数
+EXTRACT_MAX_ITEMS = int(os.getenv("EXTRACT_MAX_ITEMS", "20"))
+
+# --- イベントループの監視設定 (Event Loop Monitor) ---
+# イベントループの遅れ（ラグ）を計測し、threshold 秒以上止まった場合は原因のスタックを記録する（api/loop_monitor.py）
+LOOP_MONITOR_ENABLED = os.getenv("LOOP_MONITOR_ENABLED", "true").lower() == "true"
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.1"))
+LOOP_LAG_THRESHOLD = float(os.getenv("LOOP_LAG_THRESHOLD", "0.1"))
+# CPU処理を実行するスレッドプールの大きさ（ワーカーごと）と、スレッドで実行する入力の最小サイズ（文字数）
+CPU_POOL_WORKERS = int(os.getenv("CPU_POOL_WORKERS", "4"))
+OFFLOAD_MIN_SIZE = int(os.getenv("OFFLOAD_MIN_SIZE", "20000"))
+
+# --- LLMプロバイダーへの接続の設定 (Provider Transport) ---
+# プロバイダー（Gemini / OpenAI / Anthropic）ごとに共有するHTTP接続の設定（api/transport.py）
+LLM_TRANSPORT_ENABLED = os.getenv("LLM_TRANSPORT_ENABLED", "true").lower() == "true"
+# HTTP/2 を使うか（h2 パッケージがインストールされている場合のみ有効）
+LLM_HTTP2 = os.getenv("LLM_HTTP2", "true").lower() == "true"
+# プロバイダーごとの最大接続数と、使われていない接続を保持する秒数
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "120"))
+# 接続を保つための定期的な通信の間隔（秒、0で無効）と、実行する時間帯（時、開始-終了）・平日のみか
+LLM_KEEPWARM_INTERVAL = float(os.getenv("LLM_KEEPWARM_INTERVAL", "0"))
+LLM_KEEPWARM_HOURS = os.getenv("LLM_KEEPWARM_HOURS", "9-18")
+LLM_KEEPWARM_WEEKDAYS_ONLY = os.getenv("LLM_KEEPWARM_WEEKDAYS_ONLY", "true").lower() == "true"
+LLM_KEEPWARM_TIMEZONE = os.getenv("LLM_KEEPWARM_TIMEZONE", FASTPATH_TIMEZONE)
+
+# --- Notion Webhook の設定 (Notion Webhooks) ---
+# Notionのサブスクリプションの検証トークン（署名の検証に使用）。未設定の場合はイベントを受け付けない
+NOTION_WEBHOOK_SECRET = os.getenv("NOTION_WEBHOOK_SECRET", "")
+# 受け取ったイベントを各ワーカーに伝えるSQLiteファイル（ワーカー間で共有）。空文字の場合はメモリのみ
+WEBHOOK_STORE_PATH = os.getenv("WEBHOOK_STORE_PATH", os.path.join(tempfile.gettempdir(), "memo_ai_webhooks.sqlite3"))
+# キャッシュの破棄をまとめて反映する間隔（秒）。この間の同じ対象へのイベントは1回の破棄・同期にまとめる
+WEBHOOK_APPLY_INTERVAL = float(os.getenv("WEBHOOK_APPLY_INTERVAL", "2"))
+# 反映済みのイベントを保持する秒数
+WEBHOOK_RETENTION = float(os.getenv("WEBHOOK_RETENTION", "3600"))
+
+# --- チャットセッションの設定 (Chat Sessions) ---
+# 会話履歴をサーバー側で保持する秒数（最後の発言から）
+SESSION_TTL = float(os.getenv("SESSION_TTL", "86400"))
+# 会話履歴を保存するSQLiteファイル（ワーカー間で共有）。空文字の場合はメモリのみ
+SESSION_STORE_PATH = os.getenv("SESSION_STORE_PATH", os.path.join(tempfile.gettempdir(), "memo_ai_sessions.sqlite3"))
+# メモリに保持するセッション数と、1セッションに保存するメッセージ数
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "256"))
+SESSION_MAX_MESSAGES = int(os.getenv("SESSION_MAX_MESSAGES", "50"))
+# AIに送る直近の履歴の件数
+SESSION_HISTORY_LIMIT = int(os.getenv("SESSION_HISTORY_LIMIT", "10"))
+
+# --- バックグラウンド更新の設定 (Background Scheduler) ---
+# キャッシュを定期的に更新するスケジューラーを各ワーカーで起動するか（サーバーレス環境では false）
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "true").lower() == "true"
+# 同時に実行するジョブの数
+SCHEDULER_MAX_CONCURRENCY = int(os.getenv("SCHEDULER_MAX_CONCURRENCY", "2"))
+# ターゲット一覧の更新間隔（秒）
+TARGETS_REFRESH_INTERVAL = float(os.getenv("TARGETS_REFRESH_INTERVAL", "60"))
+# 最近使われたターゲットのスキーマを再検証する間隔（秒）と、「最近」とみなす期間（秒）
+SCHEMA_REFRESH_INTERVAL = float(os.getenv("SCHEMA_REFRESH_INTERVAL", "120"))
+SCHEMA_REFRESH_WINDOW = float(os.getenv("SCHEMA_REFRESH_WINDOW", "1800"))
+# モデル情報・認証情報の変更を確認する間隔（秒）
+MODEL_REGISTRY_CHECK_INTERVAL = float(os.getenv("MODEL_REGISTRY_CHECK_INTERVAL", "600"))
+
+
 def get_api_key_for_provider(provider: str) -> Optional[str]:
     """
     指定されたプロバイダーに対応するAPIキーまたは認証情報パスを返します。
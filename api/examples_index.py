@@ -0,0 +1,251 @@
+"""
+Few-shot Example Index
+プロンプトに含める過去データ例（Few-shot）を、入力テキストとの類似度で選ぶモジュールです。
+
+以前は「直近に作成された3件」を無条件に使っていたため、入力と無関係な例で
+トークンを消費していました。ここではデータベースごとに小さな索引を持ち、
+入力に似た過去データを上位から、トークン予算の範囲内で選びます。
+
+- ベクトル化: 文字 n-gram（2〜3文字）をハッシュで固定次元に落とした TF-IDF。
+  日本語でも形態素解析なしで動作し、GPUや外部モデルは不要です。
+- 保存: NumPy 配列（ページ数 × 次元）。IDFは検索時に文書頻度から計算するため、
+  ページの追加は行を1つ足すだけで済みます（差分更新）。
+- 更新: create_page の成功時に、構築済みの索引へ新しいページを追加します。
+"""
+import json
+import math
+import time
+import zlib
+import asyncio
+import unicodedata
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+from api.config import (
+    EXAMPLE_RETRIEVAL_MODE,
+    EXAMPLE_INDEX_SIZE,
+    EXAMPLE_TOP_K,
+    EXAMPLE_TOKEN_BUDGET,
+    EXAMPLE_INDEX_TTL,
+)
+from api.notion import fetch_recent_pages, on_page_created
+from api.serializers import simplify_properties
+from api.tracing import span
+from api.logger import get_logger
+
+logger = get_logger(__name__)
+
+# ハッシュ空間の次元数（100ページ × 4096次元 × float32 ≒ 1.6MB / DB）
+N_FEATURES = 4096
+# 使用する文字 n-gram の長さ
+NGRAM_SIZES = (2, 3)
+
+
+def normalize_text(text: str) -> str:
+    """全角・半角や大文字・小文字の違いを吸収し、空白を1つにまとめます"""
+    return " ".join(unicodedata.normalize("NFKC", text).lower().split())
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    トークン数の概算（英数字は約4文字で1トークン、日本語などは1文字1トークン）
+
+    トークナイザーを読み込まずに予算判定するための保守的な見積もりです。
+    """
+    ascii_chars = sum(1 for c in text if ord(c) < 128)
+    return math.ceil(ascii_chars / 4 + (len(text) - ascii_chars))
+
+
+def vectorize(text: str) -> np.ndarray:
+    """
+    テキストを文字 n-gram の出現頻度ベクトル（対数スケール）に変換します。
+
+    ハッシュには実行ごとに値が変わる hash() ではなく crc32 を使用します。
+    """
+    vec = np.zeros(N_FEATURES, dtype=np.float32)
+    text = normalize_text(text)
+    for n in NGRAM_SIZES:
+        for i in range(len(text) - n + 1):
+            gram = text[i:i + n]
+            if gram.isspace():
+                continue
+            vec[zlib.crc32(gram.encode("utf-8")) % N_FEATURES] += 1.0
+    if len(text) < min(NGRAM_SIZES):
+        # 1文字だけの入力でも検索できるようにする
+        for ch in text:
+            vec[zlib.crc32(ch.encode("utf-8")) % N_FEATURES] += 1.0
+    np.log1p(vec, out=vec)
+    return vec
+
+
+def document_text(simple_props: Dict[str, Any]) -> str:
+    # プロパティ名は全ページ共通なので、値だけを索引の対象にする
+    parts = []
+    for v in simple_props.values():
+        if isinstance(v, list):
+            parts.extend(str(x) for x in v if x)
+        elif v not in (None, "", "N/A"):
+            parts.append(str(v))
+    return " ".join(parts)
+
+
+def _dumps_example(simple_props: Dict[str, Any]) -> str:
+    # construct_prompt がプロンプトに埋め込む形式と同じ文字列でトークン数を見積もる
+    return f"- {json.dumps(simple_props, ensure_ascii=False)}"
+
+
+class ExampleIndex:
+    """
+    1データベース分の例の索引
+
+    entries と行列は max_size 件のリングバッファで、満杯になると最も古い行の位置に上書きします
+    （追加のたびに行列全体をずらさないため）。新しさは行ごとの追加順の番号（_seq）で判定します。
+    """
+
+    def __init__(self, max_size: int = EXAMPLE_INDEX_SIZE):
+        self.max_size = max(1, max_size)
+        self.entries: List[Tuple[Dict[str, Any], int, Optional[str]]] = []  # (プロパティ, 推定トークン数, ページID)
+        self.page_ids: set = set()
+        self._tf = np.zeros((self.max_size, N_FEATURES), dtype=np.float32)
+        self._df = np.zeros(N_FEATURES, dtype=np.int32)
+        self._seq = np.zeros(self.max_size, dtype=np.int64)
+        self._added = 0
+        self.built_at = time.time()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def add(self, properties: Dict[str, Any], page_id: Optional[str] = None) -> bool:
+        """ページを索引に追加します（索引にある同じページIDは重複して追加しません）"""
+        if page_id:
+            if page_id in self.page_ids:
+                return False
+            self.page_ids.add(page_id)
+
+        simple_props = simplify_properties(properties)
+        line = _dumps_example(simple_props)
+        row = vectorize(document_text(simple_props))
+        entry = (properties, estimate_tokens(line), page_id)
+
+        slot = self._added % self.max_size
+        if len(self.entries) < self.max_size:
+            self.entries.append(entry)
+        else:
+            # 最も古い行を取り除き、文書頻度とページIDの一覧からも差し引く
+            self._df -= (self._tf[slot] > 0)
+            evicted = self.entries[slot][2]
+            if evicted:
+                self.page_ids.discard(evicted)
+            self.entries[slot] = entry
+        self._tf[slot] = row
+        self._df += (row > 0)
+        self._seq[slot] = self._added
+        self._added += 1
+        return True
+
+    def search(self, text: str, k: int = EXAMPLE_TOP_K,
+               token_budget: int = EXAMPLE_TOKEN_BUDGET) -> List[Dict[str, Any]]:
+        """
+        入力テキストに類似した例を最大 k 件、推定トークン数の合計が予算内に収まるように返します。
+
+        類似度が同じ場合（入力と共通する語が無い場合を含む）は新しいページを優先するため、
+        類似する例が無い場合は従来の「直近のページ」と同じ結果になります。
+        """
+        n = len(self.entries)
+        if n == 0 or k <= 0:
+            return []
+
+        idf = np.log((1.0 + n) / (1.0 + self._df)) + 1.0
+        docs = self._tf[:n] * idf
+        query = vectorize(text) * idf
+        denom = np.linalg.norm(docs, axis=1) * np.linalg.norm(query)
+        scores = np.divide(docs @ query, denom, out=np.zeros(n, dtype=np.float32), where=denom > 0)
+
+        # 第1キー: 類似度の降順 / 第2キー: 新しい順
+        order = np.lexsort((-self._seq[:n], -scores))
+
+        selected, used = [], 0
+        for i in order:
+            properties, tokens, _ = self.entries[i]
+            if used + tokens > token_budget:
+                continue
+            selected.append(properties)
+            used += tokens
+            if len(selected) >= k:
+                break
+        return selected
+
+
+class ExampleIndexRegistry:
+    """データベースIDごとの索引を管理し、必要に応じてNotionから構築します"""
+
+    def __init__(self, max_size: int = EXAMPLE_INDEX_SIZE, ttl: float = EXAMPLE_INDEX_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._indexes: Dict[str, ExampleIndex] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    def get(self, database_id: str) -> Optional[ExampleIndex]:
+        return self._indexes.get(database_id)
+
+    def build(self, database_id: str, pages: List[Dict[str, Any]]) -> ExampleIndex:
+        """プロパティ辞書のリスト（新しい順）から索引を作成して登録します"""
+        index = ExampleIndex(self.max_size)
+        for properties in reversed(pages):
+            index.add(properties)
+        self._indexes[database_id] = index
+        return index
+
+    async def ensure(self, database_id: str) -> ExampleIndex:
+        """索引が無いか古い場合はNotionから構築します（同時要求は1回の取得にまとめます）"""
+        index = self._indexes.get(database_id)
+        if index is not None and time.time() - index.built_at < self.ttl:
+            return index
+
+        lock = self._locks.setdefault(database_id, asyncio.Lock())
+        async with lock:
+            index = self._indexes.get(database_id)
+            if index is not None and time.time() - index.built_at < self.ttl:
+                return index
+            with span("examples.build"):
+                pages = await fetch_recent_pages(database_id, limit=min(self.max_size, 100))
+                index = self.build(database_id, pages)
+            logger.info("[Examples] Indexed %d pages for %s", len(index), database_id)
+            return index
+
+    def on_page_created(self, database_id: str, properties: Dict[str, Any], page: Dict[str, Any]) -> None:
+        """create_page のフック: 構築済みの索引にだけ追加します（未構築なら次回の構築に含まれます）"""
+        index = self._indexes.get(database_id)
+        if index is not None:
+            index.add(properties, page.get("id"))
+
+    def invalidate(self, database_id: Optional[str] = None) -> None:
+        if database_id is None:
+            self._indexes.clear()
+        else:
+            self._indexes.pop(database_id, None)
+
+
+# グローバルインスタンス
+example_indexes = ExampleIndexRegistry()
+on_page_created(example_indexes.on_page_created)
+
+
+async def get_examples(
+    database_id: str,
+    text: str,
+    k: int = EXAMPLE_TOP_K,
+    token_budget: int = EXAMPLE_TOKEN_BUDGET
+) -> List[Dict[str, Any]]:
+    """
+    プロンプト用のFew-shot例を取得します（construct_prompt の recent_examples にそのまま渡せます）。
+
+    EXAMPLE_RETRIEVAL_MODE=recent の場合は従来どおり直近のページを返します。
+    """
+    if EXAMPLE_RETRIEVAL_MODE == "recent":
+        return await fetch_recent_pages(database_id, limit=k)
+
+    index = await example_indexes.ensure(database_id)
+    with span("examples.search"):
+        return index.search(text, k=k, token_budget=token_budget)
@@ -0,0 +1,353 @@
+"""
+Database Export
+対象データベースの全ページを NDJSON / CSV / Parquet で書き出すモジュールです（/api/export と CLI）。
+
+query_database は直近20件しか返さないため、分析用にデータベース全体を取り出す方法がありませんでした。
+ここでは iter_database_batches でNotionのページングを順にたどり、1バッチ（最大100件）ずつ変換して
+書き出すため、データベースの大きさに関係なくメモリの使用量は一定です。
+
+- 行の形式: プロパティは Few-shot例と同じ simplify_properties で単純な値にします。
+  メタデータとして _id（ページID）・_last_edited_time・_cursor（再開用の位置）の列を加えます。
+- 再開: 行の _cursor を cursor に指定すると、その行の次から書き出しを再開します
+  （Notionのカーソルと、バッチ内の位置の組）。同じ since で呼び出してください。
+- 差分: since を指定すると、その日時以降に更新されたページだけを書き出します（last_edited_time）。
+  Notionの更新日時は分単位のため、境界の分のページは再度含まれることがあります（_id で上書きしてください）。
+- Parquet は pyarrow がある場合のみ使えます。バッチごとに1つの行グループとして書き出します。
+
+CLI（再開・差分の状態は <output>.state.json に保存します）:
+    python -m api.export <database_id> --format csv --output tasks.csv
+    python -m api.export <database_id> --format csv --output tasks.csv --resume
+    python -m api.export <database_id> --format ndjson --output changes.ndjson --incremental --state tasks.state.json
+"""
+import io
+import os
+import csv
+import sys
+import json
+import asyncio
+import argparse
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from api.notion import get_db_schema, iter_database_batches, close_client
+from api.serializers import simplify_properties, display_value, dumps_bytes
+from api.tracing import span, metrics
+from api.logger import get_logger
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+logger = get_logger(__name__)
+
+# 形式 → (Content-Type, 拡張子)
+FORMATS = {
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+# すべての行に加えるメタデータの列
+META_COLUMNS = ("_id", "_last_edited_time", "_cursor")
+
+
+def make_cursor(batch_cursor: Optional[str], index: int) -> str:
+    """行の再開位置: 「Notionのカーソル:バッチ内の位置」（最初のバッチのカーソルは空）"""
+    return f"{batch_cursor or ''}:{index}"
+
+
+def parse_cursor(cursor: str) -> Tuple[Optional[str], int]:
+    """make_cursor の逆変換。形式が正しくない場合は ValueError"""
+    batch_cursor, sep, index = cursor.rpartition(":")
+    if not sep or not index.isdigit():
+        raise ValueError(f"cursor の形式が正しくありません: {cursor}")
+    return batch_cursor or None, int(index)
+
+
+def flatten_page(page: Dict[str, Any]) -> Dict[str, Any]:
+    """ページを1行にします（登録に対応していない型の値は None）"""
+    values = simplify_properties(page.get("properties", {}))
+    row = {"_id": page.get("id"), "_last_edited_time": page.get("last_edited_time")}
+    row.update({k: None if v == "N/A" else v for k, v in values.items()})
+    return row
+
+
+class NdjsonEncoder:
+    """1行を1つのJSONにします"""
+
+    def encode(self, rows: List[Dict[str, Any]]) -> bytes:
+        return b"".join(dumps_bytes(row) + b"\n" for row in rows)
+
+    def close(self) -> bytes:
+        return b""
+
+
+class CsvEncoder:
+    """スキーマのプロパティを列にします（複数選択はカンマ区切り）"""
+
+    def __init__(self, columns: List[str], header: bool = True):
+        self.columns = [*META_COLUMNS, *columns]
+        self._header = header
+
+    def encode(self, rows: List[Dict[str, Any]]) -> bytes:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if self._header:
+            writer.writerow(self.columns)
+            self._header = False
+        for row in rows:
+            writer.writerow([display_value(row.get(c)) for c in self.columns])
+        return buffer.getvalue().encode("utf-8")
+
+    def close(self) -> bytes:
+        return b""
+
+
+class _Sink(io.RawIOBase):
+    """ParquetWriter の出力を受け取り、書き出し済みのバイト列を取り出せるようにするバッファ"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class ParquetEncoder:
+    """バッチごとに1つの行グループを書き出します（ファイルの末尾の情報は close で書き出します）"""
+
+    def __init__(self, schema: Dict[str, Any]):
+        if pa is None:
+            raise ValueError("Parquet の出力には pyarrow が必要です")
+        fields = [pa.field(c, pa.string()) for c in META_COLUMNS]
+        for name, prop in schema.items():
+            p_type = prop.get("type") if isinstance(prop, dict) else None
+            if p_type == "number":
+                fields.append(pa.field(name, pa.float64()))
+            elif p_type == "checkbox":
+                fields.append(pa.field(name, pa.bool_()))
+            elif p_type == "multi_select":
+                fields.append(pa.field(name, pa.list_(pa.string())))
+            else:
+                fields.append(pa.field(name, pa.string()))
+        self.schema = pa.schema(fields)
+        self._sink = _Sink()
+        self._writer = pq.ParquetWriter(self._sink, self.schema)
+
+    def encode(self, rows: List[Dict[str, Any]]) -> bytes:
+        if rows:
+            self._writer.write_table(pa.Table.from_pylist(rows, schema=self.schema))
+        return self._sink.drain()
+
+    def close(self) -> bytes:
+        self._writer.close()
+        return self._sink.drain()
+
+
+class DatabaseExport:
+    """1つのデータベースの書き出し"""
+
+    def __init__(
+        self,
+        database_id: str,
+        fmt: str = "ndjson",
+        since: Optional[str] = None,
+        cursor: Optional[str] = None,
+        header: bool = True
+    ):
+        """
+        Args:
+            fmt: "ndjson" / "csv" / "parquet"
+            since: この日時（ISO 8601）以降に更新されたページだけを書き出す（差分）
+            cursor: 再開位置（書き出した行の _cursor）。この行の次から書き出す
+            header: CSVのヘッダー行を書き出すか（途中から再開したファイルに追記する場合は False）
+        """
+        if fmt not in FORMATS:
+            raise ValueError(f"不明な形式です: {fmt}")
+        self.database_id = database_id
+        self.fmt = fmt
+        self.since = since
+        self.start_cursor, self.skip = parse_cursor(cursor) if cursor else (None, -1)
+        self.header = header
+        self.encoder = None
+
+    async def prepare(self) -> None:
+        """
+        スキーマを取得して出力の準備をします（書き出しを始める前にエラーを返すため）。
+
+        Raises:
+            ValueError: データベースでない場合、Parquet に必要な pyarrow が無い場合
+        """
+        schema = await get_db_schema(self.database_id)
+        if self.fmt == "ndjson":
+            self.encoder = NdjsonEncoder()
+        elif self.fmt == "csv":
+            self.encoder = CsvEncoder(list(schema), header=self.header)
+        else:
+            self.encoder = ParquetEncoder(schema)
+
+    async def chunks(self) -> AsyncIterator[Tuple[bytes, Optional[str], int, Optional[str]]]:
+        """
+        バッチごとの出力を返します。
+
+        Yields:
+            (data, cursor, rows, last_edited_time): 出力のバイト列、最後の行の _cursor、行数、
+            最後の行の更新日時（昇順のため、ここまでの最大値）。ファイルの末尾の出力は rows が 0
+        """
+        if self.encoder is None:
+            await self.prepare()
+        first = True
+        total = 0
+        with span("export.database", format=self.fmt, mode="incremental" if self.since else "full"):
+            async for batch_cursor, pages in iter_database_batches(
+                self.database_id, edited_since=self.since, start_cursor=self.start_cursor
+            ):
+                rows = []
+                for index, page in enumerate(pages):
+                    if first and index <= self.skip:
+                        continue
+                    row = flatten_page(page)
+                    row["_cursor"] = make_cursor(batch_cursor, index)
+                    rows.append(row)
+                first = False
+                if not rows:
+                    continue
+                total += len(rows)
+                metrics.incr("memo_ai_export_rows_total", len(rows), format=self.fmt)
+                yield self.encoder.encode(rows), rows[-1]["_cursor"], len(rows), rows[-1]["_last_edited_time"]
+            tail = self.encoder.close()
+            if tail:
+                yield tail, None, 0, None
+        logger.info("[Export] Exported %d rows from %s as %s", total, self.database_id, self.fmt)
+
+    async def stream(self) -> AsyncIterator[bytes]:
+        """StreamingResponse 用: 出力のバイト列だけを返します"""
+        async for data, _, _, _ in self.chunks():
+            yield data
+
+
+# --- CLI ---
+
+def _load_state(path: str) -> Dict[str, Any]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def _save_state(path: str, state: Dict[str, Any]) -> None:
+    # 書き込み中に中断されても前回の状態が残るよう、一時ファイルから置き換える
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+async def export_to_file(
+    database_id: str,
+    fmt: str,
+    output: str,
+    state_path: Optional[str] = None,
+    resume: bool = False,
+    incremental: bool = False
+) -> Dict[str, Any]:
+    """
+    データベースをファイルに書き出し、バッチごとに再開用の状態を state_path に保存します。
+
+    Args:
+        resume: 中断された書き出しを、最後に保存したバッチの次から再開する（NDJSON / CSV のみ）
+        incremental: 前回完了した書き出しの最終更新日時（watermark）以降に更新されたページだけを書き出す
+
+    Returns:
+        保存した最終の状態
+    """
+    state_path = state_path or f"{output}.state.json"
+    state = _load_state(state_path)
+    since = cursor = None
+    offset = rows = 0
+    latest = state.get("watermark")
+    if resume:
+        if state.get("complete", True) or not state.get("cursor"):
+            raise ValueError("再開できる中断された書き出しがありません")
+        if fmt == "parquet":
+            raise ValueError("Parquet はファイルの末尾の情報が無いと読めないため、再開できません")
+        since, cursor, offset, rows = state.get("since"), state["cursor"], state["offset"], state["rows"]
+        latest = state.get("latest") or latest
+    elif incremental:
+        since = state.get("watermark")
+
+    exporter = DatabaseExport(database_id, fmt, since=since, cursor=cursor, header=not resume)
+    await exporter.prepare()
+    base = {"database_id": database_id, "format": fmt, "output": output, "since": since}
+    with open(output, "r+b" if resume else "wb") as f:
+        # 最後に保存したバッチより後に書かれた（不完全かもしれない）部分を捨てる
+        f.truncate(offset)
+        f.seek(offset)
+        async for data, last_cursor, count, edited in exporter.chunks():
+            f.write(data)
+            f.flush()
+            rows += count
+            latest = edited or latest
+            if last_cursor:
+                _save_state(state_path, {
+                    **base, "complete": False, "cursor": last_cursor, "offset": f.tell(),
+                    "rows": rows, "latest": latest, "watermark": state.get("watermark"),
+                })
+    final = {**base, "complete": True, "rows": rows, "watermark": latest}
+    _save_state(state_path, final)
+    return final
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Export a Notion database to NDJSON / CSV / Parquet")
+    parser.add_argument("database_id")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="ndjson")
+    parser.add_argument("--output", required=True, help="出力ファイル")
+    parser.add_argument("--state", help="再開・差分の状態ファイル（デフォルト: <output>.state.json）")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--resume", action="store_true", help="中断された書き出しを再開する")
+    mode.add_argument("--incremental", action="store_true",
+                      help="前回の書き出し以降に更新されたページだけを書き出す")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+
+    async def run() -> Dict[str, Any]:
+        try:
+            return await export_to_file(
+                args.database_id, args.format, args.output,
+                state_path=args.state, resume=args.resume, incremental=args.incremental
+            )
+        finally:
+            await close_client()
+
+    try:
+        state = asyncio.run(run())
+    except ValueError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    print(f"Exported {state['rows']} rows to {args.output} (watermark={state['watermark']})", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
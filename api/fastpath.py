@@ -0,0 +1,336 @@
+"""
+Fast Path Extraction
+短いメモからNotionのプロパティをルールで抽出し、LLMを呼ばずに済ませるモジュールです。
+
+「明日10時 会議」のような定型的な一行メモは、次のルールだけで十分に解釈できます。
+
+- 日付・時刻: 今日 / 明日 / 明後日 / 来週金曜 / 3日後 / 12月5日 / 10時半 / 15:30 / tomorrow / 3pm など
+  （FASTPATH_TIMEZONE の現在時刻を基準に解決します）
+- チェックボックス: 「完了」「済」「[x]」などの印、またはチェックボックスのプロパティ名そのもの
+- select / multi_select / status: スキーマの選択肢名と完全に一致する語（空白区切り、または #タグ）
+
+残った部分をタイトルとし、入力全体を説明できた場合（確信度が高い場合）は
+analyze_text_with_ai がこの結果をそのまま返します。そうでない場合は、抽出できた部分を
+プロンプトに添えてLLMに渡します。結果は memo_ai_fastpath_total{outcome} で計測します。
+"""
+import re
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from api.config import FASTPATH_MAX_CHARS, FASTPATH_TIMEZONE
+from api.tracing import metrics
+
+_TZ = ZoneInfo(FASTPATH_TIMEZONE)
+
+# 日付・時刻の後に続く助詞（「明日の会議」「10時に会議」）も合わせて取り除く
+_PARTICLE = r"(?:までに|から|まで|に|の|は)?"
+
+_WEEKDAYS_JA = {"月": 0, "火": 1, "水": 2, "木": 3, "金": 4, "土": 5, "日": 6}
+_WEEKDAYS_EN = {
+    "monday": 0, "mon": 0, "tuesday": 1, "tue": 1, "wednesday": 2, "wed": 2,
+    "thursday": 3, "thu": 3, "friday": 4, "fri": 4, "saturday": 5, "sat": 5, "sunday": 6, "sun": 6,
+}
+# 3文字の略記（sun, sat など）は普通の単語と重なるため、"next sat" / "on sun" のような前置きがある場合だけ日付とみなす
+_WEEKDAY_ABBREVIATIONS = {name for name in _WEEKDAYS_EN if len(name) == 3}
+# 「1/2 カップ」「3/4 cup」のような分量の後に続く単位
+_QUANTITY_UNIT = (
+    r"(?!\s*(?:カップ|杯|個|本|枚|切れ|人前|人分|袋|箱|缶|倍|ずつ|程度|%"
+    r"|(?:cups?|tsp|tbsp|g|kg|mg|ml|l|oz|lbs?|inch(?:es)?|miles?|km|m)\b))"
+)
+_RELATIVE_DAYS = {
+    "一昨日": -2, "おととい": -2, "昨日": -1, "きのう": -1, "今日": 0, "きょう": 0, "本日": 0,
+    "明日": 1, "あした": 1, "あす": 1, "明後日": 2, "あさって": 2,
+    "yesterday": -1, "today": 0, "tomorrow": 1,
+}
+
+_DATE_PATTERNS = [
+    ("iso", re.compile(r"(?<!\d)(\d{4})[-/](\d{1,2})[-/](\d{1,2})(?!\d)" + _PARTICLE)),
+    ("month_day", re.compile(r"(?<!\d)(\d{1,2})月(\d{1,2})日" + _PARTICLE)),
+    ("slash", re.compile(r"(?<![\d/.])(1[0-2]|0?[1-9])/(3[01]|[12]\d|0?[1-9])(?![\d/.])" + _QUANTITY_UNIT + _PARTICLE,
+                         re.IGNORECASE)),
+    ("days_later", re.compile(r"(\d+)\s*(日|週間)後" + _PARTICLE)),
+    ("in_days", re.compile(r"\bin (\d+) (day|week)s?\b", re.IGNORECASE)),
+    ("week_ja", re.compile(r"(今週|来週|再来週)?(?:の)?([月火水木金土日])曜(?:日)?" + _PARTICLE)),
+    ("week_en", re.compile(r"\b(next |this |on |by )?(" + "|".join(_WEEKDAYS_EN) + r")\b", re.IGNORECASE)),
+    ("relative", re.compile("(" + "|".join(sorted(_RELATIVE_DAYS, key=len, reverse=True)) + r")" + _PARTICLE, re.IGNORECASE)),
+]
+
+# 「12月5日(金)」の (金) のような曜日の注記
+_WEEKDAY_NOTE = re.compile(r"[（(]([月火水木金土日])[）)]")
+
+_TIME_PATTERNS = [
+    ("ja", re.compile(r"(午前|午後|朝|夜)?(\d{1,2})時(?!間)(?:(半)|(\d{1,2})分)?" + _PARTICLE)),
+    ("colon", re.compile(r"(?<![\d:])(\d{1,2}):(\d{2})(?![\d:])\s*(am|pm)?" + _PARTICLE, re.IGNORECASE)),
+    ("en", re.compile(r"(?<![\d:])(\d{1,2})\s*(am|pm)\b", re.IGNORECASE)),
+]
+
+_CHECKED_CUES = re.compile(r"\[[xX]\]|✅|☑|✓|(?:^|\s)(?:完了|済み?|done)(?=\s|$)", re.IGNORECASE)
+_UNCHECKED_CUES = re.compile(r"\[ \]|☐|(?:^|\s)(?:未完了|todo)(?=\s|$)", re.IGNORECASE)
+
+# タイトルから除く記号と、確信度を下げる語（質問や依頼はLLMに任せる）
+_TRIM_CHARS = " 　、。,.・:：-–—"
+_QUESTION = re.compile(r"[?？]|教えて|とは|\b(?:how|what|why)\b", re.IGNORECASE)
+_TOKEN_SPLIT = re.compile(r"[\s、,]+")
+# 箇条書きの行頭記号（「- 」「・」「1. 」など）
+_BULLET = re.compile(r"^\s*(?:[-*•・]|\d+[.)．])\s*")
+# 行頭のチェックボックス（「[ ] 」「☐」など。「- [ ] 」は箇条書きとして扱う）
+_CHECKBOX_ITEM = re.compile(r"^\s*(?:\[[ xX]\]|[☐☑✅])")
+
+
+class FastPathResult:
+    """ルールで抽出した値（Pythonの基本型）と、入力全体を説明できたかどうか"""
+
+    def __init__(self, values: Dict[str, Any], confident: bool, reasons: List[str],
+                 title_property: Optional[str] = None):
+        self.values = values
+        self.confident = confident
+        # 確信度が低い理由（デバッグログ用）
+        self.reasons = reasons
+        self.title_property = title_property
+
+    def can_skip_llm(self, schema: Dict[str, Any]) -> bool:
+        """
+        LLMを呼ばずにこの結果を使えるか。
+        確信度が高くても、タイトルしか抽出できなかった場合は、LLMなら他のプロパティ
+        （選択肢の推測など）を埋められるため、スキーマがタイトルだけの場合に限ります。
+        """
+        if not self.confident:
+            return False
+        if any(k != self.title_property for k in self.values):
+            return True
+        return all(isinstance(p, dict) and p.get("type") == "title" for p in schema.values())
+
+    def hint(self) -> str:
+        """
+        プロンプトに添える、抽出済みの値の説明（タイトル以外に何も無い場合は空文字）。
+        特に相対日付はLLMが今日の日付を知らないため、解決済みの値を渡す意味があります。
+        """
+        found = {k: v for k, v in self.values.items() if k != self.title_property}
+        if not found:
+            return ""
+        lines = [f"- {k}: {v}" for k, v in found.items()]
+        return "Pre-extracted values (verify and reuse if correct):\n" + "\n".join(lines)
+
+
+def is_item_list(text: str) -> bool:
+    """空行以外のすべての行が箇条書き・チェックボックスの項目か（見出しや説明の行が無いか）"""
+    lines = [line for line in text.splitlines() if line.strip()]
+    return bool(lines) and all(_BULLET.match(line) or _CHECKBOX_ITEM.match(line) for line in lines)
+
+
+def split_items(text: str) -> List[str]:
+    """複数件のメモを行ごとに分け、行頭の箇条書き記号を除きます（空行は除く）"""
+    items = []
+    for line in text.splitlines():
+        line = _BULLET.sub("", line).strip()
+        if line:
+            items.append(line)
+    return items
+
+
+def _next_weekday(today: date, weekday: int, weeks_ahead: Optional[int] = None) -> date:
+    if weeks_ahead is None:
+        # 曜日だけの場合は、今日以降で最初のその曜日
+        return today + timedelta(days=(weekday - today.weekday()) % 7)
+    monday = today - timedelta(days=today.weekday())
+    return monday + timedelta(weeks=weeks_ahead, days=weekday)
+
+
+def _resolve_date(kind: str, m: re.Match, today: date) -> Optional[date]:
+    try:
+        if kind == "iso":
+            return date(int(m.group(1)), int(m.group(2)), int(m.group(3)))
+        if kind in ("month_day", "slash"):
+            month, day = int(m.group(1)), int(m.group(2))
+            candidate = date(today.year, month, day)
+            # 過ぎた日付は翌年とみなす
+            return candidate if candidate >= today else date(today.year + 1, month, day)
+        if kind == "days_later":
+            n = int(m.group(1))
+            return today + (timedelta(days=n) if m.group(2) == "日" else timedelta(weeks=n))
+        if kind == "in_days":
+            n = int(m.group(1))
+            return today + (timedelta(days=n) if m.group(2).lower() == "day" else timedelta(weeks=n))
+        if kind == "week_ja":
+            weeks = {"今週": 0, "来週": 1, "再来週": 2}.get(m.group(1))
+            return _next_weekday(today, _WEEKDAYS_JA[m.group(2)], weeks)
+        if kind == "week_en":
+            prefix, name = (m.group(1) or "").strip().lower(), m.group(2).lower()
+            if name in _WEEKDAY_ABBREVIATIONS and not prefix:
+                return None
+            weeks = {"next": 1, "this": 0}.get(prefix)
+            return _next_weekday(today, _WEEKDAYS_EN[name], weeks)
+        if kind == "relative":
+            return today + timedelta(days=_RELATIVE_DAYS[m.group(1).lower()])
+    except ValueError:
+        # 2月30日 のような存在しない日付
+        return None
+    return None
+
+
+def _resolve_time(kind: str, m: re.Match) -> Optional[time]:
+    if kind == "ja":
+        hour = int(m.group(2))
+        minute = 30 if m.group(3) else int(m.group(4) or 0)
+        if m.group(1) in ("午後", "夜") and hour < 12:
+            hour += 12
+    elif kind == "colon":
+        hour, minute = int(m.group(1)), int(m.group(2))
+        if (m.group(3) or "").lower() == "pm" and hour < 12:
+            hour += 12
+    else:
+        hour, minute = int(m.group(1)), 0
+        if m.group(2).lower() == "pm" and hour < 12:
+            hour += 12
+    if hour > 23 or minute > 59:
+        return None
+    return time(hour, minute)
+
+
+def _find_all(patterns, text: str, resolve) -> Tuple[List[Any], List[Tuple[int, int]]]:
+    """一致したすべての値（重複を除く）と位置を返します。「12月5日(金)」のように同じ日を指す表記は1つと数えます"""
+    found, spans = [], []
+    for kind, pattern in patterns:
+        for m in pattern.finditer(text):
+            value = resolve(kind, m)
+            if value is None:
+                continue
+            if value not in found:
+                found.append(value)
+            spans.append(m.span())
+    return found, spans
+
+
+@lru_cache(maxsize=256)
+def _compile_options(key: Tuple[Tuple[str, str, Tuple[str, ...]], ...]) -> Dict[str, List[Tuple[str, str, str]]]:
+    """選択肢名（小文字）→ [(プロパティ名, 型, スキーマ上の選択肢名)] の表"""
+    table: Dict[str, List[Tuple[str, str, str]]] = {}
+    for prop, p_type, options in key:
+        for name in options:
+            table.setdefault(name.lower(), []).append((prop, p_type, name))
+    return table
+
+
+def _schema_fields(schema: Dict[str, Any]):
+    """スキーマから、タイトル・日付・チェックボックスのプロパティ名と、選択肢の表を取り出します"""
+    title, dates, checkboxes, option_key = None, [], [], []
+    for name, prop in schema.items():
+        p_type = prop.get("type") if isinstance(prop, dict) else None
+        if p_type == "title":
+            title = name
+        elif p_type == "date":
+            dates.append(name)
+        elif p_type == "checkbox":
+            checkboxes.append(name)
+        elif p_type in ("select", "multi_select", "status"):
+            options = tuple(o["name"] for o in (prop.get(p_type) or {}).get("options", []) if o.get("name"))
+            option_key.append((name, p_type, options))
+    return title, dates, checkboxes, _compile_options(tuple(option_key))
+
+
+def _cut(text: str, spans: List[Tuple[int, int]]) -> str:
+    """spans の部分を取り除きます（重なっている位置は1回だけ）"""
+    pieces, pos = [], 0
+    for start, end in sorted(spans):
+        if start < pos:
+            start = pos
+        pieces.append(text[pos:start])
+        pos = max(pos, end)
+    pieces.append(text[pos:])
+    return " ".join(pieces)
+
+
+def extract(text: str, schema: Dict[str, Any], now: Optional[datetime] = None) -> FastPathResult:
+    """
+    メモからプロパティの値を抽出します。
+
+    Args:
+        text: ユーザーの入力（一行メモ）
+        schema: 対象データベースのスキーマ
+        now: 相対日付の基準時刻（省略時は FASTPATH_TIMEZONE の現在時刻）
+
+    Returns:
+        FastPathResult。values は serialize_properties にそのまま渡せる形式です。
+    """
+    now = now or datetime.now(_TZ)
+    title_prop, date_props, checkbox_props, options = _schema_fields(schema)
+    values: Dict[str, Any] = {}
+    reasons: List[str] = []
+    rest = text.strip()
+
+    if not title_prop:
+        reasons.append("no title property")
+    if "\n" in rest or len(rest) > FASTPATH_MAX_CHARS:
+        reasons.append("not a one-line memo")
+    if _QUESTION.search(rest):
+        reasons.append("question")
+
+    # 日付・時刻（日付プロパティが1つだけの場合にタイトルから取り除く）
+    days, day_spans = _find_all(_DATE_PATTERNS, rest, lambda k, m: _resolve_date(k, m, now.date()))
+    times, time_spans = _find_all(_TIME_PATTERNS, rest, _resolve_time)
+    for m in _WEEKDAY_NOTE.finditer(rest):
+        weekday = _WEEKDAYS_JA[m.group(1)]
+        if not days:
+            days.append(_next_weekday(now.date(), weekday))
+        elif days[0].weekday() != weekday:
+            reasons.append("weekday does not match the date")
+        day_spans.append(m.span())
+    if len(days) > 1 or len(times) > 1:
+        reasons.append("multiple dates")
+    elif days or times:
+        if len(date_props) == 1:
+            day = days[0] if days else now.date()
+            values[date_props[0]] = (
+                datetime.combine(day, times[0], tzinfo=now.tzinfo).isoformat() if times else day.isoformat()
+            )
+            rest = _cut(rest, day_spans + time_spans)
+        else:
+            reasons.append("date without a single date property")
+
+    # チェックボックス
+    if checkbox_props:
+        for name in checkbox_props:
+            pattern = re.compile(r"(?:^|\s)#?" + re.escape(name) + r"(?=\s|$)")
+            if pattern.search(rest):
+                values[name] = True
+                rest = pattern.sub(" ", rest)
+        cue = _CHECKED_CUES.search(rest) or _UNCHECKED_CUES.search(rest)
+        if cue:
+            if len(checkbox_props) == 1:
+                values[checkbox_props[0]] = _CHECKED_CUES.search(rest) is not None
+                rest = _UNCHECKED_CUES.sub(" ", _CHECKED_CUES.sub(" ", rest))
+            else:
+                reasons.append("checkbox cue with several checkboxes")
+
+    # 選択肢（空白で区切られた語、または #タグ が選択肢名と完全に一致するもの）
+    kept = []
+    for token in _TOKEN_SPLIT.split(rest):
+        word = token.lstrip("#")
+        matches = options.get(word.lower()) if word else None
+        if not matches:
+            kept.append(token)
+            continue
+        if len(matches) > 1:
+            reasons.append(f"option '{word}' in several properties")
+            kept.append(token)
+            continue
+        # 入力の大文字・小文字ではなく、スキーマの選択肢名で保存する（Notionに別の選択肢が増えないように）
+        prop, p_type, name = matches[0]
+        if p_type == "multi_select":
+            values.setdefault(prop, []).append(name)
+        elif prop in values:
+            reasons.append(f"several options for {prop}")
+        else:
+            values[prop] = name
+
+    title = " ".join(t for t in kept if t).strip(_TRIM_CHARS)
+    if not title:
+        reasons.append("empty title")
+    elif title_prop:
+        values[title_prop] = title
+
+    confident = not reasons
+    metrics.incr("memo_ai_fastpath_total", outcome="hit" if confident else ("partial" if values else "miss"))
+    return FastPathResult(values, confident, reasons, title_prop)
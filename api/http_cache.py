@@ -0,0 +1,180 @@
+"""
+HTTP Response Cache
+読み取り系エンドポイント（/api/config, /api/models, /api/targets, /api/schema/{id}）の
+レスポンスをキャッシュするASGIミドルウェアです。
+
+- 事前シリアライズ・事前圧縮: 200応答の本文をそのままのバイト列と gzip / brotli 圧縮済みの形で
+  メモリに保持し、有効期間内はエンドポイントを呼ばずに返します（JSON化と圧縮のCPUを省きます）。
+- ETag / 304: 本文のハッシュから強いETagを作り、If-None-Match が一致すれば 304 を返します。
+  ETagは内容だけで決まるため、どのワーカーが応答しても同じ値になります。
+- Cache-Control: エンドポイントごとに max-age と stale-while-revalidate を設定します。
+  エンドポイント自身が Cache-Control を返した場合はそちらを優先します（/api/models のバージョン指定など）。
+
+同じURLへの同時リクエストは、1回のエンドポイント呼び出しにまとめます（api/cache.py）。
+200以外の応答はキャッシュしません。brotli パッケージが無い環境では gzip のみを使います。
+"""
+import re
+import gzip
+import hashlib
+import asyncio
+from typing import Any, Dict, List, Optional, Tuple
+
+from api.cache import TTLCache
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# この大きさ未満の本文は圧縮しない（ヘッダーの方が大きくなるため）
+MIN_COMPRESS_SIZE = 512
+
+
+class CachePolicy:
+    """パスのパターンと、そのレスポンスのキャッシュ方針"""
+
+    def __init__(self, name: str, pattern: str, max_age: int, stale_while_revalidate: int):
+        self.name = name
+        self.pattern = re.compile(pattern)
+        self.cache_control = f"private, max-age={max_age}, stale-while-revalidate={stale_while_revalidate}"
+        # サーバー側でもブラウザと同じ期間だけ本文を再利用する
+        self.responses = TTLCache(f"http:{name}", ttl=max_age)
+
+
+CACHE_POLICIES: List[CachePolicy] = [
+    CachePolicy("config", r"^/api/config$", max_age=300, stale_while_revalidate=86400),
+    CachePolicy("models", r"^/api/models$", max_age=300, stale_while_revalidate=86400),
+    CachePolicy("targets", r"^/api/targets$", max_age=30, stale_while_revalidate=600),
+    CachePolicy("schema", r"^/api/schema/[^/]+$", max_age=60, stale_while_revalidate=600),
+]
+
+
+def invalidate_responses(path_prefix: str = "") -> None:
+    """path_prefix で始まるURLのキャッシュ済みレスポンスを破棄します（省略時は全件）"""
+    for policy in CACHE_POLICIES:
+        policy.responses.invalidate(lambda key: key.startswith(path_prefix))
+
+
+class CachedResponse:
+    """シリアライズ済みの本文と、その圧縮版"""
+
+    def __init__(self, body: bytes, content_type: bytes, cache_control: Optional[bytes] = None):
+        self.content_type = content_type
+        self.cache_control = cache_control
+        # トレースのラベル用に、最初の呼び出しで解決されたルートを保持する
+        self.route = None
+        self.etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+        self.bodies: Dict[str, bytes] = {"identity": body}
+        if len(body) >= MIN_COMPRESS_SIZE:
+            self.bodies["gzip"] = gzip.compress(body, compresslevel=9, mtime=0)
+            if brotli is not None:
+                self.bodies["br"] = brotli.compress(body, quality=11)
+
+    def etag_for(self, encoding: str) -> str:
+        # 強いETagは表現（圧縮形式）ごとに異なる値にする
+        return self.etag if encoding == "identity" else f'{self.etag[:-1]}-{encoding}"'
+
+    def matches(self, if_none_match: str) -> bool:
+        if if_none_match.strip() == "*":
+            return True
+        tags = {t.strip().removeprefix("W/") for t in if_none_match.split(",")}
+        return any(self.etag_for(encoding) in tags for encoding in self.bodies)
+
+    def select_encoding(self, accept_encoding: str) -> str:
+        accepted = {e.split(";")[0].strip().lower() for e in accept_encoding.split(",")}
+        for encoding in ("br", "gzip"):
+            if encoding in accepted and encoding in self.bodies:
+                return encoding
+        return "identity"
+
+
+class _Uncacheable(Exception):
+    """200以外の応答。受け取ったASGIメッセージをそのまま返すために使います"""
+
+    def __init__(self, messages: List[Dict[str, Any]]):
+        self.messages = messages
+
+
+class ResponseCacheMiddleware:
+    """CACHE_POLICIES に一致する GET / HEAD リクエストのレスポンスをキャッシュします"""
+
+    def __init__(self, app, policies: Optional[List[CachePolicy]] = None):
+        self.app = app
+        self.policies = CACHE_POLICIES if policies is None else policies
+
+    def _match(self, path: str) -> Optional[CachePolicy]:
+        for policy in self.policies:
+            if policy.pattern.match(path):
+                return policy
+        return None
+
+    async def __call__(self, scope, receive, send):
+        policy = None
+        if scope["type"] == "http" and scope["method"] in ("GET", "HEAD"):
+            policy = self._match(scope["path"])
+        if policy is None:
+            await self.app(scope, receive, send)
+            return
+
+        key = scope["path"]
+        if scope.get("query_string"):
+            key += "?" + scope["query_string"].decode("latin-1")
+
+        try:
+            cached = await policy.responses.get_or_load(key, lambda: self._render(scope, receive))
+        except _Uncacheable as e:
+            for message in e.messages:
+                await send(message)
+            return
+
+        if cached.route is not None:
+            scope["route"] = cached.route
+        await self._send_cached(cached, policy, scope, send)
+
+    async def _render(self, scope, receive) -> CachedResponse:
+        """エンドポイントを呼び出し、200応答を CachedResponse にします"""
+        messages: List[Dict[str, Any]] = []
+
+        async def capture(message):
+            messages.append(message)
+
+        # HEAD でも本文を含めて保存するため、GET として呼び出す
+        inner_scope = dict(scope, method="GET")
+        await self.app(inner_scope, receive, capture)
+
+        start = messages[0] if messages else {}
+        headers = dict(start.get("headers", []))
+        if start.get("status") != 200 or b"content-encoding" in headers:
+            raise _Uncacheable(messages)
+
+        body = b"".join(m.get("body", b"") for m in messages if m["type"] == "http.response.body")
+        content_type = headers.get(b"content-type", b"application/json")
+        # 圧縮（特に brotli）は本文が大きいと時間がかかるため、イベントループの外で行う
+        cached = await asyncio.to_thread(CachedResponse, body, content_type, headers.get(b"cache-control"))
+        cached.route = inner_scope.get("route")
+        return cached
+
+    async def _send_cached(self, cached: CachedResponse, policy: CachePolicy, scope, send) -> None:
+        request_headers = dict(scope["headers"])
+        encoding = cached.select_encoding(request_headers.get(b"accept-encoding", b"").decode("latin-1"))
+        headers: List[Tuple[bytes, bytes]] = [
+            (b"etag", cached.etag_for(encoding).encode()),
+            (b"cache-control", cached.cache_control or policy.cache_control.encode()),
+            (b"vary", b"Accept-Encoding"),
+        ]
+
+        if_none_match = request_headers.get(b"if-none-match")
+        if if_none_match is not None and cached.matches(if_none_match.decode("latin-1")):
+            await send({"type": "http.response.start", "status": 304, "headers": headers})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        body = cached.bodies[encoding]
+        headers += [
+            (b"content-type", cached.content_type),
+            (b"content-length", str(len(body)).encode()),
+        ]
+        if encoding != "identity":
+            headers.append((b"content-encoding", encoding.encode()))
+        await send({"type": "http.response.start", "status": 200, "headers": headers})
+        await send({"type": "http.response.body", "body": b"" if scope["method"] == "HEAD" else body})
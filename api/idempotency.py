@@ -0,0 +1,244 @@
+"""
+Idempotency Store
+保存系API（/api/save, /api/pages/create）の重複実行を防ぐためのモジュールです。
+
+モバイルでの保存ボタンの二度押しや、クライアントの再送信で同じページが二重に作られるのを防ぎます。
+
+- キー: クライアントが `Idempotency-Key` ヘッダーで指定するか、
+  無い場合はサーバー側で「エンドポイント + 送信内容のハッシュ」から作成します。
+- 結果の保存: 成功した結果をメモリとSQLiteファイルに IDEMPOTENCY_WINDOW 秒間保存し、
+  同じキーの再実行には元の結果（作成済みページのURLなど）をそのまま返します。
+  SQLiteはワーカープロセス間で共有されるため、別ワーカーに届いた再送信も検出できます。
+  SQLiteの読み書きはイベントループの外（asyncio.to_thread）で行います。
+- 実行中の合流: 同じキーの処理が実行中の場合は、新たにNotionを呼ばずにその完了を待ちます。
+- 失敗した処理の結果は保存しないため、エラー後の再試行は通常どおり実行されます。
+"""
+import json
+import time
+import asyncio
+import hashlib
+import sqlite3
+import threading
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from api.config import IDEMPOTENCY_WINDOW, IDEMPOTENCY_STORE_PATH
+from api.serializers import dumps_bytes
+from api.tracing import metrics
+from api.logger import get_logger
+
+logger = get_logger(__name__)
+
+# 他のワーカーが実行中の処理を待つ最大秒数と、確認の間隔
+PENDING_TIMEOUT = 60.0
+POLL_INTERVAL = 0.1
+# 期限切れレコードを削除する間隔（秒）
+PURGE_INTERVAL = 300.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS idempotency (
+    key TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    result TEXT,
+    expires_at REAL NOT NULL
+);
+"""
+
+
+def derive_key(scope: str, payload: Any, client_key: Optional[str] = None) -> str:
+    """
+    冪等キーを作成します。
+
+    client_key がある場合はそれを使い、無い場合は送信内容のハッシュを使います。
+    いずれもエンドポイント（scope）ごとに区別します。
+    """
+    if client_key:
+        return f"{scope}:client:{client_key}"
+    # キーの順序に依存しないよう、並べ替えてからハッシュ化する
+    canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return f"{scope}:sha256:{hashlib.sha256(canonical.encode('utf-8')).hexdigest()}"
+
+
+class IdempotencyStore:
+    """メモリ + SQLite の結果ストアと、実行中の処理の合流"""
+
+    def __init__(self, path: Optional[str] = IDEMPOTENCY_STORE_PATH, window: float = IDEMPOTENCY_WINDOW):
+        self.path = path
+        self.window = window
+        self._memory: Dict[str, Tuple[float, Any]] = {}
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._last_purge = time.time()
+
+    def _db(self) -> Optional[sqlite3.Connection]:
+        # 接続は最初に使われた時点で作成する（fork 後の各ワーカーで別の接続になる）
+        if self._conn is None and self.path:
+            try:
+                # テーブルを作成してから公開する（別スレッドの呼び出しに作成前の接続を渡さない）
+                conn = sqlite3.connect(self.path, check_same_thread=False, timeout=5.0)
+                if self.path != ":memory:":
+                    conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript(_SCHEMA)
+                self._conn = conn
+            except sqlite3.Error as e:
+                logger.warning("[Idempotency] Disk store unavailable (%s), using memory only", e)
+                self.path = None
+                self._conn = None
+        return self._conn
+
+    # --- 保存済みの結果 (Stored Results) ---
+
+    def get(self, key: str) -> Tuple[Optional[str], Any]:
+        """
+        保存済みの状態を返します。
+
+        Returns:
+            ("done", 結果) / ("pending", None)（他のワーカーが実行中） / (None, None)（記録なし）
+        """
+        now = time.time()
+        entry = self._memory.get(key)
+        if entry is not None:
+            if entry[0] > now:
+                return "done", entry[1]
+            self._memory.pop(key, None)
+
+        conn = self._db()
+        if conn is None:
+            return None, None
+        with self._lock:
+            row = conn.execute(
+                "SELECT status, result, expires_at FROM idempotency WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or row[2] <= now:
+            return None, None
+        if row[0] == "done":
+            result = json.loads(row[1])
+            self._memory[key] = (row[2], result)
+            return "done", result
+        return "pending", None
+
+    def claim(self, key: str) -> bool:
+        """実行権を取得します。他のワーカーが実行中・実行済みの場合は False"""
+        conn = self._db()
+        if conn is None:
+            return True
+        now = time.time()
+        with self._lock, conn:
+            conn.execute("DELETE FROM idempotency WHERE key = ? AND expires_at <= ?", (key, now))
+            cur = conn.execute(
+                "INSERT OR IGNORE INTO idempotency (key, status, expires_at) VALUES (?, 'pending', ?)",
+                (key, now + PENDING_TIMEOUT)
+            )
+            return cur.rowcount == 1
+
+    def complete(self, key: str, result: Any) -> None:
+        expires_at = time.time() + self.window
+        self._memory[key] = (expires_at, result)
+        conn = self._db()
+        if conn is None:
+            return
+        with self._lock, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO idempotency (key, status, result, expires_at) VALUES (?, 'done', ?, ?)",
+                (key, dumps_bytes(result).decode("utf-8"), expires_at)
+            )
+        if time.time() - self._last_purge > PURGE_INTERVAL:
+            self.purge()
+
+    def release(self, key: str) -> None:
+        """失敗した処理の実行権を解放し、再試行できるようにします"""
+        conn = self._db()
+        if conn is None:
+            return
+        with self._lock, conn:
+            conn.execute("DELETE FROM idempotency WHERE key = ? AND status = 'pending'", (key,))
+
+    def purge(self) -> None:
+        """期限切れのレコードを削除します"""
+        now = self._last_purge = time.time()
+        for key in [k for k, (exp, _) in list(self._memory.items()) if exp <= now]:
+            self._memory.pop(key, None)
+        conn = self._db()
+        if conn is not None:
+            with self._lock, conn:
+                conn.execute("DELETE FROM idempotency WHERE expires_at <= ?", (now,))
+
+    # --- 実行 (Execution) ---
+
+    async def _call(self, func: Callable[..., Any], *args) -> Any:
+        """SQLiteを使う場合は、イベントループの外で実行します（busy timeout の待ちでループを止めない）"""
+        if not self.path:
+            return func(*args)
+        return await asyncio.to_thread(func, *args)
+
+    async def run(self, key: str, func: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        キーに対して func を最大1回だけ実行し、その結果を返します。
+
+        Returns:
+            (結果, replayed) — replayed は保存済みの結果や実行中の処理の結果を返した場合に True
+        """
+        if self.window <= 0:
+            return await func(), False
+
+        status, result = await self._call(self.get, key)
+        if status == "done":
+            metrics.incr("memo_ai_idempotency_total", outcome="replayed")
+            return result, True
+
+        # 同じワーカー内で実行中なら、その完了を待つ
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            metrics.incr("memo_ai_idempotency_total", outcome="coalesced")
+            return await asyncio.shield(inflight), True
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            if await self._call(self.claim, key):
+                try:
+                    result = await func()
+                except BaseException:
+                    await asyncio.shield(self._call(self.release, key))
+                    raise
+                try:
+                    await self._call(self.complete, key, result)
+                except Exception as e:
+                    # ページは作成済みなので、結果の保存（SQLite の busy など）に失敗しても 500 にしない。
+                    # このワーカーのメモリには保存済みで、他のワーカーの pending は PENDING_TIMEOUT で期限切れになる
+                    logger.warning("[Idempotency] Failed to store result for %s: %s", key, e)
+                outcome, replayed = "executed", False
+            else:
+                # 別のワーカーが実行中
+                result = await self._wait_for_other_worker(key)
+                outcome, replayed = "coalesced", True
+        except BaseException as e:
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+                # 待っている呼び出しが無い場合に "exception was never retrieved" を出さない
+                future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+        future.set_result(result)
+        metrics.incr("memo_ai_idempotency_total", outcome=outcome)
+        return result, replayed
+
+    async def _wait_for_other_worker(self, key: str) -> Any:
+        deadline = time.monotonic() + PENDING_TIMEOUT
+        while time.monotonic() < deadline:
+            await asyncio.sleep(POLL_INTERVAL)
+            status, result = await self._call(self.get, key)
+            if status == "done":
+                return result
+            if status is None:
+                # 実行中だった処理が失敗して解放された
+                raise RuntimeError("同じ内容の保存処理が失敗しました。もう一度お試しください。")
+        raise TimeoutError("同じ内容の保存処理が完了しませんでした。")
+
+
+# グローバルインスタンス
+idempotency_store = IdempotencyStore()
@@ -0,0 +1,131 @@
+"""
+Notion Schema → JSON Schema
+NotionデータベースのスキーマからLLMの構造化出力用のJSON Schemaを生成するモジュールです。
+
+JSONモード（response_format={"type": "json_object"}）ではJSONであることしか保証されず、
+モデルがプロパティ名を言い換えたり、選択肢に無い値やコードブロックを返したりするため、
+応答の修復が必要でした。構造化出力に対応したモデル（モデルレジストリの supports_response_schema）には
+このモジュールのスキーマを渡し、プロパティ名・型・選択肢が決まった形で返させます。
+
+- select / status / multi_select は選択肢を enum にします（選択肢が無い場合は自由な文字列）。
+- date は YYYY-MM-DD（format: date）または日時（format: date-time）です。
+- strict モードの制約に合わせ、すべてのプロパティを required にし、値が無い場合は null を許可します。
+  ただし次の型は null を許可しません。
+  - title: ページの作成に必須のため、必ず文字列を返させます（null ではタイトルの無いページになる）。
+  - checkbox: 値が無い状態が false と区別できないため、true / false のどちらかです。
+  - multi_select: 値が無い場合は空の配列で表せます。
+- people・files など、登録に対応していない型（api/serializers.py）は含めません。
+
+生成結果は、スキーマのバージョン（プロパティ名・型・選択肢の組）ごとにキャッシュします。
+"""
+from functools import lru_cache
+from typing import Any, Dict, Optional, Tuple
+
+from api.serializers import SERIALIZERS
+
+# 出力の形（kind）ごとのスキーマ名
+_NAMES = {
+    "properties": "notion_properties",
+    "items": "notion_items",
+    "chat": "chat_response",
+}
+
+_NULL = {"type": "null"}
+
+# スキーマのバージョン: ((プロパティ名, 型, 選択肢), ...)
+SchemaVersion = Tuple[Tuple[str, str, Tuple[str, ...]], ...]
+
+
+def schema_version(schema: Dict[str, Any]) -> SchemaVersion:
+    """構造化出力のスキーマに影響する部分（プロパティ名・型・選択肢）の組を返します"""
+    version = []
+    for name, prop in schema.items():
+        if not isinstance(prop, dict) or prop.get("type") not in SERIALIZERS:
+            continue
+        p_type = prop["type"]
+        options = ()
+        if p_type in ("select", "multi_select", "status"):
+            options = tuple(o["name"] for o in (prop.get(p_type) or {}).get("options", []) if o.get("name"))
+        version.append((name, p_type, options))
+    return tuple(version)
+
+
+def property_schema(p_type: str, options: Tuple[str, ...] = ()) -> Dict[str, Any]:
+    """
+    1つのプロパティの値のJSON Schema（options は選択肢の名前）。
+    title・checkbox・multi_select は null を許可しません（理由はモジュールの説明を参照）。
+    """
+    if p_type == "title":
+        return {"type": "string"}
+    if p_type == "rich_text":
+        return {"type": ["string", "null"]}
+    if p_type == "number":
+        return {"type": ["number", "null"]}
+    if p_type == "checkbox":
+        return {"type": "boolean"}
+    if p_type == "date":
+        return {"anyOf": [{"type": "string", "format": "date"}, {"type": "string", "format": "date-time"}, _NULL]}
+    if p_type == "multi_select":
+        item = {"type": "string", "enum": list(options)} if options else {"type": "string"}
+        return {"type": "array", "items": item}
+    # select / status
+    if options:
+        return {"type": ["string", "null"], "enum": [*options, None]}
+    return {"type": ["string", "null"]}
+
+
+@lru_cache(maxsize=256)
+def _compile(version: SchemaVersion, kind: str) -> Dict[str, Any]:
+    if kind == "properties":
+        properties = {name: property_schema(p_type, options) for name, p_type, options in version}
+        return {
+            "type": "object",
+            "properties": properties,
+            "required": list(properties),
+            "additionalProperties": False,
+        }
+    # 1件分のスキーマは "properties" のキャッシュを共有する
+    item = _compile(version, "properties")
+    if kind == "items":
+        root = {"items": {"type": "array", "items": item}}
+    elif kind == "chat":
+        root = {
+            "message": {"type": "string"},
+            "refined_text": {"type": ["string", "null"]},
+            "properties": {"anyOf": [item, _NULL]},
+        }
+    return {"type": "object", "properties": root, "required": list(root), "additionalProperties": False}
+
+
+def build_json_schema(schema: Dict[str, Any], kind: str = "properties") -> Dict[str, Any]:
+    """
+    NotionのスキーマからJSON Schemaを生成します（同じバージョンのスキーマはキャッシュを返します）。
+
+    Args:
+        schema: Notionデータベースのスキーマ（get_db_schema の結果）
+        kind: 出力の形
+            - "properties": {"プロパティ名": 値, ...}（analyze_text_with_ai）
+            - "items": {"items": [{...}, ...]}（analyze_items_with_ai）
+            - "chat": {"message", "refined_text", "properties"}（chat_analyze_text_with_ai）
+
+    注意: 返り値はキャッシュで共有されるため、書き換えないでください。
+    """
+    if kind not in _NAMES:
+        raise ValueError(f"Unknown schema kind: {kind}")
+    return _compile(schema_version(schema), kind)
+
+
+def response_format(schema: Optional[Dict[str, Any]], kind: str = "properties") -> Optional[Dict[str, Any]]:
+    """
+    LiteLLMの response_format（json_schema 形式）を返します。
+    プロパティが1つも無い場合（ページなど）は None（JSONモードを使う）。
+    """
+    if not schema:
+        return None
+    json_schema = build_json_schema(schema, kind)
+    if kind == "properties" and not json_schema["properties"]:
+        return None
+    return {
+        "type": "json_schema",
+        "json_schema": {"name": _NAMES[kind], "schema": json_schema, "strict": True},
+    }
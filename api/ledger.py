@@ -0,0 +1,417 @@
+"""
+Usage Ledger
+LLM呼び出しのトークン数とコストを、モデル・ターゲット（保存先）・クライアントごとに記録し、
+予算（1日・1か月の上限額）を超えないように制御するモジュールです。
+
+- 記録: generate_json の成功ごとにメモリ上で集計し、FLUSH_INTERVAL 秒ごとにSQLiteへまとめて書き込みます
+  （書き込みはイベントループの外のスレッドで行います）。
+  SQLiteはワーカープロセス間で共有されるため、予算は全ワーカーの合計で判定されます。
+- 予算の判定: LLMを呼び出す前に、プロンプトのトークン数からコストを見積もります。
+  - 使用額が上限の BUDGET_DOWNGRADE_RATIO を超えた、または見積もりが残額を超える場合は、
+    より安いモデル（自動選択の候補の中で見積もりが最小のもの）に切り替えます。
+  - 最も安いモデルでも残額を超える場合は BudgetExceededError を送出します。
+  - 判定を通った呼び出しの見積もりコストは、応答を記録する（または失敗する）まで使用額に含めます（予約）。
+    同時に届いた呼び出しが、まだ記録されていない互いのコストを見落として上限を超えないようにするためです。
+- ターゲットとクライアントは、エンドポイントが usage_scope() で設定します（contextvars で伝播）。
+
+日付の区切りはUTCです。
+"""
+import time
+import atexit
+import asyncio
+import sqlite3
+import itertools
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import litellm
+
+from api.config import (
+    LEDGER_PATH,
+    LLM_DAILY_BUDGET_USD,
+    LLM_MONTHLY_BUDGET_USD,
+    TARGET_DAILY_BUDGET_USD,
+    CLIENT_DAILY_BUDGET_USD,
+    BUDGET_DOWNGRADE_RATIO,
+)
+from api.models import get_model_metadata, get_routing_candidates
+from api.tracing import metrics
+from api.logger import get_logger
+
+logger = get_logger(__name__)
+
+# 未記録分をSQLiteへ書き込む間隔と、他ワーカーの使用額を読み直す間隔（秒）
+FLUSH_INTERVAL = 5.0
+REFRESH_INTERVAL = 5.0
+# コスト見積もりで想定する生成トークン数（JSON応答の典型的な長さ）
+EXPECTED_COMPLETION_TOKENS = 500
+
+GROUP_COLUMNS = ("model", "target", "client")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS usage (
+    day TEXT NOT NULL,
+    model TEXT NOT NULL,
+    target TEXT NOT NULL,
+    client TEXT NOT NULL,
+    requests INTEGER NOT NULL,
+    prompt_tokens INTEGER NOT NULL,
+    completion_tokens INTEGER NOT NULL,
+    cost REAL NOT NULL,
+    PRIMARY KEY (day, model, target, client)
+);
+"""
+
+_scope: contextvars.ContextVar[Dict[str, str]] = contextvars.ContextVar("memo_ai_usage_scope", default={})
+
+
+class BudgetExceededError(RuntimeError):
+    """予算の残額が、最も安いモデルの見積もりコストにも足りない"""
+
+
+@contextmanager
+def usage_scope(target: Optional[str] = None, client: Optional[str] = None):
+    """このブロック内のLLM呼び出しを、指定したターゲット・クライアントの使用量として記録します"""
+    token = _scope.set({"target": target or "", "client": client or ""})
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+
+def count_tokens(messages: List[Dict[str, Any]], model: str = "") -> int:
+    """メッセージのトークン数を数えます（model を省略した場合はLiteLLMの既定のトークナイザー）"""
+    try:
+        return litellm.token_counter(model=model, messages=messages)
+    except Exception:
+        # トークナイザーが使えない場合は文字数から概算する
+        return sum(len(str(m.get("content", ""))) for m in messages) // 2
+
+
+def estimate_cost(model: str, messages: List[Dict[str, Any]],
+                  completion_tokens: int = EXPECTED_COMPLETION_TOKENS,
+                  prompt_tokens: Optional[int] = None) -> float:
+    """
+    プロンプトのトークン数と想定生成トークン数から、1回の呼び出しのコスト（USD）を見積もります。
+    prompt_tokens が分かっている場合（数え済みの会話履歴など）は、messages を数え直しません。
+    """
+    metadata = get_model_metadata(model)
+    if not metadata:
+        return 0.0
+    if prompt_tokens is None:
+        prompt_tokens = count_tokens(messages, model)
+    rates = metadata.get("cost_per_1k_tokens", {})
+    return (prompt_tokens * rates.get("input", 0.0) + completion_tokens * rates.get("output", 0.0)) / 1000
+
+
+def _has_image(messages: List[Dict[str, Any]]) -> bool:
+    for m in messages:
+        content = m.get("content")
+        if isinstance(content, list) and any(isinstance(p, dict) and p.get("type") == "image_url" for p in content):
+            return True
+    return False
+
+
+class Reservation:
+    """authorize で予約した見積もりコスト。record で実際のコストに置き換え、失敗時は release で解放します"""
+
+    def __init__(self, reservation_id: Optional[int], model: str, amount: float):
+        self.id = reservation_id
+        self.model = model
+        self.amount = amount
+
+
+class Budget:
+    """予算の定義。dimension が None なら全体、"target" / "client" ならその値ごとの上限"""
+
+    def __init__(self, name: str, period: str, limit: float, dimension: Optional[str] = None):
+        self.name = name
+        self.period = period  # "day" | "month"
+        self.limit = limit
+        self.dimension = dimension
+
+
+DEFAULT_BUDGETS = [
+    Budget("daily", "day", LLM_DAILY_BUDGET_USD),
+    Budget("monthly", "month", LLM_MONTHLY_BUDGET_USD),
+    Budget("target_daily", "day", TARGET_DAILY_BUDGET_USD, dimension="target"),
+    Budget("client_daily", "day", CLIENT_DAILY_BUDGET_USD, dimension="client"),
+]
+
+
+def _period_key(period: str, now: Optional[datetime] = None) -> str:
+    now = now or datetime.now(timezone.utc)
+    return now.strftime("%Y-%m") if period == "month" else now.strftime("%Y-%m-%d")
+
+
+class UsageLedger:
+    """使用量の記録・集計と、予算に基づくモデルの選択"""
+
+    def __init__(
+        self,
+        path: Optional[str] = LEDGER_PATH,
+        budgets: Optional[List[Budget]] = None,
+        downgrade_ratio: float = BUDGET_DOWNGRADE_RATIO
+    ):
+        self.path = path
+        self.budgets = [b for b in (DEFAULT_BUDGETS if budgets is None else budgets) if b.limit > 0]
+        self.downgrade_ratio = downgrade_ratio
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        # 未書き込みの集計: (day, model, target, client) -> [requests, prompt_tokens, completion_tokens, cost]
+        self._pending: Dict[Tuple[str, str, str, str], List[float]] = {}
+        self._last_flush = time.monotonic()
+        self._flushing = False
+        # 予約中の見積もりコスト: reservation_id -> ((day, model, target, client), cost)
+        self._reserved: Dict[int, Tuple[Tuple[str, str, str, str], float]] = {}
+        self._reservation_ids = itertools.count(1)
+        # 予算の判定と予約を、同時に届いた呼び出しの間で1つずつ行うためのロック
+        self._authorize_lock = threading.Lock()
+        # SQLiteから読んだ使用額: (period_key, column, value) -> (読んだ時刻, 金額)
+        self._spent_cache: Dict[Tuple[str, str, str], Tuple[float, float]] = {}
+
+    def _db(self) -> Optional[sqlite3.Connection]:
+        # 接続は最初に使われた時点で作成する（fork 後の各ワーカーで別の接続になる）
+        if self._conn is None and self.path:
+            try:
+                self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=5.0)
+                if self.path != ":memory:":
+                    self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.executescript(_SCHEMA)
+            except sqlite3.Error as e:
+                logger.warning("[Ledger] Disk store unavailable (%s), using memory only", e)
+                self.path = None
+                self._conn = None
+        return self._conn
+
+    # --- 記録 (Recording) ---
+
+    def _key(self, model: str) -> Tuple[str, str, str, str]:
+        scope = _scope.get()
+        return (_period_key("day"), model, scope.get("target", ""), scope.get("client", ""))
+
+    def record(self, model: str, usage: Dict[str, Any], cost: float,
+               reservation: Optional[Reservation] = None) -> None:
+        """使用量を記録します。reservation を指定した場合は、その予約を実際のコストに置き換えます"""
+        key = self._key(model)
+        with self._lock:
+            if reservation is not None and reservation.id is not None:
+                self._reserved.pop(reservation.id, None)
+            row = self._pending.setdefault(key, [0, 0, 0, 0.0])
+            row[0] += 1
+            row[1] += usage.get("prompt_tokens") or 0
+            row[2] += usage.get("completion_tokens") or 0
+            row[3] += cost or 0.0
+            due = not self._flushing and time.monotonic() - self._last_flush > FLUSH_INTERVAL
+            if due:
+                self._flushing = True
+        if due:
+            try:
+                # SQLiteの書き込み（busy timeout で待つ場合がある）はイベントループの外で行う
+                asyncio.get_running_loop().run_in_executor(None, self._flush_in_background)
+            except RuntimeError:
+                self._flush_in_background()
+
+    def release(self, reservation: Reservation) -> None:
+        """予約を解放します（呼び出しが失敗した場合。record 済みなら何もしない）"""
+        if reservation.id is None:
+            return
+        with self._lock:
+            self._reserved.pop(reservation.id, None)
+
+    def _flush_in_background(self) -> None:
+        try:
+            self.flush()
+        finally:
+            self._flushing = False
+
+    def flush(self) -> None:
+        """未書き込みの集計をSQLiteへ加算します"""
+        conn = self._db()
+        if conn is None:
+            return
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+            if not pending:
+                return
+            try:
+                with conn:
+                    conn.executemany(
+                        """
+                        INSERT INTO usage (day, model, target, client, requests, prompt_tokens, completion_tokens, cost)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                        ON CONFLICT (day, model, target, client) DO UPDATE SET
+                            requests = requests + excluded.requests,
+                            prompt_tokens = prompt_tokens + excluded.prompt_tokens,
+                            completion_tokens = completion_tokens + excluded.completion_tokens,
+                            cost = cost + excluded.cost
+                        """,
+                        [key + tuple(values) for key, values in pending.items()]
+                    )
+            except sqlite3.Error as e:
+                logger.warning("[Ledger] Failed to write usage: %s", e)
+                for key, values in pending.items():
+                    row = self._pending.setdefault(key, [0, 0, 0, 0.0])
+                    for i, v in enumerate(values):
+                        row[i] += v
+                return
+            self._spent_cache.clear()
+
+    # --- 集計 (Aggregation) ---
+
+    def _where(self, period: str, column: Optional[str], value: Optional[str]) -> Tuple[str, list]:
+        clause, params = "substr(day, 1, ?) = ?", [7 if period == "month" else 10, _period_key(period)]
+        if column:
+            clause += f" AND {column} = ?"
+            params.append(value or "")
+        return clause, params
+
+    def spent(self, period: str, column: Optional[str] = None, value: Optional[str] = None) -> float:
+        """
+        期間内の使用額（USD）。このワーカーの未書き込みの記録と予約中の見積もりを含みます。
+        他ワーカーの記録は REFRESH_INTERVAL 秒ごとに読み直します。
+        """
+        prefix = _period_key(period)
+        stored = 0.0
+        conn = self._db()
+        if conn is not None:
+            cache_key = (prefix, column or "", value or "")
+            cached = self._spent_cache.get(cache_key)
+            if cached is not None and time.monotonic() - cached[0] < REFRESH_INTERVAL:
+                stored = cached[1]
+            else:
+                clause, params = self._where(period, column, value)
+                with self._lock:
+                    stored = conn.execute(f"SELECT COALESCE(SUM(cost), 0) FROM usage WHERE {clause}", params).fetchone()[0]
+                self._spent_cache[cache_key] = (time.monotonic(), stored)
+
+        index = GROUP_COLUMNS.index(column) + 1 if column else None
+
+        def matches(key):
+            return key[0].startswith(prefix) and (index is None or key[index] == (value or ""))
+
+        with self._lock:
+            local = sum(values[3] for key, values in self._pending.items() if matches(key))
+            local += sum(amount for key, amount in self._reserved.values() if matches(key))
+        return stored + local
+
+    def summary(self, period: str = "day", group_by: str = "model") -> Dict[str, Any]:
+        """期間内の使用量を group_by（model / target / client）ごとに集計します"""
+        if group_by not in GROUP_COLUMNS:
+            raise ValueError(f"group_by must be one of {GROUP_COLUMNS}")
+        self.flush()
+        groups: Dict[str, Dict[str, Any]] = {}
+        conn = self._db()
+        rows = []
+        if conn is not None:
+            clause, params = self._where(period, None, None)
+            with self._lock:
+                rows = conn.execute(
+                    f"SELECT {group_by}, SUM(requests), SUM(prompt_tokens), SUM(completion_tokens), SUM(cost) "
+                    f"FROM usage WHERE {clause} GROUP BY {group_by} ORDER BY SUM(cost) DESC",
+                    params
+                ).fetchall()
+        else:
+            # メモリのみの場合は未書き込みの集計から作る
+            prefix, index = _period_key(period), GROUP_COLUMNS.index(group_by) + 1
+            for key, values in self._pending.items():
+                if key[0].startswith(prefix):
+                    rows.append((key[index], *values))
+
+        for name, requests, prompt_tokens, completion_tokens, cost in rows:
+            g = groups.setdefault(name, {"key": name, "requests": 0, "prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0})
+            g["requests"] += requests
+            g["prompt_tokens"] += prompt_tokens
+            g["completion_tokens"] += completion_tokens
+            g["cost"] += cost
+
+        totals = {k: sum(g[k] for g in groups.values()) for k in ("requests", "prompt_tokens", "completion_tokens", "cost")}
+        return {
+            "period": _period_key(period),
+            "group_by": group_by,
+            "totals": totals,
+            "groups": sorted(groups.values(), key=lambda g: g["cost"], reverse=True),
+        }
+
+    # --- 予算 (Budgets) ---
+
+    def budget_status(self) -> List[Dict[str, Any]]:
+        """現在のリクエストのスコープに適用される予算と、その使用額"""
+        scope = _scope.get()
+        status = []
+        for b in self.budgets:
+            value = scope.get(b.dimension, "") if b.dimension else None
+            spent = self.spent(b.period, b.dimension, value)
+            status.append({
+                "name": b.name,
+                "period": b.period,
+                "limit": b.limit,
+                "spent": spent,
+                "remaining": max(b.limit - spent, 0.0),
+            })
+        return status
+
+    def authorize(self, model: str, messages: List[Dict[str, Any]],
+                  prompt_tokens: Optional[int] = None) -> str:
+        """
+        予算に照らして、この呼び出しで使うモデルを決めます（予約はしません）。
+        prompt_tokens を指定した場合は、見積もりに messages のトークン数の代わりに使います。
+
+        Returns:
+            そのまま使えるなら model、予算が残り少ない場合はより安いモデル
+        Raises:
+            BudgetExceededError: どのモデルでも残額が足りない場合
+        """
+        return self._select(model, messages, prompt_tokens)[0]
+
+    def reserve(self, model: str, messages: List[Dict[str, Any]],
+                prompt_tokens: Optional[int] = None) -> Reservation:
+        """
+        authorize と同じ判定を行い、選んだモデルの見積もりコストを使用額に予約します。
+        呼び出し側は、成功時に record(..., reservation=) を、失敗時に release を呼んでください。
+
+        Raises:
+            BudgetExceededError: どのモデルでも残額が足りない場合
+        """
+        if not self.budgets:
+            return Reservation(None, model, 0.0)
+        # 判定から予約までの間に、別の呼び出しが同じ残額で判定を通らないようにする
+        with self._authorize_lock:
+            model, estimate = self._select(model, messages, prompt_tokens)
+            reservation = Reservation(next(self._reservation_ids), model, estimate)
+            with self._lock:
+                self._reserved[reservation.id] = (self._key(model), estimate)
+        return reservation
+
+    def _select(self, model: str, messages: List[Dict[str, Any]],
+                prompt_tokens: Optional[int]) -> Tuple[str, float]:
+        """(使うモデル, その見積もりコスト)"""
+        if not self.budgets:
+            return model, 0.0
+        status = self.budget_status()
+        remaining = min(s["remaining"] for s in status)
+        used_ratio = max(s["spent"] / s["limit"] for s in status)
+        estimate = estimate_cost(model, messages, prompt_tokens=prompt_tokens)
+        if estimate <= remaining and used_ratio < self.downgrade_ratio:
+            return model, estimate
+
+        candidates = {model, *get_routing_candidates(has_image=_has_image(messages))}
+        cheapest_cost, cheapest = min((estimate_cost(m, messages, prompt_tokens=prompt_tokens), m) for m in candidates)
+        if cheapest_cost > remaining:
+            exhausted = min(status, key=lambda s: s["remaining"])["name"]
+            metrics.incr("memo_ai_budget_total", outcome="rejected", budget=exhausted)
+            raise BudgetExceededError(f"利用上限（{exhausted}）に達しました。しばらくしてから再度お試しください。")
+        if cheapest != model and cheapest_cost < estimate:
+            logger.info("[Ledger] Budget %.0f%% used, downgrading %s -> %s", used_ratio * 100, model, cheapest)
+            metrics.incr("memo_ai_budget_total", outcome="downgraded", budget="any")
+            return cheapest, cheapest_cost
+        return model, estimate
+
+
+# グローバルインスタンス
+ledger = UsageLedger()
+atexit.register(ledger.flush)
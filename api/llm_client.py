@@ -4,12 +4,24 @@ LiteLLMを利用してAIプロバイダーとの通信を統一的にハンド
 APIコールの実行、エラーハンドリング、リトライ、コスト計算などの共通処理を実装しています。
 """
 import json
+import time
 import asyncio
 from typing import Dict, Any, Optional
 from litellm import acompletion, completion_cost
 import litellm
 
-from api.config import LITELLM_VERBOSE, LITELLM_TIMEOUT, LITELLM_MAX_RETRIES
+from api.config import (
+    LITELLM_VERBOSE, LITELLM_TIMEOUT, LITELLM_MAX_RETRIES, STRUCTURED_OUTPUT_ENABLED, LLM_TRANSPORT_ENABLED
+)
+from api.models import supports_response_schema
+from api.tracing import span, metrics
+from api.logger import get_logger
+from api.model_stats import model_stats
+from api.ledger import ledger
+from api.loop_monitor import run_blocking
+from api.transport import provider_transport
+
+logger = get_logger(__name__)
 
 # LiteLLMの設定
 litellm.set_verbose = LITELLM_VERBOSE
@@ -18,7 +30,10 @@ litellm.set_verbose = LITELLM_VERBOSE
 async def generate_json(
     prompt: Any,
     model: str,
-    retries: int = None
+    retries: int = None,
+    prompt_tokens: Optional[int] = None,
+    response_schema: Optional[Dict[str, Any]] = None,
+    max_tokens: Optional[int] = None
 ) -> Dict[str, Any]:
     """
     LiteLLMを呼び出してJSONレスポンスを生成します。
@@ -31,6 +46,10 @@ async def generate_json(
                - list[dict] with 'role' key: 会話履歴を含むメッセージ配列 (例: [{"role": "system", "content": ...}, {"role": "user", "content": ...}])
         model: 使用するモデルID (例: "gemini/gemini-2.0-flash-exp")
         retries: 失敗時の最大リトライ回数 (Noneの場合は設定値を使用)
+        prompt_tokens: 数え済みのプロンプトのトークン数（予算の確認で数え直さないため、任意）
+        response_schema: 構造化出力の response_format（api/json_schema.py の response_format、任意）。
+               モデルが対応していない場合はJSONモードで呼び出します
+        max_tokens: 出力トークン数の上限（api/compact.py の max_tokens_for、任意）
     
     Returns:
         {
@@ -42,65 +61,115 @@ async def generate_json(
     
     Raises:
         RuntimeError: 全てのリトライが失敗した場合
+        BudgetExceededError: 利用予算の残額が足りない場合（api/ledger.py）
     """
     if retries is None:
         retries = LITELLM_MAX_RETRIES
     
-    for attempt in range(retries + 1):
-        try:
-            # メッセージの準備
-            if isinstance(prompt, list):
-                # リストの場合: 会話履歴 または マルチモーダルコンテンツ
-                if len(prompt) > 0 and isinstance(prompt[0], dict) and 'role' in prompt[0]:
-                    # 会話履歴形式: [{"role": "system", "content": ...}, {"role": "user", "content": ...}]
-                    messages = prompt
-                else:
-                    # マルチモーダル入力: [{"type": "text", ...}, {"type": "image_url", ...}]
-                    messages = [{"role": "user", "content": prompt}]
-            else:
-                # テキストのみ: 単純な文字列
-                messages = [{"role": "user", "content": prompt}]
-            
-            # LiteLLM呼び出し (非同期)
-            # response_format={"type": "json_object"} によりJSON出力を強制します
-            response = await acompletion(
-                model=model,
-                messages=messages,
-                response_format={"type": "json_object"},
-                timeout=LITELLM_TIMEOUT
-            )
-            
-            # コンテンツの抽出
-            content = response.choices[0].message.content
-            if not content:
-                raise RuntimeError("Empty AI response")
-            
-            # 使用量とコストの計算
-            usage = response.usage.dict() if hasattr(response, 'usage') else {}
-            cost = 0.0
-            
+    # メッセージの準備
+    if isinstance(prompt, list):
+        # リストの場合: 会話履歴 または マルチモーダルコンテンツ
+        if len(prompt) > 0 and isinstance(prompt[0], dict) and 'role' in prompt[0]:
+            # 会話履歴形式: [{"role": "system", "content": ...}, {"role": "user", "content": ...}]
+            messages = prompt
+        else:
+            # マルチモーダル入力: [{"type": "text", ...}, {"type": "image_url", ...}]
+            messages = [{"role": "user", "content": prompt}]
+    else:
+        # テキストのみ: 単純な文字列
+        messages = [{"role": "user", "content": prompt}]
+
+    # 予算の確認（残りが少ない場合は安いモデルに切り替え、足りない場合は BudgetExceededError）
+    # リトライでは再送しないよう、ループの外で1回だけ行う
+    # SQLiteの読み込みとトークン数の計算を含むため、イベントループの外で実行する（usage_scope は引き継がれる）
+    # 見積もりコストは応答の記録（失敗時は解放）まで予約され、同時の呼び出しの判定に含まれる
+    reservation = await run_blocking(ledger.reserve, model, messages, prompt_tokens=prompt_tokens)
+    model = reservation.model
+
+    # 出力形式: 構造化出力に対応したモデルにはJSON Schemaを渡し、それ以外はJSONモード
+    # （予算によるモデルの切り替え後に判定する）
+    response_format = {"type": "json_object"}
+    if response_schema and STRUCTURED_OUTPUT_ENABLED and supports_response_schema(model):
+        response_format = response_schema
+    options = {"max_tokens": max_tokens} if max_tokens else {}
+    if LLM_TRANSPORT_ENABLED:
+        # プロバイダーごとの共有接続を使う（api/transport.py）
+        options.update(provider_transport.options_for(model))
+
+    try:
+        for attempt in range(retries + 1):
             try:
-                # LiteLLMの組み込み関数でコストを計算
-                cost = completion_cost(completion_response=response)
-            except Exception as e:
-                print(f"Cost calculation failed: {e}")
+                # 計測: モデル・試行回数ごとのLLM呼び出しレイテンシ
+                with span("llm.generate", model=model, attempt=attempt, response_format=response_format["type"]) as s:
+                    # LiteLLM呼び出し (非同期)
+                    # response_format によりJSON出力（またはJSON Schemaに従った出力）を強制します
+                    started = time.perf_counter()
+                    try:
+                        response = await acompletion(
+                            model=model,
+                            messages=messages,
+                            response_format=response_format,
+                            timeout=LITELLM_TIMEOUT,
+                            **options
+                        )
+                    except Exception:
+                        # 失敗もモデル統計に記録（adaptive ルーティングのエラー率に反映）
+                        model_stats.record(model, time.perf_counter() - started, ok=False)
+                        raise
+                    latency = time.perf_counter() - started
+                
+                    # コンテンツの抽出
+                    content = response.choices[0].message.content
+                    if not content:
+                        # 空の応答もエラーとしてモデル統計に記録する（adaptive ルーティングで不利にする）
+                        model_stats.record(model, latency, ok=False)
+                        raise RuntimeError("Empty AI response")
+                
+                    # 使用量とコストの計算
+                    usage = response.usage.dict() if hasattr(response, 'usage') else {}
+                    cost = 0.0
+                
+                    try:
+                        # LiteLLMの組み込み関数でコストを計算
+                        # LiteLLMのコスト表の参照はCPU処理のため、イベントループの外で行う
+                        cost = await run_blocking(completion_cost, completion_response=response)
+                    except Exception as e:
+                        logger.debug("Cost calculation failed: %s", e)
+                
+                    model_stats.record(
+                        model, latency, ok=True,
+                        completion_tokens=usage.get("completion_tokens") or 0,
+                        cost=cost
+                    )
+                
+                    s.set_label("status", "ok")
+                    s.set_attribute("prompt_tokens", usage.get("prompt_tokens"))
+                    s.set_attribute("completion_tokens", usage.get("completion_tokens"))
+                    s.set_attribute("cost", cost)
+                    metrics.incr("memo_ai_llm_tokens_total", usage.get("prompt_tokens") or 0, model=model, kind="prompt")
+                    metrics.incr("memo_ai_llm_tokens_total", usage.get("completion_tokens") or 0, model=model, kind="completion")
+                    metrics.incr("memo_ai_llm_cost_usd_total", cost or 0.0, model=model)
+                    ledger.record(model, usage, cost, reservation=reservation)
+                
+                    return {
+                        "content": content,
+                        "usage": usage,
+                        "cost": cost,
+                        "model": model
+                    }
             
-            return {
-                "content": content,
-                "usage": usage,
-                "cost": cost,
-                "model": model
-            }
-            
-        except Exception as e:
-            if attempt == retries:
-                # 最大リトライ回数に達した場合はエラーを再送出
-                print(f"Generation failed after {retries} retries: {e}")
-                raise RuntimeError(f"AI generation failed: {str(e)}")
+            except Exception as e:
+                if attempt == retries:
+                    # 最大リトライ回数に達した場合はエラーを再送出
+                    logger.error("Generation failed after %d retries: %s", retries, e)
+                    raise RuntimeError(f"AI generation failed: {str(e)}")
             
-            # 指数バックオフ (Exponential Backoff)
-            # リトライ間隔を徐々に広げてサーバー負荷を軽減します (2s, 4s, 6s...)
-            await asyncio.sleep(2 * (attempt + 1))
+                # 指数バックオフ (Exponential Backoff)
+                # リトライ間隔を徐々に広げてサーバー負荷を軽減します (2s, 4s, 6s...)
+                with span("llm.retry_wait", model=model):
+                    await asyncio.sleep(2 * (attempt + 1))
+    finally:
+        ledger.release(reservation)
 
 
 def prepare_multimodal_prompt(text: str, image_data: str, image_mime_type: str) -> list:
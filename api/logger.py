@@ -0,0 +1,216 @@
+"""
+Structured Logging
+アプリケーション全体のログ出力を管理するモジュールです。
+
+- ノンブロッキング: ログレコードはキューに積むだけで、書き出しは専用スレッドが行います。
+  遅い出力先（Vercelのログ収集など）でもイベントループを止めません。
+- JSON形式: 1行1レコードのJSONで出力し、trace_id でトレースと突き合わせできます。
+- モジュール別レベル: `LOG_LEVELS=api.notion=DEBUG,api.ai=WARNING` のように指定できます。
+- 秘匿・省サイズ化: Base64画像データを伏せ字にし、長いメッセージは切り詰めます。
+- サンプリング: DEBUGレコードは `LOG_DEBUG_SAMPLE_RATE` の割合だけ出力します。
+
+使用例:
+    from api.logger import get_logger
+    logger = get_logger(__name__)
+    logger.debug("[Chat AI] Raw parsed response: %s", data)  # DEBUG無効時は文字列化されません
+"""
+import os
+import re
+import sys
+import json
+import time
+import queue
+import atexit
+import random
+import logging
+import logging.handlers
+from typing import Dict, Optional
+
+from api.config import (
+    LOG_LEVEL,
+    LOG_LEVELS,
+    LOG_FORMAT,
+    LOG_MAX_MESSAGE_CHARS,
+    LOG_DEBUG_SAMPLE_RATE,
+)
+from api.tracing import current_trace_id
+
+# ハンドラを取り付けるロガーの名前空間（api.* 配下の全モジュールが対象）
+ROOT_LOGGER_NAME = "api"
+
+# data URI 形式の画像と、長いBase64文字列を検出するパターン
+_DATA_URI_PATTERN = re.compile(r"data:[\w/+.-]+;base64,[A-Za-z0-9+/=]+")
+_BASE64_PATTERN = re.compile(r"[A-Za-z0-9+/]{200,}={0,2}")
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_handler: Optional[logging.Handler] = None
+_stream = None
+
+
+def redact(message: str, max_chars: int = LOG_MAX_MESSAGE_CHARS) -> str:
+    """
+    ログメッセージから画像データを除去し、最大長で切り詰めます。
+
+    例: "data:image/png;base64,iVBOR..." -> "<image data redacted: 12345 chars>"
+    """
+    message = _DATA_URI_PATTERN.sub(lambda m: f"<image data redacted: {len(m.group(0))} chars>", message)
+    message = _BASE64_PATTERN.sub(lambda m: f"<base64 redacted: {len(m.group(0))} chars>", message)
+    if max_chars and len(message) > max_chars:
+        message = f"{message[:max_chars]}... <truncated {len(message) - max_chars} chars>"
+    return message
+
+
+class DebugSamplingFilter(logging.Filter):
+    """DEBUGレコードを一定割合だけ通すフィルター（INFO以上は常に通す）"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or self.rate >= 1.0:
+            return True
+        return random.random() < self.rate
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    呼び出し元スレッドでの処理を最小限にする QueueHandler
+
+    標準の QueueHandler はキュー投入前にフォーマット処理を行いますが、
+    ここではメッセージの展開（getMessage）と trace_id の取得だけを行い、
+    秘匿処理・JSON化・書き出しはリスナースレッドに任せます。
+    キューが満杯の場合はレコードを破棄し、リクエスト処理を優先します。
+    """
+
+    dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 引数のオブジェクトが後で変更されても影響を受けないよう、ここで文字列化する
+        record.msg = record.getMessage()
+        record.args = None
+        record.trace_id = current_trace_id()
+        if record.exc_info:
+            # 例外情報はスレッドを跨ぐ前にテキスト化しておく
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            NonBlockingQueueHandler.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    """1行1レコードのJSONフォーマッター"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": redact(record.getMessage()),
+        }
+        trace_id = getattr(record, "trace_id", None)
+        if trace_id:
+            entry["trace_id"] = trace_id
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry["fields"] = {k: redact(str(v)) if isinstance(v, str) else v for k, v in fields.items()}
+        if record.exc_text:
+            entry["exc"] = redact(record.exc_text, max_chars=0)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """開発時向けの読みやすいテキストフォーマッター（秘匿処理は同様に適用）"""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(name)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        return redact(super().format(record))
+
+
+def parse_levels(spec: str) -> Dict[str, int]:
+    """
+    "api.notion=DEBUG,api.ai=WARNING" 形式の指定をパースします。
+    不正なエントリは無視します。
+    """
+    levels = {}
+    for item in (spec or "").split(","):
+        name, _, level = item.partition("=")
+        name, level = name.strip(), level.strip().upper()
+        if name and level in logging._nameToLevel:
+            levels[name] = logging._nameToLevel[level]
+    return levels
+
+
+def setup_logging(stream=None) -> None:
+    """
+    ログ出力を初期化します（複数回呼ばれても一度だけ実行されます）。
+    """
+    global _listener, _handler, _stream
+    if _listener is not None:
+        return
+
+    _stream = stream or _stream or sys.stdout
+    output = logging.StreamHandler(_stream)
+    output.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else TextFormatter())
+
+    log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=10000)
+    handler = NonBlockingQueueHandler(log_queue)
+    handler.addFilter(DebugSamplingFilter(LOG_DEBUG_SAMPLE_RATE))
+
+    root = logging.getLogger(ROOT_LOGGER_NAME)
+    root.setLevel(logging._nameToLevel.get(LOG_LEVEL.upper(), logging.INFO))
+    if _handler is not None:
+        root.removeHandler(_handler)
+    root.addHandler(handler)
+    _handler = handler
+    # uvicorn 等のルートロガーと二重出力しないように伝播を止める
+    root.propagate = False
+
+    for name, level in parse_levels(LOG_LEVELS).items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging() -> None:
+    """キューに残ったレコードを書き出してリスナーを停止します"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def _reinit_after_fork() -> None:
+    """
+    fork 後の子プロセス（api/server.py のワーカー）では書き出しスレッドが引き継がれないため、
+    キューとリスナーを作り直します。
+    """
+    global _listener
+    if _listener is None:
+        return
+    _listener = None
+    setup_logging()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reinit_after_fork)
+
+
+def get_logger(name: str) -> logging.Logger:
+    """
+    モジュール用のロガーを返します。
+
+    ホットパスでは f-string ではなく `logger.debug("... %s", value)` の形式を使ってください。
+    レベルが無効な場合は引数の文字列化が行われません。
+    """
+    setup_logging()
+    return logging.getLogger(name)
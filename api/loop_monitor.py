@@ -0,0 +1,183 @@
+"""
+Event Loop Monitor
+イベントループの停止（ブロッキング）を検出するモニターと、CPU処理をスレッドプールで実行する関数です。
+
+asyncio のイベントループは1つのスレッドで全リクエストを処理するため、同期処理が
+ループ上で長く動くと、その間は他のすべてのリクエストが止まります。
+
+- LoopLagMonitor: 一定間隔（interval）で眠るタスクを動かし、予定より起きるのが遅れた時間（ラグ）を
+  memo_ai_loop_lag_seconds に記録します。監視スレッドはループが threshold 以上止まっていることを
+  検出すると、その時点のループのスタックを取得し、原因の関数ごとに memo_ai_loop_stalls_total を
+  数えてスタックをログに出力します。
+- run_blocking: 重い同期処理（モデルレジストリの構築、コスト計算、大きなJSONの解析など）を、
+  大きさの上限がある専用のスレッドプール（CPU_POOL_WORKERS）で実行します。
+  小さな入力（size が OFFLOAD_MIN_SIZE 未満）はスレッド切り替えの方が高くつくため、その場で実行します。
+
+スレッドプールはワーカープロセスごとに、最初に使われた時点で作成します（fork 前に作らない）。
+"""
+import sys
+import time
+import asyncio
+import functools
+import threading
+import traceback
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+from api.config import LOOP_LAG_INTERVAL, LOOP_LAG_THRESHOLD, CPU_POOL_WORKERS, OFFLOAD_MIN_SIZE
+from api.tracing import metrics
+from api.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def _culprit(frame) -> str:
+    """スタックの中で最も内側にあるアプリケーション（api/）のフレームを「ファイル:関数」で返します"""
+    innermost = None
+    while frame is not None:
+        code = frame.f_code
+        location = f"{code.co_filename.rsplit('/', 1)[-1]}:{code.co_name}"
+        if innermost is None:
+            innermost = location
+        if "/api/" in code.co_filename.replace("\\", "/") and not code.co_filename.endswith("loop_monitor.py"):
+            return location
+        frame = frame.f_back
+    return innermost or "unknown"
+
+
+class LoopLagMonitor:
+    """イベントループのラグの計測と、停止時のスタックの記録"""
+
+    def __init__(
+        self,
+        interval: float = LOOP_LAG_INTERVAL,
+        threshold: float = LOOP_LAG_THRESHOLD,
+        history: int = 2048,
+        max_stalls: int = 20
+    ):
+        self.interval = interval
+        self.threshold = threshold
+        self.lags: Deque[float] = deque(maxlen=history)
+        self.stalls: Deque[Dict[str, Any]] = deque(maxlen=max_stalls)
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._loop_thread: Optional[int] = None
+        self._heartbeat = 0.0
+        self._captured = False
+
+    @property
+    def started(self) -> bool:
+        return self._task is not None
+
+    async def start(self) -> None:
+        if self.started:
+            return
+        self._loop_thread = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._run())
+        self._watchdog = threading.Thread(target=self._watch, name="memo-ai-loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._stopped.set()
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - started - self.interval)
+            self._heartbeat = now
+            self.lags.append(lag)
+            metrics.observe("memo_ai_loop_lag_seconds", lag, {})
+            if lag >= self.threshold and not self._captured:
+                # 監視スレッドが間に合わなかった短い停止は、原因不明として数える
+                self._record(lag, "unknown", [])
+            self._captured = False
+
+    def _watch(self) -> None:
+        # ループ上で動く処理が止まっている間にスタックを取得する
+        while not self._stopped.wait(self.threshold / 2):
+            blocked = time.monotonic() - self._heartbeat - self.interval
+            if blocked < self.threshold or self._captured:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            self._captured = True
+            self._record(blocked, _culprit(frame), traceback.format_stack(frame))
+
+    def _record(self, lag: float, culprit: str, stack: List[str]) -> None:
+        metrics.incr("memo_ai_loop_stalls_total", culprit=culprit)
+        self.stalls.append({"at": time.time(), "lag": round(lag, 4), "culprit": culprit, "stack": stack})
+        if stack:
+            logger.warning("[LoopLag] Event loop blocked for %.0fms in %s\n%s",
+                           lag * 1000, culprit, "".join(stack[-8:]))
+        else:
+            logger.warning("[LoopLag] Event loop lagged %.0fms", lag * 1000)
+
+    def percentile(self, q: float) -> float:
+        """直近のラグのパーセンタイル（秒）"""
+        if not self.lags:
+            return 0.0
+        ordered = sorted(self.lags)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "p50": round(self.percentile(0.50), 4),
+            "p99": round(self.percentile(0.99), 4),
+            "max": round(max(self.lags, default=0.0), 4),
+            "stalls": [{k: v for k, v in s.items() if k != "stack"} for s in self.stalls],
+        }
+
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=CPU_POOL_WORKERS, thread_name_prefix="memo-ai-cpu")
+    return _executor
+
+
+async def run_blocking(func: Callable[..., Any], *args, size: Optional[int] = None, **kwargs) -> Any:
+    """
+    同期関数をCPU処理用のスレッドプールで実行し、結果を返します。
+
+    トレースのスパン（api/tracing.py）が親子関係を保てるよう、呼び出し元のコンテキストで実行します。
+
+    Args:
+        size: 入力の大きさ（文字数など、任意）。OFFLOAD_MIN_SIZE 未満ならスレッドを使わずにその場で実行します
+    """
+    if size is not None and size < OFFLOAD_MIN_SIZE:
+        return func(*args, **kwargs)
+    context = contextvars.copy_context()
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), functools.partial(context.run, func, *args, **kwargs))
+
+
+def shutdown_executor() -> None:
+    """スレッドプールを終了します（ワーカーの終了時）"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+# グローバルインスタンス
+loop_monitor = LoopLagMonitor()
@@ -0,0 +1,241 @@
+"""
+Model Performance Statistics
+モデルごとの実測パフォーマンス（レイテンシ・エラー率・生成速度・コスト）を記録し、
+自動選択時に最適なモデルを選ぶためのモジュールです。
+
+- 各指標は指数移動平均（EWMA）で保持するため、最近の傾向に素早く追従します。
+- 統計は小さなJSONファイルに保存し、再起動後も引き継ぎます。
+  ファイルは全ワーカーで共有するため、保存時はファイルの統計に、前回の保存以降の自分の観測値を適用して
+  書き戻します（他のワーカーの観測値を上書きしない）。保存はイベントループの外のスレッドで行います。
+- 実績の少ないモデルも一定確率で選ばれる（探索）ため、新しいモデルも評価されます。
+"""
+import os
+import json
+import time
+import random
+import atexit
+import asyncio
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from api.config import (
+    MODEL_STATS_PATH,
+    ROUTING_LATENCY_SLO,
+    ROUTING_COST_CEILING,
+    ROUTING_EXPLORATION_RATE,
+)
+from api.logger import get_logger
+
+logger = get_logger(__name__)
+
+# EWMAの平滑化係数（大きいほど直近の値を重視）
+EWMA_ALPHA = 0.2
+# この回数未満のモデルは「未評価」として探索対象にします
+MIN_SAMPLES = 3
+# ファイル保存の間隔（秒、定期ジョブの間隔）
+SAVE_INTERVAL = 30.0
+
+
+class ModelStats:
+    """1モデル分の統計値"""
+    __slots__ = ("latency", "error_rate", "tokens_per_s", "cost", "samples", "updated_at")
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, tokens_per_s: float = 0.0,
+                 cost: float = 0.0, samples: int = 0, updated_at: float = 0.0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.tokens_per_s = tokens_per_s
+        self.cost = cost
+        self.samples = samples
+        self.updated_at = updated_at
+
+    def _ewma(self, current: float, value: float) -> float:
+        # 最初の観測値はそのまま採用
+        return value if self.samples == 0 else current + EWMA_ALPHA * (value - current)
+
+    def record(self, latency: float, ok: bool, completion_tokens: int = 0, cost: float = 0.0) -> None:
+        self.latency = self._ewma(self.latency, latency)
+        self.error_rate = self._ewma(self.error_rate, 0.0 if ok else 1.0)
+        if ok:
+            if completion_tokens and latency > 0:
+                self.tokens_per_s = self._ewma(self.tokens_per_s, completion_tokens / latency)
+            self.cost = self._ewma(self.cost, cost or 0.0)
+        self.samples += 1
+        self.updated_at = time.time()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {k: getattr(self, k) for k in self.__slots__}
+
+
+class ModelStatsStore:
+    """
+    全モデルの統計値を保持し、JSONファイルへ永続化するストア
+
+    記録はイベントループ上から呼ばれるため、メモリ上の統計の更新だけを行い、
+    ファイルへの保存は SAVE_INTERVAL ごとに別スレッドでまとめて行います。
+    """
+
+    def __init__(self, path: Optional[str] = MODEL_STATS_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._stats: Dict[str, ModelStats] = {}
+        # 前回の保存以降の観測値: (モデル, latency, ok, completion_tokens, cost)
+        self._pending: List[Tuple[str, float, bool, int, float]] = []
+        self._last_save = time.time()
+        self._saving = False
+        self.load()
+
+    def _read(self) -> Dict[str, ModelStats]:
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        with open(self.path, "r", encoding="utf-8") as f:
+            raw = json.load(f)
+        return {
+            model: ModelStats(**{k: v for k, v in values.items() if k in ModelStats.__slots__})
+            for model, values in raw.get("models", {}).items()
+        }
+
+    def load(self) -> None:
+        try:
+            stats = self._read()
+        except (OSError, ValueError, TypeError) as e:
+            logger.warning("[ModelStats] Failed to load %s: %s", self.path, e)
+            return
+        with self._lock:
+            self._stats = stats
+
+    def save(self, force: bool = False) -> None:
+        """
+        前回の保存以降の観測値を、ファイルの統計（他のワーカーの観測値を含む）に適用して書き戻します。
+        メモリ上の統計も、書き戻した内容に置き換えます。force は互換のための引数です（常に保存します）。
+        """
+        if not self.path:
+            return
+        with self._lock:
+            pending, self._pending = self._pending, []
+            self._last_save = time.time()
+        if not pending:
+            return
+        lock_file = None
+        try:
+            if fcntl is not None:
+                # 読み込みから書き戻しまでの間に、他のワーカーが保存しないようにする
+                lock_file = open(f"{self.path}.lock", "w")
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                merged = self._read()
+            except (ValueError, TypeError) as e:
+                logger.warning("[ModelStats] Ignoring unreadable %s: %s", self.path, e)
+                merged = {}
+            for model, latency, ok, completion_tokens, cost in pending:
+                merged.setdefault(model, ModelStats()).record(latency, ok, completion_tokens, cost)
+            payload = {"version": 1, "models": {m: s.to_dict() for m, s in merged.items()}}
+            # 書き込み途中のファイルを読まないように、一時ファイル経由で置き換える
+            # （マルチワーカー時に一時ファイルが衝突しないよう、プロセスIDを含める）
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(payload, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning("[ModelStats] Failed to save %s: %s", self.path, e)
+            with self._lock:
+                self._pending[:0] = pending
+            return
+        finally:
+            if lock_file is not None:
+                lock_file.close()
+        with self._lock:
+            # 保存中に記録された観測値はメモリ上の統計にも反映しておく
+            for model, latency, ok, completion_tokens, cost in self._pending:
+                merged.setdefault(model, ModelStats()).record(latency, ok, completion_tokens, cost)
+            self._stats = merged
+
+    def record(self, model: str, latency: float, ok: bool,
+               completion_tokens: int = 0, cost: float = 0.0) -> None:
+        with self._lock:
+            stats = self._stats.get(model)
+            if stats is None:
+                stats = self._stats[model] = ModelStats()
+            stats.record(latency, ok, completion_tokens, cost)
+            if not self.path:
+                return
+            self._pending.append((model, latency, ok, completion_tokens, cost or 0.0))
+            due = not self._saving and time.time() - self._last_save >= SAVE_INTERVAL
+            if due:
+                self._saving = True
+        if due:
+            try:
+                # ファイルの読み書きはイベントループの外で行う
+                asyncio.get_running_loop().run_in_executor(None, self._save_in_background)
+            except RuntimeError:
+                self._save_in_background()
+
+    def _save_in_background(self) -> None:
+        try:
+            self.save()
+        finally:
+            self._saving = False
+
+    def get(self, model: str) -> Optional[ModelStats]:
+        return self._stats.get(model)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {m: s.to_dict() for m, s in self._stats.items()}
+
+    def choose(
+        self,
+        candidates: List[str],
+        latency_slo: float = ROUTING_LATENCY_SLO,
+        cost_ceiling: float = ROUTING_COST_CEILING,
+        exploration_rate: float = ROUTING_EXPLORATION_RATE,
+        rng: Optional[random.Random] = None
+    ) -> Optional[str]:
+        """
+        候補の中から最適なモデルを選びます。
+
+        1. 一定確率（exploration_rate）で、実績の少ないモデルを試します。
+        2. レイテンシSLOとコスト上限を満たすモデルの中から、
+           エラー率を考慮した実効レイテンシが最小のものを選びます。
+        3. 条件を満たすモデルが無い場合は、SLO/上限からの超過度合いが最小のものを選びます。
+        4. どの候補にも実績が無い場合は、候補リストの先頭（静的な優先順）を返します。
+        """
+        if not candidates:
+            return None
+        rng = rng or random
+
+        measured = [(m, self._stats[m]) for m in candidates
+                    if m in self._stats and self._stats[m].samples >= MIN_SAMPLES]
+        measured_ids = {m for m, _ in measured}
+        unexplored = [m for m in candidates if m not in measured_ids]
+
+        if unexplored and (not measured or rng.random() < exploration_rate):
+            # 未評価モデルが無実績のままにならないよう、探索時は無実績のものから選ぶ
+            return rng.choice(unexplored) if measured else unexplored[0]
+
+        def effective_latency(stats: ModelStats) -> float:
+            # エラー時は再試行が発生するため、成功率で割って期待レイテンシとする
+            return stats.latency / max(1.0 - stats.error_rate, 0.05)
+
+        eligible = [(m, s) for m, s in measured
+                    if effective_latency(s) <= latency_slo and (not cost_ceiling or s.cost <= cost_ceiling)]
+        if eligible:
+            return min(eligible, key=lambda ms: (effective_latency(ms[1]), ms[1].cost))[0]
+
+        def overshoot(stats: ModelStats) -> float:
+            over = effective_latency(stats) / latency_slo if latency_slo else 0.0
+            if cost_ceiling:
+                over += stats.cost / cost_ceiling
+            return over
+
+        return min(measured, key=lambda ms: overshoot(ms[1]))[0]
+
+
+# グローバルインスタンス
+model_stats = ModelStatsStore()
+atexit.register(model_stats.save, True)
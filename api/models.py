@@ -4,16 +4,37 @@ AIモデルのメタデータ管理とインテリジェントな自動選択ロ
 LiteLLMから利用可能なモデル情報を動的に取得し、APIキーの設定状況に基づいて
 実際に使用可能なモデルをフィルタリングします。
 """
-from typing import List, Dict, Any, Optional
+import json
+import hashlib
+from typing import List, Dict, Any, Optional, Sequence
 import litellm
 from api.config import (
     is_provider_available,
     DEFAULT_TEXT_MODEL,
-    DEFAULT_MULTIMODAL_MODEL
+    DEFAULT_MULTIMODAL_MODEL,
+    MODEL_ROUTING_MODE,
+    ROUTING_CANDIDATES
 )
+from api.model_stats import model_stats
+from api.logger import get_logger
+
+logger = get_logger(__name__)
 
 # モデルレジストリのキャッシュ (初回構築後に再利用)
 _MODEL_CACHE = None
+# 利用可能なモデルのキャッシュと、構築時のLiteLLM・認証情報の状態
+_AVAILABLE_CACHE = None
+_REGISTRY_FINGERPRINT = None
+# 認証情報の変更を検知する対象のプロバイダー
+_KNOWN_PROVIDERS = ("gemini", "vertex_ai", "openai", "azure", "anthropic")
+# 利用可能なモデル一覧のバージョン（認証情報の組み合わせごと）
+_VERSION_CACHE: Dict[tuple, str] = {}
+
+# /api/models の fields で指定できる項目
+MODEL_FIELDS = (
+    "id", "name", "provider", "litellm_provider",
+    "supports_vision", "supports_json", "supports_response_schema", "cost_per_1k_tokens", "rate_limit_note",
+)
 
 def _build_model_registry() -> List[Dict[str, Any]]:
     """
@@ -81,6 +102,8 @@ def _build_model_registry() -> List[Dict[str, Any]]:
         
         # JSONモードのサポート（最近のモデルはほぼサポート）
         supports_json = model_info.get("supports_response_schema", True)
+        # JSON Schemaによる構造化出力のサポート（不明な場合は JSONモードを使うため False）
+        supports_response_schema = bool(model_info.get("supports_response_schema", False))
         
         # コスト情報の取得（トークン単価）
         input_cost = model_info.get("input_cost_per_token", 0.0)
@@ -94,6 +117,7 @@ def _build_model_registry() -> List[Dict[str, Any]]:
             "litellm_provider": litellm_provider,  # ルーティング用プロバイダーID
             "supports_vision": supports_vision,
             "supports_json": supports_json,
+            "supports_response_schema": supports_response_schema,
             "cost_per_1k_tokens": {
                 "input": input_cost * 1000 if input_cost else 0.0,
                 "output": output_cost * 1000 if output_cost else 0.0
@@ -114,13 +138,42 @@ def _build_model_registry() -> List[Dict[str, Any]]:
 def get_model_registry() -> List[Dict[str, Any]]:
     """
     モデルレジストリを返します。初回呼び出し時に構築を行い、以降はキャッシュを返します。
+    （LiteLLMのモデル情報や認証情報の変更は refresh_model_registry で反映します）
     """
-    global _MODEL_CACHE
+    global _MODEL_CACHE, _AVAILABLE_CACHE, _REGISTRY_FINGERPRINT
     if _MODEL_CACHE is None:
+        _REGISTRY_FINGERPRINT = _registry_fingerprint()
         _MODEL_CACHE = _build_model_registry()
+        _AVAILABLE_CACHE = None
     return _MODEL_CACHE
 
 
+def _registry_fingerprint() -> tuple:
+    """LiteLLMのモデル情報と、認証情報が設定されているプロバイダーの組み合わせ"""
+    model_cost_map = litellm.model_cost
+    providers = tuple(p for p in _KNOWN_PROVIDERS if is_provider_available(p))
+    return (id(model_cost_map), len(model_cost_map), providers)
+
+
+def refresh_model_registry() -> bool:
+    """
+    LiteLLMのモデル情報または認証情報が変わっていれば、レジストリを作り直します。
+    バックグラウンドの定期ジョブ（api/scheduler.py）から呼ばれます。
+
+    Returns:
+        作り直した場合は True
+    """
+    global _MODEL_CACHE, _AVAILABLE_CACHE, _REGISTRY_FINGERPRINT
+    fingerprint = _registry_fingerprint()
+    if _MODEL_CACHE is not None and fingerprint == _REGISTRY_FINGERPRINT:
+        return False
+    registry = _build_model_registry()
+    _MODEL_CACHE, _AVAILABLE_CACHE, _REGISTRY_FINGERPRINT = registry, None, fingerprint
+    _VERSION_CACHE.clear()
+    logger.info("Model registry rebuilt: %d models", len(registry))
+    return True
+
+
 
 
 
@@ -128,10 +181,14 @@ def get_available_models() -> List[Dict[str, Any]]:
     """
     設定されているAPIキー/認証情報に基づいて、現在利用可能なモデルのリストを返します。
     `api.config.is_provider_available` を使用して、各モデルのプロバイダーが有効かチェックします。
+    結果はレジストリと同じく、refresh_model_registry で作り直されるまで再利用します。
     """
-    available = []
+    global _AVAILABLE_CACHE
     registry = get_model_registry()
-    
+    if _AVAILABLE_CACHE is not None:
+        return _AVAILABLE_CACHE
+
+    available = []
     for model in registry:
         # LiteLLMのプロバイダーID (litellm_provider) を使用して認証チェックを行う
         # 表示名 (provider) ではなく、実際のバックエンド識別子を使用する必要があります。
@@ -140,6 +197,7 @@ def get_available_models() -> List[Dict[str, Any]]:
         if litellm_provider and is_provider_available(litellm_provider):
             available.append(model)
     
+    _AVAILABLE_CACHE = available
     return available
 
 def get_models_by_capability(supports_vision: bool = None) -> List[Dict[str, Any]]:
@@ -181,6 +239,11 @@ def get_model_metadata(model_id: str) -> Optional[Dict[str, Any]]:
     return None
 
 
+def supports_response_schema(model_id: str) -> bool:
+    """モデルがJSON Schemaによる構造化出力（response_format の json_schema）に対応しているか"""
+    metadata = get_model_metadata(model_id)
+    return bool(metadata and metadata.get("supports_response_schema"))
+
 
 def select_model_for_input(
     has_image: bool = False,
@@ -208,14 +271,20 @@ def select_model_for_input(
         if metadata and is_provider_available(metadata["litellm_provider"]):
             # テキスト専用モデルに画像を送ろうとしている場合は警告を出しますが、ユーザーの意思を尊重します。
             if has_image and not metadata.get("supports_vision"):
-                print(f"WARNING: Selected model '{user_selection}' does not support images. "
-                      f"This request may fail.")
+                logger.warning("Selected model '%s' does not support images. "
+                               "This request may fail.", user_selection)
             return user_selection
         else:
-            print(f"WARNING: Selected model '{user_selection}' is not available. "
-                  f"Falling back to default.")
+            logger.warning("Selected model '%s' is not available. "
+                           "Falling back to default.", user_selection)
+    
+    # 優先度2: 実測パフォーマンスに基づく選択（adaptive モード）
+    if MODEL_ROUTING_MODE == "adaptive":
+        routed = select_model_adaptive(has_image)
+        if routed:
+            return routed
     
-    # 優先度2: 入力タイプに基づく自動選択
+    # 優先度3: 入力タイプに基づく自動選択
     if has_image:
         # 画像入力を処理できるVisionモデルが必要です
         
@@ -234,11 +303,11 @@ def select_model_for_input(
             for fallback_model in FALLBACK_VISION_MODELS:
                 if fallback_model in vision_model_ids:
                     if fallback_model != DEFAULT_MULTIMODAL_MODEL:
-                        print(f"INFO: Using fallback vision model '{fallback_model}' (default '{DEFAULT_MULTIMODAL_MODEL}' not available)")
+                        logger.info("Using fallback vision model '%s' (default '%s' not available)", fallback_model, DEFAULT_MULTIMODAL_MODEL)
                     return fallback_model
             
             # フォールバックが見つからない場合、利用可能な最初のVisionモデルを使用
-            print(f"INFO: Using first available vision model '{vision_models[0]['id']}'")
+            logger.info("Using first available vision model '%s'", vision_models[0]["id"])
             return vision_models[0]["id"]
         else:
             raise RuntimeError("画像認識に対応したモデルが利用できません。APIキーの設定を確認してください。")
@@ -258,24 +327,121 @@ def select_model_for_input(
         for fallback_model in FALLBACK_TEXT_MODELS:
             if fallback_model in available_ids:
                 if fallback_model != DEFAULT_TEXT_MODEL:
-                    print(f"INFO: Using fallback model '{fallback_model}' (default '{DEFAULT_TEXT_MODEL}' not available)")
+                    logger.info("Using fallback model '%s' (default '%s' not available)", fallback_model, DEFAULT_TEXT_MODEL)
                 return fallback_model
             
         # 2. フォールバックがない場合、テキスト専用モデルを優先して選択
         # 単価が安い傾向があるため
         text_models = get_models_by_capability(supports_vision=False)
         if text_models:
-            print(f"INFO: Using first available text model '{text_models[0]['id']}'")
+            logger.info("Using first available text model '%s'", text_models[0]["id"])
             return text_models[0]["id"]
             
         # 3. 最終手段: 何でもいいので利用可能なモデルを使用
         if available_ids:
-            print(f"INFO: Using first available model '{available_ids[0]}'")
+            logger.info("Using first available model '%s'", available_ids[0])
             return available_ids[0]
         else:
             raise RuntimeError("利用可能なAIモデルがありません。APIキーの設定を確認してください。")
 
 
+def get_routing_candidates(has_image: bool = False) -> List[str]:
+    """
+    adaptive モードの候補モデルを優先順に返します。
+    
+    ROUTING_CANDIDATES が設定されていればそれを、無ければ静的なフォールバックリストを基本とし、
+    統計が記録済みの利用可能モデル（過去にユーザーが選択したモデルなど）も候補に加えます。
+    画像入力の場合はVision対応モデルのみに絞り込みます。
+    """
+    available = get_models_by_capability(supports_vision=True) if has_image else get_available_models()
+    available_ids = [m["id"] for m in available]
+    available_set = set(available_ids)
+    
+    base = ROUTING_CANDIDATES or [
+        DEFAULT_MULTIMODAL_MODEL if has_image else DEFAULT_TEXT_MODEL,
+        "gemini/gemini-2.5-flash",
+        "openai/gpt-4o-mini"
+    ]
+    candidates = []
+    for model_id in base + [m for m in model_stats.snapshot() if m in available_set]:
+        if model_id in available_set and model_id not in candidates:
+            candidates.append(model_id)
+    return candidates
+
+
+def select_model_adaptive(has_image: bool = False) -> Optional[str]:
+    """
+    実測のレイテンシ・エラー率・コストに基づいてモデルを選択します。
+    候補が無い場合は None を返し、呼び出し側で静的な選択ロジックにフォールバックします。
+    """
+    candidates = get_routing_candidates(has_image)
+    selected = model_stats.choose(candidates)
+    if selected:
+        stats = model_stats.get(selected)
+        logger.debug(
+            "Adaptive routing selected '%s' (latency=%.2fs, error_rate=%.2f, samples=%d)",
+            selected,
+            stats.latency if stats else 0.0,
+            stats.error_rate if stats else 0.0,
+            stats.samples if stats else 0
+        )
+    return selected
+
+
+def get_models_version() -> str:
+    """
+    利用可能なモデル一覧のバージョン（内容のハッシュ）を返します。
+
+    モデルレジストリと、認証情報が設定されているプロバイダーの組み合わせで決まるため、
+    どのワーカーでも同じ値になります。クライアントはこの値をURLに含めることで、
+    /api/models の応答を無期限にキャッシュできます。
+    """
+    available = get_available_models()
+    providers = tuple(sorted({m["litellm_provider"] for m in available}))
+    version = _VERSION_CACHE.get(providers)
+    if version is None:
+        payload = json.dumps(available, sort_keys=True, separators=(",", ":"))
+        version = hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+        _VERSION_CACHE[providers] = version
+    return version
+
+
+def filter_models(
+    models: List[Dict[str, Any]],
+    capability: Optional[str] = None,
+    provider: Optional[str] = None,
+    max_cost: Optional[float] = None
+) -> List[Dict[str, Any]]:
+    """
+    モデル一覧を条件で絞り込みます。
+
+    Args:
+        capability: "vision"（Vision対応のみ） / "text"（テキスト専用のみ）
+        provider: プロバイダーID（gemini など）または表示名（Gemini API など）。大文字小文字は区別しない
+        max_cost: 入力1kトークンあたりの上限コスト（USD）
+    """
+    if capability == "vision":
+        models = [m for m in models if m.get("supports_vision")]
+    elif capability == "text":
+        models = [m for m in models if not m.get("supports_vision")]
+
+    if provider:
+        p = provider.lower()
+        models = [m for m in models if p in (m.get("litellm_provider", "").lower(), m.get("provider", "").lower())]
+
+    if max_cost is not None:
+        models = [m for m in models if m.get("cost_per_1k_tokens", {}).get("input", 0.0) <= max_cost]
+
+    return models
+
+
+def project_models(models: List[Dict[str, Any]], fields: Optional[Sequence[str]] = None) -> List[Dict[str, Any]]:
+    """指定した項目だけを残したモデル一覧を返します（fields が空の場合はそのまま）"""
+    if not fields:
+        return models
+    return [{f: m[f] for f in fields if f in m} for m in models]
+
+
 # フロントエンド向けのコンビニエンス関数
 def get_text_models() -> List[Dict[str, Any]]:
     """利用可能なテキスト専用モデルのリストを返します"""
@@ -1,12 +1,146 @@
 import os
+import time
 import asyncio
 import httpx
-from typing import Dict, List, Optional, Any
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple, Any
+
+from api.tracing import span, normalize_endpoint
+from api.logger import get_logger
+from api.serializers import dumps_bytes, simplify_properties
+from api.config import NOTION_MAX_CONNECTIONS, NOTION_RATE_LIMIT, NOTION_RATE_BURST
+
+logger = get_logger(__name__)
 
 # Notion API Configuration
 # Notion APIのバージョンを指定（破壊的変更が多いため固定推奨）
 NOTION_VERSION = "2022-06-28"
-BASE_URL = "https://api.notion.com/v1"
+# ベンチマーク等でローカルのモックサーバーを使う場合は NOTION_API_BASE_URL で上書きします
+BASE_URL = os.getenv("NOTION_API_BASE_URL", "https://api.notion.com/v1").rstrip("/")
+
+# --- 共有HTTPクライアント (Shared HTTP Client) ---
+# リクエストごとに AsyncClient を作るとTCP/TLS接続が毎回やり直しになるため、
+# イベントループ（ワーカープロセス）ごとに1つを共有し、接続を再利用します。
+_client: Optional[httpx.AsyncClient] = None
+_client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """
+    現在のイベントループ用の共有クライアントを返します。
+
+    fork 前に作られたクライアントや、別のイベントループ（テスト・ベンチマーク）で
+    作られたクライアントは使い回さず、新しく作成します。
+    """
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client.is_closed or _client_loop is not loop:
+        _client = httpx.AsyncClient(
+            timeout=30.0,
+            limits=httpx.Limits(
+                max_connections=NOTION_MAX_CONNECTIONS,
+                max_keepalive_connections=NOTION_MAX_CONNECTIONS
+            )
+        )
+        _client_loop = loop
+    return _client
+
+
+async def close_client() -> None:
+    """共有クライアントを閉じます（アプリ終了時に呼び出します）"""
+    global _client, _client_loop
+    if _client is not None and _client_loop is asyncio.get_running_loop():
+        await _client.aclose()
+    _client, _client_loop = None, None
+
+
+async def warmup(connections: int = 1) -> int:
+    """
+    Notion APIへの接続を事前に確立し、最初のリクエストのTLSハンドシェイク待ちをなくします。
+    認証エラー等の応答でも接続自体は確立されるため、ステータスは問いません。
+
+    Returns:
+        int: 確立できた接続数
+    """
+    api_key = os.environ.get("NOTION_API_KEY")
+    headers = {"Notion-Version": NOTION_VERSION}
+    if api_key:
+        headers["Authorization"] = f"Bearer {api_key}"
+    client = get_client()
+
+    async def _open() -> bool:
+        try:
+            # 同時に送ることで、プールに connections 本の接続が残る
+            await client.get(f"{BASE_URL}/users/me", headers=headers, timeout=10.0)
+            return True
+        except httpx.HTTPError as e:
+            logger.warning("[Notion] Warmup failed: %s", e)
+            return False
+
+    with span("notion.warmup"):
+        results = await asyncio.gather(*[_open() for _ in range(max(1, connections))])
+    return sum(results)
+
+# --- 送信レートの制御 (Throttle) ---
+# 以前はリクエストごとに一律 0.35 秒待っていましたが、同時に送るリクエストには効かず、
+# 空いている時にも毎回待ち時間がかかっていました。ワーカー内の全リクエストで1つのバケットを共有します。
+
+class Throttle:
+    """トークンバケット方式のレート制御（rate 件/秒、最大 burst 件まで連続で送信可能）"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> None:
+        """送信枠を1つ確保します（枠が無い場合は空くまで待ちます）"""
+        if self.rate <= 0:
+            return
+        # 先に枠を予約してから待つ（await を挟まないため、同時に呼ばれても順番に割り当てられる）
+        self._refill()
+        self._tokens -= 1
+        if self._tokens >= 0:
+            return
+        try:
+            await asyncio.sleep(-self._tokens / self.rate)
+        except asyncio.CancelledError:
+            # 使わなかった枠を返す
+            self._tokens += 1
+            raise
+
+    def pause(self, seconds: float) -> None:
+        """レート制限（429）を受けた場合に、seconds 秒間は新しい送信を止めます"""
+        if self.rate <= 0:
+            return
+        self._refill()
+        self._tokens = min(self._tokens, -seconds * self.rate)
+
+
+throttle = Throttle(NOTION_RATE_LIMIT, NOTION_RATE_BURST)
+
+# ページ作成後に呼び出すコールバック（ローカルの索引を差分更新するために使用）
+# 引数: (database_id, properties, page) / 例外は記録するだけで登録処理には影響させません
+_page_created_hooks: List[Callable[[str, Dict[str, Any], Dict[str, Any]], None]] = []
+
+
+def on_page_created(callback: Callable[[str, Dict[str, Any], Dict[str, Any]], None]) -> None:
+    """create_page の成功後に呼び出されるコールバックを登録します"""
+    _page_created_hooks.append(callback)
+
+
+def _notify_page_created(target_db_id: str, properties: Dict[str, Any], page: Dict[str, Any]) -> None:
+    for callback in _page_created_hooks:
+        try:
+            callback(target_db_id, properties, page)
+        except Exception:
+            logger.exception("[Notion] page_created hook failed: %r", callback)
 
 async def safe_api_call(
     method, 
@@ -14,6 +148,7 @@ async def safe_api_call(
     ignore_errors: Optional[List[int]] = None, 
     max_retries: int = 3, 
     timeout: float = 30.0,
+    retry_on_timeout: bool = True,
     **kwargs
 ):
     """
@@ -28,6 +163,8 @@ async def safe_api_call(
         ignore_errors (List[int]): 無視してNoneを返すステータスコードのリスト
         max_retries (int): 最大リトライ回数
         timeout (float): タイムアウト秒数
+        retry_on_timeout (bool): 応答タイムアウト時に再送信するか。
+            ページ作成など冪等でないリクエストでは False にします（送信自体は届いている場合があるため）
     """
     api_key = os.environ.get("NOTION_API_KEY")
     if not api_key:
@@ -41,63 +178,88 @@ async def safe_api_call(
     
     url = f"{BASE_URL}/{endpoint}"
     
+    # 計測: エンドポイント（ID除去済み）とステータスごとにレイテンシを集計
+    with span("notion.api", method=method, endpoint=normalize_endpoint(endpoint)) as s:
+        try:
+            return await _request_with_retries(
+                s, method, url, endpoint, headers, ignore_errors, max_retries, timeout, retry_on_timeout, **kwargs
+            )
+        finally:
+            # 例外時にステータスが無い場合は span 側で例外名がラベルになります
+            status = s.attributes.get("http.status_code")
+            if status is not None:
+                s.set_label("status", status)
+
+
+async def _request_with_retries(
+    s, method, url, endpoint, headers, ignore_errors, max_retries, timeout, retry_on_timeout, **kwargs
+):
+    """safe_api_call のリトライループ本体"""
     # リトライループ
     for attempt in range(max_retries):
+        s.set_attribute("attempts", attempt + 1)
+        s.set_attribute("http.status_code", None)
         try:
-            async with httpx.AsyncClient(timeout=timeout) as client:
-                # レート制限対策として少し待機
-                await asyncio.sleep(0.35) 
-                
-                response = await client.request(method, url, headers=headers, **kwargs)
-                
-                # HTTP 429 (Too Many Requests) のハンドリング
-                if response.status_code == 429:
-                    retry_after = int(response.headers.get("Retry-After", 2))
-                    print(f"Rate limited, waiting {retry_after}s...")
+            client = get_client()
+            # レート制限対策: ワーカー内で共有する送信枠を待つ
+            with span("notion.throttle"):
+                await throttle.acquire()
+            
+            response = await client.request(method, url, headers=headers, timeout=timeout, **kwargs)
+            s.set_attribute("http.status_code", response.status_code)
+            
+            # HTTP 429 (Too Many Requests) のハンドリング
+            if response.status_code == 429:
+                retry_after = int(response.headers.get("Retry-After", 2))
+                logger.info("Rate limited, waiting %ds...", retry_after)
+                # 同時に送ろうとしている他のリクエストも止める
+                throttle.pause(retry_after)
+                with span("notion.retry_wait", reason="rate_limited"):
                     await asyncio.sleep(retry_after)
-                    continue
-                
-                # 指定されたエラーコードの場合、例外を投げずにNoneを返す（例：404 Not Foundを許容する場合など）
-                if ignore_errors and response.status_code in ignore_errors:
-                    return None
-                
-                response.raise_for_status()
-                return response.json()
-                
+                continue
+            
+            # 指定されたエラーコードの場合、例外を投げずにNoneを返す（例：404 Not Foundを許容する場合など）
+            if ignore_errors and response.status_code in ignore_errors:
+                return None
+            
+            response.raise_for_status()
+            return response.json()
+            
         except httpx.ReadTimeout:
-            if attempt < max_retries - 1:
+            if retry_on_timeout and attempt < max_retries - 1:
                 # 指数バックオフ: 1秒, 2秒, 4秒... と待機時間を倍にしていく
                 backoff = 2 ** attempt
-                print(f"Timeout on {endpoint}, retry {attempt + 1}/{max_retries} after {backoff}s")
-                await asyncio.sleep(backoff)
+                logger.warning("Timeout on %s, retry %d/%d after %ds", endpoint, attempt + 1, max_retries, backoff)
+                with span("notion.retry_wait", reason="timeout"):
+                    await asyncio.sleep(backoff)
             else:
-                print(f"Final timeout on {endpoint} after {max_retries} attempts")
+                logger.error("Final timeout on %s after %d attempts", endpoint, max_retries)
                 raise
                 
         except httpx.NetworkError as e:
             if attempt < max_retries - 1:
                 backoff = 2 ** attempt
-                print(f"Network error on {endpoint}, retry {attempt + 1}/{max_retries} after {backoff}s")
-                await asyncio.sleep(backoff)
+                logger.warning("Network error on %s, retry %d/%d after %ds", endpoint, attempt + 1, max_retries, backoff)
+                with span("notion.retry_wait", reason="network_error"):
+                    await asyncio.sleep(backoff)
             else:
-                print(f"Network error on {endpoint} after {max_retries} attempts: {e}")
+                logger.error("Network error on %s after %d attempts: %s", endpoint, max_retries, e)
                 raise
                 
         except httpx.HTTPStatusError as e:
             status = e.response.status_code
-            print(f"HTTP {status} on {method} {endpoint}")
+            logger.warning("HTTP %d on %s %s", status, method, endpoint)
             # 500系エラーはサーバー側の問題なのでリトライする価値がある
             if status >= 500 and attempt < max_retries - 1:
                 backoff = 2 ** attempt
-                print(f"Server error, retry {attempt + 1}/{max_retries} after {backoff}s")
-                await asyncio.sleep(backoff)
+                logger.warning("Server error, retry %d/%d after %ds", attempt + 1, max_retries, backoff)
+                with span("notion.retry_wait", reason="server_error"):
+                    await asyncio.sleep(backoff)
             else:
                 raise
                 
         except Exception as e:
-            print(f"Unexpected error on {endpoint}: {type(e).__name__} - {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("Unexpected error on %s: %s - %s", endpoint, type(e).__name__, e)
             raise
     
     return None
@@ -151,6 +313,10 @@ async def fetch_config_db(config_db_id: str) -> List[Dict[str, str]]:
             continue
     return configs
 
+class NotADatabaseError(ValueError):
+    """IDがデータベースではない（ページなど）とNotionが応答した"""
+
+
 async def get_db_schema(target_db_id: str) -> Dict[str, Any]:
     """
     データベースのスキーマ（プロパティ定義）を取得
@@ -162,7 +328,7 @@ async def get_db_schema(target_db_id: str) -> Dict[str, Any]:
     # （呼び出し元で is None チェックをしている場合があるため）
     response = await safe_api_call("GET", f"databases/{target_db_id}", ignore_errors=[400])
     if response is None:
-        raise ValueError("Not a database")
+        raise NotADatabaseError("Not a database")
     
     return response.get("properties", {})
 
@@ -201,12 +367,93 @@ async def create_page(target_db_id: str, properties: Dict[str, Any]) -> str:
         "properties": properties
     }
     
-    response = await safe_api_call("POST", "pages", json=body)
+    # プロパティ数が多い場合に備え、JSONエンコードは高速なバイト列エンコーダーで行います
+    content = dumps_bytes(body)
+    # Notionの created_time は分単位のため、検索の起点は1分前にする
+    started = (datetime.now(timezone.utc) - timedelta(minutes=1)).isoformat()
+    try:
+        response = await safe_api_call("POST", "pages", content=content, retry_on_timeout=False)
+    except httpx.ReadTimeout:
+        # リクエストは届いていて応答だけが遅れた可能性があるため、再送信の前に作成済みか確認する
+        response = await _find_created_page(target_db_id, properties, started)
+        if response is not None:
+            logger.info("[Notion] create_page timed out but the page exists, not resending")
+        else:
+            response = await safe_api_call("POST", "pages", content=content, retry_on_timeout=False)
     if response and "url" in response:
+        _notify_page_created(target_db_id, properties, response)
         return response["url"]
     
     raise Exception("Failed to create page")
 
+def _comparable(value: Any) -> Any:
+    """simplify_properties の値を比較用に正規化します（日時の表記ゆれ・複数選択の順序）"""
+    if isinstance(value, list):
+        return sorted(str(v) for v in value)
+    if isinstance(value, str) and len(value) > 10 and value[4:5] == "-" and "T" in value:
+        # Notion は "2026-10-20T10:00:00+09:00" を "2026-10-20T10:00:00.000+09:00" の形式で返す
+        try:
+            return datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return value
+    return value
+
+
+def _has_written_values(page: Dict[str, Any], properties: Dict[str, Any]) -> bool:
+    """ページのプロパティが、送信したすべてのプロパティの値と一致するか"""
+    written = simplify_properties(properties)
+    stored = simplify_properties(page.get("properties", {}))
+    return all(_comparable(stored.get(k)) == _comparable(v) for k, v in written.items() if v != "N/A")
+
+
+async def _find_created_page(
+    target_db_id: str,
+    properties: Dict[str, Any],
+    created_since: str
+) -> Optional[Dict[str, Any]]:
+    """
+    created_since 以降に作成され、送信したすべてのプロパティの値が一致するページを探します（見つからなければ None）。
+    タイトルだけで判定すると、直前に同じタイトルで保存した別のページを作成済みとみなしてしまうためです。
+    """
+    for name, value in properties.items():
+        if isinstance(value, dict) and "title" in value:
+            title = "".join([(t.get("text") or {}).get("content", "") for t in value["title"]])
+            break
+    else:
+        return None
+    if not title:
+        return None
+
+    body = {
+        "page_size": 10,
+        "filter": {"and": [
+            {"property": name, "title": {"equals": title}},
+            {"timestamp": "created_time", "created_time": {"on_or_after": created_since}},
+        ]},
+        "sorts": [{"timestamp": "created_time", "direction": "descending"}],
+    }
+    response = await safe_api_call("POST", f"databases/{target_db_id}/query", json=body)
+    for page in (response or {}).get("results", []):
+        if _has_written_values(page, properties):
+            return page
+    return None
+
+async def create_child_page(parent_page_id: str, title: str) -> Dict[str, Any]:
+    """
+    指定したページの子として、新しい空のページを作成
+
+    Returns:
+        Dict: 作成されたページオブジェクト（id, url を含む）
+    """
+    body = {
+        "parent": {"page_id": parent_page_id},
+        "properties": {"title": {"title": [{"text": {"content": title}}]}}
+    }
+    response = await safe_api_call("POST", "pages", content=dumps_bytes(body), retry_on_timeout=False)
+    if not response or "id" not in response:
+        raise Exception("Failed to create page")
+    return response
+
 async def fetch_children_list(parent_page_id: str, limit: int = 100) -> List[Dict[str, Any]]:
     """
     ページ内ブロック（子要素）の一覧取得
@@ -271,3 +518,80 @@ async def query_database(database_id: str, limit: int = 20) -> List[Dict[str, An
     if not response:
         return []
     return response.get("results", [])
+
+async def iter_database_batches(
+    database_id: str,
+    edited_since: Optional[str] = None,
+    page_size: int = 100,
+    start_cursor: Optional[str] = None
+) -> AsyncIterator[Tuple[Optional[str], List[Dict[str, Any]]]]:
+    """
+    データベースのページを、1回のリクエストで取得した単位で最終更新日時の昇順に返します。
+
+    Yields:
+        (cursor, pages): このバッチの取得に使った start_cursor（最初のバッチは None）とページの一覧。
+        cursor を start_cursor に指定すると、同じ条件（edited_since）でこのバッチから取得し直せます
+
+    Args:
+        database_id (str): 対象データベースのID
+        edited_since (str): 指定した場合、この日時（ISO 8601）以降に更新されたページのみ取得
+        page_size (int): 1回のリクエストで取得する件数（最大100）
+        start_cursor (str): 途中から取得する場合の、前回のバッチの cursor
+    """
+    body: Dict[str, Any] = {
+        "page_size": page_size,
+        "sorts": [{"timestamp": "last_edited_time", "direction": "ascending"}]
+    }
+    if edited_since:
+        # Notionの last_edited_time は分単位のため、境界の分は再取得になる（呼び出し側で上書き）
+        body["filter"] = {"timestamp": "last_edited_time", "last_edited_time": {"on_or_after": edited_since}}
+    if start_cursor:
+        body["start_cursor"] = start_cursor
+
+    while True:
+        response = await safe_api_call("POST", f"databases/{database_id}/query", json=body, timeout=60.0)
+        if not response:
+            return
+        yield body.get("start_cursor"), response.get("results", [])
+        if not response.get("has_more") or not response.get("next_cursor"):
+            return
+        body["start_cursor"] = response["next_cursor"]
+
+async def iter_database_pages(
+    database_id: str,
+    edited_since: Optional[str] = None,
+    page_size: int = 100
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    データベースの全ページを最終更新日時の昇順で順に返します（ページングは自動で処理）。
+
+    Args:
+        database_id (str): 対象データベースのID
+        edited_since (str): 指定した場合、この日時（ISO 8601）以降に更新されたページのみ取得
+        page_size (int): 1回のリクエストで取得する件数（最大100）
+    """
+    async for _, pages in iter_database_batches(database_id, edited_since=edited_since, page_size=page_size):
+        for page in pages:
+            yield page
+
+async def iter_block_children(block_id: str, page_size: int = 100) -> AsyncIterator[Dict[str, Any]]:
+    """
+    ブロック（ページ）の子ブロックを順に返します（ページングは自動で処理）。
+
+    呼び出し側が途中で反復をやめれば、残りのページは取得しません。
+    削除済み（アーカイブ）のブロックは除外します。
+    """
+    cursor = None
+    while True:
+        endpoint = f"blocks/{block_id}/children?page_size={page_size}"
+        if cursor:
+            endpoint += f"&start_cursor={cursor}"
+        response = await safe_api_call("GET", endpoint)
+        if not response:
+            return
+        for block in response.get("results", []):
+            if not block.get("archived"):
+                yield block
+        cursor = response.get("next_cursor")
+        if not response.get("has_more") or not cursor:
+            return
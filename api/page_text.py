@@ -0,0 +1,159 @@
+"""
+Reference Text Extraction
+「ページを参照」機能で、ターゲットの内容をプロンプト用のプレーンテキストに変換するモジュールです。
+
+- ページ: 子ブロックをページングしながら順に取得し（子ブロックは REFERENCE_MAX_DEPTH 階層まで）、
+  1ブロックずつテキストに変換します。トークン予算に達した時点で取得をやめるため、
+  巨大なページでもメモリ使用量とプロンプトの長さが一定に収まります。
+- データベース: 最新の行を「列名: 値」の形式に変換します。
+
+ページの抽出結果は「ページID + last_edited_time」をキーにキャッシュし、
+ページが編集されるまではブロックを取得し直しません。
+"""
+from typing import Any, Dict, List, Optional
+
+from api.config import REFERENCE_TOKEN_BUDGET, REFERENCE_MAX_DEPTH, REFERENCE_CACHE_SIZE
+from api.cache import TTLCache
+from api.notion import get_page_info, iter_block_children
+from api.serializers import simplify_properties, display_value
+from api.examples_index import estimate_tokens
+from api.tracing import span
+
+# 1ブロック・1セルあたりの最大文字数（1つの長いブロックが予算を占有しないように）
+MAX_BLOCK_CHARS = 500
+MAX_VALUE_CHARS = 100
+# データベースの参照に含める最大行数
+MAX_DATABASE_ROWS = 10
+
+# 子ブロックをたどらないブロック（別ページの内容になるため）
+_NO_RECURSE_TYPES = {"child_page", "child_database"}
+
+_LINE_PREFIXES = {
+    "heading_1": "# ",
+    "heading_2": "## ",
+    "heading_3": "### ",
+    "bulleted_list_item": "- ",
+    "numbered_list_item": "1. ",
+    "quote": "> ",
+}
+
+# キーに last_edited_time を含むため期限切れは不要だが、古い版を残さないよう件数で制限する
+_page_text_cache = TTLCache("page_text", ttl=86400, max_entries=REFERENCE_CACHE_SIZE)
+
+
+def block_to_text(block: Dict[str, Any]) -> str:
+    """ブロックを1行のプレーンテキストにします（テキストを持たないブロックは空文字）"""
+    b_type = block.get("type")
+    data = block.get(b_type) or {}
+
+    if b_type == "child_page":
+        return data.get("title", "")
+    if b_type == "table_row":
+        cells = ["".join(t.get("plain_text", "") for t in cell) for cell in data.get("cells", [])]
+        return " | ".join(cells)
+
+    text = "".join(t.get("plain_text", "") for t in data.get("rich_text", []))
+    if not text:
+        return ""
+    if b_type == "to_do":
+        return ("[x] " if data.get("checked") else "[ ] ") + text
+    return _LINE_PREFIXES.get(b_type, "") + text
+
+
+def truncate_to_tokens(text: str, budget: int) -> str:
+    """estimate_tokens の見積もりで budget に収まるように末尾を切り詰めます"""
+    if estimate_tokens(text) <= budget:
+        return text
+    used = 0.0
+    for i, c in enumerate(text):
+        used += 0.25 if ord(c) < 128 else 1.0
+        if used > budget:
+            return text[:i]
+    return text
+
+
+async def _extract(page_id: str, token_budget: int, max_depth: int) -> str:
+    lines: List[str] = []
+    remaining = token_budget
+
+    async def walk(block_id: str, depth: int) -> bool:
+        """予算内に収まれば True、予算に達したら False を返します"""
+        nonlocal remaining
+        async for block in iter_block_children(block_id):
+            text = block_to_text(block)[:MAX_BLOCK_CHARS]
+            if text:
+                line = "  " * depth + text
+                cost = estimate_tokens(line) + 1  # 改行の分
+                if cost > remaining:
+                    lines.append(truncate_to_tokens(line, remaining))
+                    remaining = 0
+                    return False
+                lines.append(line)
+                remaining -= cost
+            if block.get("has_children") and depth < max_depth and block.get("type") not in _NO_RECURSE_TYPES:
+                if not await walk(block["id"], depth + 1):
+                    return False
+        return True
+
+    with span("page_text.extract"):
+        await walk(page_id, 0)
+    return "\n".join(line for line in lines if line)
+
+
+async def extract_page_text(
+    page_id: str,
+    token_budget: int = REFERENCE_TOKEN_BUDGET,
+    max_depth: int = REFERENCE_MAX_DEPTH
+) -> str:
+    """
+    ページの本文をプレーンテキストで返します（token_budget トークンまで）。
+
+    Args:
+        page_id: 対象ページのID
+        token_budget: 返すテキストの上限（estimate_tokens による概算）
+        max_depth: 子ブロックをたどる階層数（0 の場合はページ直下のブロックのみ）
+    """
+    info = await get_page_info(page_id)
+    edited = (info or {}).get("last_edited_time")
+    if not edited:
+        return await _extract(page_id, token_budget, max_depth)
+    key = (page_id, edited, token_budget, max_depth)
+    return await _page_text_cache.get_or_load(key, lambda: _extract(page_id, token_budget, max_depth))
+
+
+def invalidate_page_text(page_id: str) -> None:
+    """ページの本文のキャッシュを破棄します（Notion Webhook で更新を通知された場合）"""
+    _page_text_cache.invalidate(lambda key: key[0] == page_id)
+
+
+def format_database_rows(
+    pages: List[Dict[str, Any]],
+    token_budget: int = REFERENCE_TOKEN_BUDGET,
+    max_rows: int = MAX_DATABASE_ROWS
+) -> str:
+    """データベースの行（新しい順）を「列名: 値」の形式にし、行の間を --- で区切ります"""
+    blocks: List[str] = []
+    remaining = token_budget
+    for page in pages[:max_rows]:
+        lines = []
+        for key, value in simplify_properties(page.get("properties", {})).items():
+            text = display_value(value)[:MAX_VALUE_CHARS]
+            if text:
+                lines.append(f"{key}: {text}")
+        if not lines:
+            continue
+        row = "\n".join(lines)
+        cost = estimate_tokens(row) + 4  # 区切り線の分
+        if cost > remaining:
+            blocks.append(truncate_to_tokens(row, remaining))
+            break
+        blocks.append(row)
+        remaining -= cost
+    return "\n---\n".join(b for b in blocks if b)
+
+
+def wrap_reference(text: Optional[str]) -> str:
+    """抽出したテキストを、プロンプトに含める参考情報の形式にします（空の場合は空文字）"""
+    if not text or not text.strip():
+        return ""
+    return f"<参考 既存の情報>\n{text}\n</参考 既存の情報>"
@@ -0,0 +1,214 @@
+"""
+Target Prefetch
+ターゲット（保存先のデータベース・ページ）ごとのデータをキャッシュし、
+ターゲットが選択された時点で先読みするモジュールです。
+
+フロントエンドはターゲット選択時に POST /api/warmup/{target_id} を呼び出します。
+サーバーはバックグラウンドで以下を取得・構築してキャッシュに入れるため、
+直後の最初のチャットはLLMの応答時間だけで済みます。
+
+- スキーマ（/api/schema と /api/chat で共用）
+- Few-shot例の索引（api/examples_index.py）
+- チャット用のシステムメッセージ（システムプロンプト + スキーマ）
+- 「ページを参照」が有効な場合は、参照用のテキスト（api/page_text.py）
+
+キャッシュは TARGET_CACHE_TTL 秒で期限切れになり、保存（create_page / append_block）時には
+該当ターゲットのコンテンツを破棄します。
+
+ターゲット一覧と、最近使われたターゲットのスキーマはバックグラウンドの定期ジョブ（api/scheduler.py）で
+期限切れの前に更新するため、リクエストがNotionの応答を待つのは初回だけです。
+"""
+import time
+import asyncio
+import hashlib
+from typing import Any, Dict, List, Optional
+
+from api.config import NOTION_ROOT_PAGE_ID, TARGET_CACHE_TTL, EXAMPLE_RETRIEVAL_MODE, SCHEMA_REFRESH_WINDOW
+from api.cache import TTLCache
+from api.http_cache import invalidate_responses
+from api.notion import (
+    NotADatabaseError,
+    get_db_schema,
+    query_database,
+    fetch_children_list,
+    on_page_created,
+)
+from api.examples_index import example_indexes
+from api.ai import build_chat_system_message
+from api.page_text import extract_page_text, format_database_rows, wrap_reference
+from api.tracing import span
+from api.logger import get_logger
+
+logger = get_logger(__name__)
+
+schema_cache = TTLCache("schema", TARGET_CACHE_TTL)
+system_message_cache = TTLCache("system_message", TARGET_CACHE_TTL)
+content_cache = TTLCache("content", TARGET_CACHE_TTL)
+targets_cache = TTLCache("targets", TARGET_CACHE_TTL)
+
+# スキーマを取得したターゲットと最後に使われた時刻（time.monotonic）。定期的な再検証の対象
+_recent_targets: Dict[str, float] = {}
+
+# 実行中の先読みタスク（完了前にGCで回収されないよう参照を保持する）
+_warmup_tasks: Dict[str, asyncio.Task] = {}
+
+
+async def _load_targets() -> List[Dict[str, Any]]:
+    targets = []
+    for block in await fetch_children_list(NOTION_ROOT_PAGE_ID):
+        if block.get("type") == "child_database":
+            targets.append({"id": block["id"], "type": "database", "title": block["child_database"].get("title", "")})
+        elif block.get("type") == "child_page":
+            targets.append({"id": block["id"], "type": "page", "title": block["child_page"].get("title", "")})
+    return targets
+
+
+async def list_targets() -> List[Dict[str, Any]]:
+    """ルートページ直下のデータベースとページ（保存先の候補）を返します"""
+    return await targets_cache.get_or_load(NOTION_ROOT_PAGE_ID, _load_targets)
+
+
+async def refresh_targets() -> None:
+    """ターゲット一覧を取得し直します。変わっていれば /api/targets のレスポンスを破棄します"""
+    if not NOTION_ROOT_PAGE_ID:
+        return
+    previous = targets_cache.get(NOTION_ROOT_PAGE_ID)
+    targets = await targets_cache.refresh(NOTION_ROOT_PAGE_ID, _load_targets)
+    if previous is not None and targets != previous:
+        logger.info("[Prefetch] Targets changed: %d -> %d", len(previous), len(targets))
+        invalidate_responses("/api/targets")
+
+
+def invalidate_targets() -> None:
+    """ターゲットが追加された場合に、一覧とそのレスポンスを破棄します"""
+    targets_cache.invalidate()
+    invalidate_responses("/api/targets")
+
+
+async def _load_target_schema(target_id: str) -> Dict[str, Any]:
+    # ページとして扱うのは「データベースではない」という応答の場合だけ。
+    # 設定の誤り（NOTION_API_KEY が無いなど）や通信エラーは送出し、キャッシュしない
+    try:
+        return {"type": "database", "schema": await get_db_schema(target_id)}
+    except NotADatabaseError:
+        return {"type": "page", "schema": {}}
+
+
+async def get_target_schema(target_id: str) -> Dict[str, Any]:
+    """
+    ターゲットの種類とスキーマを返します: {"type": "database" | "page", "schema": {...}}
+    ページの場合（データベースとして取得できない場合）は空のスキーマになります。
+    """
+    _recent_targets[target_id] = time.monotonic()
+    return await schema_cache.get_or_load(target_id, lambda: _load_target_schema(target_id))
+
+
+async def refresh_recent_schemas() -> int:
+    """
+    SCHEMA_REFRESH_WINDOW 秒以内に使われたターゲットのスキーマを取得し直します。
+    スキーマが変わったターゲットは、システムメッセージと /api/schema のレスポンスを破棄します。
+
+    Returns:
+        スキーマが変わったターゲットの数
+    """
+    cutoff = time.monotonic() - SCHEMA_REFRESH_WINDOW
+    for target_id in [t for t, used in _recent_targets.items() if used < cutoff]:
+        _recent_targets.pop(target_id, None)
+
+    changed = 0
+    for target_id in list(_recent_targets):
+        previous = schema_cache.get(target_id)
+        try:
+            target = await schema_cache.refresh(target_id, lambda: _load_target_schema(target_id))
+        except Exception as e:
+            # 1つのターゲットの失敗（削除されたデータベース・429 など）で、残りの確認とジョブ全体を止めない
+            logger.warning("[Prefetch] Schema refresh failed for %s: %s", target_id, e)
+            continue
+        if previous is not None and target != previous:
+            changed += 1
+            logger.info("[Prefetch] Schema changed: %s", target_id)
+            system_message_cache.invalidate(lambda key: key[0] == target_id)
+            invalidate_responses(f"/api/schema/{target_id}")
+    return changed
+
+
+async def get_system_message(target_id: str, system_prompt: str) -> str:
+    """チャット用のシステムメッセージを返します（ターゲットとシステムプロンプトの組ごとにキャッシュ）"""
+    key = (target_id, hashlib.sha256(system_prompt.encode("utf-8")).hexdigest())
+
+    async def _build():
+        target = await get_target_schema(target_id)
+        return build_chat_system_message(system_prompt, target["schema"])
+
+    return await system_message_cache.get_or_load(key, _build)
+
+
+async def get_database_pages(database_id: str) -> List[Dict[str, Any]]:
+    return await content_cache.get_or_load(("database", database_id), lambda: query_database(database_id))
+
+
+async def get_page_blocks(page_id: str) -> List[Dict[str, Any]]:
+    return await content_cache.get_or_load(("page", page_id), lambda: fetch_children_list(page_id))
+
+
+async def get_reference_context(target_id: str) -> str:
+    """「ページを参照」用に、ターゲットの内容をプロンプトに含める形式で返します"""
+    target = await get_target_schema(target_id)
+    if target["type"] == "database":
+        text = format_database_rows(await get_database_pages(target_id))
+    else:
+        text = await extract_page_text(target_id)
+    return wrap_reference(text)
+
+
+def invalidate_content(target_id: str) -> None:
+    """保存によって内容が変わったターゲットのコンテンツを破棄します"""
+    content_cache.invalidate(lambda key: key[1] == target_id)
+
+
+def invalidate_schema(target_id: str) -> None:
+    """スキーマが変わったターゲットのスキーマ・システムメッセージ・例の索引と /api/schema のレスポンスを破棄します"""
+    schema_cache.invalidate(lambda key: key == target_id)
+    system_message_cache.invalidate(lambda key: key[0] == target_id)
+    example_indexes.invalidate(target_id)
+    invalidate_responses(f"/api/schema/{target_id}")
+
+
+async def warm_target(target_id: str, system_prompt: Optional[str] = None, reference: bool = False) -> None:
+    """ターゲットのスキーマ・例・システムメッセージ・（参照用）テキストを並行して取得します"""
+    with span("prefetch.target"):
+        target = await get_target_schema(target_id)
+        jobs = []
+        if system_prompt:
+            jobs.append(get_system_message(target_id, system_prompt))
+        if target["type"] == "database" and EXAMPLE_RETRIEVAL_MODE != "recent":
+            jobs.append(example_indexes.ensure(target_id))
+        if reference:
+            jobs.append(get_reference_context(target_id))
+
+        for result in await asyncio.gather(*jobs, return_exceptions=True):
+            if isinstance(result, Exception):
+                logger.warning("[Prefetch] Failed for %s: %s", target_id, result)
+
+
+def schedule_warmup(target_id: str, system_prompt: Optional[str] = None, reference: bool = False) -> bool:
+    """
+    先読みをバックグラウンドで開始します。
+    同じターゲットの先読みが実行中の場合は何もせず False を返します。
+    """
+    if target_id in _warmup_tasks:
+        return False
+
+    async def _run():
+        try:
+            await warm_target(target_id, system_prompt, reference)
+        except Exception as e:
+            logger.warning("[Prefetch] Failed for %s: %s", target_id, e)
+        finally:
+            _warmup_tasks.pop(target_id, None)
+
+    _warmup_tasks[target_id] = asyncio.create_task(_run())
+    return True
+
+
+on_page_created(lambda database_id, properties, page: invalidate_content(database_id))
@@ -1,9 +1,35 @@
 import os
 import time
-from typing import Optional, Dict, List
-from collections import defaultdict
+import ipaddress
+from typing import Optional, Dict, Deque, List
+from collections import defaultdict, deque
 from fastapi import Request, HTTPException
 
+from api.config import TRUSTED_PROXIES
+from api.logger import get_logger
+
+logger = get_logger(__name__)
+
+def _prune(log: Deque[float], cutoff: float) -> None:
+    """cutoff 以前の記録を先頭から削除します"""
+    while log and log[0] <= cutoff:
+        log.popleft()
+
+
+def _parse_proxies(value: str) -> List:
+    """TRUSTED_PROXIES（カンマ区切りのアドレス・CIDR）を ip_network のリストにします"""
+    networks = []
+    for item in value.split(","):
+        item = item.strip()
+        if not item or item == "*":
+            continue
+        try:
+            networks.append(ipaddress.ip_network(item, strict=False))
+        except ValueError:
+            logger.warning("[RateLimit] Ignoring invalid TRUSTED_PROXIES entry: %s", item)
+    return networks
+
+
 class SimpleRateLimiter:
     """
     シンプルなインメモリレート制限
@@ -21,17 +47,24 @@ class SimpleRateLimiter:
         self.global_per_hour = int(os.getenv("RATE_LIMIT_GLOBAL_PER_HOUR", "1000"))
         self.cleanup_interval = int(os.getenv("RATE_LIMIT_CLEANUP_INTERVAL", "300"))
         
-        # インメモリストレージ: {ip:endpoint: [(timestamp1, timestamp2, ...)]}
-        self.request_log: Dict[str, List[float]] = defaultdict(list)
+        # インメモリストレージ: {ip:endpoint: deque([timestamp1, timestamp2, ...])}
+        # 古い順に並ぶため、期限切れの削除は先頭から取り除くだけで済む（リスト全体を作り直さない）
+        self.request_log: Dict[str, Deque[float]] = defaultdict(deque)
         
         # グローバルカウンター（インスタンス単位）
-        self.global_log: Dict[str, List[float]] = defaultdict(list)
+        self.global_log: Dict[str, Deque[float]] = defaultdict(deque)
         
+        # X-Forwarded-For を信頼するプロキシ（"*" なら直前のプロキシを常に信頼）
+        self.trust_all_proxies = "*" in [p.strip() for p in TRUSTED_PROXIES.split(",")]
+        self.trusted_proxies = _parse_proxies(TRUSTED_PROXIES)
+
         # 最後のクリーンアップ時刻
         self.last_cleanup = time.time()
+        # バックグラウンドの定期ジョブ（api/scheduler.py）がクリーンアップする場合は True
+        self.cleanup_scheduled = False
         
         if self.enabled:
-            print(f"✅ [RateLimit] Enabled - {self.global_per_hour} requests/hour (global)")
+            logger.info("✅ [RateLimit] Enabled - %d requests/hour (global)", self.global_per_hour)
     
     async def check_rate_limit(
         self,
@@ -46,28 +79,43 @@ class SimpleRateLimiter:
         if not self.enabled:
             return {}
         
-        # 定期的にメモリをクリーンアップ
-        self._cleanup_old_entries()
+        # 定期的にメモリをクリーンアップ（定期ジョブが無い環境では、リクエストの処理中に行う）
+        if not self.cleanup_scheduled:
+            self._cleanup_old_entries()
         
         # グローバル制限チェックのみ（1時間1000リクエスト）
         self._check_global_limit(endpoint)
         
         return {}
     
-    def _get_client_ip(self, request: Request) -> str:
-        """クライアントIPを取得（Vercelのヘッダーを考慮）"""
-        # Vercel環境ではx-forwarded-forヘッダーを使用
+    def _is_trusted_proxy(self, host: str) -> bool:
+        try:
+            address = ipaddress.ip_address(host)
+        except ValueError:
+            return False
+        return any(address in network for network in self.trusted_proxies)
+
+    def get_client_ip(self, request: Request) -> str:
+        """クライアントIPを取得（信頼するプロキシが付けた X-Forwarded-For のみ考慮）
+
+        X-Forwarded-For の先頭はクライアントが自由に書けるため、接続元から右へ遡り、
+        信頼するプロキシ以外で最初に現れたアドレスをクライアントとします。
+        "*" の場合は直前のプロキシが付けた末尾のアドレスだけを使います。
+        """
+        peer = request.client.host if request.client else "unknown"
         forwarded = request.headers.get("x-forwarded-for")
-        if forwarded:
-            return forwarded.split(",")[0].strip()
-        
-        # x-real-ipヘッダーも確認
-        real_ip = request.headers.get("x-real-ip")
-        if real_ip:
-            return real_ip
-        
-        # フォールバック
-        return request.client.host if request.client else "unknown"
+        if not forwarded or not (self.trust_all_proxies or self._is_trusted_proxy(peer)):
+            return peer
+
+        hops = [hop.strip() for hop in forwarded.split(",") if hop.strip()]
+        if not hops:
+            return peer
+        if self.trust_all_proxies:
+            return hops[-1]
+        for hop in reversed(hops):
+            if not self._is_trusted_proxy(hop):
+                return hop
+        return hops[0]
     
     def _check_ip_limit(
         self,
@@ -84,17 +132,15 @@ class SimpleRateLimiter:
         key = f"{client_ip}:{endpoint}"
         
         # 古いエントリを削除（ウィンドウ外）
-        self.request_log[key] = [
-            t for t in self.request_log[key] 
-            if t > now - window
-        ]
+        log = self.request_log[key]
+        _prune(log, now - window)
         
         # 現在のカウント
-        count = len(self.request_log[key])
+        count = len(log)
         
         if count >= limit:
             # 最も古いエントリから次のリセット時刻を計算
-            oldest = min(self.request_log[key]) if self.request_log[key] else now
+            oldest = log[0] if log else now
             reset_time = int(oldest + window)
             retry_after = max(1, reset_time - int(now))
             
@@ -114,7 +160,7 @@ class SimpleRateLimiter:
             )
         
         # 新しいリクエストを記録
-        self.request_log[key].append(now)
+        log.append(now)
         
         # レート制限情報を返す
         return {
@@ -133,15 +179,13 @@ class SimpleRateLimiter:
         key = f"global:{endpoint}"
         
         # 古いエントリを削除
-        self.global_log[key] = [
-            t for t in self.global_log[key]
-            if t > now - window
-        ]
+        log = self.global_log[key]
+        _prune(log, now - window)
         
-        count = len(self.global_log[key])
+        count = len(log)
         
         if count >= self.global_per_hour:
-            print(f"⚠️ [RateLimit] Global limit reached for {endpoint}: {count}/{self.global_per_hour}")
+            logger.warning("⚠️ [RateLimit] Global limit reached for %s: %d/%d", endpoint, count, self.global_per_hour)
             raise HTTPException(
                 status_code=429,
                 detail={
@@ -152,31 +196,28 @@ class SimpleRateLimiter:
             )
         
         # 記録
-        self.global_log[key].append(now)
+        log.append(now)
     
     def _cleanup_old_entries(self):
         """古いエントリを定期的に削除してメモリを節約"""
-        now = time.time()
-        
-        if now - self.last_cleanup < self.cleanup_interval:
+        if time.time() - self.last_cleanup < self.cleanup_interval:
             return
+        self.cleanup()
+
+    def cleanup(self):
+        """ウィンドウ外になったエントリを削除します"""
+        now = time.time()
         
         # IP別ログのクリーンアップ
         for key in list(self.request_log.keys()):
-            self.request_log[key] = [
-                t for t in self.request_log[key]
-                if t > now - 120  # 2分以上古いエントリは削除
-            ]
+            _prune(self.request_log[key], now - 120)  # 2分以上古いエントリは削除
             # 空になったキーを削除
             if not self.request_log[key]:
                 del self.request_log[key]
         
         # グローバルログのクリーンアップ
         for key in list(self.global_log.keys()):
-            self.global_log[key] = [
-                t for t in self.global_log[key]
-                if t > now - 7200  # 2時間以上古いエントリは削除
-            ]
+            _prune(self.global_log[key], now - 7200)  # 2時間以上古いエントリは削除
             if not self.global_log[key]:
                 del self.global_log[key]
         
@@ -185,7 +226,7 @@ class SimpleRateLimiter:
         # ログ出力
         total_ips = len(self.request_log)
         if total_ips > 0:
-            print(f"🧹 [RateLimit] Cleanup complete - tracking {total_ips} unique IP:endpoint pairs")
+            logger.debug("🧹 [RateLimit] Cleanup complete - tracking %d unique IP:endpoint pairs", total_ips)
 
 # グローバルインスタンス
 rate_limiter = SimpleRateLimiter()
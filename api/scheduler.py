@@ -0,0 +1,177 @@
+"""
+Background Scheduler
+サーバー内のキャッシュを定期的に更新する、プロセス内の小さなスケジューラーです。
+
+FastAPIの lifespan で各ワーカーごとに起動し、登録されたジョブを一定間隔で実行します。
+リクエストの処理中はキャッシュを読むだけになり、更新の待ち時間を払いません。
+
+- ジッター: 実行間隔に ±jitter の揺らぎを加え、ワーカー間でNotionへのリクエストが重ならないようにします。
+- 同時実行数: 同時に実行するジョブの数を max_concurrency に制限します。
+  同じジョブが前回の実行中であれば、その回は実行しません。
+- 失敗時のバックオフ: 失敗が続くと次の実行までの間隔を倍々に延ばします（上限 max_backoff）。
+  成功すると元の間隔に戻ります。
+
+ジョブの関数は同期関数でも非同期関数でも構いません（同期関数はスレッドで実行します）。
+"""
+import time
+import random
+import asyncio
+import inspect
+from typing import Any, Callable, Dict, List, Optional
+
+from api.config import SCHEDULER_MAX_CONCURRENCY
+from api.tracing import metrics
+from api.logger import get_logger
+
+logger = get_logger(__name__)
+
+# スケジューラーがジョブの期限を確認する間隔（秒）
+TICK_INTERVAL = 1.0
+
+
+class Job:
+    """定期実行するジョブと、その実行状態"""
+
+    def __init__(
+        self,
+        name: str,
+        func: Callable[[], Any],
+        interval: float,
+        jitter: float = 0.1,
+        timeout: Optional[float] = None,
+        max_backoff: Optional[float] = None,
+        initial_delay: Optional[float] = None
+    ):
+        """
+        Args:
+            name: ジョブ名（ログとメトリクスのラベル）
+            func: 実行する関数（引数なし）
+            interval: 実行間隔（秒）
+            jitter: 実行間隔に加える揺らぎの割合（0.1 なら ±10%）
+            timeout: 1回の実行の制限時間（秒）。省略時は interval
+            max_backoff: 失敗が続いた場合の最大間隔（秒）。省略時は interval の10倍
+            initial_delay: 起動から初回実行までの秒数。省略時は interval（ジッター付き）
+        """
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.jitter = jitter
+        self.timeout = timeout if timeout is not None else interval
+        self.max_backoff = max_backoff if max_backoff is not None else interval * 10
+        self.initial_delay = initial_delay
+        self.failures = 0
+        self.running = False
+        self.last_error: Optional[str] = None
+        self.next_run = 0.0
+
+    def delay(self) -> float:
+        """次の実行までの秒数（失敗が続いている場合はバックオフ）"""
+        if self.failures:
+            return min(self.interval * (2 ** self.failures), self.max_backoff)
+        spread = self.interval * self.jitter
+        return max(0.0, self.interval + random.uniform(-spread, spread))
+
+    async def run(self) -> None:
+        if inspect.iscoroutinefunction(self.func):
+            await asyncio.wait_for(self.func(), self.timeout)
+        else:
+            await asyncio.wait_for(asyncio.to_thread(self.func), self.timeout)
+
+
+class Scheduler:
+    """登録されたジョブを、同時実行数を制限しながら定期的に実行します"""
+
+    def __init__(self, max_concurrency: int = 2):
+        self.max_concurrency = max_concurrency
+        self.jobs: Dict[str, Job] = {}
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop_task: Optional[asyncio.Task] = None
+        self._running: set = set()
+
+    @property
+    def started(self) -> bool:
+        return self._loop_task is not None
+
+    def add(self, name: str, func: Callable[[], Any], interval: float, **options) -> Job:
+        """ジョブを登録します（同じ名前のジョブは置き換えます）。options は Job の引数です"""
+        job = Job(name, func, interval, **options)
+        self.jobs[name] = job
+        if self.started:
+            self._schedule_first(job)
+        return job
+
+    def _schedule_first(self, job: Job) -> None:
+        delay = job.initial_delay if job.initial_delay is not None else job.delay()
+        job.next_run = time.monotonic() + delay
+
+    async def start(self) -> None:
+        if self.started:
+            return
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        for job in self.jobs.values():
+            self._schedule_first(job)
+        self._loop_task = asyncio.create_task(self._loop())
+        logger.info("[Scheduler] Started %d job(s): %s", len(self.jobs), ", ".join(self.jobs))
+
+    async def stop(self) -> None:
+        """ループと実行中のジョブを止めます"""
+        if self._loop_task is None:
+            return
+        tasks = [self._loop_task, *self._running]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._loop_task = None
+        self._running.clear()
+
+    async def _loop(self) -> None:
+        while True:
+            now = time.monotonic()
+            for job in self.jobs.values():
+                if job.running or job.next_run > now:
+                    continue
+                job.running = True
+                task = asyncio.create_task(self._execute(job))
+                self._running.add(task)
+                task.add_done_callback(self._running.discard)
+            await asyncio.sleep(TICK_INTERVAL)
+
+    async def _execute(self, job: Job) -> None:
+        try:
+            async with self._semaphore:
+                start = time.perf_counter()
+                try:
+                    await job.run()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    job.failures += 1
+                    job.last_error = f"{type(e).__name__}: {e}"
+                    metrics.incr("memo_ai_scheduler_runs_total", job=job.name, outcome="error")
+                    logger.warning("[Scheduler] Job %s failed (%d in a row): %s", job.name, job.failures, job.last_error)
+                else:
+                    job.failures = 0
+                    job.last_error = None
+                    metrics.incr("memo_ai_scheduler_runs_total", job=job.name, outcome="ok")
+                    logger.debug("[Scheduler] Job %s done in %.0fms", job.name, (time.perf_counter() - start) * 1000)
+        finally:
+            job.next_run = time.monotonic() + job.delay()
+            job.running = False
+
+    def status(self) -> List[Dict[str, Any]]:
+        now = time.monotonic()
+        return [
+            {
+                "name": job.name,
+                "interval": job.interval,
+                "running": job.running,
+                "failures": job.failures,
+                "last_error": job.last_error,
+                "next_run_in": round(max(0.0, job.next_run - now), 1) if self.started else None,
+            }
+            for job in self.jobs.values()
+        ]
+
+
+# グローバルインスタンス
+scheduler = Scheduler(SCHEDULER_MAX_CONCURRENCY)
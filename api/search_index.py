@@ -0,0 +1,352 @@
+"""
+Full-text Search Index
+対象データベースのページ（タイトルとテキストプロパティ）を全文検索するためのローカル索引です。
+
+以前は `/api/content/database/{id}` で直近20件を取得し、クライアント側で絞り込むしかありませんでした。
+ここでは SQLite の FTS5 に索引を作り、検索のたびにNotionへ問い合わせずにミリ秒単位で結果を返します。
+
+- 分かち書き: 日本語は単語の区切りが無いため、文字バイグラム（2文字ずつ）を空白区切りで格納します。
+  検索語も同じ形に変換してフレーズ検索するため、部分一致と同じ結果になります。
+- 差分更新: データベースごとに最終更新日時（last_edited_time）の最大値を記録し、
+  次回はそれ以降に更新されたページだけをNotionから取得します。
+- 削除: データベースのクエリはゴミ箱・アーカイブのページを返さないため、差分更新では削除に気付けません。
+  SEARCH_RECONCILE_INTERVAL 秒ごとに全件を取得し直し、返されなかったページを索引から取り除きます。
+  Webhook（api/webhooks.py）の page.deleted は、そのページを直ちに取り除きます。
+- SQLiteの読み書きはイベントループの外（asyncio.to_thread）で行います。
+- ランキング: FTS5 の bm25（タイトルの一致を本文より重く評価）。
+"""
+import time
+import asyncio
+import sqlite3
+import threading
+import unicodedata
+from typing import Dict, Any, List, Optional, Tuple
+
+from api.config import SEARCH_INDEX_PATH, SEARCH_SYNC_INTERVAL, SEARCH_RECONCILE_INTERVAL
+from api.notion import iter_database_pages, on_page_created
+from api.tracing import span
+from api.logger import get_logger
+
+logger = get_logger(__name__)
+
+# bm25 の列ごとの重み（title, body の順）
+BM25_WEIGHTS = (10.0, 1.0)
+# 検索結果に含める本文の抜粋の長さ（文字数）
+SNIPPET_CHARS = 80
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    page_id TEXT PRIMARY KEY,
+    database_id TEXT NOT NULL,
+    title TEXT NOT NULL,
+    body TEXT NOT NULL,
+    url TEXT,
+    last_edited_time TEXT
+);
+CREATE INDEX IF NOT EXISTS pages_database ON pages (database_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS pages_fts USING fts5 (
+    title, body, tokenize = 'unicode61 remove_diacritics 0'
+);
+CREATE TABLE IF NOT EXISTS watermarks (
+    database_id TEXT PRIMARY KEY,
+    last_edited_time TEXT,
+    synced_at REAL
+);
+"""
+
+
+def _bigrams(word: str) -> List[str]:
+    return [word[i:i + 2] for i in range(len(word) - 1)] or [word]
+
+
+def tokenize(text: str) -> str:
+    """
+    索引用に、テキストを空白区切りの文字バイグラムに変換します。
+
+    例: "会議の準備" -> "会議 議の の準 準備 備"
+    語の末尾の1文字も加えるため、1文字の検索語は前方一致（"備"*）ですべての出現位置に一致します。
+    """
+    tokens = []
+    for word in unicodedata.normalize("NFKC", text).lower().split():
+        tokens.extend(_bigrams(word))
+        if len(word) > 1:
+            tokens.append(word[-1])
+    return " ".join(tokens)
+
+
+def build_match_query(query: str) -> Optional[str]:
+    """
+    検索語を FTS5 の MATCH 式に変換します。
+    空白で区切られた語ごとにバイグラムのフレーズを作り、すべてを含むページを探します（AND検索）。
+    """
+    phrases = []
+    for word in unicodedata.normalize("NFKC", query).lower().split():
+        phrase = '"' + " ".join(_bigrams(word)).replace('"', '""') + '"'
+        phrases.append(phrase + "*" if len(word) == 1 else phrase)
+    return " AND ".join(phrases) or None
+
+
+def extract_text(properties: Dict[str, Any]) -> Tuple[str, str]:
+    """ページのプロパティからタイトルと本文（rich_text プロパティの連結）を取り出します"""
+    title, bodies = "", []
+    for v in properties.values():
+        if not isinstance(v, dict):
+            continue
+        p_type = v.get("type")
+        if p_type in ("title", "rich_text"):
+            text = "".join([t.get("plain_text", "") for t in v.get(p_type, [])])
+            if p_type == "title":
+                title = text
+            elif text:
+                bodies.append(text)
+    return title, "\n".join(bodies)
+
+
+def _later(a: Optional[str], b: Optional[str]) -> Optional[str]:
+    # ISO 8601 (UTC) の文字列は辞書順で比較できる
+    if a is None or b is None:
+        return a or b
+    return max(a, b)
+
+
+def _snippet(body: str, query: str) -> str:
+    # 最初にヒットした語の周辺を切り出す（ヒットしなければ先頭）
+    normalized = unicodedata.normalize("NFKC", body).lower()
+    pos = -1
+    for word in query.split():
+        pos = normalized.find(unicodedata.normalize("NFKC", word).lower())
+        if pos >= 0:
+            break
+    start = max(0, pos - SNIPPET_CHARS // 4) if pos >= 0 else 0
+    snippet = body[start:start + SNIPPET_CHARS]
+    return ("…" if start > 0 else "") + snippet + ("…" if start + SNIPPET_CHARS < len(body) else "")
+
+
+class SearchIndex:
+    """
+    SQLite FTS5 による全文検索索引
+
+    接続はスレッド間で共有し、読み書きはロックで直列化します。
+    """
+
+    def __init__(self, path: str = SEARCH_INDEX_PATH):
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def upsert_pages(self, database_id: str, pages: List[Dict[str, Any]]) -> Optional[str]:
+        """
+        ページオブジェクトを索引に登録（更新）し、その中の最大の last_edited_time を返します。
+        アーカイブ（削除）されたページは索引から取り除きます。
+        """
+        watermark = None
+        with self._lock, self._conn:
+            for page in pages:
+                page_id = page.get("id")
+                if not page_id:
+                    continue
+                edited = page.get("last_edited_time")
+                watermark = _later(watermark, edited)
+                self._delete(page_id)
+                if page.get("archived") or page.get("in_trash"):
+                    continue
+                title, body = extract_text(page.get("properties", {}))
+                cur = self._conn.execute(
+                    "INSERT INTO pages (page_id, database_id, title, body, url, last_edited_time)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    (page_id, database_id, title, body, page.get("url"), edited)
+                )
+                self._conn.execute(
+                    "INSERT INTO pages_fts (rowid, title, body) VALUES (?, ?, ?)",
+                    (cur.lastrowid, tokenize(title), tokenize(body))
+                )
+        return watermark
+
+    def delete_pages(self, page_ids: List[str]) -> int:
+        """ページを索引から取り除き、取り除いた件数を返します"""
+        with self._lock, self._conn:
+            return sum(self._delete(page_id) for page_id in page_ids)
+
+    def page_ids(self, database_id: str) -> List[str]:
+        """索引にあるデータベースのページIDの一覧"""
+        with self._lock:
+            rows = self._conn.execute("SELECT page_id FROM pages WHERE database_id = ?", (database_id,)).fetchall()
+        return [row[0] for row in rows]
+
+    def _delete(self, page_id: str) -> bool:
+        row = self._conn.execute("SELECT rowid FROM pages WHERE page_id = ?", (page_id,)).fetchone()
+        if row is None:
+            return False
+        self._conn.execute("DELETE FROM pages_fts WHERE rowid = ?", (row[0],))
+        self._conn.execute("DELETE FROM pages WHERE rowid = ?", (row[0],))
+        return True
+
+    def get_watermark(self, database_id: str) -> Tuple[Optional[str], float]:
+        """(最終更新日時の最大値, 最後に同期した時刻) を返します"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT last_edited_time, synced_at FROM watermarks WHERE database_id = ?", (database_id,)
+            ).fetchone()
+        return (row[0], row[1] or 0.0) if row else (None, 0.0)
+
+    def set_watermark(self, database_id: str, last_edited_time: Optional[str]) -> None:
+        """同期完了を記録します（最終更新日時は後退させません）"""
+        with self._lock, self._conn:
+            current, _ = self.get_watermark(database_id)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO watermarks (database_id, last_edited_time, synced_at) VALUES (?, ?, ?)",
+                (database_id, _later(current, last_edited_time), time.time())
+            )
+
+    def search(self, database_id: str, query: str, limit: int = 20, offset: int = 0) -> Dict[str, Any]:
+        """
+        データベース内のページを検索し、関連度順に結果を返します。
+
+        Returns:
+            {"results": [{"id", "title", "snippet", "url", "last_edited_time", "score"}], "next_cursor": ...}
+        """
+        match = build_match_query(query)
+        if not match:
+            return {"results": [], "next_cursor": None}
+
+        sql = (
+            "SELECT p.page_id, p.title, p.body, p.url, p.last_edited_time,"
+            f" bm25(pages_fts, {BM25_WEIGHTS[0]}, {BM25_WEIGHTS[1]}) AS score"
+            " FROM pages_fts JOIN pages p ON p.rowid = pages_fts.rowid"
+            " WHERE pages_fts MATCH ? AND p.database_id = ?"
+            " ORDER BY score, p.last_edited_time DESC LIMIT ? OFFSET ?"
+        )
+        try:
+            # 次ページの有無を判定するため1件多く取得する
+            with self._lock:
+                rows = self._conn.execute(sql, (match, database_id, limit + 1, offset)).fetchall()
+        except sqlite3.OperationalError as e:
+            # 記号だけの検索語など、FTS5 が解釈できない式は「該当なし」とする
+            logger.debug("[Search] Invalid match expression %r: %s", match, e)
+            return {"results": [], "next_cursor": None}
+        results = [
+            {
+                "id": row["page_id"],
+                "title": row["title"],
+                "snippet": _snippet(row["body"], query),
+                "url": row["url"],
+                "last_edited_time": row["last_edited_time"],
+                # bm25 は小さいほど関連度が高いため、符号を反転して返す
+                "score": round(-row["score"], 4),
+            }
+            for row in rows[:limit]
+        ]
+        return {"results": results, "next_cursor": offset + limit if len(rows) > limit else None}
+
+    def count(self, database_id: str) -> int:
+        with self._lock:
+            row = self._conn.execute("SELECT COUNT(*) FROM pages WHERE database_id = ?", (database_id,)).fetchone()
+        return row[0]
+
+
+class SearchService:
+    """索引の同期（Notionからの差分取得）と検索をまとめるサービス"""
+
+    def __init__(self, index: Optional[SearchIndex] = None, sync_interval: float = SEARCH_SYNC_INTERVAL,
+                 reconcile_interval: float = SEARCH_RECONCILE_INTERVAL):
+        self._index = index
+        self.sync_interval = sync_interval
+        self.reconcile_interval = reconcile_interval
+        self._locks: Dict[str, asyncio.Lock] = {}
+        # データベースごとに、最後に全件を取得して突き合わせた時刻（ワーカーごと）
+        self._reconciled_at: Dict[str, float] = {}
+
+    @property
+    def index(self) -> SearchIndex:
+        # SQLiteファイルは最初に使われた時点で作成する
+        if self._index is None:
+            self._index = SearchIndex()
+        return self._index
+
+    async def sync(self, database_id: str, force: bool = False) -> int:
+        """
+        前回の同期以降に更新されたページを取得して索引に反映します。
+        同期間隔内であれば何もしません（同時要求は1回の同期にまとめます）。
+        SEARCH_RECONCILE_INTERVAL 秒ごとに全件を取得し、Notionから返されなかった（削除された）ページを取り除きます。
+
+        Returns:
+            int: 取り込んだページ数
+        """
+        watermark, synced_at = await asyncio.to_thread(self.index.get_watermark, database_id)
+        if not force and time.time() - synced_at < self.sync_interval:
+            return 0
+
+        lock = self._locks.setdefault(database_id, asyncio.Lock())
+        async with lock:
+            watermark, synced_at = await asyncio.to_thread(self.index.get_watermark, database_id)
+            if not force and time.time() - synced_at < self.sync_interval:
+                return 0
+
+            started = time.time()
+            reconcile = started - self._reconciled_at.get(database_id, 0.0) >= self.reconcile_interval
+            since = None if reconcile else watermark
+            count, batch, latest, seen = 0, [], watermark, set()
+            with span("search.sync", mode="incremental" if since else "full"):
+                async for page in iter_database_pages(database_id, edited_since=since):
+                    batch.append(page)
+                    seen.add(page.get("id"))
+                    if len(batch) >= 100:
+                        latest = _later(latest, await self._upsert(database_id, batch))
+                        count += len(batch)
+                        batch = []
+                if batch:
+                    latest = _later(latest, await self._upsert(database_id, batch))
+                    count += len(batch)
+                if reconcile:
+                    removed = await asyncio.to_thread(self._remove_missing, database_id, seen)
+                    self._reconciled_at[database_id] = started
+                    if removed:
+                        logger.info("[Search] Removed %d deleted pages from %s", removed, database_id)
+                await asyncio.to_thread(self.index.set_watermark, database_id, latest)
+            if count:
+                logger.info("[Search] Synced %d pages for %s (watermark=%s)", count, database_id, latest)
+            return count
+
+    def _remove_missing(self, database_id: str, seen: set) -> int:
+        return self.index.delete_pages([p for p in self.index.page_ids(database_id) if p not in seen])
+
+    async def _upsert(self, database_id: str, pages: List[Dict[str, Any]]) -> Optional[str]:
+        # FTSへの書き込みはイベントループを止めないように別スレッドで行う
+        return await asyncio.to_thread(self.index.upsert_pages, database_id, pages)
+
+    async def remove_pages(self, page_ids: List[str]) -> int:
+        """削除されたページを索引から取り除きます（Webhook の page.deleted）"""
+        return await asyncio.to_thread(self.index.delete_pages, page_ids)
+
+    async def search(self, database_id: str, query: str, limit: int = 20, offset: int = 0) -> Dict[str, Any]:
+        await self.sync(database_id)
+        with span("search.query"):
+            return await asyncio.to_thread(self.index.search, database_id, query, limit=limit, offset=offset)
+
+    def on_page_created(self, database_id: str, properties: Dict[str, Any], page: Dict[str, Any]) -> None:
+        """create_page のフック: 作成されたページをすぐに検索できるようにします（書き込みはスレッドで行う）"""
+        if self._index is None or not page.get("properties"):
+            return
+        try:
+            asyncio.get_running_loop().run_in_executor(None, self._index_created, database_id, page)
+        except RuntimeError:
+            self._index_created(database_id, page)
+
+    def _index_created(self, database_id: str, page: Dict[str, Any]) -> None:
+        try:
+            self.index.upsert_pages(database_id, [page])
+        except sqlite3.Error as e:
+            logger.warning("[Search] Failed to index created page %s: %s", page.get("id"), e)
+
+
+# グローバルインスタンス
+search_service = SearchService()
+on_page_created(search_service.on_page_created)
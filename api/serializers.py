@@ -0,0 +1,229 @@
+"""
+Notion Property Serializers
+Python の値を Notion API のプロパティJSONへ直接変換するモジュールです。
+
+以前は値ごとに入れ子の辞書を一から組み立て、チャット経路では
+`json.dumps` → `json.loads` の往復を経てから検証していました。
+ここではスキーマごとに変換関数の表を一度だけ作成（コンパイル）してキャッシュし、
+select / multi_select の選択肢オブジェクトはインターン（共有）して再利用します。
+
+注意: インターンされたオブジェクトは複数のペイロードで共有されるため、
+返り値のプロパティ辞書を呼び出し側で書き換えないでください。
+"""
+import json
+from functools import lru_cache
+from typing import Dict, Any, Callable, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# 変換関数の型: 値を受け取り、Notionプロパティ値（または登録しない場合は None）を返す
+Serializer = Callable[[Any], Optional[Dict[str, Any]]]
+
+
+@lru_cache(maxsize=4096)
+def _option(name: str) -> Dict[str, str]:
+    """選択肢オブジェクト {"name": ...} をインターンして返します"""
+    return {"name": name}
+
+
+@lru_cache(maxsize=4096)
+def _select_value(name: str) -> Dict[str, Any]:
+    return {"select": _option(name)}
+
+
+@lru_cache(maxsize=4096)
+def _status_value(name: str) -> Dict[str, Any]:
+    return {"status": _option(name)}
+
+
+def _plain_text(v: Any) -> str:
+    """リッチテキスト配列が渡された場合は plain_text を連結して文字列にします"""
+    if isinstance(v, list):
+        return "".join([t.get("plain_text", "") for t in v if "plain_text" in t])
+    return str(v)
+
+
+def _serialize_select(v: Any) -> Optional[Dict[str, Any]]:
+    # Select型: 文字列に変換
+    if isinstance(v, dict):
+        v = v.get("name")
+    return _select_value(str(v)) if v else None
+
+
+def _serialize_multi_select(v: Any) -> Dict[str, Any]:
+    # Multi-Select型: 文字列のリストに変換
+    if not isinstance(v, list):
+        v = [v]
+    opts = []
+    for item in v:
+        if isinstance(item, dict):
+            item = item.get("name")
+        if item:
+            opts.append(_option(str(item)))
+    return {"multi_select": opts}
+
+
+def _serialize_status(v: Any) -> Optional[Dict[str, Any]]:
+    if isinstance(v, dict):
+        v = v.get("name")
+    return _status_value(str(v)) if v else None
+
+
+def _serialize_date(v: Any) -> Optional[Dict[str, Any]]:
+    # Date型: YYYY-MM-DD 文字列を期待
+    if isinstance(v, dict):
+        v = v.get("start")
+    return {"date": {"start": str(v)}} if v else None
+
+
+def _serialize_checkbox(v: Any) -> Dict[str, Any]:
+    return {"checkbox": bool(v)}
+
+
+def _serialize_number(v: Any) -> Optional[Dict[str, Any]]:
+    if v is None:
+        return None
+    try:
+        return {"number": float(v)}
+    except (ValueError, TypeError):
+        # 数値変換に失敗した場合はスキップ（例: "abc"）
+        return None
+
+
+def _serialize_title(v: Any) -> Dict[str, Any]:
+    return {"title": [{"text": {"content": _plain_text(v)}}]}
+
+
+def _serialize_rich_text(v: Any) -> Dict[str, Any]:
+    return {"rich_text": [{"text": {"content": _plain_text(v)}}]}
+
+
+# 型ごとの変換関数テーブル
+# people（ユーザーIDが必要）と files（アップロードが必要）は未対応のため含めません。
+SERIALIZERS: Dict[str, Serializer] = {
+    "select": _serialize_select,
+    "multi_select": _serialize_multi_select,
+    "status": _serialize_status,
+    "date": _serialize_date,
+    "checkbox": _serialize_checkbox,
+    "number": _serialize_number,
+    "title": _serialize_title,
+    "rich_text": _serialize_rich_text,
+}
+
+
+def schema_signature(schema: Dict[str, Any]) -> Tuple[Tuple[str, str], ...]:
+    """スキーマの (プロパティ名, 型) の組。コンパイル結果のキャッシュキーに使用します"""
+    return tuple(
+        (k, v.get("type")) for k, v in schema.items()
+        if isinstance(v, dict) and "type" in v
+    )
+
+
+@lru_cache(maxsize=256)
+def _compile(signature: Tuple[Tuple[str, str], ...]) -> Dict[str, Serializer]:
+    return {name: SERIALIZERS[p_type] for name, p_type in signature if p_type in SERIALIZERS}
+
+
+def compile_schema(schema: Dict[str, Any]) -> Dict[str, Serializer]:
+    """
+    スキーマから「プロパティ名 → 変換関数」の表を作成します（同じスキーマはキャッシュを返します）。
+    """
+    return _compile(schema_signature(schema))
+
+
+def serialize_properties(values: Dict[str, Any], schema: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Python の値（AIの出力など）を Notion API のプロパティ形式に変換します。
+
+    スキーマに存在しないキーや、変換できない値、null（構造化出力で値が無い場合）は結果に含めません。
+
+    例:
+        serialize_properties({"Status": "完了", "Done": 1}, schema)
+        -> {"Status": {"select": {"name": "完了"}}, "Done": {"checkbox": True}}
+    """
+    if not isinstance(values, dict):
+        return {}
+    compiled = compile_schema(schema)
+    result = {}
+    for k, v in values.items():
+        serializer = compiled.get(k)
+        if serializer is None or v is None:
+            continue
+        prop = serializer(v)
+        if prop is not None:
+            result[k] = prop
+    return result
+
+
+def _rich_text_plain(items: Any) -> str:
+    """読み取り形式（plain_text）と書き込み形式（text.content）の両方に対応して連結します"""
+    if not isinstance(items, list):
+        return ""
+    return "".join(
+        [t.get("plain_text") or (t.get("text") or {}).get("content", "") for t in items if isinstance(t, dict)]
+    )
+
+
+def _property_type(v: Dict[str, Any]) -> Optional[str]:
+    # 読み取り形式は "type" キーを持つが、書き込み形式（create_page のボディ）は持たない
+    p_type = v.get("type")
+    if p_type:
+        return p_type
+    for key in v:
+        if key in SERIALIZERS:
+            return key
+    return None
+
+
+def simplify_properties(props: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Notion のプロパティ値を、AIや検索が扱いやすい単純な値に変換します（serialize_properties の逆変換）。
+
+    例: {"Status": {"type": "select", "select": {"name": "完了"}}} -> {"Status": "完了"}
+    未対応の型は "N/A" になります。
+    """
+    simple_props = {}
+    for k, v in props.items():
+        if not isinstance(v, dict):
+            continue
+        p_type = _property_type(v)
+        val = "N/A"
+        if p_type == "title":
+            val = _rich_text_plain(v.get("title", []))
+        elif p_type == "rich_text":
+            val = _rich_text_plain(v.get("rich_text", []))
+        elif p_type in ("select", "status"):
+            val = v.get(p_type, {}).get("name") if v.get(p_type) else None
+        elif p_type == "multi_select":
+            val = [o.get("name") for o in v.get("multi_select", [])]
+        elif p_type == "date":
+            val = v.get("date", {}).get("start") if v.get("date") else None
+        elif p_type == "checkbox":
+            val = v.get("checkbox")
+        elif p_type == "number":
+            val = v.get("number")
+        simple_props[k] = val
+    return simple_props
+
+
+def display_value(value: Any) -> str:
+    """simplify_properties の値を表示用の文字列にします（値なしは空文字、リストはカンマ区切り）"""
+    if value is None or value == "N/A":
+        return ""
+    if isinstance(value, list):
+        return ", ".join(str(v) for v in value if v)
+    return str(value)
+
+
+def dumps_bytes(obj: Any) -> bytes:
+    """
+    リクエストボディ用のJSONバイト列を生成します。
+    orjson がインストールされていれば使用し、無ければ標準の json で同等の出力を作ります。
+    """
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
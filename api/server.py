@@ -0,0 +1,250 @@
+"""
+Production Server
+本番環境（単一ホスト）向けのマルチワーカー起動スクリプトです。
+
+使用例:
+    python -m api.server --host 0.0.0.0 --port 8000 --workers 4
+
+- 事前読み込み（preload）: アプリ本体・モデルレジストリ・設定を fork 前に親プロセスで構築します。
+  ワーカーはそれらをコピーオンライトで共有するため、起動が速くメモリ使用量も抑えられます。
+  （uvicorn の --workers は spawn で起動するため、ワーカーごとに全モジュールを読み込み直します）
+- 共有ソケット: 親プロセスでポートを開き、全ワーカーが同じソケットで接続を受け付けます。
+- 接続のウォームアップ: Notionへの接続はプロセス間で共有できないため、
+  各ワーカーの起動時（api/app.py の lifespan）に確立してから ready になります。
+- グレースフル停止: SIGTERM を受けると、各ワーカーは /api/ready を 503 にし、
+  DRAIN_DELAY 秒後に新規接続の受け付けを止め、処理中のリクエストを GRACEFUL_TIMEOUT 秒まで待ちます。
+- 監視: 異常終了したワーカーは自動で再起動します。
+
+fork が使えない環境（Windows）や --workers 1 の場合は、単一プロセスで起動します。
+"""
+import gc
+import os
+import sys
+import time
+import signal
+import socket
+import argparse
+import threading
+from typing import Dict, List, Optional
+
+import uvicorn
+
+from api.config import WEB_CONCURRENCY, GRACEFUL_TIMEOUT, DRAIN_DELAY, TRUSTED_PROXIES
+from api.logger import get_logger, shutdown_logging
+
+# `python -m api.server` で実行すると __name__ が "__main__" になるため、名前を固定する
+logger = get_logger("api.server")
+
+# ワーカーが起動直後にこの秒数以内で終了した場合は、再起動の前に待機する（クラッシュループ対策）
+MIN_WORKER_LIFETIME = 1.0
+
+
+def preload():
+    """
+    fork 前にアプリと共有データを構築します。
+
+    gc.freeze() で構築済みのオブジェクトをGCの対象外にし、
+    ワーカー側のGCが共有ページに書き込んでコピーが発生するのを防ぎます。
+    """
+    from api.app import app
+    from api.models import get_model_registry
+
+    registry = get_model_registry()
+    logger.info("[Server] Preloaded app and %d models", len(registry))
+    gc.collect()
+    if hasattr(gc, "freeze"):
+        gc.freeze()
+    return app
+
+
+def bind_socket(host: str, port: int, backlog: int = 2048) -> socket.socket:
+    """全ワーカーで共有するリスニングソケットを作成します"""
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+class WorkerServer(uvicorn.Server):
+    """
+    終了シグナルを受けたら、まず readiness を 503 にしてから停止を始める uvicorn.Server
+
+    drain_delay 秒の間はリクエストの受け付けを続けるため、ロードバランサーが
+    /api/ready の変化を検知して振り分けを止めるまでのリクエストも取りこぼしません。
+    """
+
+    def __init__(self, config: uvicorn.Config, drain_delay: float = 0.0):
+        super().__init__(config)
+        self.drain_delay = drain_delay
+        self._draining = False
+
+    def handle_exit(self, sig, frame) -> None:
+        self.config.app.state.draining = True
+        if self.drain_delay > 0 and not self._draining:
+            self._draining = True
+            logger.info("[Server] Worker %d draining for %.1fs", os.getpid(), self.drain_delay)
+            timer = threading.Timer(self.drain_delay, super().handle_exit, (sig, frame))
+            timer.daemon = True
+            timer.start()
+            return
+        super().handle_exit(sig, frame)
+
+
+def make_server(app, args: argparse.Namespace) -> WorkerServer:
+    config = uvicorn.Config(
+        app,
+        lifespan="on",
+        timeout_graceful_shutdown=args.graceful_timeout,
+        proxy_headers=True,
+        forwarded_allow_ips=TRUSTED_PROXIES,
+        access_log=args.access_log,
+    )
+    return WorkerServer(config, drain_delay=args.drain_delay)
+
+
+def run_worker(app, sock: socket.socket, args: argparse.Namespace) -> None:
+    """fork 後の子プロセスで実行されます（戻らずにプロセスを終了します）"""
+    server = make_server(app, args)
+
+    # uvicorn は停止後、受け取ったシグナルをイベントループの中で元のハンドラに再送出する。
+    # そこで SystemExit を投げると asyncio.run の後始末が中断されるため、停止の指示を記録するだけにする
+    # （起動前に届いたシグナルも、起動後すぐの停止として扱われる）。プロセスは最後の os._exit で終了する
+    def request_exit(sig, frame):
+        server.should_exit = True
+
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, request_exit)
+
+    code = 0
+    try:
+        server.run(sockets=[sock])
+    except SystemExit as e:
+        code = e.code if isinstance(e.code, int) else 0
+    except BaseException:
+        logger.exception("[Server] Worker %d crashed", os.getpid())
+        code = 1
+    finally:
+        shutdown_logging()
+        os._exit(code)
+
+
+class Arbiter:
+    """ワーカープロセスの起動・監視・停止を行う親プロセス"""
+
+    def __init__(self, app, sock: socket.socket, args: argparse.Namespace):
+        self.app = app
+        self.sock = sock
+        self.args = args
+        self.workers: Dict[int, float] = {}  # pid -> 起動時刻
+        self.stopping = False
+
+    def spawn(self) -> None:
+        pid = os.fork()
+        if pid == 0:
+            run_worker(self.app, self.sock, self.args)
+        self.workers[pid] = time.monotonic()
+        logger.info("[Server] Started worker %d", pid)
+
+    def reap(self) -> List[int]:
+        """終了したワーカーを回収し、異常終了したものを返します"""
+        crashed = []
+        while self.workers:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                self.workers.clear()
+                break
+            if pid == 0:
+                break
+            started = self.workers.pop(pid, None)
+            if started is None:
+                continue
+            code = os.waitstatus_to_exitcode(status)
+            if not self.stopping:
+                logger.warning("[Server] Worker %d exited with %d", pid, code)
+                crashed.append(pid)
+                if time.monotonic() - started < MIN_WORKER_LIFETIME:
+                    time.sleep(MIN_WORKER_LIFETIME)
+        return crashed
+
+    def handle_signal(self, sig, frame) -> None:
+        if not self.stopping:
+            logger.info("[Server] Received %s, shutting down", signal.Signals(sig).name)
+        self.stopping = True
+
+    def run(self) -> int:
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, self.handle_signal)
+
+        for _ in range(self.args.workers):
+            self.spawn()
+        logger.info("[Server] Listening on %s:%d with %d workers", self.args.host, self.args.port, self.args.workers)
+
+        while not self.stopping:
+            for _ in self.reap():
+                if not self.stopping:
+                    self.spawn()
+            time.sleep(0.5)
+
+        return self.stop()
+
+    def stop(self) -> int:
+        """全ワーカーに SIGTERM を送り、終了を待ちます。期限を過ぎたものは強制終了します"""
+        for pid in list(self.workers):
+            self._kill(pid, signal.SIGTERM)
+
+        deadline = time.monotonic() + self.args.drain_delay + self.args.graceful_timeout + 5
+        while self.workers and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.1)
+
+        for pid in list(self.workers):
+            logger.warning("[Server] Worker %d did not stop in time, killing", pid)
+            self._kill(pid, signal.SIGKILL)
+        self.reap()
+        self.sock.close()
+        logger.info("[Server] Stopped")
+        return 0
+
+    def _kill(self, pid: int, sig: int) -> None:
+        try:
+            os.kill(pid, sig)
+        except ProcessLookupError:
+            self.workers.pop(pid, None)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Memo AI production server")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=WEB_CONCURRENCY,
+                        help="ワーカープロセス数（デフォルト: WEB_CONCURRENCY またはCPUコア数）")
+    parser.add_argument("--graceful-timeout", type=int, default=GRACEFUL_TIMEOUT,
+                        help="終了時に処理中のリクエストを待つ最大秒数")
+    parser.add_argument("--drain-delay", type=float, default=DRAIN_DELAY,
+                        help="終了シグナル受信後、/api/ready を 503 にしたまま受け付けを続ける秒数")
+    parser.add_argument("--access-log", action="store_true", help="uvicorn のアクセスログを出力する")
+    args = parser.parse_args(argv)
+    args.workers = max(1, args.workers)
+    return args
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    app = preload()
+
+    if args.workers == 1 or not hasattr(os, "fork"):
+        if args.workers > 1:
+            logger.warning("[Server] fork is not available, running a single worker")
+        make_server(app, args).run(sockets=[bind_socket(args.host, args.port)])
+        return 0
+
+    sock = bind_socket(args.host, args.port)
+    return Arbiter(app, sock, args).run()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
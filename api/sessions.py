@@ -0,0 +1,203 @@
+"""
+Chat Session Store
+チャットの会話履歴をサーバー側で保持するモジュールです。
+
+クライアントは /api/chat に新しいメッセージと session_id だけを送り、
+サーバーがユーザーの入力とAIの応答を履歴に追加します。
+会話が長くなってもリクエストの大きさは変わらず、履歴を毎回送り直す必要がありません。
+
+- 保存先: 最近使われたセッションをメモリ（LRU, SESSION_TTL 秒で期限切れ）に置き、
+  SESSION_STORE_PATH のSQLiteファイルにも書き込みます。SQLiteはワーカープロセス間で共有されるため、
+  次のリクエストが別のワーカーに届いても同じ履歴を使えます。
+- トークン数: メッセージを追加する時点で1件ずつトークン数を数えて保持します。
+  予算の確認（api/ledger.py）では、履歴全体を数え直さずにこの合計を使います。
+- SQLiteの読み書きとトークン数の計算はイベントループの外（asyncio.to_thread）で行うため、
+  メモリのLRUとSQLiteの接続は同じロックで保護します。
+- 同じセッションへの書き込みが複数のワーカーで同時に起きた場合は、後の書き込みが優先されます
+  （1つの画面からの会話は順番に送られるため、通常は起きません）。
+"""
+import json
+import time
+import secrets
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from api.config import SESSION_TTL, SESSION_STORE_PATH, SESSION_CACHE_SIZE, SESSION_MAX_MESSAGES
+from api.ledger import count_tokens
+from api.tracing import metrics
+from api.logger import get_logger
+
+logger = get_logger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    messages TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+
+class ChatSession:
+    """1つの会話の履歴。messages と tokens は同じ順序で対応します"""
+
+    def __init__(self, session_id: str, messages: Optional[List[Dict[str, str]]] = None,
+                 tokens: Optional[List[int]] = None, version: int = 0):
+        self.id = session_id
+        self.messages: List[Dict[str, str]] = messages or []
+        self.tokens: List[int] = tokens or []
+        self.version = version
+
+    def recent(self, limit: int) -> Tuple[List[Dict[str, str]], int]:
+        """直近 limit 件のメッセージと、その合計トークン数を返します"""
+        if limit <= 0:
+            return [], 0
+        return self.messages[-limit:], sum(self.tokens[-limit:])
+
+
+class SessionStore:
+    """メモリ（LRU） + SQLite のセッションストア"""
+
+    def __init__(
+        self,
+        path: Optional[str] = SESSION_STORE_PATH,
+        ttl: float = SESSION_TTL,
+        max_entries: int = SESSION_CACHE_SIZE,
+        max_messages: int = SESSION_MAX_MESSAGES
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_messages = max_messages
+        self._memory: "OrderedDict[str, Tuple[float, ChatSession]]" = OrderedDict()
+        # メモリのLRUとSQLiteの接続を保護する（呼び出しはスレッドから行われる）
+        self._lock = threading.RLock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _db(self) -> Optional[sqlite3.Connection]:
+        # 接続は最初に使われた時点で作成する（fork 後の各ワーカーで別の接続になる）
+        if self._conn is None and self.path:
+            try:
+                self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=5.0)
+                if self.path != ":memory:":
+                    self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.executescript(_SCHEMA)
+            except sqlite3.Error as e:
+                logger.warning("[Sessions] Disk store unavailable (%s), using memory only", e)
+                self.path = None
+                self._conn = None
+        return self._conn
+
+    def _remember(self, session: ChatSession, expires_at: float) -> None:
+        self._memory[session.id] = (expires_at, session)
+        self._memory.move_to_end(session.id)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def create(self) -> ChatSession:
+        """新しいセッションを作ります（最初のメッセージが追加されるまでは保存しません）"""
+        metrics.incr("memo_ai_session_total", outcome="created")
+        return ChatSession(secrets.token_urlsafe(18))
+
+    def get(self, session_id: str) -> Optional[ChatSession]:
+        """セッションを返します。存在しない・期限切れの場合は None（SQLiteを読むため、スレッドから呼んでください）"""
+        with self._lock:
+            return self._get(session_id)
+
+    def _get(self, session_id: str) -> Optional[ChatSession]:
+        now = time.time()
+        entry = self._memory.get(session_id)
+        if entry is not None and entry[0] <= now:
+            self._memory.pop(session_id, None)
+            entry = None
+
+        conn = self._db()
+        if conn is None:
+            if entry is None:
+                metrics.incr("memo_ai_session_total", outcome="missing")
+                return None
+            self._memory.move_to_end(session_id)
+            metrics.incr("memo_ai_session_total", outcome="hit")
+            return entry[1]
+
+        # 他のワーカーが追記していなければ（バージョンが同じなら）メモリの内容をそのまま使う
+        row = conn.execute(
+            "SELECT version, expires_at FROM sessions WHERE id = ?", (session_id,)
+        ).fetchone()
+        if row is None or row[1] <= now:
+            self._memory.pop(session_id, None)
+            metrics.incr("memo_ai_session_total", outcome="missing")
+            return None
+        if entry is not None and entry[1].version == row[0]:
+            self._memory.move_to_end(session_id)
+            metrics.incr("memo_ai_session_total", outcome="hit")
+            return entry[1]
+
+        loaded = conn.execute(
+            "SELECT messages, version, expires_at FROM sessions WHERE id = ?", (session_id,)
+        ).fetchone()
+        if loaded is None:
+            return None
+        stored = json.loads(loaded[0])
+        session = ChatSession(
+            session_id,
+            messages=[{"role": m["role"], "content": m["content"]} for m in stored],
+            tokens=[m["tokens"] for m in stored],
+            version=loaded[1]
+        )
+        self._remember(session, loaded[2])
+        metrics.incr("memo_ai_session_total", outcome="loaded")
+        return session
+
+    def append(self, session: ChatSession, messages: List[Dict[str, str]]) -> None:
+        """
+        メッセージを履歴に追加して保存します（古いものは SESSION_MAX_MESSAGES 件を超えた分を削除）。
+        トークン数の計算とSQLiteへの書き込みを行うため、スレッドから呼んでください。
+        """
+        # トークン数の計算はロックの外で行う
+        tokens = [count_tokens([message]) for message in messages]
+        with self._lock:
+            session.messages.extend(messages)
+            session.tokens.extend(tokens)
+            if len(session.messages) > self.max_messages:
+                del session.messages[:-self.max_messages]
+                del session.tokens[:-self.max_messages]
+            session.version += 1
+
+            expires_at = time.time() + self.ttl
+            self._remember(session, expires_at)
+            conn = self._db()
+            if conn is None:
+                return
+            stored = [dict(m, tokens=t) for m, t in zip(session.messages, session.tokens)]
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO sessions (id, messages, version, expires_at) VALUES (?, ?, ?, ?)",
+                    (session.id, json.dumps(stored, ensure_ascii=False), session.version, expires_at)
+                )
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._memory.pop(session_id, None)
+            conn = self._db()
+            if conn is not None:
+                with conn:
+                    conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+    def purge(self) -> None:
+        """期限切れのセッションを削除します"""
+        now = time.time()
+        with self._lock:
+            for session_id in [k for k, (exp, _) in self._memory.items() if exp <= now]:
+                self._memory.pop(session_id, None)
+            conn = self._db()
+            if conn is not None:
+                with conn:
+                    conn.execute("DELETE FROM sessions WHERE expires_at <= ?", (now,))
+
+
+# グローバルインスタンス
+session_store = SessionStore()
@@ -0,0 +1,185 @@
+"""
+Target Router
+メモの内容から保存先（ターゲットのデータベース）を推定する、小さな分類器のモジュールです。
+
+メモを送るたびに保存先を選ぶ必要がなくなり、選び間違いによる保存のやり直し
+（別のスキーマでのLLMの再呼び出し）も減らせます。推定した保存先はその場で先読みさせる
+（api/prefetch.py）ため、送信時にはスキーマと例が揃っています。
+
+- 特徴量: Few-shot例の索引（api/examples_index.py）と同じ、文字 n-gram をハッシュした
+  ベクトル（L2正規化）。日本語でも形態素解析なしで動作します。
+- モデル: NumPy の多クラスロジスティック回帰（softmax）。CPUのみで、推定は行列とベクトルの積1回です。
+- 学習: ルートページ直下の各データベースから直近のページを取得して学習します。
+  ページが作成されるたびに、その1件で重みを少しだけ更新します（差分学習）。
+  全体の学習し直しはバックグラウンドの定期ジョブ（api/scheduler.py）で行います。
+"""
+import time
+import asyncio
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+from api.config import ROUTER_PAGES_PER_TARGET, ROUTER_EPOCHS, ROUTER_LEARNING_RATE
+from api.examples_index import N_FEATURES, vectorize, document_text
+from api.notion import fetch_recent_pages, on_page_created
+from api.prefetch import list_targets
+from api.serializers import simplify_properties
+from api.tracing import span, metrics
+from api.logger import get_logger
+
+logger = get_logger(__name__)
+
+# L2正則化の強さ
+L2 = 1e-4
+
+
+def features(text: str) -> np.ndarray:
+    """テキストを長さ1のベクトルにします（空のテキストはゼロベクトル）"""
+    vec = vectorize(text)
+    norm = np.linalg.norm(vec)
+    if norm > 0:
+        vec /= norm
+    return vec
+
+
+def _softmax(logits: np.ndarray) -> np.ndarray:
+    logits = logits - logits.max(axis=-1, keepdims=True)
+    exp = np.exp(logits)
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+
+class TargetClassifier:
+    """ターゲットIDを クラスとする多クラスロジスティック回帰"""
+
+    def __init__(self, learning_rate: float = ROUTER_LEARNING_RATE, l2: float = L2):
+        self.learning_rate = learning_rate
+        self.l2 = l2
+        self.classes: List[str] = []
+        self.weights = np.zeros((0, N_FEATURES), dtype=np.float32)
+        self.bias = np.zeros(0, dtype=np.float32)
+        self.samples = 0
+
+    def _class_index(self, target_id: str) -> int:
+        """クラスの番号を返します（未知のターゲットは重みゼロの行を追加）"""
+        try:
+            return self.classes.index(target_id)
+        except ValueError:
+            self.classes.append(target_id)
+            self.weights = np.vstack([self.weights, np.zeros((1, N_FEATURES), dtype=np.float32)])
+            self.bias = np.append(self.bias, np.float32(0.0))
+            return len(self.classes) - 1
+
+    def fit(self, samples: List[Tuple[str, str]], epochs: int = ROUTER_EPOCHS) -> None:
+        """
+        (テキスト, ターゲットID) の組で学習します（勾配降下法、全件を1バッチ）。
+        ページ数の少ないデータベースが無視されないよう、件数の逆数で重み付けします。
+        """
+        if not samples:
+            return
+        labels = np.array([self._class_index(target_id) for _, target_id in samples])
+        x = np.stack([features(text) for text, _ in samples])
+        n, k = len(samples), len(self.classes)
+        y = np.zeros((n, k), dtype=np.float32)
+        y[np.arange(n), labels] = 1.0
+        counts = np.bincount(labels, minlength=k).astype(np.float32)
+        sample_weight = (n / (k * counts[labels]))[:, None] / n
+
+        for _ in range(epochs):
+            grad = (_softmax(x @ self.weights.T + self.bias) - y) * sample_weight
+            self.weights -= self.learning_rate * (grad.T @ x + self.l2 * self.weights)
+            self.bias -= self.learning_rate * grad.sum(axis=0)
+        self.samples += n
+
+    def partial_fit(self, text: str, target_id: str, steps: int = 3) -> None:
+        """1件のサンプルで重みを更新します（保存されたページの差分学習）"""
+        index = self._class_index(target_id)
+        x = features(text)
+        if not x.any():
+            return
+        for _ in range(steps):
+            grad = _softmax(self.weights @ x + self.bias)
+            grad[index] -= 1.0
+            self.weights -= self.learning_rate * np.outer(grad, x)
+            self.bias -= self.learning_rate * grad
+        self.samples += 1
+
+    def predict(self, text: str, k: int = 3) -> List[Tuple[str, float]]:
+        """確率の高い順に最大 k 件の (ターゲットID, 確率) を返します"""
+        if not self.classes:
+            return []
+        x = features(text)
+        if not x.any():
+            return []
+        probs = _softmax(self.weights @ x + self.bias)
+        order = np.argsort(-probs)[:k]
+        return [(self.classes[i], float(probs[i])) for i in order]
+
+
+class TargetRouter:
+    """分類器を保持し、必要に応じてNotionのデータから学習させます"""
+
+    def __init__(self, pages_per_target: int = ROUTER_PAGES_PER_TARGET):
+        self.pages_per_target = pages_per_target
+        self.classifier: Optional[TargetClassifier] = None
+        self.trained_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+
+    async def train(self) -> TargetClassifier:
+        """各データベースの直近のページを取得し、新しい分類器を学習させて置き換えます"""
+        with span("router.train"):
+            targets = [t for t in await list_targets() if t.get("type") == "database"]
+            pages = await asyncio.gather(
+                *[fetch_recent_pages(t["id"], limit=self.pages_per_target) for t in targets],
+                return_exceptions=True
+            )
+            samples = []
+            for target, result in zip(targets, pages):
+                if isinstance(result, Exception):
+                    logger.warning("[Router] Failed to load pages of %s: %s", target["id"], result)
+                    continue
+                for properties in result:
+                    text = document_text(simplify_properties(properties))
+                    if text:
+                        samples.append((text, target["id"]))
+
+            classifier = TargetClassifier()
+            # 学習はCPU処理のため、イベントループを止めないようスレッドで行う
+            await asyncio.to_thread(classifier.fit, samples)
+        self.classifier = classifier
+        self.trained_at = time.time()
+        logger.info("[Router] Trained on %d pages from %d databases", len(samples), len(classifier.classes))
+        return classifier
+
+    async def ensure(self) -> TargetClassifier:
+        """未学習の場合は学習させます（同時要求は1回の学習にまとめます）"""
+        if self.classifier is not None:
+            return self.classifier
+        async with self._lock:
+            if self.classifier is None:
+                await self.train()
+            return self.classifier
+
+    async def refresh(self) -> None:
+        """定期ジョブ: 一度でも使われた（学習済みの）場合だけ学習し直します"""
+        if self.classifier is not None:
+            await self.train()
+
+    async def route(self, text: str, k: int = 3) -> List[Tuple[str, float]]:
+        classifier = await self.ensure()
+        with span("router.predict"):
+            candidates = classifier.predict(text, k=k)
+        metrics.incr("memo_ai_router_predictions_total", outcome="hit" if candidates else "empty")
+        return candidates
+
+    def on_page_created(self, database_id: str, properties: Dict[str, Any], page: Dict[str, Any]) -> None:
+        """create_page のフック: 学習済みの分類器を保存されたページで更新します"""
+        if self.classifier is None:
+            return
+        text = document_text(simplify_properties(properties))
+        if text:
+            self.classifier.partial_fit(text, database_id)
+
+
+# グローバルインスタンス
+target_router = TargetRouter()
+on_page_created(target_router.on_page_created)
@@ -0,0 +1,383 @@
+"""
+Request Tracing & Metrics
+リクエスト単位のトレーシングと、処理ステージごとのレイテンシ集計を行うモジュールです。
+
+`span()` で囲んだ処理の所要時間をプロセス内のヒストグラムに集計し、
+p50/p95/p99 を Prometheus テキスト形式で `/api/metrics` から公開します。
+`TRACE_EXPORT_PATH` を設定すると、各スパンを OTLP JSON 形式でファイルに書き出し、
+オフラインでの分析にも利用できます。
+"""
+import os
+import re
+import json
+import time
+import queue
+import logging
+import functools
+import threading
+import contextvars
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, Tuple, List
+
+from api.config import TRACING_ENABLED, TRACE_EXPORT_PATH
+
+# api.logger が api.tracing に依存するため、ここでは標準のロガーを直接使用します
+logger = logging.getLogger(__name__)
+
+# ヒストグラムのバケット境界（秒）
+# Notionのスロットリング（0.35秒）からLLMの長時間応答（数十秒）までをカバーします。
+DEFAULT_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.35, 0.5,
+    0.75, 1.0, 1.5, 2.5, 5.0, 7.5, 10.0, 15.0, 30.0, 60.0,
+)
+
+# 公開するパーセンタイル
+QUANTILES = (0.5, 0.95, 0.99)
+
+# 現在のトレースコンテキスト（非同期タスクごとに独立）
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar(
+    "memo_ai_current_span", default=None
+)
+
+# NotionのID（32桁のhex、ハイフン有無どちらも）をラベル用に正規化するパターン
+_ID_PATTERN = re.compile(r"[0-9a-fA-F]{8}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{12}")
+
+
+def normalize_endpoint(endpoint: str) -> str:
+    """
+    エンドポイント文字列をメトリクスのラベルに使える形に正規化します。
+    ページIDやクエリ文字列を除去し、ラベルのカーディナリティが増えすぎないようにします。
+
+    例: "blocks/2e13...33/children?page_size=100" -> "blocks/{id}/children"
+    """
+    path = endpoint.split("?", 1)[0]
+    return _ID_PATTERN.sub("{id}", path)
+
+
+class Histogram:
+    """
+    固定バケットのレイテンシヒストグラム
+
+    メモリ使用量はバケット数に比例するだけなので、長時間稼働しても増加しません。
+    パーセンタイルはバケット内の線形補間で推定します。
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # 最後の要素は +Inf バケット
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """バケット内の線形補間でパーセンタイルを推定します"""
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for i, c in enumerate(self.counts):
+            if c and cumulative + c >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                if i >= len(self.buckets):
+                    # +Inf バケット: 上限が無いため最後の境界値を返す
+                    return self.buckets[-1]
+                upper = self.buckets[i]
+                return lower + (upper - lower) * ((rank - cumulative) / c)
+            cumulative += c
+        return self.buckets[-1]
+
+
+class MetricsRegistry:
+    """
+    プロセス内メトリクスの集計先
+
+    - histograms: スパン名 + ラベルごとのレイテンシヒストグラム
+    - counters:   トークン数・コストなどの累積カウンター
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], Histogram] = {}
+        self.counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+
+    @staticmethod
+    def _key(name: str, labels: Dict[str, Any]) -> Tuple[str, Tuple[Tuple[str, str], ...]]:
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def observe(self, name: str, value: float, labels: Dict[str, Any]) -> None:
+        key = self._key(name, labels)
+        with self._lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = Histogram()
+            hist.observe(value)
+
+    def incr(self, name: str, value: float = 1.0, **labels) -> None:
+        key = self._key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0.0) + value
+
+    def reset(self) -> None:
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+    def render_prometheus(self) -> str:
+        """Prometheus テキスト形式（version 0.0.4）で全メトリクスを出力します"""
+        lines: List[str] = []
+        with self._lock:
+            histograms = sorted(self.histograms.items())
+            counters = sorted(self.counters.items())
+
+        if histograms:
+            lines.append("# HELP memo_ai_span_duration_seconds Duration of traced stages.")
+            lines.append("# TYPE memo_ai_span_duration_seconds histogram")
+            for (name, labels), hist in histograms:
+                base = (("span", name),) + labels
+                cumulative = 0
+                for bound, c in zip(hist.buckets, hist.counts):
+                    cumulative += c
+                    lines.append(f"memo_ai_span_duration_seconds_bucket{_fmt_labels(base + (('le', _fmt_float(bound)),))} {cumulative}")
+                lines.append(f"memo_ai_span_duration_seconds_bucket{_fmt_labels(base + (('le', '+Inf'),))} {hist.count}")
+                lines.append(f"memo_ai_span_duration_seconds_sum{_fmt_labels(base)} {_fmt_float(hist.total)}")
+                lines.append(f"memo_ai_span_duration_seconds_count{_fmt_labels(base)} {hist.count}")
+
+            lines.append("# HELP memo_ai_span_duration_quantile_seconds Estimated latency percentiles of traced stages.")
+            lines.append("# TYPE memo_ai_span_duration_quantile_seconds gauge")
+            for (name, labels), hist in histograms:
+                base = (("span", name),) + labels
+                for q in QUANTILES:
+                    value = hist.quantile(q)
+                    lines.append(f"memo_ai_span_duration_quantile_seconds{_fmt_labels(base + (('quantile', str(q)),))} {_fmt_float(value)}")
+
+        declared = set()
+        for (name, labels), value in counters:
+            if name not in declared:
+                lines.append(f"# TYPE {name} counter")
+                declared.add(name)
+            lines.append(f"{name}{_fmt_labels(labels)} {_fmt_float(value)}")
+
+        return "\n".join(lines) + "\n"
+
+
+def _fmt_float(value: float) -> str:
+    return repr(float(value))
+
+
+def _fmt_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    escaped = []
+    for k, v in labels:
+        v = v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        escaped.append(f'{k}="{v}"')
+    return "{" + ",".join(escaped) + "}"
+
+
+# グローバルインスタンス
+metrics = MetricsRegistry()
+
+
+class Span:
+    """
+    計測対象の処理区間
+
+    labels はメトリクスの集計キーになるため、モデル名やステータスコードなど
+    値の種類が限られるものだけを指定してください。
+    トークン数などの詳細は attributes に記録し、エクスポートのみに使用します。
+    """
+    __slots__ = ("name", "labels", "attributes", "trace_id", "span_id",
+                 "parent_id", "start_ns", "end_ns", "_token")
+
+    def __init__(self, name: str, labels: Dict[str, Any], parent: Optional["Span"]):
+        self.name = name
+        self.labels = labels
+        self.attributes: Dict[str, Any] = {}
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent else None
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self._token = None
+
+    def set_label(self, key: str, value: Any) -> None:
+        self.labels[key] = value
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    @property
+    def duration(self) -> float:
+        end = self.end_ns or time.time_ns()
+        return (end - self.start_ns) / 1e9
+
+
+@contextmanager
+def span(name: str, **labels):
+    """
+    処理区間を計測するコンテキストマネージャー
+
+    同期・非同期どちらのコードでも使用できます。ネストした場合は
+    contextvars を通じて親子関係が記録されます。
+
+    使用例:
+        with span("notion.api", endpoint="pages", method="POST") as s:
+            ...
+            s.set_label("status", response.status_code)
+    """
+    if not TRACING_ENABLED:
+        yield _NOOP_SPAN
+        return
+
+    s = Span(name, labels, _current_span.get())
+    s._token = _current_span.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.labels.setdefault("status", type(e).__name__)
+        raise
+    finally:
+        s.end_ns = time.time_ns()
+        _current_span.reset(s._token)
+        metrics.observe(name, s.duration, s.labels)
+        if _exporter is not None:
+            _exporter.submit(s)
+
+
+def traced(name: str, **labels):
+    """
+    関数全体を span で囲むデコレーター（同期関数用）
+
+    使用例:
+        @traced("ai.validate_json")
+        def validate_and_fix_json(...): ...
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name, **labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class _NoopSpan:
+    """トレーシング無効時に返すダミースパン"""
+    labels: Dict[str, Any] = {}
+    attributes: Dict[str, Any] = {}
+
+    def set_label(self, key: str, value: Any) -> None:
+        pass
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def current_trace_id() -> Optional[str]:
+    """現在のトレースIDを返します（ログとの突き合わせ用）"""
+    s = _current_span.get()
+    return s.trace_id if s else None
+
+
+def render_prometheus() -> str:
+    return metrics.render_prometheus()
+
+
+# --- OTLP ファイルエクスポーター (OTLP-to-file Exporter) ---
+
+class OTLPFileExporter:
+    """
+    スパンを OTLP/JSON 形式（1行1リクエスト）でファイルに追記するエクスポーター
+
+    書き込みはバックグラウンドスレッドで行うため、イベントループはブロックされません。
+    出力ファイルは OpenTelemetry Collector の `otlpjsonfile` レシーバーなどで読み込めます。
+    """
+
+    def __init__(self, path: str, batch_size: int = 64, flush_interval: float = 2.0):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.start()
+
+    def start(self) -> None:
+        """キューと書き込みスレッドを作成します（fork 後の子プロセスでも呼び出されます）"""
+        self._queue: "queue.Queue[Span]" = queue.Queue(maxsize=10000)
+        self._thread = threading.Thread(target=self._run, name="otlp-file-exporter", daemon=True)
+        self._thread.start()
+
+    def submit(self, s: Span) -> None:
+        try:
+            self._queue.put_nowait(s)
+        except queue.Full:
+            # 書き込みが追いつかない場合は破棄（リクエスト処理を優先）
+            metrics.incr("memo_ai_trace_spans_dropped_total")
+
+    def _run(self) -> None:
+        batch: List[Span] = []
+        while True:
+            try:
+                batch.append(self._queue.get(timeout=self.flush_interval))
+                if len(batch) < self.batch_size:
+                    continue
+            except queue.Empty:
+                if not batch:
+                    continue
+            self._write(batch)
+            batch = []
+
+    def _write(self, batch: List[Span]) -> None:
+        payload = {
+            "resourceSpans": [{
+                "resource": {"attributes": [_otlp_attr("service.name", "memo_ai")]},
+                "scopeSpans": [{
+                    "scope": {"name": "api.tracing"},
+                    "spans": [_to_otlp_span(s) for s in batch]
+                }]
+            }]
+        }
+        try:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(payload, ensure_ascii=False) + "\n")
+        except OSError as e:
+            logger.warning("[Tracing] Failed to export spans: %s", e)
+
+
+def _otlp_attr(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+def _to_otlp_span(s: Span) -> Dict[str, Any]:
+    attrs = {**s.labels, **s.attributes}
+    result = {
+        "traceId": s.trace_id,
+        "spanId": s.span_id,
+        "name": s.name,
+        "kind": 1,  # SPAN_KIND_INTERNAL
+        "startTimeUnixNano": str(s.start_ns),
+        "endTimeUnixNano": str(s.end_ns),
+        "attributes": [_otlp_attr(k, v) for k, v in attrs.items() if v is not None],
+    }
+    if s.parent_id:
+        result["parentSpanId"] = s.parent_id
+    return result
+
+
+_exporter: Optional[OTLPFileExporter] = (
+    OTLPFileExporter(TRACE_EXPORT_PATH) if TRACING_ENABLED and TRACE_EXPORT_PATH else None
+)
+if _exporter is not None and hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_exporter.start)
@@ -0,0 +1,217 @@
+"""
+Provider Transport
+LLMプロバイダー（Gemini / OpenAI / Anthropic）へのHTTP接続を、プロバイダーごとに共有するモジュールです。
+
+acompletion を model / messages だけで呼ぶと、接続の再利用は LiteLLM 内部のクライアントのキャッシュ次第になり、
+しばらく使われなかった後の最初の呼び出しでは DNS の解決と TLS のハンドシェイクからやり直しになります。
+このモジュールでは次のようにして、その待ち時間をなくします。
+
+- 共有クライアント: プロバイダーのベースURLごとに httpx.AsyncClient を1つ作り、
+  options_for(model) で acompletion の client 引数として渡します（イベントループ＝ワーカーごと）。
+- HTTP/2: h2 パッケージがある場合は HTTP/2 を使い、同時の呼び出しを1本の接続で多重化します。
+- キープアライブ: 使われていない接続を LLM_KEEPALIVE_EXPIRY 秒保持します（httpx の既定は5秒）。
+- キープウォーム: LLM_KEEPWARM_INTERVAL を設定すると、営業時間（LLM_KEEPWARM_HOURS）の間だけ
+  各プロバイダーのベースURLに軽いリクエストを送り、サーバー側に接続を閉じられないようにします。
+  応答のステータスは問わず、認証情報も送らないため、課金や利用量には影響しません。
+
+Vertex AI はリージョンごとにURLが異なるため対象外です（LiteLLM の既定の接続を使います）。
+"""
+import time
+import asyncio
+from datetime import datetime
+from zoneinfo import ZoneInfo
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+import httpx
+from litellm.llms.custom_httpx.http_handler import AsyncHTTPHandler
+
+from api.config import (
+    LITELLM_TIMEOUT,
+    OPENAI_API_KEY,
+    LLM_HTTP2,
+    LLM_MAX_CONNECTIONS,
+    LLM_KEEPALIVE_EXPIRY,
+    LLM_KEEPWARM_HOURS,
+    LLM_KEEPWARM_WEEKDAYS_ONLY,
+    LLM_KEEPWARM_TIMEZONE,
+    is_provider_available,
+)
+from api.models import get_model_metadata
+from api.tracing import span, metrics
+from api.logger import get_logger
+
+try:
+    import h2  # noqa: F401  httpx の HTTP/2 対応に必要
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+logger = get_logger(__name__)
+
+# プロバイダーID（LiteLLM の litellm_provider）→ ベースURL
+PROVIDER_BASE_URLS = {
+    "gemini": "https://generativelanguage.googleapis.com",
+    "openai": "https://api.openai.com",
+    "anthropic": "https://api.anthropic.com",
+}
+
+
+def parse_hours(value: str) -> Tuple[int, int]:
+    """"9-18" → (9, 18)。形式が正しくない場合は終日 (0, 24)"""
+    try:
+        start, end = (int(v) for v in value.split("-", 1))
+    except ValueError:
+        logger.warning("[Transport] Invalid LLM_KEEPWARM_HOURS: %r", value)
+        return 0, 24
+    return max(0, start), min(24, end)
+
+
+class _SharedHandler(AsyncHTTPHandler):
+    """共有の httpx.AsyncClient を使う LiteLLM のHTTPハンドラー（独自の接続プールを作りません）
+
+    初期化は LiteLLM のコンストラクタで行い、接続プールを作るフックの create_client だけを差し替えます。
+    """
+
+    def __init__(self, client: httpx.AsyncClient):
+        self._shared_client = client
+        super().__init__(timeout=client.timeout, client_alias="memo_ai")
+
+    def create_client(self, *args: Any, **kwargs: Any) -> httpx.AsyncClient:
+        return self._shared_client
+
+
+class ProviderTransport:
+    """プロバイダーごとの共有クライアントと、キープウォーム"""
+
+    def __init__(
+        self,
+        base_urls: Optional[Dict[str, str]] = None,
+        max_connections: int = LLM_MAX_CONNECTIONS,
+        keepalive_expiry: float = LLM_KEEPALIVE_EXPIRY,
+        http2: bool = LLM_HTTP2,
+        hours: str = LLM_KEEPWARM_HOURS,
+        weekdays_only: bool = LLM_KEEPWARM_WEEKDAYS_ONLY,
+        timezone: str = LLM_KEEPWARM_TIMEZONE,
+        transport: Optional[httpx.AsyncBaseTransport] = None
+    ):
+        """
+        Args:
+            base_urls: プロバイダーID → ベースURL（省略時は PROVIDER_BASE_URLS）
+            transport: httpx のトランスポート（テストで通信を差し替える場合のみ）
+        """
+        self.base_urls = dict(base_urls or PROVIDER_BASE_URLS)
+        self.max_connections = max_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.http2 = http2 and HTTP2_AVAILABLE
+        self.hours = parse_hours(hours)
+        self.weekdays_only = weekdays_only
+        self.tz = ZoneInfo(timezone)
+        self.transport = transport
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._handlers: Dict[str, Any] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _check_loop(self) -> None:
+        # 別のイベントループ（fork 前・テスト）で作ったクライアントは使い回さない
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._clients.clear()
+            self._handlers.clear()
+            self._loop = loop
+
+    def client(self, provider: str) -> httpx.AsyncClient:
+        """プロバイダーのベースURL用の共有クライアントを返します（初回に作成）"""
+        self._check_loop()
+        base_url = self.base_urls[provider]
+        client = self._clients.get(base_url)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                http2=self.http2,
+                transport=self.transport,
+                timeout=httpx.Timeout(LITELLM_TIMEOUT),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                    keepalive_expiry=self.keepalive_expiry
+                )
+            )
+            self._clients[base_url] = client
+            self._handlers.pop(provider, None)
+        return client
+
+    def _handler(self, provider: str) -> Any:
+        client = self.client(provider)
+        handler = self._handlers.get(provider)
+        if handler is None:
+            if provider == "openai":
+                # OpenAI は公式SDKのクライアントを渡す（リトライは generate_json で行う）
+                from openai import AsyncOpenAI
+                handler = AsyncOpenAI(api_key=OPENAI_API_KEY, http_client=client, max_retries=0)
+            else:
+                handler = _SharedHandler(client)
+            self._handlers[provider] = handler
+        return handler
+
+    def options_for(self, model: str) -> Dict[str, Any]:
+        """
+        acompletion に追加で渡す引数（{"client": ...}）を返します。
+        対象外のプロバイダーのモデルは空の辞書（LiteLLM の既定の接続を使う）。
+        """
+        metadata = get_model_metadata(model)
+        provider = metadata["litellm_provider"] if metadata else model.partition("/")[0]
+        if provider not in self.base_urls:
+            return {}
+        return {"client": self._handler(provider)}
+
+    def within_hours(self, now: Optional[datetime] = None) -> bool:
+        """キープウォームを行う時間帯か（LLM_KEEPWARM_TIMEZONE の現在時刻で判定）"""
+        now = now or datetime.now(self.tz)
+        if self.weekdays_only and now.weekday() >= 5:
+            return False
+        start, end = self.hours
+        return start <= now.hour < end
+
+    async def ping(self, provider: str) -> float:
+        """ベースURLに軽いリクエストを送り、かかった秒数を返します（ステータスは問いません）"""
+        started = time.perf_counter()
+        with span("llm.keepwarm", provider=provider):
+            await self.client(provider).head(self.base_urls[provider] + "/", timeout=10.0)
+        return time.perf_counter() - started
+
+    async def keep_warm(self, providers: Optional[Iterable[str]] = None, now: Optional[datetime] = None) -> int:
+        """
+        定期ジョブ: 営業時間内なら各プロバイダーへの接続を保つためのリクエストを送ります。
+
+        Args:
+            providers: 対象のプロバイダー（省略時は認証情報が設定されているもの）
+
+        Returns:
+            int: 応答があったプロバイダーの数
+        """
+        if not self.within_hours(now):
+            return 0
+        if providers is None:
+            providers = [p for p in self.base_urls if is_provider_available(p)]
+        providers = list(providers)
+        results = await asyncio.gather(*[self.ping(p) for p in providers], return_exceptions=True)
+        warmed = 0
+        for provider, result in zip(providers, results):
+            if isinstance(result, Exception):
+                metrics.incr("memo_ai_llm_keepwarm_total", provider=provider, outcome="error")
+                logger.warning("[Transport] Keep-warm to %s failed: %s", provider, result)
+            else:
+                metrics.incr("memo_ai_llm_keepwarm_total", provider=provider, outcome="ok")
+                warmed += 1
+        return warmed
+
+    async def close(self) -> None:
+        """共有クライアントを閉じます（ワーカーの終了時）"""
+        if self._loop is asyncio.get_running_loop():
+            await asyncio.gather(*[c.aclose() for c in self._clients.values()], return_exceptions=True)
+        self._clients.clear()
+        self._handlers.clear()
+        self._loop = None
+
+
+# グローバルインスタンス
+provider_transport = ProviderTransport()
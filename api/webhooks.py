@@ -0,0 +1,288 @@
+"""
+Notion Webhooks
+Notionの変更通知（Webhook）を受け取り、変更された対象のキャッシュだけを破棄するモジュールです。
+
+サーバー側のキャッシュ（スキーマ・ターゲット一覧・データベースの行・ページの本文）は、これまで
+有効期限（TARGET_CACHE_TTL）か定期的な再取得で更新していたため、古さとNotionへの問い合わせ回数の
+どちらかを選ぶ必要がありました。変更通知を受け取れば、有効期限を長くしても古い内容は残りません。
+
+- 署名: X-Notion-Signature（"sha256=" + 本文の HMAC-SHA256、鍵は検証トークン）を確認します。
+  サブスクリプション作成時に送られる検証トークンは、NOTION_WEBHOOK_SECRET が未設定の間だけログに出力します
+  （設定後の署名の無い検証リクエストは拒否します）。
+- 変換: イベントの種類と対象から、破棄するキャッシュ（invalidations_for）を決めます。
+  - schema:  スキーマ・システムメッセージ・例の索引・/api/schema のレスポンス（database.schema_updated など）
+  - content: データベースの行・ページのブロック・ページの本文（page.* / database.content_updated）
+  - targets: ターゲット一覧（ルートページ直下のページ・データベースの作成・削除・移動）
+  - mirror:  全文検索の索引（api/search_index.py）の差分同期。索引を作成済みのデータベースのみ
+  - unindex: 削除されたページを全文検索の索引から取り除く（差分同期では削除が分からないため）
+- ワーカー間の共有: 受け取ったワーカーはSQLite（WEBHOOK_STORE_PATH）に記録するだけで、
+  各ワーカーが WEBHOOK_APPLY_INTERVAL 秒ごとに新しい記録を読み、自分のメモリのキャッシュを破棄します。
+  全文検索の同期は最初に記録を取得したワーカーだけが行います。
+- まとめ処理: 間隔内の同じ対象へのイベントは1回の破棄・同期にまとめるため、
+  一括編集などで大量のイベントが届いても、Notionへの再取得は対象ごとに1回です。
+"""
+import re
+import hmac
+import json
+import time
+import asyncio
+import hashlib
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from api.config import NOTION_ROOT_PAGE_ID, NOTION_WEBHOOK_SECRET, WEBHOOK_STORE_PATH, WEBHOOK_RETENTION
+from api.prefetch import invalidate_schema, invalidate_content, invalidate_targets
+from api.page_text import invalidate_page_text
+from api.search_index import search_service
+from api.tracing import metrics
+from api.logger import get_logger
+
+logger = get_logger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS invalidations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    target_id TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    claimed INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+# 検証トークンの形式（ログに任意の文字列を書き込ませないため、この形式以外は受け付けない）
+_VERIFICATION_TOKEN = re.compile(r"secret_[A-Za-z0-9]{10,100}")
+
+# ページ・データベースの追加・削除にあたるイベントの動作
+_MEMBERSHIP_ACTIONS = ("created", "deleted", "undeleted", "moved")
+
+
+class InvalidSignatureError(ValueError):
+    """Webhook の署名が無い、または検証トークンと一致しない"""
+
+
+def _normalize_id(value: Optional[str]) -> str:
+    return (value or "").replace("-", "").lower()
+
+
+def verify_signature(body: bytes, signature: Optional[str], secret: str) -> bool:
+    """X-Notion-Signature（"sha256=<hex>"）が本文と検証トークンから計算した値と一致するか"""
+    if not signature or not secret:
+        return False
+    expected = "sha256=" + hmac.new(secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+
+def invalidations_for(event: Dict[str, Any]) -> List[Tuple[str, str]]:
+    """
+    イベントから、破棄するキャッシュの (種類, 対象のID) の一覧を返します。
+    種類は "schema" / "content" / "targets" / "mirror" / "unindex"。関係の無いイベント（コメントなど）は空です。
+    """
+    category, _, action = (event.get("type") or "").partition(".")
+    entity_id = (event.get("entity") or {}).get("id")
+    parent = (event.get("data") or {}).get("parent") or {}
+    parent_id, parent_type = parent.get("id"), parent.get("type")
+    under_root = bool(NOTION_ROOT_PAGE_ID) and _normalize_id(parent_id) == _normalize_id(NOTION_ROOT_PAGE_ID)
+    if not entity_id:
+        return []
+
+    result: List[Tuple[str, str]] = []
+    if category == "page":
+        # ページ自身のブロック・本文
+        result.append(("content", entity_id))
+        if parent_type in ("database", "data_source") and parent_id and action != "content_updated":
+            # データベースの行（プロパティ）が変わった
+            result += [("content", parent_id), ("mirror", parent_id)]
+        if action == "deleted":
+            result.append(("unindex", entity_id))
+        if action in _MEMBERSHIP_ACTIONS and (under_root or action in ("deleted", "moved")):
+            # 削除・移動は元の親が分からないため、常にターゲット一覧を破棄する
+            result.append(("targets", "root"))
+    elif category in ("database", "data_source"):
+        # data_source（新しいAPIバージョン）のイベントは親のデータベースとして扱う
+        database_id = parent_id if category == "data_source" and parent_type == "database" else entity_id
+        if action == "schema_updated":
+            result.append(("schema", database_id))
+        elif action == "content_updated":
+            result += [("content", database_id), ("mirror", database_id)]
+        elif action in _MEMBERSHIP_ACTIONS:
+            result += [("schema", database_id), ("targets", "root")]
+    return result
+
+
+class InvalidationLog:
+    """ワーカー間で共有する、キャッシュの破棄の記録（SQLite）"""
+
+    def __init__(self, path: Optional[str] = WEBHOOK_STORE_PATH):
+        self.path = path or ":memory:"
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _db(self) -> sqlite3.Connection:
+        # 接続は最初に使われた時点で作成する（fork 後の各ワーカーで別の接続になる）
+        if self._conn is None:
+            try:
+                self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=5.0)
+                if self.path != ":memory:":
+                    self._conn.execute("PRAGMA journal_mode=WAL")
+            except sqlite3.Error as e:
+                logger.warning("[Webhook] Disk store unavailable (%s), using memory only", e)
+                self.path = ":memory:"
+                self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.executescript(_SCHEMA)
+        return self._conn
+
+    def append(self, items: List[Tuple[str, str]]) -> None:
+        now = time.time()
+        with self._lock, self._db() as conn:
+            conn.executemany(
+                "INSERT INTO invalidations (kind, target_id, created_at) VALUES (?, ?, ?)",
+                [(kind, target_id, now) for kind, target_id in items]
+            )
+
+    def latest_id(self) -> int:
+        with self._lock:
+            row = self._db().execute("SELECT MAX(id) FROM invalidations").fetchone()
+        return row[0] or 0
+
+    def read(self, after_id: int) -> List[Tuple[int, str, str]]:
+        """after_id より後の記録を古い順に返します"""
+        with self._lock:
+            return self._db().execute(
+                "SELECT id, kind, target_id FROM invalidations WHERE id > ? ORDER BY id", (after_id,)
+            ).fetchall()
+
+    def claim(self, ids: List[int]) -> bool:
+        """記録を処理済みにします。他のワーカーが先に処理済みにしていた場合は False"""
+        with self._lock, self._db() as conn:
+            cursor = conn.execute(
+                f"UPDATE invalidations SET claimed = 1 WHERE claimed = 0 AND id IN ({','.join('?' * len(ids))})",
+                ids
+            )
+        return cursor.rowcount > 0
+
+    def prune(self, before: float) -> int:
+        with self._lock, self._db() as conn:
+            return conn.execute("DELETE FROM invalidations WHERE created_at < ?", (before,)).rowcount
+
+
+class WebhookService:
+    """Webhook の受信と、記録されたキャッシュの破棄の反映"""
+
+    def __init__(self, log: Optional[InvalidationLog] = None, secret: str = NOTION_WEBHOOK_SECRET):
+        self.log = log or InvalidationLog()
+        self.secret = secret
+        self._last_id: Optional[int] = None
+        self._mirror_tasks: Dict[str, asyncio.Task] = {}
+        self._mirror_pending: Set[str] = set()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.secret)
+
+    def start(self) -> None:
+        """起動時: 起動前の記録は反映しない（キャッシュは空から始まるため）"""
+        self._last_id = self.log.latest_id()
+
+    async def receive(self, body: bytes, signature: Optional[str]) -> Dict[str, Any]:
+        """
+        Webhook の本文を検証し、破棄するキャッシュを記録します（記録はイベントループの外で行います）。
+
+        Raises:
+            ValueError: 本文がJSONでない場合、検証トークンの形式が正しくない場合
+            InvalidSignatureError: 署名が一致しない場合、検証トークンの設定後に検証リクエストが届いた場合
+        """
+        try:
+            event = json.loads(body)
+        except (ValueError, UnicodeDecodeError):
+            raise ValueError("本文がJSONではありません")
+        if not isinstance(event, dict):
+            raise ValueError("本文がJSONオブジェクトではありません")
+
+        if "verification_token" in event and "type" not in event:
+            # サブスクリプション作成時の検証リクエスト（署名なし）。設定後は誰でも送れるため受け付けない
+            if self.enabled:
+                metrics.incr("memo_ai_webhook_events_total", type="verification", outcome="invalid_signature")
+                raise InvalidSignatureError("検証トークンは設定済みです")
+            token = event["verification_token"]
+            if not isinstance(token, str) or not _VERIFICATION_TOKEN.fullmatch(token):
+                raise ValueError("検証トークンの形式が正しくありません")
+            logger.warning("[Webhook] Verification token received. Set NOTION_WEBHOOK_SECRET=%s", token)
+            return {"status": "verification"}
+
+        if not verify_signature(body, signature, self.secret):
+            metrics.incr("memo_ai_webhook_events_total", type="unknown", outcome="invalid_signature")
+            raise InvalidSignatureError("署名が一致しません")
+
+        items = invalidations_for(event)
+        if items:
+            # SQLiteへの書き込み（busy timeout で待つ場合がある）はイベントループの外で行う
+            await asyncio.to_thread(self.log.append, items)
+        metrics.incr("memo_ai_webhook_events_total", type=event.get("type") or "unknown",
+                     outcome="accepted" if items else "ignored")
+        return {"status": "accepted", "invalidations": len(items)}
+
+    async def apply(self) -> int:
+        """
+        定期ジョブ: 前回以降の記録を読み、同じ対象をまとめてキャッシュを破棄します。
+
+        Returns:
+            int: 破棄した対象の数（まとめた後）
+        """
+        entries = await asyncio.to_thread(self.log.read, self._last_id or 0)
+        if not entries:
+            return 0
+        self._last_id = entries[-1][0]
+
+        pending: Dict[Tuple[str, str], List[int]] = {}
+        for entry_id, kind, target_id in entries:
+            pending.setdefault((kind, target_id), []).append(entry_id)
+
+        for (kind, target_id), ids in pending.items():
+            if kind == "schema":
+                invalidate_schema(target_id)
+            elif kind == "content":
+                invalidate_content(target_id)
+                invalidate_page_text(target_id)
+            elif kind == "targets":
+                invalidate_targets()
+            elif kind == "mirror" and await asyncio.to_thread(self.log.claim, ids):
+                await self._sync_mirror(target_id)
+            elif kind == "unindex" and await asyncio.to_thread(self.log.claim, ids):
+                # 索引のSQLiteはワーカー間で共有されるため、取り除くのは1つのワーカーだけでよい
+                await search_service.remove_pages([target_id])
+            metrics.incr("memo_ai_webhook_invalidations_total", kind=kind)
+        logger.info("[Webhook] Applied %d invalidations from %d events", len(pending), len(entries))
+        return len(pending)
+
+    async def _sync_mirror(self, database_id: str) -> None:
+        """全文検索の索引を差分同期します（同期中なら、完了後にもう一度同期）"""
+        _, synced_at = await asyncio.to_thread(search_service.index.get_watermark, database_id)
+        if not synced_at:
+            # 一度も検索されていない（索引が無い）データベースは、最初の検索時に同期される
+            return
+        if database_id in self._mirror_tasks:
+            self._mirror_pending.add(database_id)
+            return
+
+        async def _run():
+            try:
+                while True:
+                    self._mirror_pending.discard(database_id)
+                    await search_service.sync(database_id, force=True)
+                    if database_id not in self._mirror_pending:
+                        return
+            except Exception as e:
+                logger.warning("[Webhook] Search sync failed for %s: %s", database_id, e)
+            finally:
+                self._mirror_tasks.pop(database_id, None)
+
+        self._mirror_tasks[database_id] = asyncio.create_task(_run())
+
+    async def prune(self) -> None:
+        """定期ジョブ: 保持期間を過ぎた記録を削除します"""
+        await asyncio.to_thread(self.log.prune, time.time() - WEBHOOK_RETENTION)
+
+
+# グローバルインスタンス
+webhook_service = WebhookService()
@@ -0,0 +1,107 @@
+"""
+Compact Output Benchmark
+通常のプロンプト（construct_prompt / chat_analyze_text_with_ai）と短い形式（api/compact.py）で、
+抽出1回あたりの出力トークン数・プロンプトのトークン数・レイテンシを比較します。
+
+フェイクLLM（benchmarks/fake_llm.py）は出力トークン数に比例した時間で応答するため、
+出力の短縮がそのままレイテンシの差として現れます。
+
+使用例:
+    python -m benchmarks.bench_compact --requests 50 --token-rate 100
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+from typing import Dict, Any, List, Optional
+
+from benchmarks.run import percentile
+from benchmarks.mock_notion import make_schema
+
+VARIANTS = (
+    ("analyze", False),
+    ("analyze", True),
+    ("chat", False),
+    ("chat", True),
+)
+
+
+async def run_variant(kind: str, compact: bool, requests: int, model: str) -> Dict[str, Any]:
+    from api.ai import analyze_text_with_ai, chat_analyze_text_with_ai
+
+    schema = make_schema()
+    latencies: List[float] = []
+    prompt_tokens = completion_tokens = errors = 0
+    for i in range(requests):
+        # 複数行のメモはルールによる抽出（api/fastpath.py）では確定せず、LLMを呼ぶ
+        text = f"明日10時に会議 #{i}\n議題: 来期の予算と採用計画"
+        start = time.perf_counter()
+        if kind == "analyze":
+            result = await analyze_text_with_ai(text, schema, [], "タスク名に言い換えて。", model=model, compact=compact)
+            ok = "error" not in result and result["properties"].get("Name")
+        else:
+            result = await chat_analyze_text_with_ai(text, schema, "タスク名に言い換えて。", model=model, compact=compact)
+            ok = bool(result.get("properties"))
+        latencies.append(time.perf_counter() - start)
+        errors += 0 if ok else 1
+        usage = result.get("usage") or {}
+        prompt_tokens += usage.get("prompt_tokens") or 0
+        completion_tokens += usage.get("completion_tokens") or 0
+
+    latencies.sort()
+    return {
+        "scenario": kind,
+        "mode": "compact" if compact else "default",
+        "requests": requests,
+        "errors": errors,
+        "prompt_tokens": round(prompt_tokens / requests, 1),
+        "completion_tokens": round(completion_tokens / requests, 1),
+        "latency_ms": {
+            "p50": round(percentile(latencies, 0.50) * 1000, 2),
+            "p95": round(percentile(latencies, 0.95) * 1000, 2),
+            "mean": round(sum(latencies) / len(latencies) * 1000, 2),
+        },
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Compact output benchmark")
+    parser.add_argument("--requests", type=int, default=50, help="各モードのリクエスト数")
+    parser.add_argument("--token-rate", type=float, default=100.0, help="フェイクLLMの出力トークン/秒")
+    parser.add_argument("--ttft", type=float, default=0.05, help="フェイクLLMの初回トークン遅延（秒）")
+    parser.add_argument("--output", help="結果JSONの出力先（省略時は標準出力）")
+    args = parser.parse_args(argv)
+
+    # api.* のインポート前にダミー認証情報を設定する
+    os.environ.setdefault("NOTION_API_KEY", "bench-notion-key")
+    os.environ.setdefault("OPENAI_API_KEY", "bench-openai-key")
+    from benchmarks.fake_llm import install_fake_llm, FAKE_MODEL
+    install_fake_llm(token_rate=args.token_rate, ttft=args.ttft)
+
+    results = []
+    for kind, compact in VARIANTS:
+        result = asyncio.run(run_variant(kind, compact, args.requests, FAKE_MODEL))
+        results.append(result)
+        print(
+            f"[bench] {kind:<8} {result['mode']:<8} completion={result['completion_tokens']:>6.1f} tok  "
+            f"prompt={result['prompt_tokens']:>6.1f} tok  p50={result['latency_ms']['p50']:.1f}ms  "
+            f"errors={result['errors']}",
+            file=sys.stderr
+        )
+
+    report = {
+        "meta": {"token_rate": args.token_rate, "ttft": args.ttft, "requests": args.requests},
+        "results": results,
+    }
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Serializer Microbenchmark
+30プロパティのスキーマで、プロパティ変換とリクエストボディのエンコードを計測します。
+
+- legacy:  旧チャット経路（json.dumps → json.loads → 値ごとに辞書を組み立て）
+- compiled: api/serializers.serialize_properties（コンパイル済み変換表 + インターン）
+- encode:  create_page のボディ生成（json.dumps().encode() と dumps_bytes の比較）
+
+使用例:
+    python -m benchmarks.bench_serializers --iterations 20000
+"""
+import json
+import timeit
+import argparse
+from typing import Dict, Any, Optional, List
+
+from api.serializers import serialize_properties, dumps_bytes
+
+PROPERTY_TYPES = ("title", "rich_text", "select", "multi_select", "status", "date", "checkbox", "number")
+
+
+def make_schema(size: int = 30) -> Dict[str, Any]:
+    """各種の型を混ぜた size 個のプロパティを持つスキーマ"""
+    schema = {"Name": {"type": "title", "title": {}}}
+    for i in range(1, size):
+        p_type = PROPERTY_TYPES[1 + (i % (len(PROPERTY_TYPES) - 1))]
+        entry = {"type": p_type, p_type: {}}
+        if p_type in ("select", "multi_select", "status"):
+            entry[p_type] = {"options": [{"name": f"選択肢{j}"} for j in range(8)]}
+        schema[f"Prop{i:02d}"] = entry
+    return schema
+
+
+def make_values(schema: Dict[str, Any]) -> Dict[str, Any]:
+    """AIの出力を想定した値（Python の基本型）"""
+    values = {}
+    for k, v in schema.items():
+        p_type = v["type"]
+        if p_type in ("title", "rich_text"):
+            values[k] = f"{k} のテキスト 📝"
+        elif p_type in ("select", "status"):
+            values[k] = "選択肢3"
+        elif p_type == "multi_select":
+            values[k] = ["選択肢1", "選択肢5"]
+        elif p_type == "date":
+            values[k] = "2026-01-15"
+        elif p_type == "checkbox":
+            values[k] = True
+        elif p_type == "number":
+            values[k] = "42"
+    return values
+
+
+def legacy_validate(json_str: str, schema: Dict[str, Any]) -> Dict[str, Any]:
+    """変更前の validate_and_fix_json のプロパティ変換部分（比較用）"""
+    data = json.loads(json_str)
+    validated = {}
+    for k, v in data.items():
+        if k not in schema:
+            continue
+        target_type = schema[k]["type"]
+        if target_type == "select":
+            if isinstance(v, dict): v = v.get("name")
+            if v:
+                validated[k] = {"select": {"name": str(v)}}
+        elif target_type == "multi_select":
+            if not isinstance(v, list): v = [v]
+            opts = []
+            for item in v:
+                if isinstance(item, dict): item = item.get("name")
+                if item: opts.append({"name": str(item)})
+            validated[k] = {"multi_select": opts}
+        elif target_type == "status":
+            if isinstance(v, dict): v = v.get("name")
+            if v:
+                validated[k] = {"status": {"name": str(v)}}
+        elif target_type == "date":
+            if isinstance(v, dict): v = v.get("start")
+            if v:
+                validated[k] = {"date": {"start": str(v)}}
+        elif target_type == "checkbox":
+            validated[k] = {"checkbox": bool(v)}
+        elif target_type == "number":
+            try:
+                if v is not None:
+                    validated[k] = {"number": float(v)}
+            except (ValueError, TypeError):
+                pass
+        elif target_type == "title":
+            if isinstance(v, list): v = "".join([t.get("plain_text", "") for t in v if "plain_text" in t])
+            validated[k] = {"title": [{"text": {"content": str(v)}}]}
+        elif target_type == "rich_text":
+            if isinstance(v, list): v = "".join([t.get("plain_text", "") for t in v if "plain_text" in t])
+            validated[k] = {"rich_text": [{"text": {"content": str(v)}}]}
+    return validated
+
+
+def bench(stmt, iterations: int) -> float:
+    """1回あたりの平均実行時間（マイクロ秒）。ウォームアップ後に3回計測し最小値を採用"""
+    stmt()
+    best = min(timeit.repeat(stmt, number=iterations, repeat=3))
+    return best / iterations * 1e6
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Notion property serializer microbenchmark")
+    parser.add_argument("--iterations", type=int, default=10000)
+    parser.add_argument("--properties", type=int, default=30)
+    args = parser.parse_args(argv)
+
+    schema = make_schema(args.properties)
+    values = make_values(schema)
+
+    # 両実装の出力が一致することを確認してから計測する
+    assert legacy_validate(json.dumps(values), schema) == serialize_properties(values, schema)
+
+    properties = serialize_properties(values, schema)
+    body = {"parent": {"database_id": "bench-db"}, "properties": properties}
+
+    results = {
+        "properties": len(schema),
+        "iterations": args.iterations,
+        "convert_us": {
+            "legacy_dump_parse": round(bench(lambda: legacy_validate(json.dumps(values), schema), args.iterations), 2),
+            "compiled": round(bench(lambda: serialize_properties(values, schema), args.iterations), 2),
+        },
+        "encode_us": {
+            "json_dumps_encode": round(bench(lambda: json.dumps(body).encode("utf-8"), args.iterations), 2),
+            "dumps_bytes": round(bench(lambda: dumps_bytes(body), args.iterations), 2),
+        },
+        "body_bytes": {
+            "json_dumps_encode": len(json.dumps(body).encode("utf-8")),
+            "dumps_bytes": len(dumps_bytes(body)),
+        },
+    }
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
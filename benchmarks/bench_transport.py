@@ -0,0 +1,165 @@
+"""
+Provider Transport Benchmark
+しばらく使われなかった後の最初のLLM呼び出しの、最初のバイトが届くまでの時間（TTFT）を比較します。
+
+ローカルのスタンドインのプロバイダーは、実際のAPIの接続確立（DNS + TCP + TLS）の待ち時間を
+新しい接続ごとの --handshake 秒で再現し、--server-idle 秒使われなかった接続を閉じます
+（実際のプロバイダーも、アイドルの接続をサーバー側で閉じます）。
+
+- default:   httpx の既定の設定（アイドルの接続を5秒で破棄）
+- keepalive: api/transport.py の共有クライアント（LLM_KEEPALIVE_EXPIRY）のみ
+- keepwarm:  共有クライアント + キープウォーム（--ping-interval 秒ごと）
+
+使用例:
+    python -m benchmarks.bench_transport --idle 8 --trials 3 --handshake 0.15
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, List, Optional
+
+from benchmarks.run import percentile
+
+MODES = ("default", "keepalive", "keepwarm")
+
+
+def start_provider(handshake: float, ttft: float, server_idle: float) -> ThreadingHTTPServer:
+    """接続ごとにハンドシェイクの待ち時間がある、スタンドインのプロバイダーを起動します"""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # この秒数リクエストが無い接続は閉じる
+        timeout = server_idle
+
+        def setup(self):
+            time.sleep(handshake)
+            super().setup()
+
+        def _reply(self, body: bytes) -> None:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if self.command != "HEAD":
+                self.wfile.write(body)
+
+        def do_HEAD(self):
+            self._reply(b"")
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            time.sleep(ttft)
+            self._reply(b'{"choices":[{"message":{"content":"{}"}}]}')
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+async def first_byte(client, url: str) -> float:
+    """リクエストを送り、応答の最初のバイトが届くまでの秒数を返します"""
+    started = time.perf_counter()
+    async with client.stream("POST", url + "/v1/chat/completions", json={"messages": []}) as response:
+        elapsed = None
+        # 本文を最後まで読み、接続をプールに戻す
+        async for _ in response.aiter_raw():
+            if elapsed is None:
+                elapsed = time.perf_counter() - started
+    return elapsed
+
+
+async def run_trial(url: str, idle: float, ping_interval: float) -> Dict[str, Dict[str, float]]:
+    import httpx
+    from api.transport import ProviderTransport
+
+    transports = {
+        mode: ProviderTransport(base_urls={"mock": url}, hours="0-24", weekdays_only=False)
+        for mode in ("keepalive", "keepwarm")
+    }
+    clients = {"default": httpx.AsyncClient(timeout=30.0)}
+    clients.update({mode: t.client("mock") for mode, t in transports.items()})
+
+    async def keep_warm() -> None:
+        while True:
+            await asyncio.sleep(ping_interval)
+            await transports["keepwarm"].keep_warm(["mock"])
+
+    # 最初の呼び出し（接続なし）→ アイドル → アイドル後の最初の呼び出し
+    cold = await asyncio.gather(*[first_byte(clients[m], url) for m in MODES])
+    pinger = asyncio.create_task(keep_warm())
+    await asyncio.sleep(idle)
+    after_idle = await asyncio.gather(*[first_byte(clients[m], url) for m in MODES])
+    pinger.cancel()
+    await asyncio.gather(pinger, return_exceptions=True)
+
+    await clients["default"].aclose()
+    for t in transports.values():
+        await t.close()
+    return {m: {"cold": c, "after_idle": a} for m, c, a in zip(MODES, cold, after_idle)}
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Provider transport benchmark")
+    parser.add_argument("--trials", type=int, default=3, help="試行回数")
+    parser.add_argument("--idle", type=float, default=8.0, help="呼び出しの間隔（秒）")
+    parser.add_argument("--handshake", type=float, default=0.15, help="新しい接続の確立にかかる秒数（DNS + TLS）")
+    parser.add_argument("--ttft", type=float, default=0.05, help="プロバイダーの最初のトークンまでの秒数")
+    parser.add_argument("--server-idle", type=float, default=6.0, help="サーバーがアイドルの接続を閉じるまでの秒数")
+    parser.add_argument("--ping-interval", type=float, default=3.0, help="キープウォームの間隔（秒）")
+    parser.add_argument("--output", help="結果JSONの出力先（省略時は標準出力）")
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault("NOTION_API_KEY", "bench-notion-key")
+    server = start_provider(args.handshake, args.ttft, args.server_idle)
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    samples: Dict[str, Dict[str, List[float]]] = {m: {"cold": [], "after_idle": []} for m in MODES}
+    for trial in range(args.trials):
+        result = asyncio.run(run_trial(url, args.idle, args.ping_interval))
+        for mode, timings in result.items():
+            for key, value in timings.items():
+                samples[mode][key].append(value)
+        print(f"[bench] trial {trial + 1}/{args.trials} done", file=sys.stderr)
+    server.shutdown()
+
+    results = []
+    for mode in MODES:
+        after_idle = sorted(samples[mode]["after_idle"])
+        result = {
+            "mode": mode,
+            "cold_ms": round(sum(samples[mode]["cold"]) / args.trials * 1000, 2),
+            "after_idle_ms": {
+                "p50": round(percentile(after_idle, 0.50) * 1000, 2),
+                "max": round(after_idle[-1] * 1000, 2),
+            },
+        }
+        results.append(result)
+        print(
+            f"[bench] {mode:<9} cold={result['cold_ms']:>7.1f}ms  "
+            f"after idle p50={result['after_idle_ms']['p50']:>7.1f}ms",
+            file=sys.stderr
+        )
+
+    report = {
+        "meta": {k: getattr(args, k) for k in ("trials", "idle", "handshake", "ttft", "server_idle", "ping_interval")},
+        "results": results,
+    }
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
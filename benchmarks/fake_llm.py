@@ -0,0 +1,136 @@
+"""
+Fake LiteLLM Provider
+ベンチマーク用のローカル LLM スタンドインです。
+
+LiteLLM のカスタムプロバイダー機構（`litellm.custom_provider_map`）に登録するため、
+`api/llm_client.generate_json` は実プロバイダーと同じ `acompletion` 経路を通ります。
+
+- token_rate:  1秒あたりの出力トークン数（生成時間 = completion_tokens / token_rate）
+- ttft:        最初のトークンまでの待ち時間（秒）
+- error_rate:  例外を送出する確率 (0.0〜1.0)
+
+プロンプトが短い形式（api/compact.py）を指示している場合は短いキーの応答を返し、
+max_tokens が指定された場合はその長さで打ち切ります。
+"""
+import json
+import random
+import asyncio
+from typing import Dict, Any, Optional
+
+import litellm
+from litellm import CustomLLM, ModelResponse
+
+from api.compact import COMPACT_INSTRUCTION, compress_properties
+from benchmarks.mock_notion import make_schema
+
+FAKE_PROVIDER = "fake-llm"
+FAKE_MODEL = f"{FAKE_PROVIDER}/bench"
+
+# フェイクLLMが抽出する値（モックNotionのスキーマのプロパティ名）
+PROPERTIES = {
+    "Name": "📅 明日10時の会議に参加する",
+    "Status": "未着手",
+    "Tags": ["会議", "仕事"],
+    "Due": "2026-01-16",
+    "Done": False,
+}
+
+
+class FakeLLMError(Exception):
+    """error_rate によって意図的に発生させるエラー"""
+
+
+class FakeLLM(CustomLLM):
+    """一定のトークンレートで固定のJSONを返すフェイクプロバイダー"""
+
+    def __init__(self, token_rate: float = 200.0, ttft: float = 0.05,
+                 error_rate: float = 0.0, seed: Optional[int] = None):
+        super().__init__()
+        self.token_rate = token_rate
+        self.ttft = ttft
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.calls = 0
+        self.errors = 0
+
+    def _content(self, messages) -> str:
+        texts = [m.get("content") for m in messages or [] if isinstance(m.get("content"), str)]
+        if any(COMPACT_INSTRUCTION in t for t in texts):
+            properties = compress_properties(PROPERTIES, make_schema())
+            # チャット（システムメッセージあり）は {"p": ...}、抽出はプロパティのみ。応答文は省略する
+            is_chat = any(m.get("role") == "system" for m in messages)
+            return json.dumps({"p": properties} if is_chat else properties,
+                              ensure_ascii=False, separators=(",", ":"))
+        return json.dumps({
+            "message": "タスクを整理しました。",
+            "refined_text": PROPERTIES["Name"],
+            "properties": PROPERTIES,
+            # analyze 経路（トップレベルにプロパティを返す形式）にも対応
+            "Name": PROPERTIES["Name"],
+            "Status": PROPERTIES["Status"],
+        }, ensure_ascii=False)
+
+    @staticmethod
+    def _count_prompt_tokens(messages) -> int:
+        # 概算: 4文字 ≒ 1トークン（ベンチマーク用途では十分）
+        chars = 0
+        for m in messages or []:
+            content = m.get("content", "")
+            chars += len(content) if isinstance(content, str) else len(json.dumps(content))
+        return max(1, chars // 4)
+
+    async def acompletion(self, *args, **kwargs) -> ModelResponse:
+        self.calls += 1
+        if self.error_rate and self.random.random() < self.error_rate:
+            self.errors += 1
+            raise FakeLLMError("injected provider error")
+
+        content = self._content(kwargs.get("messages"))
+        completion_tokens = max(1, len(content) // 4)
+        max_tokens = (kwargs.get("optional_params") or {}).get("max_tokens") or kwargs.get("max_tokens")
+        if max_tokens and completion_tokens > max_tokens:
+            completion_tokens = max_tokens
+            content = content[:max_tokens * 4]
+        await asyncio.sleep(self.ttft + completion_tokens / self.token_rate)
+
+        prompt_tokens = self._count_prompt_tokens(kwargs.get("messages"))
+        return ModelResponse(
+            model=kwargs.get("model", FAKE_MODEL),
+            choices=[{"index": 0, "finish_reason": "stop",
+                      "message": {"role": "assistant", "content": content}}],
+            usage={
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        )
+
+    def completion(self, *args, **kwargs) -> ModelResponse:
+        return asyncio.run(self.acompletion(*args, **kwargs))
+
+    def stats(self) -> Dict[str, Any]:
+        return {"calls": self.calls, "errors": self.errors}
+
+
+def install_fake_llm(**kwargs) -> FakeLLM:
+    """
+    フェイクプロバイダーを LiteLLM に登録し、モデルレジストリにも掲載します。
+
+    レジストリ上は "openai" プロバイダー扱いにするため、呼び出し側で
+    OPENAI_API_KEY（ダミー値で可）を設定しておく必要があります。
+    """
+    handler = FakeLLM(**kwargs)
+    litellm.custom_provider_map = [
+        entry for entry in (litellm.custom_provider_map or [])
+        if entry.get("provider") != FAKE_PROVIDER
+    ] + [{"provider": FAKE_PROVIDER, "custom_handler": handler}]
+    litellm.register_model({
+        FAKE_MODEL: {
+            "litellm_provider": "openai",
+            "mode": "chat",
+            "input_cost_per_token": 0.0000003,
+            "output_cost_per_token": 0.0000025,
+            "supports_vision": True,
+        }
+    })
+    return handler
@@ -0,0 +1,257 @@
+"""
+Mock Notion API Server
+ベンチマーク用のローカル Notion API スタンドインです。
+
+実際の Notion API と同じパス・レスポンス形式を返すため、`NOTION_API_BASE_URL` を
+このサーバーに向けるだけで `api/notion.py` のコードをそのまま計測できます。
+
+- latency:     各リクエストの応答前に待機する秒数
+- rate_limit:  HTTP 429 (Retry-After付き) を返す確率 (0.0〜1.0)
+- page_count:  データベースごとのページ数（クエリは page_size / start_cursor でページング）
+
+単体起動:
+    python -m benchmarks.mock_notion --port 8765 --latency 0.05 --rate-limit 0.02
+"""
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, List, Optional
+
+
+def make_schema() -> Dict[str, Any]:
+    """ベンチマーク用の典型的なタスクDBスキーマ"""
+    return {
+        "Name": {"id": "title", "type": "title", "title": {}},
+        "Status": {"id": "s1", "type": "select", "select": {"options": [
+            {"name": "未着手"}, {"name": "進行中"}, {"name": "完了"}]}},
+        "Tags": {"id": "t1", "type": "multi_select", "multi_select": {"options": [
+            {"name": "仕事"}, {"name": "買い物"}, {"name": "会議"}, {"name": "個人"}]}},
+        "Due": {"id": "d1", "type": "date", "date": {}},
+        "Done": {"id": "c1", "type": "checkbox", "checkbox": {}},
+        "Memo": {"id": "r1", "type": "rich_text", "rich_text": {}},
+    }
+
+
+def make_page(database_id: str, index: int) -> Dict[str, Any]:
+    """スキーマに沿ったダミーページ（Notionのページオブジェクト形式）"""
+    title = f"タスク {index}"
+    return {
+        "object": "page",
+        "id": str(uuid.UUID(int=index + 1)),
+        "created_time": "2026-01-01T00:00:00.000Z",
+        "last_edited_time": f"2026-01-{(index % 28) + 1:02d}T00:00:00.000Z",
+        "parent": {"type": "database_id", "database_id": database_id},
+        "url": f"https://www.notion.so/{index:032x}",
+        "properties": {
+            "Name": {"type": "title", "title": [{"plain_text": title, "text": {"content": title}}]},
+            "Status": {"type": "select", "select": {"name": ["未着手", "進行中", "完了"][index % 3]}},
+            "Tags": {"type": "multi_select", "multi_select": [{"name": "仕事"}]},
+            "Due": {"type": "date", "date": {"start": "2026-01-15"}},
+            "Done": {"type": "checkbox", "checkbox": index % 2 == 0},
+            "Memo": {"type": "rich_text", "rich_text": [{"plain_text": "メモ本文" * 5}]},
+        },
+    }
+
+
+class MockNotionState:
+    """サーバー全体で共有する設定とカウンター"""
+
+    def __init__(self, latency: float = 0.0, rate_limit: float = 0.0, page_count: int = 50,
+                 seed: Optional[int] = None):
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.page_count = page_count
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.rate_limited = 0
+        self.created_pages = 0
+
+    def should_rate_limit(self) -> bool:
+        with self.lock:
+            self.requests += 1
+            if self.rate_limit and self.random.random() < self.rate_limit:
+                self.rate_limited += 1
+                return True
+            return False
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "rate_limited": self.rate_limited,
+                "created_pages": self.created_pages,
+            }
+
+
+class MockNotionHandler(BaseHTTPRequestHandler):
+    """Notion API v1 の主要エンドポイントを模倣するハンドラ"""
+    server_version = "MockNotion/1.0"
+    protocol_version = "HTTP/1.1"  # keep-alive を有効にして実環境に近づける
+
+    @property
+    def state(self) -> MockNotionState:
+        return self.server.state
+
+    def log_message(self, format, *args):
+        # ベンチマーク中の標準出力を汚さない
+        pass
+
+    def _read_json(self) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return {}
+        try:
+            return json.loads(self.rfile.read(length))
+        except ValueError:
+            return {}
+
+    def _send(self, status: int, body: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> None:
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _dispatch(self, method: str) -> None:
+        body = self._read_json() if method in ("POST", "PATCH") else {}
+        if self.state.latency:
+            time.sleep(self.state.latency)
+        if self.state.should_rate_limit():
+            self._send(429, {"object": "error", "status": 429, "code": "rate_limited"},
+                       headers={"Retry-After": "0"})
+            return
+
+        path, _, query = self.path.partition("?")
+        parts = [p for p in path.split("/") if p][1:]  # 先頭の "v1" を除く
+        params = dict(p.split("=", 1) for p in query.split("&") if "=" in p)
+
+        if method == "GET" and len(parts) == 2 and parts[0] == "databases":
+            self._send(200, {"object": "database", "id": parts[1], "properties": make_schema()})
+        elif method == "POST" and len(parts) == 3 and parts[0] == "databases" and parts[2] == "query":
+            self._query(parts[1], body)
+        elif method == "POST" and parts == ["pages"]:
+            with self.state.lock:
+                self.state.created_pages += 1
+                index = self.state.page_count + self.state.created_pages
+            page = make_page(body.get("parent", {}).get("database_id", ""), index)
+            self._send(200, page)
+        elif method == "GET" and len(parts) == 2 and parts[0] == "pages":
+            page = make_page("", 0)
+            page["id"] = parts[1]
+            self._send(200, page)
+        elif len(parts) == 3 and parts[0] == "blocks" and parts[2] == "children":
+            if method == "PATCH":
+                self._send(200, {"object": "list", "results": body.get("children", [])})
+            else:
+                self._children(parts[1], params)
+        else:
+            self._send(404, {"object": "error", "status": 404, "code": "object_not_found"})
+
+    def _query(self, database_id: str, body: Dict[str, Any]) -> None:
+        page_size = min(int(body.get("page_size") or 100), 100)
+        start = int(body.get("start_cursor") or 0)
+        end = min(start + page_size, self.state.page_count)
+        results = [make_page(database_id, i) for i in range(start, end)]
+        has_more = end < self.state.page_count
+        self._send(200, {
+            "object": "list",
+            "results": results,
+            "has_more": has_more,
+            "next_cursor": str(end) if has_more else None,
+        })
+
+    def _children(self, block_id: str, params: Dict[str, str]) -> None:
+        page_size = min(int(params.get("page_size") or 100), 100)
+        start = int(params.get("start_cursor") or 0)
+        total = self.state.page_count
+        end = min(start + page_size, total)
+        results = [{
+            "object": "block",
+            "id": str(uuid.UUID(int=i + 1)),
+            "type": "paragraph",
+            "has_children": False,
+            "archived": False,
+            "paragraph": {"rich_text": [{"plain_text": f"段落 {i}"}]},
+        } for i in range(start, end)]
+        has_more = end < total
+        self._send(200, {
+            "object": "list",
+            "results": results,
+            "has_more": has_more,
+            "next_cursor": str(end) if has_more else None,
+        })
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_PATCH(self):
+        self._dispatch("PATCH")
+
+
+class MockNotionServer:
+    """
+    バックグラウンドスレッドで動作するモックサーバー
+
+    使用例:
+        with MockNotionServer(latency=0.05) as server:
+            os.environ["NOTION_API_BASE_URL"] = server.base_url
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, **state_kwargs):
+        self.state = MockNotionState(**state_kwargs)
+        self.httpd = ThreadingHTTPServer((host, port), MockNotionHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.state = self.state
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="mock-notion", daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "MockNotionServer":
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self) -> "MockNotionServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Mock Notion API server for benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="応答遅延（秒）")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="429を返す確率")
+    parser.add_argument("--pages", type=int, default=50, help="DBあたりのページ数")
+    args = parser.parse_args(argv)
+
+    server = MockNotionServer(args.host, args.port, latency=args.latency,
+                              rate_limit=args.rate_limit, page_count=args.pages)
+    print(f"Mock Notion API listening on {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""
+Offline Benchmark Runner
+ローカルのモック Notion サーバーとフェイク LLM プロバイダーを使って、
+実際の `safe_api_call` / `generate_json` / `analyze_text_with_ai` の経路を
+複数の同時実行数で計測し、結果を JSON で出力します。
+
+APIキーもネットワークも不要なため、性能改善の前後比較（回帰検知）に使えます。
+
+使用例:
+    python -m benchmarks.run --concurrency 1,16,64,256 --requests 256 --output bench.json
+    python -m benchmarks.run --scenarios notion --notion-latency 0.1 --rate-limit 0.05
+"""
+import os
+import sys
+import json
+import math
+import time
+import asyncio
+import argparse
+import platform
+import resource
+from typing import Dict, Any, List, Callable, Awaitable, Optional
+
+from benchmarks.mock_notion import MockNotionServer
+
+BENCH_DB_ID = "bench-db"
+SCENARIOS = ("notion", "llm", "analyze", "fastpath")
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """最近傍順位法によるパーセンタイル（sorted_values は昇順ソート済み）"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(q * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def peak_rss_mb() -> float:
+    """プロセスのピークRSS（MB）。Linuxは KB 単位、macOS は byte 単位で返るため換算します"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+
+async def run_level(
+    name: str,
+    op: Callable[[int], Awaitable[bool]],
+    concurrency: int,
+    total: int
+) -> Dict[str, Any]:
+    """
+    指定の同時実行数で op を total 回実行し、スループットとレイテンシ分布を返します。
+    op は成功時 True、失敗時 False を返すか例外を送出します。
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors = 0
+
+    async def one(i: int) -> None:
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                ok = await op(i)
+            except Exception:
+                ok = False
+            latencies.append(time.perf_counter() - start)
+            if not ok:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    duration = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "scenario": name,
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "duration_s": round(duration, 4),
+        "throughput_rps": round(total / duration, 2) if duration else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 0.50) * 1000, 2),
+            "p95": round(percentile(latencies, 0.95) * 1000, 2),
+            "p99": round(percentile(latencies, 0.99) * 1000, 2),
+            "mean": round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0.0,
+            "max": round(latencies[-1] * 1000, 2) if latencies else 0.0,
+        },
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def build_scenarios(model: str) -> Dict[str, Callable[[int], Awaitable[bool]]]:
+    """
+    計測対象の操作を構築します。
+    api.* のインポートは環境変数（NOTION_API_BASE_URL 等）を設定した後に行う必要があります。
+    """
+    from api.notion import safe_api_call, get_db_schema
+    from api.examples_index import get_examples
+    from api.llm_client import generate_json
+    from api.ai import analyze_text_with_ai
+
+    cache: Dict[str, Any] = {}
+
+    async def notion_op(i: int) -> bool:
+        result = await safe_api_call("POST", f"databases/{BENCH_DB_ID}/query", json={"page_size": 20})
+        return bool(result and result.get("results"))
+
+    async def llm_op(i: int) -> bool:
+        result = await generate_json(f"ベンチマーク入力 {i}: 明日10時に会議", model=model, retries=0)
+        return bool(result.get("content"))
+
+    async def analyze_op(i: int) -> bool:
+        if "schema" not in cache:
+            cache["schema"] = await get_db_schema(BENCH_DB_ID)
+        # 複数行のメモはルールによる抽出（api/fastpath.py）では確定せず、LLMを呼ぶ
+        text = f"明日10時に会議 #{i}\n議題: 来期の予算と採用計画"
+        # 索引は初回のみNotionから構築され、以降はローカルで類似検索する
+        examples = await get_examples(BENCH_DB_ID, text)
+        result = await analyze_text_with_ai(
+            text,
+            cache["schema"],
+            examples,
+            "タスク名に言い換えて。",
+            model=model
+        )
+        return "error" not in result
+
+    async def fastpath_op(i: int) -> bool:
+        if "schema" not in cache:
+            cache["schema"] = await get_db_schema(BENCH_DB_ID)
+        # 一行メモはルールで抽出され、LLMを呼ばない
+        result = await analyze_text_with_ai(f"明日10時に会議 #{i}", cache["schema"], [], "タスク名に言い換えて。", model=model)
+        return result["model"] == "fastpath"
+
+    return {"notion": notion_op, "llm": llm_op, "analyze": analyze_op, "fastpath": fastpath_op}
+
+
+async def run_benchmarks(args: argparse.Namespace, model: str) -> List[Dict[str, Any]]:
+    ops = build_scenarios(model)
+    results = []
+    for scenario in args.scenarios:
+        for level in args.concurrency:
+            total = max(args.requests, level)
+            result = await run_level(scenario, ops[scenario], level, total)
+            results.append(result)
+            print(
+                f"[bench] {scenario:<8} c={level:<4} {result['throughput_rps']:>9.2f} req/s  "
+                f"p50={result['latency_ms']['p50']:.1f}ms p99={result['latency_ms']['p99']:.1f}ms  "
+                f"errors={result['errors']}",
+                file=sys.stderr
+            )
+    return results
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Memo AI offline benchmark")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help=f"カンマ区切りのシナリオ ({', '.join(SCENARIOS)})")
+    parser.add_argument("--concurrency", default="1,4,16,64,256",
+                        help="カンマ区切りの同時実行数（1〜256）")
+    parser.add_argument("--requests", type=int, default=128, help="各レベルの総リクエスト数")
+    parser.add_argument("--notion-latency", type=float, default=0.02, help="モックNotionの応答遅延（秒）")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="モックNotionが429を返す確率")
+    parser.add_argument("--notion-rate", type=float, default=0.0,
+                        help="Notionへの送信レート（件/秒、NOTION_RATE_LIMIT）。0でクライアント側の制限なし")
+    parser.add_argument("--pages", type=int, default=50, help="モックDBのページ数（ページング確認用）")
+    parser.add_argument("--token-rate", type=float, default=400.0, help="フェイクLLMの出力トークン/秒")
+    parser.add_argument("--ttft", type=float, default=0.05, help="フェイクLLMの初回トークン遅延（秒）")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="フェイクLLMのエラー率")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--output", help="結果JSONの出力先（省略時は標準出力）")
+    args = parser.parse_args(argv)
+
+    args.scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    args.concurrency = [int(c) for c in args.concurrency.split(",") if c.strip()]
+    if any(c < 1 or c > 256 for c in args.concurrency):
+        parser.error("concurrency must be between 1 and 256")
+    return args
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv)
+
+    with MockNotionServer(latency=args.notion_latency, rate_limit=args.rate_limit,
+                          page_count=args.pages, seed=args.seed) as server:
+        # api.* のインポート前に接続先とダミー認証情報を設定する
+        os.environ["NOTION_API_BASE_URL"] = server.base_url
+        os.environ["NOTION_RATE_LIMIT"] = str(args.notion_rate)
+        os.environ.setdefault("NOTION_API_KEY", "bench-notion-key")
+        os.environ.setdefault("OPENAI_API_KEY", "bench-openai-key")
+
+        from benchmarks.fake_llm import install_fake_llm, FAKE_MODEL
+        fake = install_fake_llm(token_rate=args.token_rate, ttft=args.ttft,
+                                error_rate=args.llm_error_rate, seed=args.seed)
+
+        results = asyncio.run(run_benchmarks(args, FAKE_MODEL))
+        report = {
+            "meta": {
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+                "params": {
+                    "requests": args.requests,
+                    "notion_latency": args.notion_latency,
+                    "rate_limit": args.rate_limit,
+                    "pages": args.pages,
+                    "token_rate": args.token_rate,
+                    "ttft": args.ttft,
+                    "llm_error_rate": args.llm_error_rate,
+                    "seed": args.seed,
+                },
+            },
+            "results": results,
+            "mock_notion": server.state.stats(),
+            "fake_llm": fake.stats(),
+        }
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
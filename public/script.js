@@ -18,9 +18,12 @@ const SCHEMA_CACHE_PREFIX = 'memo_ai_schema_';
 const DRAFT_KEY = 'memo_ai_draft';               // 入力中の下書き保存用キー
 const LAST_TARGET_KEY = 'memo_ai_last_target';   // 最後に選択したターゲットID
 const CHAT_HISTORY_KEY = 'memo_ai_chat_history'; // チャット履歴
+const SESSION_ID_KEY = 'memo_ai_session_id';     // サーバー側で保持する会話履歴のID
 const LOCAL_PROMPT_PREFIX = 'memo_ai_prompt_';   // システムプロンプト（ターゲット毎）
 const SHOW_MODEL_INFO_KEY = 'memo_ai_show_model_info';
 const REFERENCE_PAGE_KEY = 'memo_ai_reference_page'; // 「ページを参照」チェックボックスの状態
+const AUTO_ROUTE_KEY = 'memo_ai_auto_route';         // 「保存先を自動で選ぶ」チェックボックスの状態
+const AUTO_ROUTE_DELAY_MS = 500;                     // 入力が止まってから保存先を推定するまでの待ち時間
 
 // デフォルトのシステムプロンプト
 // AIの基本的な役割定義。ターゲットごとに上書き可能です。
@@ -33,7 +36,7 @@ let DEFAULT_SYSTEM_PROMPT = `優秀な秘書として、ユーザーのタスク
 
 // --- グローバル状態管理 (Global State) ---
 let chatHistory = [];  // UI表示用の全チャット履歴: [{type, message, properties, timestamp}]
-let chatSession = [];  // AIに送信する短期会話コンテキスト: {role, content}
+let chatSessionId = null;  // AIに送る会話履歴はサーバー側で保持し、そのIDだけを送る (api/sessions.py)
 let currentTargetId = null;       // 現在選択中のNotionターゲットID
 let currentTargetName = '';       // 現在選択中のターゲット名
 let currentTargetType = 'database'; // 'database' または 'page'
@@ -185,6 +188,9 @@ document.addEventListener('DOMContentLoaded', () => {
         // 入力のたびに下書き保存
         localStorage.setItem(DRAFT_KEY, memoInput.value);
         updateSaveStatus("下書き保存中...");
+
+        // 保存先の自動選択（入力が止まったら推定する）
+        scheduleAutoRoute(memoInput.value);
     });
     
     // 3. IME対応
@@ -238,6 +244,17 @@ document.addEventListener('DOMContentLoaded', () => {
         
         referenceToggle.addEventListener('change', (e) => {
             localStorage.setItem(REFERENCE_PAGE_KEY, e.target.checked);
+            // 参照をオンにした時点で、参照コンテンツを先読みさせる
+            if (e.target.checked && currentTargetId) warmupTarget(currentTargetId);
+        });
+    }
+    
+    // Auto Route Toggle Logic
+    const autoRouteToggle = document.getElementById('autoRouteToggle');
+    if (autoRouteToggle) {
+        autoRouteToggle.checked = localStorage.getItem(AUTO_ROUTE_KEY) === 'true';
+        autoRouteToggle.addEventListener('change', (e) => {
+            localStorage.setItem(AUTO_ROUTE_KEY, e.target.checked);
         });
     }
     
@@ -478,18 +495,30 @@ function renderDebugInfo(data) {
     content.innerHTML = html;
 }
 
+/**
+ * /api/config を取得します（モデル一覧の読み込みとデバッグモードの初期化で共用し、1回だけ取得）
+ */
+let serverConfigPromise = null;
+function loadServerConfig() {
+    if (!serverConfigPromise) {
+        serverConfigPromise = fetch('/api/config')
+            .then(res => res.ok ? res.json() : null)
+            .catch(() => null);
+    }
+    return serverConfigPromise;
+}
+
 /**
  * DEBUG_MODE状態を取得してUI制御を初期化
  */
 async function initializeDebugMode() {
     try {
-        const res = await fetch('/api/config');
-        if (!res.ok) {
+        const data = await loadServerConfig();
+        if (!data) {
             console.warn('[DEBUG_MODE] Failed to fetch config, assuming debug_mode=false');
             return;
         }
         
-        const data = await res.json();
         serverDebugMode = data.debug_mode || false;
         
         // デフォルトシステムプロンプトを更新
@@ -890,34 +919,13 @@ function saveChatHistory() {
 }
 
 function loadChatHistory() {
+    // 会話の文脈はサーバー側のセッションに残っているため、IDだけを復元する
+    chatSessionId = localStorage.getItem(SESSION_ID_KEY);
     const saved = localStorage.getItem(CHAT_HISTORY_KEY);
     if (saved) {
         try {
             chatHistory = JSON.parse(saved);
             renderChatHistory();
-            
-            // Rebuild chatSession for API context
-            chatSession = chatHistory
-                .filter(entry => ['user', 'ai'].includes(entry.type))
-                .map(entry => {
-                    let content = entry.message;
-                    
-                    // 画像タグを削除して、テキストと[画像送信]のみを保持
-                    // 例: "テキスト<br>[画像送信]<img...>" -> "テキスト [画像送信]"
-                    content = content.replace(/\u003cimg[^>]*>/g, ''); // imgタグを削除
-                    content = content.replace(/\u003cbr\u003e/g, ' '); // <br>をスペースに置換
-                    content = content.trim(); // 余分な空白を削除
-                    
-                    return {
-                        role: entry.type === 'user' ? 'user' : 'assistant',
-                        content: content
-                    };
-                });
-            
-            // If the last message was from user and we are reloading, 
-            // we might want to ensure we don't double-send or anything, 
-            // but for now just restoring context is enough.
-            
         } catch(e) {
             console.error("History parse error", e);
         }
@@ -979,20 +987,9 @@ async function handleChatAI() {
     
     console.log('[handleChatAI] Image data copied:', imageToSend ? `${imageToSend.length} chars` : 'null');
     
-    // 2. 会話履歴の準備（現在のメッセージを追加する前に取得）
-    // AIに送信する履歴には、現在のメッセージを含めず、直近10件のみを送信します。
-    const historyToSend = chatSession.slice(-10);
-    console.log('[handleChatAI] Sending conversation history:', historyToSend.length, 'messages');
-    
-    // 3. AIへのコンテキスト用にメッセージを追加
-    // 画像がある場合は、テキストと[画像送信]の両方を含めて履歴に記録します。
-    let contextMessage = text || '';
-    if (imageToSend) {
-        contextMessage = contextMessage ? `${contextMessage} [画像送信]` : '[画像送信]';
-    }
-    if (contextMessage) {
-        chatSession.push({role: 'user', content: contextMessage});
-    }
+    // 2. 会話履歴はサーバー側で保持する
+    // 今回のメッセージとAIの応答はサーバーが履歴に追加するため、送るのはセッションIDだけです。
+    console.log('[handleChatAI] Session ID:', chatSessionId);
     
     // 入力欄とプレビューのクリア
     memoInput.value = '';
@@ -1025,19 +1022,17 @@ async function handleChatAI() {
         const systemPrompt = currentSystemPrompt || DEFAULT_SYSTEM_PROMPT;
         
         // 「ページを参照」機能: オプションでターゲットの内容をコンテキストに含める
+        // 内容の取得と切り詰めはサーバー側で行う（api/page_text.py）
         const referenceToggle = document.getElementById('referencePageToggle');
-        let referenceContext = '';
-        if (referenceToggle && referenceToggle.checked && currentTargetId) {
-            referenceContext = await fetchAndTruncatePageContent(currentTargetId, currentTargetType);
-        }
+        const referencePage = !!(referenceToggle && referenceToggle.checked && currentTargetId);
 
         // ペイロードの構築
         const payload = {
             text: text,
             target_id: currentTargetId,
             system_prompt: systemPrompt,
-            session_history: historyToSend, // 現在のメッセージを含まない、直近10件の履歴
-            reference_context: referenceContext,
+            session_id: chatSessionId, // 初回は null（サーバーが新しいセッションを作成する）
+            reference_page: referencePage,
             image_data: imageToSend,
             image_mime_type: mimeToSend,
             model: currentModel // 自動選択の場合はnullを送る
@@ -1070,6 +1065,12 @@ async function handleChatAI() {
         
         const data = await res.json();
         
+        // セッションが新しく作られた（または期限切れで作り直された）場合はIDを更新
+        if (data.session_id && data.session_id !== chatSessionId) {
+            chatSessionId = data.session_id;
+            localStorage.setItem(SESSION_ID_KEY, chatSessionId);
+        }
+        
         // AI応答受信後、インジケーターを非表示
         hideAITypingIndicator();
         
@@ -1097,7 +1098,6 @@ async function handleChatAI() {
                 cost: data.cost
             };
             addChatMessage('ai', data.message, null, modelInfo);
-            chatSession.push({role: 'assistant', content: data.message});
         }
         
         // 6. 抽出されたプロパティのフォーム反映
@@ -1118,7 +1118,12 @@ async function handleChatAI() {
 }
 
 function handleSessionClear() {
-    chatSession = [];
+    if (chatSessionId) {
+        // サーバー側の会話履歴も削除する（失敗しても期限切れで消えるため待たない）
+        fetch(`/api/sessions/${encodeURIComponent(chatSessionId)}`, { method: 'DELETE' }).catch(() => {});
+    }
+    chatSessionId = null;
+    localStorage.removeItem(SESSION_ID_KEY);
     chatHistory = [];
     renderChatHistory();
     localStorage.removeItem(CHAT_HISTORY_KEY);
@@ -1246,52 +1251,6 @@ async function saveToPage(content) {
     }
 }
 
-// --- ページ参照機能 ---
-
-async function fetchAndTruncatePageContent(targetId, targetType) {
-    try {
-        const endpoint = targetType === 'database' 
-            ? `/api/content/database/${targetId}`
-            : `/api/content/page/${targetId}`;
-        
-        const res = await fetch(endpoint);
-        if (!res.ok) throw new Error('コンテンツ取得失敗');
-        
-        const data = await res.json();
-        let content = '';
-        
-        if (data.type === 'database') {
-            // DBの場合: 最新10行まで、各カラムを100文字まで
-            const rows = data.rows.slice(0, 10);
-            rows.forEach((row, idx) => {
-                Object.entries(row).forEach(([key, value]) => {
-                    if (key !== 'id') {
-                        const truncated = String(value).substring(0, 100);
-                        if (truncated) content += `${key}: ${truncated}\n`;
-                    }
-                });
-                if (idx < rows.length - 1) content += '---\n';
-            });
-        } else {
-            // ページの場合: 各ブロックを500文字まで
-            data.blocks.forEach(block => {
-                const truncated = block.content.substring(0, 500);
-                if (truncated) content += truncated + '\n';
-            });
-        }
-        
-        // 全体を2000文字に制限
-        content = content.substring(0, 2000);
-        
-        if (!content.trim()) return '';
-        
-        return `<参考 既存の情報>\n${content}\n</参考 既存の情報>`;
-    } catch(e) {
-        console.error('Failed to fetch reference content:', e);
-        return '';
-    }
-}
-
 // --- プロパティUI (Dynamic Property Forms) ---
 
 function renderDynamicForm(container, schema) {
@@ -1598,6 +1557,54 @@ function renderTargetOptions(selector, targets) {
     if (selector.value && selector.value !== '__NEW_PAGE__') handleTargetChange(selector.value);
 }
 
+// サーバー側の先読み (Prefetch)
+// 失敗してもチャット時に通常どおり取得されるため、エラーは無視します。
+function warmupTarget(targetId) {
+    const referenceToggle = document.getElementById('referencePageToggle');
+    fetch(`/api/warmup/${targetId}`, {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify({
+            system_prompt: currentSystemPrompt || DEFAULT_SYSTEM_PROMPT,
+            reference: !!(referenceToggle && referenceToggle.checked)
+        })
+    }).catch(e => console.warn('[Warmup] Failed:', e));
+}
+
+// 保存先の自動選択 (Auto Route)
+// 入力中のメモから保存先をサーバーで推定し、確率が十分高ければ選択を切り替えます。
+// 推定された保存先はサーバー側で先読みが始まるため、送信時の待ち時間が短くなります。
+let autoRouteTimer = null;
+function scheduleAutoRoute(text) {
+    const toggle = document.getElementById('autoRouteToggle');
+    if (!toggle || !toggle.checked) return;
+    clearTimeout(autoRouteTimer);
+    if (text.trim().length < 2) return;
+    autoRouteTimer = setTimeout(() => routeMemo(text), AUTO_ROUTE_DELAY_MS);
+}
+
+async function routeMemo(text) {
+    try {
+        const res = await fetch('/api/route', {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify({ text })
+        });
+        if (!res.ok) return;
+        const data = await res.json();
+        if (!data.target_id || data.target_id === currentTargetId) return;
+
+        const selector = document.getElementById('appSelector');
+        const option = Array.from(selector.options).find(o => o.value === data.target_id);
+        if (!option) return;
+        selector.value = data.target_id;
+        await handleTargetChange(data.target_id);
+        showToast(`保存先: ${option.textContent}`);
+    } catch (e) {
+        console.warn('[AutoRoute] Failed:', e);
+    }
+}
+
 // ターゲット変更時のハンドラ
 // スキーマ情報の取得とUIの更新を行います。
 async function handleTargetChange(targetId) {
@@ -1651,6 +1658,9 @@ async function handleTargetChange(targetId) {
             currentSystemPrompt = null;
         }
 
+        // 最初のチャットに備えて、サーバー側でスキーマ・例・参照コンテンツを先読みさせる（完了は待たない）
+        warmupTarget(targetId);
+
     } catch(e) {
         console.error('[handleTargetChange Error]', e);
         formContainer.innerHTML = `<p class="error">スキーマ読み込み失敗: ${e.message}</p>`;
@@ -2088,17 +2098,25 @@ function toggleSettingsMenu() {
     menu.classList.toggle('hidden');
 }
 
+// モデル選択UIで使う項目だけを取得する（/api/models の fields）
+const MODEL_LIST_FIELDS = 'id,name,provider,supports_vision,cost_per_1k_tokens,rate_limit_note';
+
 async function loadAvailableModels() {
     try {
-        const res = await fetch('/api/models');
+        // models_version をURLに含めると、モデル構成が変わるまでブラウザのキャッシュから読み込まれる
+        const config = await loadServerConfig();
+        const params = new URLSearchParams({ fields: MODEL_LIST_FIELDS });
+        if (config && config.models_version) params.set('v', config.models_version);
+        
+        const res = await fetch(`/api/models?${params}`);
         if (!res.ok) throw new Error('Failed to load models');
         
         const data = await res.json();
         
         // モデルの分類とデフォルト設定
-        availableModels = data.all || [];
-        textOnlyModels = data.text_only || [];
-        visionModels = data.vision_capable || [];
+        availableModels = data.models || [];
+        textOnlyModels = availableModels.filter(m => !m.supports_vision);
+        visionModels = availableModels.filter(m => m.supports_vision);
         defaultTextModel = data.defaults?.text;
         defaultMultimodalModel = data.defaults?.multimodal;
         
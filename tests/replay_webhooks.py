@@ -0,0 +1,75 @@
+"""
+Notion Webhook Replayer
+記録したNotionのWebhookイベント（tests/webhook_events.json）に署名を付けて、
+ローカルのサーバーの /api/webhooks/notion に順に送ります。
+
+テスト（tests/test_webhooks.py）では FastAPI の TestClient を、単体起動では httpx を使います。
+
+使用例（サーバーと同じ NOTION_WEBHOOK_SECRET を指定）:
+    python tests/replay_webhooks.py --secret <token> --repeat 50
+"""
+import os
+import sys
+import hmac
+import json
+import time
+import hashlib
+import argparse
+from typing import Any, Dict, List, Optional
+
+EVENTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "webhook_events.json")
+ENDPOINT = "/api/webhooks/notion"
+
+
+def load_events(path: str = EVENTS_PATH) -> List[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def sign(body: bytes, secret: str) -> str:
+    """Notionと同じ形式の X-Notion-Signature"""
+    return "sha256=" + hmac.new(secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+
+
+def replay(client, events: List[Dict[str, Any]], secret: str, url: str = ENDPOINT,
+           repeat: int = 1, delay: float = 0.0) -> List[Any]:
+    """
+    イベントを repeat 回ずつ送り、レスポンスの一覧を返します。
+
+    Args:
+        client: post(url, content=..., headers=...) を持つクライアント（TestClient / httpx.Client）
+    """
+    responses = []
+    for event in events:
+        for _ in range(repeat):
+            body = json.dumps(event, ensure_ascii=False).encode("utf-8")
+            headers = {"Content-Type": "application/json", "X-Notion-Signature": sign(body, secret)}
+            responses.append(client.post(url, content=body, headers=headers))
+            if delay:
+                time.sleep(delay)
+    return responses
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    import httpx
+
+    parser = argparse.ArgumentParser(description="Replay recorded Notion webhook events")
+    parser.add_argument("--url", default=f"http://localhost:8000{ENDPOINT}")
+    parser.add_argument("--secret", default=os.getenv("NOTION_WEBHOOK_SECRET", ""))
+    parser.add_argument("--events", default=EVENTS_PATH, help="記録したイベントのJSONファイル")
+    parser.add_argument("--repeat", type=int, default=1, help="各イベントを送る回数（イベントの集中の再現）")
+    parser.add_argument("--delay", type=float, default=0.0, help="送信の間隔（秒）")
+    args = parser.parse_args(argv)
+
+    with httpx.Client(timeout=10.0) as client:
+        responses = replay(client, load_events(args.events), args.secret, url=args.url,
+                           repeat=args.repeat, delay=args.delay)
+    failed = [r for r in responses if r.status_code != 200]
+    print(f"Sent {len(responses)} events, {len(failed)} failed", file=sys.stderr)
+    for r in failed[:5]:
+        print(f"  {r.status_code} {r.text}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,155 @@
+"""
+api/app.py のテスト
+起動・終了に伴う readiness の変化、プレビュー用コンテンツの整形、重複保存の防止、
+サーバー側の会話履歴、モデル一覧の絞り込み、クライアントの識別と利用状況の公開範囲を検証します。
+"""
+from ipaddress import ip_network
+
+from fastapi import Request
+from fastapi.testclient import TestClient
+
+import api.app as app_module
+import api.prefetch as prefetch
+from api.app import app
+from api.idempotency import IdempotencyStore
+from api.sessions import SessionStore
+from api.http_cache import invalidate_responses
+from api.rate_limiter import SimpleRateLimiter
+
+
+def test_readiness_follows_lifespan_and_draining(monkeypatch):
+    monkeypatch.setattr(app_module, "NOTION_WARMUP_CONNECTIONS", 0)
+    monkeypatch.setattr(app_module, "SCHEDULER_ENABLED", False)
+    client = TestClient(app)
+    assert client.get("/api/ready").status_code == 503
+
+    with client:
+        assert client.get("/api/ready").json()["status"] == "ready"
+        app.state.draining = True
+        try:
+            assert client.get("/api/ready").json() == {"status": "draining"}
+        finally:
+            app.state.draining = False
+        assert client.get("/api/health").json() == {"status": "ok"}
+
+    assert client.get("/api/ready").status_code == 503
+
+
+def test_database_content_is_flattened_for_preview(monkeypatch):
+    async def fake_query(database_id, limit=20):
+        return [{
+            "id": "page-1",
+            "properties": {
+                "Name": {"type": "title", "title": [{"plain_text": "会議"}]},
+                "Tags": {"type": "multi_select", "multi_select": [{"name": "仕事"}, {"name": "重要"}]},
+                "Due": {"type": "date", "date": None},
+            },
+        }]
+
+    monkeypatch.setattr(prefetch, "query_database", fake_query)
+    prefetch.content_cache.invalidate()
+    data = TestClient(app).get("/api/content/database/db-1").json()
+    assert data == {
+        "type": "database",
+        "columns": ["Name", "Tags", "Due"],
+        "rows": [{"Name": "会議", "Tags": "仕事, 重要", "Due": "", "id": "page-1"}],
+    }
+
+
+def test_repeated_save_returns_original_page(monkeypatch):
+    calls = []
+
+    async def fake_create_page(target_db_id, properties):
+        calls.append(target_db_id)
+        return "https://www.notion.so/page-1"
+
+    monkeypatch.setattr(app_module, "create_page", fake_create_page)
+    monkeypatch.setattr(app_module, "idempotency_store", IdempotencyStore(path=None, window=60))
+    client = TestClient(app)
+    body = {"target_db_id": "db-1", "properties": {"Name": {"title": [{"text": {"content": "牛乳"}}]}}}
+
+    first = client.post("/api/save", json=body)
+    second = client.post("/api/save", json=body)
+    assert first.json() == second.json() == {"status": "success", "url": "https://www.notion.so/page-1"}
+    assert "Idempotent-Replayed" not in first.headers
+    assert second.headers["Idempotent-Replayed"] == "true"
+    assert calls == ["db-1"]
+
+
+def test_chat_keeps_history_on_the_server(monkeypatch):
+    seen = []
+
+    async def fake_schema(target_id):
+        return {"type": "page", "schema": {}}
+
+    async def fake_system_message(target_id, system_prompt):
+        return "system"
+
+    async def fake_chat(text, schema, system_prompt, session_history=None, history_tokens=None, **kwargs):
+        seen.append((list(session_history), history_tokens))
+        return {"message": f"reply to {text}"}
+
+    monkeypatch.setattr(app_module, "get_target_schema", fake_schema)
+    monkeypatch.setattr(app_module, "get_system_message", fake_system_message)
+    monkeypatch.setattr(app_module, "chat_analyze_text_with_ai", fake_chat)
+    monkeypatch.setattr(app_module, "session_store", SessionStore(path=None))
+    client = TestClient(app)
+
+    first = client.post("/api/chat", json={"text": "hello", "target_id": "page-1"}).json()
+    second = client.post("/api/chat", json={"text": "again", "target_id": "page-1", "session_id": first["session_id"]}).json()
+    assert second["session_id"] == first["session_id"]
+    assert seen[0] == ([], 0)
+    assert seen[1][0] == [{"role": "user", "content": "hello"}, {"role": "assistant", "content": "reply to hello"}]
+    assert seen[1][1] > 0
+
+    # 旧クライアントが送る履歴はそのまま使い、サーバー側には保存しない
+    legacy = client.post("/api/chat", json={"text": "x", "target_id": "page-1", "session_history": []}).json()
+    assert "session_id" not in legacy
+    assert client.delete(f"/api/sessions/{first['session_id']}").status_code == 204
+
+
+def test_models_are_filtered_projected_and_versioned(monkeypatch):
+    models = [
+        {"id": "gemini/a", "name": "a", "provider": "Gemini API", "litellm_provider": "gemini",
+         "supports_vision": True, "supports_json": True, "cost_per_1k_tokens": {"input": 0.0001, "output": 0.0004}},
+        {"id": "openai/b", "name": "b", "provider": "OpenAI", "litellm_provider": "openai",
+         "supports_vision": False, "supports_json": True, "cost_per_1k_tokens": {"input": 0.01, "output": 0.03}},
+    ]
+    monkeypatch.setattr(app_module, "get_available_models", lambda: models)
+    monkeypatch.setattr(app_module, "get_models_version", lambda: "v1")
+    invalidate_responses()
+    client = TestClient(app)
+
+    data = client.get("/api/models", params={"capability": "vision", "fields": "id,supports_vision"}).json()
+    assert data["version"] == "v1"
+    assert data["models"] == [{"id": "gemini/a", "supports_vision": True}]
+    assert [m["id"] for m in client.get("/api/models", params={"max_cost": 0.001}).json()["models"]] == ["gemini/a"]
+    assert [m["id"] for m in client.get("/api/models", params={"provider": "OpenAI"}).json()["models"]] == ["openai/b"]
+    assert client.get("/api/models", params={"fields": "id,secret"}).status_code == 422
+
+    assert "immutable" not in client.get("/api/models").headers["cache-control"]
+    assert "immutable" in client.get("/api/models", params={"v": "v1"}).headers["cache-control"]
+    invalidate_responses()
+
+
+def _request(peer, forwarded=None):
+    headers = [(b"x-forwarded-for", forwarded.encode())] if forwarded else []
+    return Request({"type": "http", "headers": headers, "client": (peer, 1234)})
+
+
+def test_client_ip_ignores_forwarded_for_from_untrusted_peers(monkeypatch):
+    limiter = SimpleRateLimiter()
+    monkeypatch.setattr(limiter, "trusted_proxies", [ip_network("10.0.0.0/8")])
+
+    # 信頼しない接続元が付けたヘッダーは無視する
+    assert limiter.get_client_ip(_request("203.0.113.5", "1.2.3.4")) == "203.0.113.5"
+    # 信頼するプロキシ経由なら、クライアントが書いた先頭ではなく、プロキシが付けた右端から遡る
+    assert limiter.get_client_ip(_request("10.0.0.2", "1.2.3.4, 198.51.100.7, 10.0.0.1")) == "198.51.100.7"
+
+    monkeypatch.setattr(limiter, "trust_all_proxies", True)
+    assert limiter.get_client_ip(_request("172.16.0.1", "1.2.3.4, 198.51.100.7")) == "198.51.100.7"
+
+
+def test_usage_does_not_expose_clients():
+    client = TestClient(app)
+    assert client.get("/api/usage", params={"group_by": "client"}).status_code == 422
@@ -0,0 +1,56 @@
+"""
+api/compact.py のユニットテスト
+短いキーの割り当てと復元、チャット応答の通常の形への復元、
+短い形式の呼び出しで max_tokens が指定されることを検証します。
+"""
+import asyncio
+
+import api.ai as ai
+from api.compact import compact_keys, compress_properties, expand_chat_response, expand_properties, max_tokens_for
+
+SCHEMA = {
+    "Name": {"type": "title", "title": {}},
+    "Owner": {"type": "people", "people": {}},
+    "Status": {"type": "select", "select": {"options": [{"name": "未着手"}, {"name": "完了"}]}},
+    "Due": {"type": "date", "date": {}},
+}
+
+
+def test_keys_follow_schema_order_and_round_trip():
+    assert compact_keys(SCHEMA) == {"Name": "a", "Status": "b", "Due": "c"}
+    values = {"Name": "会議の準備", "Status": "未着手", "Due": None}
+    assert compress_properties(values, SCHEMA) == {"a": "会議の準備", "b": "未着手"}
+    # 未知のキーは捨て、プロパティ名のまま返された値は受け付ける
+    assert expand_properties({"a": "会議の準備", "z": 1, "Due": "2026-01-16"}, SCHEMA) == {
+        "Name": "会議の準備", "Due": "2026-01-16"
+    }
+
+
+def test_chat_response_is_expanded_to_the_usual_shape():
+    assert expand_chat_response({"p": {"a": "牛乳"}}, SCHEMA) == {
+        "refined_text": None, "properties": {"Name": "牛乳"}
+    }
+    assert expand_chat_response({"m": "こんにちは"}, SCHEMA)["message"] == "こんにちは"
+    # 通常の形で返された場合はそのまま
+    assert expand_chat_response({"message": "hi"}, SCHEMA) == {"message": "hi"}
+
+
+def test_compact_chat_caps_output_and_restores_properties(monkeypatch):
+    calls = []
+
+    async def fake_generate_json(messages, model=None, **kwargs):
+        calls.append((messages, kwargs))
+        return {"content": '{"p":{"a":"牛乳を買う","b":"未着手"}}', "usage": {}, "cost": 0.0, "model": "m"}
+
+    monkeypatch.setattr(ai, "generate_json", fake_generate_json)
+    monkeypatch.setattr(ai, "select_model_for_input", lambda has_image=False, user_selection=None: "m")
+    result = asyncio.run(ai.chat_analyze_text_with_ai("牛乳", SCHEMA, "prompt", compact=True))
+
+    messages, kwargs = calls[0]
+    assert kwargs["max_tokens"] == max_tokens_for(SCHEMA, chat=True)
+    assert "a: Name (title)" in messages[0]["content"]
+    assert result["properties"] == {
+        "Name": {"title": [{"text": {"content": "牛乳を買う"}}]},
+        "Status": {"select": {"name": "未着手"}},
+    }
+    assert result["message"]
@@ -0,0 +1,68 @@
+"""
+api/examples_index.py のユニットテスト
+類似度によるFew-shot例の選択、トークン予算、差分更新を検証します。
+"""
+from api.examples_index import ExampleIndex, ExampleIndexRegistry, estimate_tokens
+from api.serializers import simplify_properties
+
+
+def _props(title, status="未着手", memo=""):
+    return {
+        "Name": {"type": "title", "title": [{"plain_text": title}]},
+        "Status": {"type": "select", "select": {"name": status}},
+        "Memo": {"type": "rich_text", "rich_text": [{"plain_text": memo}]},
+    }
+
+
+def _titles(examples):
+    return [simplify_properties(p)["Name"] for p in examples]
+
+
+def test_returns_most_similar_examples_first():
+    index = ExampleIndex(max_size=10)
+    for title in ["牛乳を買う", "企画会議の準備", "歯医者の予約", "定例会議の議事録"]:
+        index.add(_props(title))
+    assert set(_titles(index.search("明日の会議の資料", k=2))) == {"定例会議の議事録", "企画会議の準備"}
+
+
+def test_falls_back_to_newest_when_nothing_matches():
+    index = ExampleIndex(max_size=10)
+    for title in ["古いページ", "中間のページ", "新しいページ"]:
+        index.add(_props(title))
+    assert _titles(index.search("xyz", k=2)) == ["新しいページ", "中間のページ"]
+
+
+def test_respects_token_budget():
+    index = ExampleIndex(max_size=10)
+    index.add(_props("会議", memo="長いメモ" * 100))
+    index.add(_props("会議の予定"))
+    short_tokens = index.entries[1][1]
+    assert short_tokens < estimate_tokens("長いメモ" * 100)
+    assert _titles(index.search("会議", k=3, token_budget=short_tokens)) == ["会議の予定"]
+
+
+def test_evicts_oldest_and_skips_duplicate_page_ids():
+    index = ExampleIndex(max_size=2)
+    assert index.add(_props("A 会議"), page_id="p1")
+    assert not index.add(_props("A 会議"), page_id="p1")
+    index.add(_props("B 買い物"), page_id="p2")
+    index.add(_props("C 会議"), page_id="p3")
+    assert len(index) == 2
+    assert _titles(index.search("会議", k=5)) == ["C 会議", "B 買い物"]
+    # 追い出されたページは、もう一度追加できる
+    assert index.page_ids == {"p2", "p3"}
+    assert index.add(_props("A 会議"), page_id="p1")
+    assert _titles(index.search("xyz", k=5)) == ["A 会議", "C 会議"]
+
+
+def test_page_created_hook_updates_built_index_only():
+    registry = ExampleIndexRegistry(max_size=10)
+    registry.build("db", [_props("新しい"), _props("古い")])
+    # create_page に渡される書き込み形式のプロパティ
+    written = {"Name": {"title": [{"text": {"content": "請求書の送付"}}]}, "Status": {"select": {"name": "完了"}}}
+    registry.on_page_created("db", written, {"id": "page-1"})
+    registry.on_page_created("other-db", written, {"id": "page-2"})
+
+    assert registry.get("other-db") is None
+    top = registry.get("db").search("請求書", k=1)
+    assert simplify_properties(top[0]) == {"Name": "請求書の送付", "Status": "完了"}
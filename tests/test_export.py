@@ -0,0 +1,121 @@
+"""
+api/export.py のテスト
+プロパティが単純な値の行になること、行の _cursor から重複も欠落もなく再開できること、
+CLIの書き出しが中断後に再開でき、差分の書き出しが前回の最終更新日時以降だけを取得することを検証します。
+"""
+import csv
+import json
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+import api.export as export
+from api.app import app
+from api.export import DatabaseExport, export_to_file
+
+SCHEMA = {
+    "Name": {"type": "title", "title": {}},
+    "Tags": {"type": "multi_select", "multi_select": {"options": []}},
+    "Done": {"type": "checkbox", "checkbox": {}},
+}
+
+
+def _page(i: int) -> dict:
+    return {
+        "id": f"p{i}",
+        "last_edited_time": f"2026-01-{i + 1:02d}T00:00:00.000Z",
+        "properties": {
+            "Name": {"type": "title", "title": [{"plain_text": f"メモ {i}"}]},
+            "Tags": {"type": "multi_select", "multi_select": [{"name": "仕事"}, {"name": "会議"}]},
+            "Done": {"type": "checkbox", "checkbox": i % 2 == 0},
+        },
+    }
+
+
+class FakeNotion:
+    """3件ずつのバッチでページを返す iter_database_batches / get_db_schema の代わり"""
+
+    def __init__(self, pages, fail_after=None):
+        self.pages = pages
+        self.fail_after = fail_after
+        self.calls = []
+
+    async def schema(self, database_id):
+        return SCHEMA
+
+    async def batches(self, database_id, edited_since=None, page_size=100, start_cursor=None):
+        self.calls.append((edited_since, start_cursor))
+        pages = [p for p in self.pages if edited_since is None or p["last_edited_time"] >= edited_since]
+        start = int(start_cursor[1:]) if start_cursor else 0
+        for offset in range(start, len(pages), 3):
+            if self.fail_after is not None and offset >= self.fail_after:
+                raise ConnectionError("interrupted")
+            yield (f"c{offset}" if offset else None), pages[offset:offset + 3]
+
+
+@pytest.fixture
+def notion(monkeypatch):
+    fake = FakeNotion([_page(i) for i in range(8)])
+    monkeypatch.setattr(export, "get_db_schema", fake.schema)
+    monkeypatch.setattr(export, "iter_database_batches", fake.batches)
+    return fake
+
+
+def _rows(fmt="ndjson", **kwargs):
+    async def main():
+        return b"".join([chunk async for chunk in DatabaseExport("db", fmt, **kwargs).stream()])
+    data = asyncio.run(main()).decode("utf-8")
+    if fmt == "csv":
+        return list(csv.DictReader(data.splitlines()))
+    return [json.loads(line) for line in data.splitlines()]
+
+
+def test_rows_are_flattened_and_resumable_from_any_cursor(notion):
+    rows = _rows()
+    assert [r["_id"] for r in rows] == [f"p{i}" for i in range(8)]
+    assert rows[0]["Name"] == "メモ 0" and rows[0]["Tags"] == ["仕事", "会議"] and rows[0]["Done"] is True
+
+    for i, row in enumerate(rows):
+        resumed = _rows(cursor=row["_cursor"])
+        assert [r["_id"] for r in resumed] == [r["_id"] for r in rows[i + 1:]]
+
+
+def test_csv_has_schema_columns(notion):
+    rows = _rows("csv")
+    assert len(rows) == 8
+    assert list(rows[0]) == ["_id", "_last_edited_time", "_cursor", "Name", "Tags", "Done"]
+    assert rows[0]["Tags"] == "仕事, 会議" and rows[1]["Done"] == "False"
+
+
+def test_cli_export_resumes_and_runs_incrementally(notion, tmp_path):
+    output = str(tmp_path / "tasks.csv")
+    notion.fail_after = 6
+    with pytest.raises(ConnectionError):
+        asyncio.run(export_to_file("db", "csv", output))
+    # 最後のバッチの途中まで書かれた部分は、再開時に切り捨てられる
+    with open(output, "a", encoding="utf-8") as f:
+        f.write("p6,partial")
+
+    notion.fail_after = None
+    state = asyncio.run(export_to_file("db", "csv", output, resume=True))
+    with open(output, encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    assert [r["_id"] for r in rows] == [f"p{i}" for i in range(8)]
+    assert state["complete"] and state["watermark"] == "2026-01-08T00:00:00.000Z"
+
+    notion.pages.append(_page(8))
+    notion.calls.clear()
+    changes = str(tmp_path / "changes.ndjson")
+    asyncio.run(export_to_file("db", "ndjson", changes, state_path=f"{output}.state.json", incremental=True))
+    with open(changes, encoding="utf-8") as f:
+        assert [json.loads(line)["_id"] for line in f] == ["p7", "p8"]
+    assert notion.calls == [("2026-01-08T00:00:00.000Z", None)]
+
+
+def test_export_endpoint_streams_ndjson(notion):
+    response = TestClient(app).get("/api/export/db?format=ndjson")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    assert len(response.text.splitlines()) == 8
+    assert TestClient(app).get("/api/export/db?format=ndjson&cursor=bad").status_code == 400
@@ -0,0 +1,124 @@
+"""
+複数件の抽出と一括保存のユニットテスト
+1回のLLM応答から複数の項目を取り出す処理、Notionへの送信レートの制御、
+一括保存で失敗した行だけが再送信時に作成されることを検証します。
+"""
+import asyncio
+import time
+
+from fastapi.testclient import TestClient
+
+import api.ai as ai
+import api.app as app_module
+from api.app import app
+from api.idempotency import IdempotencyStore
+from api.notion import Throttle
+
+SCHEMA = {
+    "Name": {"type": "title", "title": {}},
+    "Done": {"type": "checkbox", "checkbox": {}},
+}
+
+
+def test_items_are_parsed_from_a_single_response():
+    content = '```json\n{"items": [{"Name": "牛乳を買う"}, {"Name": "報告書", "Done": "true"}, "x"]}\n```'
+    items = ai.validate_and_fix_items(content, SCHEMA)
+    assert [i["Name"]["title"][0]["text"]["content"] for i in items] == ["牛乳を買う", "報告書"]
+    assert items[1]["Done"] == {"checkbox": True}
+    assert len(ai.validate_and_fix_items('[{"Name": "a"}]', SCHEMA)) == 1
+    assert ai.validate_and_fix_items("not json", SCHEMA) == []
+
+
+def test_one_llm_call_for_many_items(monkeypatch):
+    calls = []
+
+    async def fake_generate_json(prompt, model=None, **kwargs):
+        calls.append(prompt)
+        return {"content": '{"items": [{"Name": "A"}, {"Name": "B"}, {"Name": "C"}]}',
+                "usage": {"prompt_tokens": 10}, "cost": 0.001, "model": "m"}
+
+    monkeypatch.setattr(ai, "generate_json", fake_generate_json)
+    monkeypatch.setattr(ai, "select_model_for_input", lambda has_image=False, user_selection=None: "m")
+    text = "- Aさんに連絡する件について確認\n- Bの資料を来月までに整理\n- Cの見積もりを依頼"
+    result = asyncio.run(ai.analyze_items_with_ai(text, SCHEMA, [], "prompt", max_items=2))
+    assert len(calls) == 1
+    assert '"items"' in calls[0]
+    assert [i["Name"]["title"][0]["text"]["content"] for i in result["items"]] == ["A", "B"]
+
+
+def test_meeting_notes_are_not_split_by_the_fast_path(monkeypatch):
+    calls = []
+
+    async def fake_generate_json(prompt, model=None, **kwargs):
+        calls.append(prompt)
+        return {"content": '{"items": [{"Name": "資料を送る"}, {"Name": "見積もりを確認"}]}',
+                "usage": {}, "cost": 0.001, "model": "m"}
+
+    monkeypatch.setattr(ai, "generate_json", fake_generate_json)
+    monkeypatch.setattr(ai, "select_model_for_input", lambda has_image=False, user_selection=None: "m")
+    # 見出しや参加者の行は項目ではないため、どの行が項目かはLLMが判断する
+    text = "議事録\n参加者: 田中 佐藤\n- 資料を送る\n- 見積もりを確認"
+    result = asyncio.run(ai.analyze_items_with_ai(text, SCHEMA, [], "prompt"))
+    assert len(calls) == 1 and len(result["items"]) == 2
+
+    # 箇条書きだけで、すべての項目がルールで解釈できる場合はLLMを呼ばない
+    result = asyncio.run(ai.analyze_items_with_ai("- [x] 資料を送る\n- [ ] 見積もりを確認", SCHEMA, [], "prompt"))
+    assert len(calls) == 1 and result["model"] == "fastpath"
+    assert [i["Done"] for i in result["items"]] == [{"checkbox": True}, {"checkbox": False}]
+
+
+def test_throttle_allows_burst_then_spaces_requests():
+    async def main():
+        throttle = Throttle(rate=50, burst=2)
+        start = time.monotonic()
+        for _ in range(4):
+            await throttle.acquire()
+        return time.monotonic() - start
+
+    # 2件はすぐに送信でき、残り2件は 1/50 秒ずつ待つ
+    elapsed = asyncio.run(main())
+    assert 0.03 <= elapsed < 0.5
+    assert asyncio.run(Throttle(rate=0, burst=1).acquire()) is None
+
+
+def test_batch_save_retries_only_failed_items(monkeypatch):
+    created, fail = [], {"B"}
+
+    async def fake_create_page(target_db_id, properties):
+        name = properties["Name"]["title"][0]["text"]["content"]
+        if name in fail:
+            raise RuntimeError("boom")
+        created.append(name)
+        return f"https://www.notion.so/{name}"
+
+    monkeypatch.setattr(app_module, "create_page", fake_create_page)
+    monkeypatch.setattr(app_module, "idempotency_store", IdempotencyStore(path=None, window=60))
+    client = TestClient(app)
+    items = [{"Name": {"title": [{"text": {"content": n}}]}} for n in ("A", "B", "C")]
+    body = {"target_db_id": "db-1", "items": items}
+
+    first = client.post("/api/save/batch", json=body).json()
+    assert first["status"] == "partial" and first["failed"] == 1
+    assert [r["status"] for r in first["results"]] == ["success", "error", "success"]
+
+    fail.clear()
+    second = client.post("/api/save/batch", json=body).json()
+    assert second["status"] == "success"
+    assert [r["replayed"] for r in second["results"]] == [True, False, True]
+    assert sorted(created) == ["A", "B", "C"]
+
+
+def test_identical_rows_in_one_batch_are_each_created(monkeypatch):
+    created = []
+
+    async def fake_create_page(target_db_id, properties):
+        created.append(properties["Name"]["title"][0]["text"]["content"])
+        return f"https://www.notion.so/{len(created)}"
+
+    monkeypatch.setattr(app_module, "create_page", fake_create_page)
+    monkeypatch.setattr(app_module, "idempotency_store", IdempotencyStore(path=None, window=60))
+    item = {"Name": {"title": [{"text": {"content": "牛乳"}}]}}
+    result = TestClient(app).post("/api/save/batch", json={"target_db_id": "db-1", "items": [item, item]}).json()
+    assert result["status"] == "success"
+    assert [r["replayed"] for r in result["results"]] == [False, False]
+    assert created == ["牛乳", "牛乳"]
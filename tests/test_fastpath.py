@@ -0,0 +1,112 @@
+"""
+api/fastpath.py のユニットテスト
+日付・時刻・チェックボックス・選択肢のルール抽出と確信度の判定、
+確信度が高い場合に analyze_text_with_ai がLLMを呼ばないことを検証します。
+"""
+import asyncio
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+import pytest
+
+import api.ai as ai
+from api.fastpath import extract
+
+SCHEMA = {
+    "Name": {"type": "title", "title": {}},
+    "Due": {"type": "date", "date": {}},
+    "Done": {"type": "checkbox", "checkbox": {}},
+    "Tags": {"type": "multi_select", "multi_select": {"options": [{"name": "仕事"}, {"name": "買い物"}]}},
+    "Priority": {"type": "select", "select": {"options": [{"name": "高"}, {"name": "低"}]}},
+}
+# 2026-10-19 (月) 09:00 JST
+NOW = datetime(2026, 10, 19, 9, 0, tzinfo=ZoneInfo("Asia/Tokyo"))
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("明日10時 会議", {"Name": "会議", "Due": "2026-10-20T10:00:00+09:00"}),
+    ("明日10時に会議 #仕事 高", {"Name": "会議", "Due": "2026-10-20T10:00:00+09:00", "Tags": ["仕事"], "Priority": "高"}),
+    ("来週金曜 レポート提出 完了", {"Name": "レポート提出", "Due": "2026-10-30", "Done": True}),
+    ("午後3時半から打ち合わせ", {"Name": "打ち合わせ", "Due": "2026-10-19T15:30:00+09:00"}),
+    ("12月4日(金) 忘年会", {"Name": "忘年会", "Due": "2026-12-04"}),
+    ("tomorrow 3pm call Bob", {"Name": "call Bob", "Due": "2026-10-20T15:00:00+09:00"}),
+    ("3/1 確定申告", {"Name": "確定申告", "Due": "2027-03-01"}),
+    # 語の一部は選択肢とみなさない
+    ("買い物リストを作る", {"Name": "買い物リストを作る"}),
+    ("lunch with Bob on sat", {"Name": "lunch with Bob", "Due": "2026-10-24"}),
+    # 語の一部の how / what は質問とみなさない
+    ("明日 show slides", {"Name": "show slides", "Due": "2026-10-20"}),
+])
+def test_simple_memos_are_extracted_with_confidence(text, expected):
+    result = extract(text, SCHEMA, now=NOW)
+    assert result.confident, result.reasons
+    assert result.values == expected
+
+
+@pytest.mark.parametrize("text", [
+    "今日と明日 掃除",         # 日付が2つ
+    "12月5日(金) 忘年会",      # 曜日が日付と合わない
+    "会議って何時？",           # 質問
+    "明日10時 会議\n議題: 予算",  # 複数行
+])
+def test_ambiguous_memos_fall_back_with_a_hint(text):
+    result = extract(text, SCHEMA, now=NOW)
+    assert not result.confident
+    if "\n" in text:
+        assert "Due: 2026-10-20T10:00:00+09:00" in result.hint()
+
+
+def test_analyze_skips_the_llm_on_a_fast_path_hit(monkeypatch):
+    async def no_llm(*args, **kwargs):
+        raise AssertionError("LLM should not be called")
+
+    monkeypatch.setattr(ai, "generate_json", no_llm)
+    result = asyncio.run(ai.analyze_text_with_ai("牛乳 買い物", SCHEMA, [], "prompt"))
+    assert result["model"] == "fastpath"
+    assert result["cost"] == 0.0
+    assert result["properties"] == {
+        "Name": {"title": [{"text": {"content": "牛乳"}}]},
+        "Tags": {"multi_select": [{"name": "買い物"}]},
+    }
+
+
+def test_options_are_stored_with_the_schema_name():
+    schema = {
+        "Name": {"type": "title", "title": {}},
+        "Priority": {"type": "select", "select": {"options": [{"name": "High"}, {"name": "Low"}]}},
+        "Tags": {"type": "multi_select", "multi_select": {"options": [{"name": "Work"}]}},
+    }
+    result = extract("report high work", schema, now=NOW)
+    assert result.confident, result.reasons
+    assert result.values == {"Name": "report", "Priority": "High", "Tags": ["Work"]}
+
+
+def test_title_only_memos_still_go_to_the_llm(monkeypatch):
+    calls = []
+
+    async def fake_generate_json(prompt, model=None, **kwargs):
+        calls.append(prompt)
+        return {"content": '{"Name": "牛乳", "Priority": "高"}', "usage": {}, "cost": 0.001, "model": "m"}
+
+    monkeypatch.setattr(ai, "generate_json", fake_generate_json)
+    monkeypatch.setattr(ai, "select_model_for_input", lambda has_image=False, user_selection=None: "m")
+    result = asyncio.run(ai.analyze_text_with_ai("牛乳", SCHEMA, [], "prompt", compact=False))
+    assert len(calls) == 1 and result["model"] == "m"
+
+    # スキーマがタイトルだけなら、LLMは呼ばない
+    result = asyncio.run(ai.analyze_text_with_ai("牛乳", {"Name": SCHEMA["Name"]}, [], "prompt"))
+    assert len(calls) == 1 and result["model"] == "fastpath"
+
+
+
+@pytest.mark.parametrize("text", [
+    "dry clothes in the sun",   # 曜日の略記と同じ普通の単語
+    "Sat down with Bob",
+    "砂糖 1/2 カップ買う",        # 分量
+    "add 3/4 cup flour",
+    "score 13/20",              # 月が 1〜12 ではない
+])
+def test_words_and_quantities_are_not_dates(text):
+    result = extract(text, SCHEMA, now=NOW)
+    assert "Due" not in result.values
+    assert not result.can_skip_llm(SCHEMA)
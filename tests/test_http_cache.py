@@ -0,0 +1,68 @@
+"""
+api/http_cache.py のユニットテスト
+ETag / 304、事前圧縮した本文の再利用、キャッシュ対象外の応答を検証します。
+"""
+import gzip
+
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+
+from api.http_cache import CachePolicy, ResponseCacheMiddleware
+
+
+def _make_client():
+    calls = []
+    app = FastAPI()
+    policies = [
+        CachePolicy("items", r"^/items/[^/]+$", max_age=60, stale_while_revalidate=600),
+    ]
+    app.add_middleware(ResponseCacheMiddleware, policies=policies)
+
+    @app.get("/items/{item_id}")
+    async def get_item(item_id: str):
+        calls.append(item_id)
+        if item_id == "missing":
+            raise HTTPException(status_code=404, detail="not found")
+        return {"id": item_id, "text": "メモ" * 200}
+
+    @app.get("/other")
+    async def other():
+        calls.append("other")
+        return {"ok": True}
+
+    return TestClient(app), calls, policies
+
+
+def test_etag_and_not_modified():
+    client, calls, _ = _make_client()
+    first = client.get("/items/a", headers={"Accept-Encoding": "identity"})
+    assert first.status_code == 200
+    assert first.headers["cache-control"] == "private, max-age=60, stale-while-revalidate=600"
+    etag = first.headers["etag"]
+
+    second = client.get("/items/a", headers={"Accept-Encoding": "identity", "If-None-Match": etag})
+    assert second.status_code == 304 and second.content == b""
+    assert second.headers["etag"] == etag
+    assert calls == ["a"]
+
+
+def test_compressed_body_is_reused():
+    client, calls, policies = _make_client()
+    res = client.get("/items/a", headers={"Accept-Encoding": "gzip"}).json()
+    cached = policies[0].responses.get("/items/a")
+    assert gzip.decompress(cached.bodies["gzip"]) == cached.bodies["identity"]
+
+    again = client.get("/items/a", headers={"Accept-Encoding": "gzip"})
+    assert again.headers["content-encoding"] == "gzip"
+    assert again.headers["etag"].endswith('-gzip"')
+    assert again.json() == res
+    assert calls == ["a"]
+
+
+def test_errors_and_unmatched_paths_are_not_cached():
+    client, calls, _ = _make_client()
+    assert client.get("/items/missing").status_code == 404
+    assert client.get("/items/missing").status_code == 404
+    client.get("/other")
+    client.get("/other")
+    assert calls == ["missing", "missing", "other", "other"]
@@ -0,0 +1,170 @@
+"""
+api/idempotency.py のユニットテスト
+保存結果の再利用、実行中の処理の合流、失敗時や結果の保存に失敗した場合の扱い、ワーカー間の共有と、
+ページ作成がタイムアウトした場合に作成済みのページを正しく見分けることを検証します。
+"""
+import asyncio
+import sqlite3
+import threading
+
+import httpx
+import pytest
+
+import api.notion as notion
+from api.idempotency import IdempotencyStore, derive_key
+
+
+def test_derive_key_ignores_key_order_and_prefers_client_key():
+    a = derive_key("save", {"target_db_id": "db", "properties": {"A": 1, "B": 2}})
+    b = derive_key("save", {"properties": {"B": 2, "A": 1}, "target_db_id": "db"})
+    assert a == b
+    assert a != derive_key("pages.create", {"target_db_id": "db", "properties": {"A": 1, "B": 2}})
+    assert derive_key("save", {"x": 1}, "abc") == "save:client:abc"
+
+
+def test_repeated_and_concurrent_calls_execute_once():
+    store = IdempotencyStore(path=None, window=60)
+    calls = []
+
+    async def create():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"url": "https://www.notion.so/p1"}
+
+    async def main():
+        first = await asyncio.gather(*[store.run("k", create) for _ in range(5)])
+        again = await store.run("k", create)
+        return first, again
+
+    first, again = asyncio.run(main())
+    assert len(calls) == 1
+    assert [replayed for _, replayed in first].count(False) == 1
+    assert all(result == {"url": "https://www.notion.so/p1"} for result, _ in first)
+    assert again == ({"url": "https://www.notion.so/p1"}, True)
+
+
+def test_failures_are_not_stored():
+    store = IdempotencyStore(path=None, window=60)
+    attempts = []
+
+    async def flaky():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError("Notion unavailable")
+        return {"url": "ok"}
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(store.run("k", flaky))
+    assert asyncio.run(store.run("k", flaky)) == ({"url": "ok"}, False)
+
+
+def test_created_result_is_returned_when_storing_it_fails(tmp_path):
+    store = IdempotencyStore(path=str(tmp_path / "idempotency.sqlite3"), window=60)
+    calls = []
+
+    def locked(key, result):
+        raise sqlite3.OperationalError("database is locked")
+
+    store.complete = locked
+
+    async def create():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"url": "https://www.notion.so/p1"}
+
+    async def main():
+        return await asyncio.gather(store.run("k", create), store.run("k", create))
+
+    # ページは作成済みなので 500 にせず、合流した呼び出しにも同じ結果を返す
+    first, second = asyncio.run(main())
+    assert first == ({"url": "https://www.notion.so/p1"}, False)
+    assert second == ({"url": "https://www.notion.so/p1"}, True)
+    assert len(calls) == 1
+
+
+def test_workers_share_results_through_disk(tmp_path):
+    path = str(tmp_path / "idempotency.sqlite3")
+    worker_a = IdempotencyStore(path=path, window=60)
+    worker_b = IdempotencyStore(path=path, window=60)
+
+    async def main():
+        started = asyncio.Event()
+
+        async def slow_create():
+            started.set()
+            await asyncio.sleep(0.3)
+            return {"url": "https://www.notion.so/p1"}
+
+        async def must_not_run():
+            raise AssertionError("executed twice")
+
+        task = asyncio.create_task(worker_a.run("k", slow_create))
+        await started.wait()
+        # worker_a の実行中は pending として見え、完了後はその結果を受け取る
+        assert worker_b.get("k") == ("pending", None)
+        waited = await worker_b.run("k", must_not_run)
+        return await task, waited
+
+    executed, waited = asyncio.run(main())
+    assert executed == ({"url": "https://www.notion.so/p1"}, False)
+    assert waited == ({"url": "https://www.notion.so/p1"}, True)
+
+
+def test_disk_store_is_used_outside_the_event_loop(tmp_path):
+    store = IdempotencyStore(path=str(tmp_path / "idempotency.sqlite3"), window=60)
+    threads = []
+    for name in ("get", "claim", "complete"):
+        original = getattr(store, name)
+
+        def traced(*args, _original=original):
+            threads.append(threading.current_thread())
+            return _original(*args)
+
+        setattr(store, name, traced)
+
+    async def create():
+        return {"url": "ok"}
+
+    assert asyncio.run(store.run("k", create)) == ({"url": "ok"}, False)
+    assert len(threads) == 3 and threading.main_thread() not in threads
+
+
+def test_timed_out_create_matches_only_a_page_with_all_written_values(monkeypatch):
+    earlier = {"url": "https://www.notion.so/earlier", "properties": {
+        "Name": {"type": "title", "title": [{"plain_text": "会議"}]},
+        "Due": {"type": "date", "date": {"start": "2026-10-19T10:00:00.000+09:00"}},
+    }}
+    ours = {"url": "https://www.notion.so/ours", "properties": {
+        "Name": {"type": "title", "title": [{"plain_text": "会議"}]},
+        "Due": {"type": "date", "date": {"start": "2026-10-20T10:00:00.000+09:00"}},
+    }}
+    pages, posts = [earlier], []
+    created = {"on_timeout": True}
+
+    async def fake_api_call(method, endpoint, **kwargs):
+        if method == "POST" and endpoint == "pages":
+            posts.append(1)
+            if len(posts) == 1:
+                # 1回目はタイムアウト（on_timeout なら、Notionには作成されている）
+                if created["on_timeout"]:
+                    pages.insert(0, ours)
+                raise httpx.ReadTimeout("timed out")
+            return {"url": "https://www.notion.so/resent"}
+        return {"results": list(pages)}
+
+    monkeypatch.setattr(notion, "safe_api_call", fake_api_call)
+    monkeypatch.setattr(notion, "_notify_page_created", lambda *args: None)
+    properties = {
+        "Name": {"title": [{"text": {"content": "会議"}}]},
+        "Due": {"date": {"start": "2026-10-20T10:00:00+09:00"}},
+    }
+    # 応答は遅れたが作成済みのページは再送信しない
+    assert asyncio.run(notion.create_page("db", properties)) == "https://www.notion.so/ours"
+    assert len(posts) == 1
+
+    # 同じタイトルで値の異なる、直前に作成された別のページは作成済みとみなさない
+    pages.remove(ours)
+    posts.clear()
+    created["on_timeout"] = False
+    assert asyncio.run(notion.create_page("db", properties)) == "https://www.notion.so/resent"
+    assert len(posts) == 2
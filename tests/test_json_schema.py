@@ -0,0 +1,72 @@
+"""
+api/json_schema.py のユニットテスト
+NotionのスキーマからのJSON Schemaの生成（選択肢の enum・日付の形式・null の許可）とキャッシュ、
+対応モデルにだけ json_schema の response_format を渡すことを検証します。
+"""
+import asyncio
+from types import SimpleNamespace
+
+import api.llm_client as llm_client
+from api.json_schema import build_json_schema, response_format
+from api.serializers import serialize_properties
+
+SCHEMA = {
+    "Name": {"type": "title", "title": {}},
+    "Due": {"type": "date", "date": {}},
+    "Status": {"type": "status", "status": {"options": [{"name": "未着手"}, {"name": "完了"}]}},
+    "Tags": {"type": "multi_select", "multi_select": {"options": [{"name": "仕事"}, {"name": "買い物"}]}},
+    "Owner": {"type": "people", "people": {}},
+    "Memo": {"type": "rich_text", "rich_text": {}},
+}
+
+
+def test_schema_has_enums_formats_and_required_keys():
+    js = build_json_schema(SCHEMA)
+    assert js["required"] == ["Name", "Due", "Status", "Tags", "Memo"]
+    assert js["additionalProperties"] is False
+    assert js["properties"]["Status"]["enum"] == ["未着手", "完了", None]
+    assert js["properties"]["Tags"]["items"]["enum"] == ["仕事", "買い物"]
+    assert {"type": "string", "format": "date"} in js["properties"]["Due"]["anyOf"]
+    # 値が無い状態を null で表すのは title・checkbox・multi_select 以外
+    assert js["properties"]["Name"] == {"type": "string"}
+    assert js["properties"]["Tags"]["type"] == "array"
+    assert {"type": "null"} in js["properties"]["Due"]["anyOf"]
+    assert "null" in js["properties"]["Memo"]["type"]
+
+    items = build_json_schema(SCHEMA, "items")
+    assert items["properties"]["items"]["items"] is js
+
+
+def test_schema_is_cached_per_version():
+    first = build_json_schema(SCHEMA)
+    # プロパティの設定（選択肢以外）が変わっただけなら同じスキーマ
+    same = dict(SCHEMA, Name={"type": "title", "title": {}, "id": "title"})
+    assert build_json_schema(same) is first
+    changed = dict(SCHEMA, Tags={"type": "multi_select", "multi_select": {"options": [{"name": "新規"}]}})
+    assert build_json_schema(changed)["properties"]["Tags"]["items"]["enum"] == ["新規"]
+    assert response_format({}) is None
+
+
+def test_null_values_are_not_saved():
+    assert serialize_properties({"Name": "牛乳", "Memo": None, "Status": None}, SCHEMA) == {
+        "Name": {"title": [{"text": {"content": "牛乳"}}]}
+    }
+
+
+def test_json_schema_is_sent_only_to_supporting_models(monkeypatch):
+    sent = []
+
+    async def fake_acompletion(model, messages, response_format, timeout):
+        sent.append(response_format["type"])
+        message = SimpleNamespace(content='{"Name": "牛乳"}')
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)],
+                               usage=SimpleNamespace(dict=lambda: {}))
+
+    monkeypatch.setattr(llm_client, "acompletion", fake_acompletion)
+    monkeypatch.setattr(llm_client, "completion_cost", lambda completion_response: 0.0)
+    monkeypatch.setattr(llm_client, "supports_response_schema", lambda model: model == "structured")
+    schema = response_format(SCHEMA)
+
+    asyncio.run(llm_client.generate_json("memo", model="structured", response_schema=schema))
+    asyncio.run(llm_client.generate_json("memo", model="plain", response_schema=schema))
+    assert sent == ["json_schema", "json_object"]
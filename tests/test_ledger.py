@@ -0,0 +1,102 @@
+"""
+api/ledger.py のユニットテスト
+使用量の記録と集計、ワーカー間での共有、予算に応じたモデルの切り替えと拒否、同時の呼び出しの予約、
+書き込みがイベントループの外で行われることを検証します。
+"""
+import asyncio
+import threading
+
+import pytest
+
+import api.ledger as ledger_module
+from api.ledger import Budget, BudgetExceededError, UsageLedger, usage_scope
+
+
+def _usage(prompt, completion):
+    return {"prompt_tokens": prompt, "completion_tokens": completion}
+
+
+def test_usage_is_grouped_by_model_target_and_client(tmp_path):
+    ledger = UsageLedger(path=str(tmp_path / "ledger.sqlite3"), budgets=[])
+    with usage_scope(target="db-1", client="1.1.1.1"):
+        ledger.record("gemini/a", _usage(100, 20), 0.01)
+        ledger.record("openai/b", _usage(50, 10), 0.03)
+    with usage_scope(target="db-2", client="1.1.1.1"):
+        ledger.record("gemini/a", _usage(10, 5), 0.001)
+
+    by_model = ledger.summary("day", "model")
+    assert [g["key"] for g in by_model["groups"]] == ["openai/b", "gemini/a"]
+    assert by_model["totals"]["requests"] == 3
+    assert by_model["totals"]["prompt_tokens"] == 160
+    assert ledger.summary("month", "target")["groups"][0] == {
+        "key": "db-1", "requests": 2, "prompt_tokens": 150, "completion_tokens": 30, "cost": pytest.approx(0.04)
+    }
+
+    # 別ワーカー（別インスタンス）からも同じ使用額が見える
+    other = UsageLedger(path=str(tmp_path / "ledger.sqlite3"), budgets=[])
+    assert other.spent("day") == pytest.approx(0.041)
+    assert other.spent("day", "target", "db-2") == pytest.approx(0.001)
+
+
+def test_budget_downgrades_then_rejects(monkeypatch):
+    costs = {"expensive": 0.05, "cheap": 0.005}
+    monkeypatch.setattr(ledger_module, "estimate_cost", lambda model, messages, **kwargs: costs[model])
+    monkeypatch.setattr(ledger_module, "get_routing_candidates", lambda has_image=False: ["expensive", "cheap"])
+    ledger = UsageLedger(path=None, budgets=[Budget("client_daily", "day", 0.1, dimension="client")],
+                         downgrade_ratio=0.5)
+    messages = [{"role": "user", "content": "hi"}]
+
+    with usage_scope(client="a"):
+        assert ledger.authorize("expensive", messages) == "expensive"
+        ledger.record("expensive", _usage(1, 1), 0.06)
+        # 上限の50%を超えたので安いモデルに切り替える
+        assert ledger.authorize("expensive", messages) == "cheap"
+        ledger.record("cheap", _usage(1, 1), 0.038)
+        with pytest.raises(BudgetExceededError):
+            ledger.authorize("expensive", messages)
+
+    # 予算はクライアントごと
+    with usage_scope(client="b"):
+        assert ledger.authorize("expensive", messages) == "expensive"
+
+
+def test_concurrent_calls_reserve_their_estimated_cost(monkeypatch):
+    monkeypatch.setattr(ledger_module, "estimate_cost", lambda model, messages, **kwargs: 0.04)
+    monkeypatch.setattr(ledger_module, "get_routing_candidates", lambda has_image=False: ["m"])
+    ledger = UsageLedger(path=None, budgets=[Budget("daily", "day", 0.1)], downgrade_ratio=1.0)
+    messages = [{"role": "user", "content": "hi"}]
+
+    # 応答を待っている2件の見積もりで残額が足りなくなるため、3件目は拒否される
+    first, second = ledger.reserve("m", messages), ledger.reserve("m", messages)
+    with pytest.raises(BudgetExceededError):
+        ledger.reserve("m", messages)
+
+    # 失敗した呼び出しの予約は解放され、成功した呼び出しは実際のコストに置き換わる
+    ledger.release(first)
+    ledger.record("m", _usage(1, 1), 0.01, reservation=second)
+    assert ledger.spent("day") == pytest.approx(0.01)
+    assert ledger.reserve("m", messages).model == "m"
+    ledger.release(second)
+    assert ledger.spent("day") == pytest.approx(0.05)
+
+
+def test_record_flushes_outside_the_event_loop(monkeypatch, tmp_path):
+    monkeypatch.setattr(ledger_module, "FLUSH_INTERVAL", 0.0)
+    ledger = UsageLedger(path=str(tmp_path / "ledger.sqlite3"), budgets=[])
+    flushed_in = []
+    original_flush = ledger.flush
+
+    def flush():
+        flushed_in.append(threading.current_thread())
+        original_flush()
+
+    ledger.flush = flush
+
+    async def main():
+        ledger.record("gemini/a", _usage(1, 1), 0.01)
+        while ledger._flushing:
+            await asyncio.sleep(0.01)
+
+    asyncio.run(main())
+    assert flushed_in and flushed_in[0] is not threading.main_thread()
+    assert UsageLedger(path=str(tmp_path / "ledger.sqlite3"), budgets=[]).spent("day") == pytest.approx(0.01)
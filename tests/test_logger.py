@@ -0,0 +1,65 @@
+"""
+api/logger.py のユニットテスト
+画像データの秘匿・切り詰め・サンプリング・遅延フォーマットを検証します。
+"""
+import json
+import logging
+
+from api.logger import (
+    DebugSamplingFilter,
+    JsonFormatter,
+    NonBlockingQueueHandler,
+    get_logger,
+    parse_levels,
+    redact,
+)
+
+
+def test_redact_removes_image_data_and_truncates():
+    payload = "image: data:image/png;base64," + "A" * 5000 + " end"
+    result = redact(payload, max_chars=100)
+    assert "AAAA" not in result
+    assert "<image data redacted:" in result
+
+    long_text = "あ" * 300
+    truncated = redact(long_text, max_chars=50)
+    assert truncated.startswith("あ" * 50)
+    assert "<truncated 250 chars>" in truncated
+
+
+def test_parse_levels_ignores_invalid_entries():
+    levels = parse_levels("api.notion=DEBUG, api.ai=warning,broken,api.x=NOPE")
+    assert levels == {"api.notion": logging.DEBUG, "api.ai": logging.WARNING}
+
+
+def test_debug_sampling_keeps_info_and_drops_debug():
+    never = DebugSamplingFilter(0.0)
+    debug = logging.LogRecord("api.test", logging.DEBUG, __file__, 1, "x", None, None)
+    info = logging.LogRecord("api.test", logging.INFO, __file__, 1, "x", None, None)
+    assert never.filter(info) is True
+    assert never.filter(debug) is False
+
+
+def test_disabled_level_does_not_format_arguments():
+    class Expensive:
+        calls = 0
+
+        def __str__(self):
+            Expensive.calls += 1
+            return "expensive"
+
+    logger = get_logger("api.test_disabled")
+    logger.setLevel(logging.INFO)
+    logger.debug("value: %s", Expensive())
+    assert Expensive.calls == 0
+
+
+def test_json_formatter_outputs_single_line_record():
+    handler = NonBlockingQueueHandler(None)
+    record = logging.LogRecord("api.ai", logging.INFO, __file__, 1, "hello %s", ("world",), None)
+    record = handler.prepare(record)
+    line = JsonFormatter().format(record)
+    entry = json.loads(line)
+    assert entry["msg"] == "hello world"
+    assert entry["level"] == "INFO"
+    assert "\n" not in line
@@ -0,0 +1,93 @@
+"""
+api/model_stats.py のユニットテスト
+実測値に基づくモデル選択と、統計の永続化（ワーカー間での統合）、空の応答をエラーとして記録することを検証します。
+"""
+import random
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import api.llm_client as llm_client
+
+from api.model_stats import MIN_SAMPLES, ModelStatsStore
+
+
+def _store(tmp_path):
+    return ModelStatsStore(path=str(tmp_path / "stats.json"))
+
+
+def _feed(store, model, latency, cost=0.001, ok=True, n=MIN_SAMPLES):
+    for _ in range(n):
+        store.record(model, latency, ok=ok, completion_tokens=100, cost=cost)
+
+
+def test_without_stats_keeps_static_priority(tmp_path):
+    store = _store(tmp_path)
+    assert store.choose(["a", "b", "c"]) == "a"
+    assert store.choose([]) is None
+
+
+def test_prefers_fastest_model_within_slo_and_cost(tmp_path):
+    store = _store(tmp_path)
+    _feed(store, "slow", 4.0)
+    _feed(store, "fast", 1.0)
+    _feed(store, "fast-expensive", 0.5, cost=1.0)
+    choice = store.choose(["slow", "fast", "fast-expensive"], latency_slo=5.0,
+                          cost_ceiling=0.01, exploration_rate=0.0)
+    assert choice == "fast"
+
+
+def test_error_rate_penalises_effective_latency(tmp_path):
+    store = _store(tmp_path)
+    _feed(store, "flaky", 1.0)
+    _feed(store, "flaky", 1.0, ok=False, n=5)
+    _feed(store, "steady", 1.5)
+    assert store.choose(["flaky", "steady"], latency_slo=5.0, cost_ceiling=0, exploration_rate=0.0) == "steady"
+
+
+def test_exploration_samples_unmeasured_models(tmp_path):
+    store = _store(tmp_path)
+    _feed(store, "known", 1.0)
+    rng = random.Random(0)
+    picks = {store.choose(["known", "new"], exploration_rate=1.0, rng=rng) for _ in range(5)}
+    assert picks == {"new"}
+
+
+def test_stats_persist_across_instances(tmp_path):
+    store = _store(tmp_path)
+    _feed(store, "persisted", 2.0)
+    store.save(force=True)
+    reloaded = _store(tmp_path)
+    stats = reloaded.get("persisted")
+    assert stats is not None
+    assert stats.samples == MIN_SAMPLES
+    assert abs(stats.latency - 2.0) < 1e-9
+
+
+def test_workers_merge_their_measurements_on_save(tmp_path):
+    worker_a, worker_b = _store(tmp_path), _store(tmp_path)
+    _feed(worker_a, "model-a", 1.0)
+    _feed(worker_b, "model-b", 2.0)
+    worker_a.save()
+    worker_b.save()
+
+    # 後から保存したワーカーも、先に保存したワーカーの観測値を消さない
+    reloaded = _store(tmp_path)
+    assert reloaded.get("model-a").samples == MIN_SAMPLES
+    assert reloaded.get("model-b").samples == MIN_SAMPLES
+    assert worker_b.get("model-a").samples == MIN_SAMPLES
+
+
+def test_empty_responses_count_as_errors(monkeypatch, tmp_path):
+    store = ModelStatsStore(path=None)
+
+    async def empty_acompletion(model, messages, response_format, timeout):
+        message = SimpleNamespace(content="")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=SimpleNamespace(dict=lambda: {}))
+
+    monkeypatch.setattr(llm_client, "model_stats", store)
+    monkeypatch.setattr(llm_client, "acompletion", empty_acompletion)
+    with pytest.raises(RuntimeError):
+        asyncio.run(llm_client.generate_json("memo", model="empty", retries=0))
+    assert store.get("empty").error_rate == 1.0
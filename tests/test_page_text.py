@@ -0,0 +1,75 @@
+"""
+api/page_text.py のユニットテスト
+ブロックのテキスト変換、階層の制限、トークン予算での打ち切り、編集日時によるキャッシュを検証します。
+"""
+import asyncio
+
+import api.page_text as page_text
+from api.page_text import block_to_text, extract_page_text, format_database_rows, truncate_to_tokens
+
+
+def _block(block_id, b_type, text, has_children=False, **extra):
+    data = {"rich_text": [{"plain_text": text}], **extra}
+    return {"id": block_id, "type": b_type, b_type: data, "has_children": has_children}
+
+
+def _fake_notion(monkeypatch, tree, edited="2026-01-01T00:00:00.000Z"):
+    fetched = []
+
+    async def fake_info(page_id):
+        return {"id": page_id, "last_edited_time": edited}
+
+    async def fake_children(block_id, page_size=100):
+        for block in tree.get(block_id, []):
+            fetched.append(block["id"])
+            yield block
+
+    monkeypatch.setattr(page_text, "get_page_info", fake_info)
+    monkeypatch.setattr(page_text, "iter_block_children", fake_children)
+    return fetched
+
+
+def test_block_to_text():
+    assert block_to_text(_block("a", "heading_2", "見出し")) == "## 見出し"
+    assert block_to_text(_block("a", "to_do", "買い物", checked=True)) == "[x] 買い物"
+    assert block_to_text({"type": "divider", "divider": {}}) == ""
+    assert block_to_text({"type": "table_row", "table_row": {"cells": [[{"plain_text": "A"}], [{"plain_text": "B"}]]}}) == "A | B"
+    assert truncate_to_tokens("あいうえお", 3) == "あいう"
+
+
+def test_extraction_follows_children_up_to_depth(monkeypatch):
+    page_text._page_text_cache.invalidate()
+    tree = {
+        "page": [_block("b1", "bulleted_list_item", "親", has_children=True), _block("b2", "paragraph", "次")],
+        "b1": [_block("c1", "paragraph", "子", has_children=True)],
+        "c1": [_block("d1", "paragraph", "孫")],
+    }
+    _fake_notion(monkeypatch, tree)
+    assert asyncio.run(extract_page_text("page", token_budget=100, max_depth=1)) == "- 親\n  子\n次"
+
+
+def test_extraction_stops_at_budget_and_caches_by_edit_time(monkeypatch):
+    tree = {"page": [_block(f"b{i}", "paragraph", "メモ" * 5) for i in range(100)]}
+    page_text._page_text_cache.invalidate()
+    fetched = _fake_notion(monkeypatch, tree)
+
+    text = asyncio.run(extract_page_text("page", token_budget=25, max_depth=0))
+    assert text.split("\n") == ["メモ" * 5, "メモ" * 5, "メモメ"]
+    assert fetched == ["b0", "b1", "b2"]
+
+    asyncio.run(extract_page_text("page", token_budget=25, max_depth=0))
+    assert len(fetched) == 3
+
+    # ページが編集されると取得し直す
+    refetched = _fake_notion(monkeypatch, tree, edited="2026-01-02T00:00:00.000Z")
+    asyncio.run(extract_page_text("page", token_budget=25, max_depth=0))
+    assert refetched == ["b0", "b1", "b2"]
+
+
+def test_database_rows_are_formatted():
+    pages = [{"properties": {
+        "Name": {"type": "title", "title": [{"plain_text": "会議"}]},
+        "Tags": {"type": "multi_select", "multi_select": [{"name": "仕事"}]},
+        "Done": {"type": "checkbox", "checkbox": False},
+    }}] * 2
+    assert format_database_rows(pages) == "Name: 会議\nTags: 仕事\nDone: False\n---\nName: 会議\nTags: 仕事\nDone: False"
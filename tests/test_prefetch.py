@@ -0,0 +1,100 @@
+"""
+api/cache.py と api/prefetch.py のユニットテスト
+キャッシュの有効期限と同時取得のまとめ込み、ターゲット選択時の先読み、
+設定の誤りをページとしてキャッシュしないことを検証します。
+"""
+import asyncio
+
+import pytest
+
+import api.prefetch as prefetch
+from api.cache import TTLCache
+from api.notion import NotADatabaseError
+
+
+def test_cache_coalesces_concurrent_loads_and_skips_failures():
+    cache = TTLCache("test", ttl=60)
+    calls = []
+
+    async def load():
+        calls.append(1)
+        await asyncio.sleep(0.02)
+        return {"value": len(calls)}
+
+    async def fail():
+        raise RuntimeError("boom")
+
+    async def main():
+        results = await asyncio.gather(*[cache.get_or_load("k", load) for _ in range(5)])
+        with pytest.raises(RuntimeError):
+            await cache.get_or_load("other", fail)
+        return results
+
+    assert asyncio.run(main()) == [{"value": 1}] * 5
+    assert calls == [1]
+    assert cache.get("other") is None
+
+
+def test_cache_expires_and_evicts_oldest(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("api.cache.time.monotonic", lambda: now[0])
+    cache = TTLCache("test", ttl=10, max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.set("c", 3)
+    assert cache.get("a") is None and cache.get("b") == 2
+    now[0] += 11
+    assert cache.get("c") is None
+
+
+def test_warmup_fills_caches_used_by_chat(monkeypatch):
+    calls = []
+
+    async def fake_schema(target_id):
+        calls.append(("schema", target_id))
+        if target_id == "page-1":
+            raise NotADatabaseError("Not a database")
+        return {"Name": {"type": "title", "title": {}}}
+
+    async def fake_extract(page_id):
+        calls.append(("extract", page_id))
+        return "本文"
+
+    monkeypatch.setattr(prefetch, "get_db_schema", fake_schema)
+    monkeypatch.setattr(prefetch, "extract_page_text", fake_extract)
+    for cache in (prefetch.schema_cache, prefetch.system_message_cache, prefetch.content_cache):
+        cache.invalidate()
+
+    async def main():
+        await prefetch.warm_target("page-1", system_prompt="秘書として", reference=True)
+        # 先読み後の取得はNotionを呼ばない
+        target = await prefetch.get_target_schema("page-1")
+        message = await prefetch.get_system_message("page-1", "秘書として")
+        reference = await prefetch.get_reference_context("page-1")
+        return target, message, reference
+
+    target, message, reference = asyncio.run(main())
+    assert target == {"type": "page", "schema": {}}
+    assert message.startswith("秘書として")
+    assert reference == "<参考 既存の情報>\n本文\n</参考 既存の情報>"
+    # 本文のキャッシュは page_text 側（last_edited_time 単位）で行う
+    assert calls == [("schema", "page-1"), ("extract", "page-1"), ("extract", "page-1")]
+
+
+def test_configuration_errors_are_not_cached_as_pages(monkeypatch):
+    async def missing_key(target_id):
+        raise ValueError("NOTION_API_KEY が設定されていません")
+
+    async def database(target_id):
+        return {"Name": {"type": "title", "title": {}}}
+
+    prefetch.schema_cache.invalidate()
+    monkeypatch.setattr(prefetch, "get_db_schema", missing_key)
+    with pytest.raises(ValueError):
+        asyncio.run(prefetch.get_target_schema("db-1"))
+    assert prefetch.schema_cache.get("db-1") is None
+
+    # 設定を直した後はデータベースとして取得できる
+    monkeypatch.setattr(prefetch, "get_db_schema", database)
+    assert asyncio.run(prefetch.get_target_schema("db-1"))["type"] == "database"
+    prefetch.schema_cache.invalidate()
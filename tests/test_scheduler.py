@@ -0,0 +1,105 @@
+"""
+api/scheduler.py のテスト
+ジッターとバックオフによる実行間隔、同時実行数の制限、
+スキーマの定期再検証によるキャッシュの破棄を検証します。
+"""
+import time
+import asyncio
+
+import api.prefetch as prefetch
+import api.scheduler as scheduler_module
+from api.scheduler import Job, Scheduler
+
+
+def test_delay_applies_jitter_and_backoff():
+    job = Job("test", lambda: None, interval=100, jitter=0.1, max_backoff=500)
+    assert all(90 <= job.delay() <= 110 for _ in range(50))
+
+    job.failures = 1
+    assert job.delay() == 200
+    job.failures = 5
+    assert job.delay() == 500
+
+
+def test_scheduler_caps_concurrency_and_backs_off_failing_jobs(monkeypatch):
+    monkeypatch.setattr(scheduler_module, "TICK_INTERVAL", 0.01)
+    active = []
+    peak = []
+    runs = {"slow": 0, "fail": 0}
+
+    async def slow():
+        runs["slow"] += 1
+        active.append(1)
+        peak.append(len(active))
+        await asyncio.sleep(0.05)
+        active.pop()
+
+    async def fail():
+        runs["fail"] += 1
+        raise RuntimeError("boom")
+
+    async def main():
+        scheduler = Scheduler(max_concurrency=1)
+        for name in ("a", "b", "c"):
+            scheduler.add(name, slow, interval=0.01, jitter=0, initial_delay=0, timeout=1)
+        fail_job = scheduler.add("fail", fail, interval=0.05, jitter=0, initial_delay=0, max_backoff=10)
+        await scheduler.start()
+        await asyncio.sleep(0.3)
+        await scheduler.stop()
+        return fail_job
+
+    fail_job = asyncio.run(main())
+    assert max(peak) == 1
+    assert runs["slow"] >= 3
+    # 0.05 → 0.1 → 0.2 と間隔が延びるため、0.3秒の間の実行は数回に収まる
+    assert 1 <= runs["fail"] <= 3
+    assert fail_job.failures == runs["fail"]
+    assert "boom" in fail_job.last_error
+
+
+def test_refresh_recent_schemas_drops_stale_system_messages(monkeypatch):
+    schemas = {"Name": {"type": "title"}}
+
+    async def fake_schema(target_id):
+        return dict(schemas)
+
+    monkeypatch.setattr(prefetch, "get_db_schema", fake_schema)
+    prefetch.schema_cache.invalidate()
+    prefetch.system_message_cache.invalidate()
+    prefetch._recent_targets.clear()
+
+    async def main():
+        first = await prefetch.get_system_message("db-1", "prompt")
+        assert await prefetch.refresh_recent_schemas() == 0
+        cached_after_noop = len(prefetch.system_message_cache)
+
+        schemas["Tags"] = {"type": "multi_select"}
+        changed = await prefetch.refresh_recent_schemas()
+        second = await prefetch.get_system_message("db-1", "prompt")
+        return first, cached_after_noop, changed, second
+
+    first, cached_after_noop, changed, second = asyncio.run(main())
+    assert cached_after_noop == 1
+    assert changed == 1
+    assert "Tags" not in first and "Tags" in second
+
+
+def test_one_failing_target_does_not_stop_the_schema_refresh(monkeypatch):
+    schemas = {"db-2": {"Name": {"type": "title"}}}
+
+    async def fake_schema(target_id):
+        if target_id == "db-1":
+            raise RuntimeError("HTTP 429")
+        return dict(schemas[target_id])
+
+    monkeypatch.setattr(prefetch, "get_db_schema", fake_schema)
+    prefetch.schema_cache.invalidate()
+    prefetch._recent_targets.clear()
+    prefetch._recent_targets.update({"db-1": time.monotonic(), "db-2": time.monotonic()})
+    prefetch.schema_cache.set("db-2", {"type": "database", "schema": {}})
+
+    # db-1 が失敗しても db-2 は確認され、ジョブは失敗にならない
+    assert asyncio.run(prefetch.refresh_recent_schemas()) == 1
+    assert prefetch.schema_cache.get("db-2")["schema"] == schemas["db-2"]
+    prefetch.schema_cache.invalidate()
+    prefetch._recent_targets.clear()
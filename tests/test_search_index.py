@@ -0,0 +1,115 @@
+"""
+api/search_index.py のユニットテスト
+バイグラムによる日本語の部分一致検索、ランキング、ページング、差分同期と、
+削除されたページが全件の突き合わせで索引から取り除かれることを検証します。
+"""
+import asyncio
+
+import api.search_index as search_index
+from api.search_index import SearchIndex, SearchService, build_match_query, tokenize
+
+
+def _page(page_id, title, memo="", edited="2026-01-01T00:00:00.000Z", **extra):
+    page = {
+        "object": "page",
+        "id": page_id,
+        "url": f"https://www.notion.so/{page_id}",
+        "last_edited_time": edited,
+        "properties": {
+            "Name": {"type": "title", "title": [{"plain_text": title}]},
+            "Memo": {"type": "rich_text", "rich_text": [{"plain_text": memo}]},
+            "Done": {"type": "checkbox", "checkbox": False},
+        },
+    }
+    page.update(extra)
+    return page
+
+
+def _ids(result):
+    return [r["id"] for r in result["results"]]
+
+
+def test_tokenize_and_match_query():
+    assert tokenize("会議の準備") == "会議 議の の準 準備 備"
+    assert tokenize("ＡＢ c") == "ab b c"
+    assert build_match_query('会議 "x') == '"会議" AND """x"'
+    assert build_match_query("Ａ") == '"a"*'
+    assert build_match_query("   ") is None
+
+
+def test_search_ranks_title_matches_and_filters_by_database():
+    index = SearchIndex(":memory:")
+    index.upsert_pages("db", [
+        _page("p1", "買い物リスト", memo="会議の後に牛乳を買う"),
+        _page("p2", "定例会議", memo="議事録"),
+        _page("p3", "歯医者"),
+    ])
+    index.upsert_pages("other", [_page("p4", "別DBの会議")])
+
+    result = index.search("db", "会議")
+    assert _ids(result) == ["p2", "p1"]
+    assert result["results"][1]["snippet"].startswith("会議の後")
+    assert _ids(index.search("db", "議会")) == []
+    assert _ids(index.search("db", "!!")) == []
+
+
+def test_pagination_and_archived_pages():
+    index = SearchIndex(":memory:")
+    index.upsert_pages("db", [_page(f"p{i}", f"メモ {i}", edited=f"2026-01-0{i}T00:00:00.000Z") for i in range(1, 6)])
+
+    assert _ids(index.search("db", "メモ 3")) == ["p3"]
+    assert set(_ids(index.search("db", "モ"))) == {f"p{i}" for i in range(1, 6)}
+
+    first = index.search("db", "メモ", limit=3)
+    assert len(first["results"]) == 3 and first["next_cursor"] == 3
+    second = index.search("db", "メモ", limit=3, offset=first["next_cursor"])
+    assert len(second["results"]) == 2 and second["next_cursor"] is None
+
+    index.upsert_pages("db", [_page("p1", "メモ 1", archived=True)])
+    assert index.count("db") == 4
+
+
+def test_sync_uses_last_edited_watermark(monkeypatch):
+    calls = []
+    pages = [
+        _page("p1", "古いメモ", edited="2026-01-01T00:00:00.000Z"),
+        _page("p2", "新しいメモ", edited="2026-01-02T00:00:00.000Z"),
+    ]
+
+    async def fake_iter(database_id, edited_since=None, page_size=100):
+        calls.append(edited_since)
+        for page in pages:
+            if edited_since is None or page["last_edited_time"] >= edited_since:
+                yield page
+
+    monkeypatch.setattr(search_index, "iter_database_pages", fake_iter)
+    service = SearchService(SearchIndex(":memory:"), sync_interval=0)
+
+    assert asyncio.run(service.sync("db")) == 2
+    pages[0] = _page("p1", "更新されたメモ", edited="2026-01-03T00:00:00.000Z")
+    assert asyncio.run(service.sync("db")) == 2
+    assert calls == [None, "2026-01-02T00:00:00.000Z"]
+    assert _ids(asyncio.run(service.search("db", "更新"))) == ["p1"]
+
+
+def test_reconcile_removes_pages_the_query_no_longer_returns(monkeypatch):
+    pages = [_page("p1", "残るメモ"), _page("p2", "削除するメモ")]
+    calls = []
+
+    async def fake_iter(database_id, edited_since=None, page_size=100):
+        calls.append(edited_since)
+        for page in pages:
+            yield page
+
+    monkeypatch.setattr(search_index, "iter_database_pages", fake_iter)
+    service = SearchService(SearchIndex(":memory:"), sync_interval=0, reconcile_interval=3600)
+    asyncio.run(service.sync("db"))
+    # ゴミ箱に移したページはデータベースのクエリに返されない
+    pages.pop()
+    asyncio.run(service.sync("db"))
+    assert _ids(asyncio.run(service.search("db", "メモ"))) == ["p1", "p2"]
+
+    service.reconcile_interval = 0
+    asyncio.run(service.sync("db"))
+    assert _ids(asyncio.run(service.search("db", "メモ"))) == ["p1"]
+    assert calls[-1] is None
@@ -0,0 +1,62 @@
+"""
+api/serializers.py のユニットテスト
+AIの出力値が Notion API のプロパティ形式へ正しく変換されることを検証します。
+"""
+import json
+
+from api.serializers import compile_schema, dumps_bytes, serialize_properties
+
+SCHEMA = {
+    "Name": {"type": "title", "title": {}},
+    "Status": {"type": "select", "select": {"options": [{"name": "完了"}]}},
+    "Tags": {"type": "multi_select", "multi_select": {"options": [{"name": "仕事"}]}},
+    "Stage": {"type": "status", "status": {}},
+    "Due": {"type": "date", "date": {}},
+    "Done": {"type": "checkbox", "checkbox": {}},
+    "Points": {"type": "number", "number": {}},
+    "Memo": {"type": "rich_text", "rich_text": {}},
+    "Owner": {"type": "people", "people": {}},
+}
+
+
+def test_serialize_properties_converts_each_type():
+    values = {
+        "Name": [{"plain_text": "会議"}, {"plain_text": "準備"}],
+        "Status": {"name": "完了"},
+        "Tags": "仕事",
+        "Stage": "進行中",
+        "Due": {"start": "2026-01-15"},
+        "Done": 1,
+        "Points": "3",
+        "Memo": "メモ",
+        "Owner": "someone",
+        "Unknown": "ignored",
+    }
+    assert serialize_properties(values, SCHEMA) == {
+        "Name": {"title": [{"text": {"content": "会議準備"}}]},
+        "Status": {"select": {"name": "完了"}},
+        "Tags": {"multi_select": [{"name": "仕事"}]},
+        "Stage": {"status": {"name": "進行中"}},
+        "Due": {"date": {"start": "2026-01-15"}},
+        "Done": {"checkbox": True},
+        "Points": {"number": 3.0},
+        "Memo": {"rich_text": [{"text": {"content": "メモ"}}]},
+    }
+
+
+def test_serialize_properties_skips_empty_and_invalid_values():
+    values = {"Status": "", "Due": None, "Points": "abc", "Tags": [None, {"name": "仕事"}]}
+    assert serialize_properties(values, SCHEMA) == {"Tags": {"multi_select": [{"name": "仕事"}]}}
+    assert serialize_properties("not a dict", SCHEMA) == {}
+
+
+def test_options_are_interned_and_schema_is_compiled_once():
+    first = serialize_properties({"Status": "完了"}, SCHEMA)
+    second = serialize_properties({"Status": "完了"}, SCHEMA)
+    assert first["Status"] is second["Status"]
+    assert compile_schema(SCHEMA) is compile_schema(dict(SCHEMA))
+
+
+def test_dumps_bytes_round_trips_unicode():
+    body = {"properties": {"Name": {"title": [{"text": {"content": "📝 会議"}}]}}}
+    assert json.loads(dumps_bytes(body)) == body
@@ -0,0 +1,49 @@
+"""
+api/sessions.py のユニットテスト
+ワーカー間での履歴の共有、保存件数の上限と数え済みトークン数、期限切れを検証します。
+"""
+import api.sessions as sessions
+from api.sessions import SessionStore
+
+
+def test_history_is_shared_between_workers(tmp_path):
+    path = str(tmp_path / "sessions.sqlite3")
+    worker_a, worker_b = SessionStore(path=path), SessionStore(path=path)
+
+    session = worker_a.create()
+    worker_a.append(session, [{"role": "user", "content": "牛乳を買う"}, {"role": "assistant", "content": "了解です"}])
+
+    loaded = worker_b.get(session.id)
+    assert loaded.messages == session.messages
+    worker_b.append(loaded, [{"role": "user", "content": "明日まで"}])
+
+    # 別のワーカーが追記したため、worker_a は読み込み直す
+    assert [m["content"] for m in worker_a.get(session.id).messages] == ["牛乳を買う", "了解です", "明日まで"]
+
+    worker_b.delete(session.id)
+    assert worker_a.get(session.id) is None
+
+
+def test_recent_uses_counted_tokens_and_trims_old_messages(monkeypatch):
+    monkeypatch.setattr(sessions, "count_tokens", lambda messages: len(messages[0]["content"]))
+    store = SessionStore(path=None, max_messages=3)
+    session = store.create()
+    store.append(session, [{"role": "user", "content": "a" * n} for n in (1, 2, 3, 4)])
+
+    assert [len(m["content"]) for m in session.messages] == [2, 3, 4]
+    assert session.recent(2) == (session.messages[-2:], 7)
+    assert session.recent(0) == ([], 0)
+
+
+def test_expired_sessions_are_dropped(monkeypatch, tmp_path):
+    now = [1000.0]
+    monkeypatch.setattr("api.sessions.time.time", lambda: now[0])
+    store = SessionStore(path=str(tmp_path / "sessions.sqlite3"), ttl=60)
+    session = store.create()
+    store.append(session, [{"role": "user", "content": "メモ"}])
+    assert store.get(session.id) is session
+
+    now[0] += 61
+    assert store.get(session.id) is None
+    store.purge()
+    assert store._db().execute("SELECT COUNT(*) FROM sessions").fetchone()[0] == 0
@@ -0,0 +1,74 @@
+"""
+api/target_router.py のユニットテスト
+保存先の分類器の学習と推定、保存されたページによる差分学習、
+Notionのデータからの学習と /api/route の応答を検証します。
+"""
+import asyncio
+
+from fastapi.testclient import TestClient
+
+import api.app as app_module
+import api.target_router as router_module
+from api.app import app
+from api.target_router import TargetClassifier, TargetRouter
+
+SHOPPING = ["牛乳を買う", "卵とパンを買う", "スーパーで野菜", "ドラッグストアで洗剤", "米を買う"]
+WORK = ["会議の議事録", "見積もりを送付", "クライアントに連絡", "報告書を提出", "来期の予算会議"]
+
+
+def _title_page(title):
+    return {"Name": {"type": "title", "title": [{"plain_text": title}]}}
+
+
+def test_classifier_learns_targets_and_updates_incrementally():
+    classifier = TargetClassifier()
+    classifier.fit([(t, "shop") for t in SHOPPING] + [(t, "work") for t in WORK])
+    assert classifier.predict("パンを買う")[0][0] == "shop"
+    assert classifier.predict("予算の会議")[0][0] == "work"
+    assert classifier.predict("") == []
+
+    # 保存されたページで新しい保存先を学習する
+    classifier.partial_fit("ジムで筋トレ", "health")
+    target_id, score = classifier.predict("ジムで筋トレ")[0]
+    assert target_id == "health" and score > 0.5
+
+
+def test_router_trains_from_databases_and_learns_saved_pages(monkeypatch):
+    async def fake_list_targets():
+        return [{"id": "shop", "type": "database", "title": "買い物"},
+                {"id": "work", "type": "database", "title": "仕事"},
+                {"id": "diary", "type": "page", "title": "日記"}]
+
+    async def fake_fetch_recent_pages(database_id, limit=3):
+        return [_title_page(t) for t in {"shop": SHOPPING, "work": WORK}[database_id]]
+
+    monkeypatch.setattr(router_module, "list_targets", fake_list_targets)
+    monkeypatch.setattr(router_module, "fetch_recent_pages", fake_fetch_recent_pages)
+    router = TargetRouter()
+
+    candidates = asyncio.run(router.route("牛乳とパン"))
+    assert router.classifier.classes == ["shop", "work"]
+    assert candidates[0][0] == "shop"
+
+    router.on_page_created("work", _title_page("歯医者の予約"), {"id": "p1"})
+    assert router.classifier.samples == len(SHOPPING) + len(WORK) + 1
+
+
+def test_route_endpoint_prefetches_confident_target(monkeypatch):
+    warmed = []
+
+    async def fake_route(text, k=3):
+        return [("db-1", 0.9), ("gone", 0.05), ("db-2", 0.05)]
+
+    async def fake_list_targets():
+        return [{"id": "db-1", "type": "database", "title": "タスク"},
+                {"id": "db-2", "type": "database", "title": "買い物"}]
+
+    monkeypatch.setattr(app_module.target_router, "route", fake_route)
+    monkeypatch.setattr(app_module, "list_targets", fake_list_targets)
+    monkeypatch.setattr(app_module, "schedule_warmup", lambda target_id: warmed.append(target_id) or True)
+
+    data = TestClient(app).post("/api/route", json={"text": "明日の会議"}).json()
+    assert data["target_id"] == "db-1"
+    assert [c["id"] for c in data["candidates"]] == ["db-1", "db-2"]
+    assert data["warming"] is True and warmed == ["db-1"]
@@ -0,0 +1,56 @@
+"""
+api/tracing.py のユニットテスト
+ヒストグラムのパーセンタイル推定と Prometheus 出力形式を検証します。
+"""
+import asyncio
+
+from api.tracing import Histogram, MetricsRegistry, metrics, normalize_endpoint, span
+
+
+def test_normalize_endpoint_strips_ids_and_query():
+    endpoint = "blocks/2e137abcdef0123456789abcdeff733a/children?page_size=100"
+    assert normalize_endpoint(endpoint) == "blocks/{id}/children"
+    assert normalize_endpoint("databases/2e137abc-def0-1234-5678-9abcdeff733a/query") == "databases/{id}/query"
+    assert normalize_endpoint("pages") == "pages"
+
+
+def test_histogram_quantiles_are_monotonic():
+    hist = Histogram()
+    for i in range(1, 101):
+        hist.observe(i / 100)  # 0.01s 〜 1.0s
+    p50, p95, p99 = hist.quantile(0.5), hist.quantile(0.95), hist.quantile(0.99)
+    assert 0.25 <= p50 <= 0.75
+    assert p50 <= p95 <= p99 <= 1.0
+    assert hist.count == 100
+
+
+def test_render_prometheus_contains_histogram_and_quantiles():
+    registry = MetricsRegistry()
+    registry.observe("notion.api", 0.4, {"endpoint": "pages", "status": 200})
+    registry.incr("memo_ai_llm_tokens_total", 120, model="gemini/gemini-2.5-flash", kind="prompt")
+    text = registry.render_prometheus()
+    assert '# TYPE memo_ai_span_duration_seconds histogram' in text
+    assert 'memo_ai_span_duration_seconds_count{span="notion.api",endpoint="pages",status="200"} 1' in text
+    assert 'quantile="0.99"' in text
+    assert 'memo_ai_llm_tokens_total{kind="prompt",model="gemini/gemini-2.5-flash"} 120.0' in text
+
+
+def test_nested_spans_share_trace_and_record_errors():
+    metrics.reset()
+
+    async def run():
+        with span("outer") as outer:
+            with span("inner") as inner:
+                await asyncio.sleep(0)
+            assert inner.trace_id == outer.trace_id
+            assert inner.parent_id == outer.span_id
+        try:
+            with span("failing"):
+                raise ValueError("boom")
+        except ValueError:
+            pass
+
+    asyncio.run(run())
+    names = {name: dict(labels) for name, labels in metrics.histograms}
+    assert set(names) == {"outer", "inner", "failing"}
+    assert names["failing"]["status"] == "ValueError"
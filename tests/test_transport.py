@@ -0,0 +1,111 @@
+"""
+api/transport.py のユニットテスト
+プロバイダーごとに共有のクライアントが使われること、LiteLLMの呼び出しがそのクライアントを通ること、
+キープウォームが営業時間内だけ行われることを検証します。
+"""
+import asyncio
+from datetime import datetime
+
+import httpx
+import pytest
+from litellm import acompletion
+
+import api.transport as transport_module
+from api.transport import ProviderTransport
+
+CONTENT = "{\"Name\": \"会議\"}"
+# プロバイダーのホスト → 応答（各APIの形式）
+RESPONSES = {
+    "generativelanguage.googleapis.com": {
+        "candidates": [{"content": {"parts": [{"text": CONTENT}], "role": "model"}, "finishReason": "STOP"}],
+        "usageMetadata": {"promptTokenCount": 3, "candidatesTokenCount": 2, "totalTokenCount": 5},
+    },
+    "api.anthropic.com": {
+        "id": "msg_1", "type": "message", "role": "assistant", "model": "claude-3-5-haiku-20241022",
+        "content": [{"type": "text", "text": CONTENT}],
+        "stop_reason": "end_turn", "usage": {"input_tokens": 3, "output_tokens": 2},
+    },
+    "api.openai.com": {
+        "id": "chatcmpl-1", "object": "chat.completion", "created": 0, "model": "gpt-4o-mini",
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": CONTENT}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 3, "completion_tokens": 2, "total_tokens": 5},
+    },
+}
+
+
+def _transport(requests):
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(200, json=RESPONSES.get(request.url.host, {}))
+    return httpx.MockTransport(handler)
+
+
+def test_clients_are_shared_per_provider():
+    async def main():
+        transport = ProviderTransport(transport=_transport([]))
+        first = transport.options_for("gemini/gemini-2.5-flash")
+        second = transport.options_for("gemini/gemini-2.0-flash")
+        other = transport.options_for("anthropic/claude-3-5-haiku-20241022")
+        unknown = transport.options_for("fake/model")
+        await transport.close()
+        return first, second, other, unknown
+
+    first, second, other, unknown = asyncio.run(main())
+    assert first["client"] is second["client"]
+    assert other["client"].client is not first["client"].client
+    assert unknown == {}
+
+
+@pytest.mark.parametrize("model, host", [
+    ("gemini/gemini-2.5-flash", "generativelanguage.googleapis.com"),
+    ("anthropic/claude-3-5-haiku-20241022", "api.anthropic.com"),
+    ("openai/gpt-4o-mini", "api.openai.com"),
+])
+def test_acompletion_uses_the_shared_client(monkeypatch, model, host):
+    # 環境のベースURL・認証情報に左右されないよう、明示的に指定する
+    monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+    monkeypatch.setattr(transport_module, "OPENAI_API_KEY", "test-key")
+    monkeypatch.delenv("OPENAI_BASE_URL", raising=False)
+    requests = []
+
+    async def main():
+        transport = ProviderTransport(transport=_transport(requests))
+        provider = model.partition("/")[0]
+        kwargs = {"api_key": "test-key"} if provider == "gemini" else {
+            "api_key": "test-key", "api_base": transport.base_urls[provider] + ("/v1" if provider == "openai" else "")
+        }
+        response = await acompletion(
+            model=model,
+            messages=[{"role": "user", "content": "明日の会議"}],
+            timeout=5,
+            **kwargs,
+            **transport.options_for(model)
+        )
+        await transport.close()
+        return response
+
+    response = asyncio.run(main())
+    assert response.choices[0].message.content == CONTENT
+    assert len(requests) == 1
+    assert requests[0].url.host == host
+
+
+def test_keep_warm_only_during_business_hours():
+    requests = []
+    transport = ProviderTransport(transport=_transport(requests), hours="9-18", weekdays_only=True)
+    monday_morning = datetime(2025, 6, 2, 10, 0, tzinfo=transport.tz)
+    monday_night = datetime(2025, 6, 2, 20, 0, tzinfo=transport.tz)
+    saturday = datetime(2025, 6, 7, 10, 0, tzinfo=transport.tz)
+
+    async def main():
+        results = [
+            await transport.keep_warm(["gemini", "openai"], now=monday_morning),
+            await transport.keep_warm(["gemini", "openai"], now=monday_night),
+            await transport.keep_warm(["gemini", "openai"], now=saturday),
+        ]
+        await transport.close()
+        return results
+
+    assert asyncio.run(main()) == [2, 0, 0]
+    assert sorted(r.url.host for r in requests) == ["api.openai.com", "generativelanguage.googleapis.com"]
+    assert all(r.method == "HEAD" and "authorization" not in r.headers for r in requests)
@@ -0,0 +1,154 @@
+"""
+api/webhooks.py のテスト
+記録したNotionのイベントを署名付きで再送し（tests/replay_webhooks.py）、
+署名の無いリクエストが拒否されること、変更された対象のキャッシュだけが破棄されること、
+大量のイベントが対象ごとに1回の破棄・同期にまとめられ、同期は1つのワーカーだけが行うことを検証します。
+"""
+import json
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+import api.app as app_module
+import api.prefetch as prefetch
+import api.webhooks as webhooks
+from api.app import app
+from api.webhooks import InvalidationLog, WebhookService, invalidations_for
+from replay_webhooks import load_events, replay, sign
+
+SECRET = "secret_test_token"
+DATABASE_ID = "4f2a6c8e-0000-4000-8000-00000000d001"
+PAGE_ID = "8e2f4a6b-0000-4000-8000-00000000p001"
+ROOT_ID = "1a2b3c4d-0000-4000-8000-00000000r001"
+OTHER_ID = "00000000-0000-4000-8000-00000000ffff"
+
+
+@pytest.fixture
+def service(monkeypatch, tmp_path):
+    service = WebhookService(InvalidationLog(str(tmp_path / "webhooks.sqlite3")), secret=SECRET)
+    monkeypatch.setattr(app_module, "webhook_service", service)
+    monkeypatch.setattr(webhooks, "NOTION_ROOT_PAGE_ID", ROOT_ID.replace("-", ""))
+    return service
+
+
+class FakeSearchService:
+    """全文検索の同期の呼び出しを記録する（索引は作成済みとして扱う）"""
+
+    def __init__(self):
+        self.calls = []
+        self.removed = []
+        self.index = self
+
+    def get_watermark(self, database_id):
+        return "2026-01-01T00:00:00.000Z", 1.0
+
+    async def sync(self, database_id, force=False):
+        self.calls.append(database_id)
+        return 0
+
+    async def remove_pages(self, page_ids):
+        self.removed.extend(page_ids)
+        return len(page_ids)
+
+
+@pytest.fixture
+def synced(monkeypatch):
+    search = FakeSearchService()
+    monkeypatch.setattr(webhooks, "search_service", search)
+    yield search
+    for cache in (prefetch.schema_cache, prefetch.system_message_cache, prefetch.content_cache, prefetch.targets_cache):
+        cache.invalidate()
+
+
+def test_requests_without_a_valid_signature_are_rejected(service):
+    client = TestClient(app)
+    body = json.dumps(load_events()[0]).encode("utf-8")
+    headers = {"Content-Type": "application/json"}
+
+    assert client.post("/api/webhooks/notion", content=body, headers=headers).status_code == 401
+    headers["X-Notion-Signature"] = sign(body, "wrong-secret")
+    assert client.post("/api/webhooks/notion", content=body, headers=headers).status_code == 401
+    assert service.log.latest_id() == 0
+
+    # 検証トークンの設定後は、署名の無い検証リクエストを受け付けない
+    token = {"verification_token": "secret_0123456789abcdef"}
+    assert client.post("/api/webhooks/notion", json=token).status_code == 401
+
+    service.secret = ""
+    headers["X-Notion-Signature"] = sign(body, SECRET)
+    assert client.post("/api/webhooks/notion", content=body, headers=headers).status_code == 503
+    # 未設定の間は、サブスクリプション作成時の検証リクエストを署名なしで受け付ける（形式が正しいもののみ）
+    assert client.post("/api/webhooks/notion", json=token).json() == {"status": "verification"}
+    fake = {"verification_token": "secret_x\n[ERROR] forged log line"}
+    assert client.post("/api/webhooks/notion", json=fake).status_code == 400
+
+
+def test_replayed_events_invalidate_only_the_changed_targets(service, synced):
+    for target_id in (DATABASE_ID, OTHER_ID):
+        prefetch.schema_cache.set(target_id, {"type": "database", "schema": {}})
+        prefetch.system_message_cache.set((target_id, "prompt"), "message")
+        prefetch.content_cache.set(("database", target_id), [])
+    prefetch.content_cache.set(("page", PAGE_ID), [])
+    prefetch.targets_cache.set(ROOT_ID, [])
+
+    responses = replay(TestClient(app), load_events(), SECRET)
+    assert [r.status_code for r in responses] == [200] * 5
+    assert responses[-1].json() == {"status": "accepted", "invalidations": 0}
+
+    async def main():
+        applied = await service.apply()
+        await asyncio.sleep(0)
+        return applied
+
+    asyncio.run(main())
+    assert prefetch.schema_cache.get(DATABASE_ID) is None
+    assert prefetch.system_message_cache.get((DATABASE_ID, "prompt")) is None
+    assert prefetch.content_cache.get(("database", DATABASE_ID)) is None
+    assert prefetch.content_cache.get(("page", PAGE_ID)) is None
+    assert prefetch.targets_cache.get(ROOT_ID) is None
+    assert synced.calls == [DATABASE_ID]
+    # 変更の無いターゲットのキャッシュは残る
+    assert prefetch.schema_cache.get(OTHER_ID) is not None
+    assert prefetch.system_message_cache.get((OTHER_ID, "prompt")) == "message"
+    assert prefetch.content_cache.get(("database", OTHER_ID)) == []
+
+
+def test_event_storm_is_coalesced_and_synced_by_one_worker(service, synced):
+    # 同じ記録を読む別のワーカー
+    other_worker = WebhookService(InvalidationLog(service.log.path), secret=SECRET)
+    other_worker.start()
+    service.start()
+
+    responses = replay(TestClient(app), load_events()[:1], SECRET, repeat=50)
+    assert all(r.status_code == 200 for r in responses)
+    assert service.log.latest_id() == 150
+
+    async def main():
+        applied = [await service.apply(), await other_worker.apply()]
+        await asyncio.sleep(0)
+        return applied
+
+    # 行のページ・データベースの行・全文検索の同期の3件にまとめられる
+    assert asyncio.run(main()) == [3, 3]
+    assert synced.calls == [DATABASE_ID]
+    assert asyncio.run(service.apply()) == 0
+
+
+def test_deleted_pages_are_removed_from_the_search_index(service, synced):
+    event = {"type": "page.deleted", "entity": {"id": PAGE_ID, "type": "page"},
+             "data": {"parent": {"id": DATABASE_ID, "type": "database"}}}
+    assert ("unindex", PAGE_ID) in invalidations_for(event)
+
+    other_worker = WebhookService(InvalidationLog(service.log.path), secret=SECRET)
+    other_worker.start()
+    service.start()
+    replay(TestClient(app), [event], SECRET)
+
+    async def main():
+        await service.apply()
+        await other_worker.apply()
+        await asyncio.sleep(0)
+
+    asyncio.run(main())
+    assert synced.removed == [PAGE_ID]
@@ -1,50 +1,62 @@
 import asyncio
 import os
 from dotenv import load_dotenv
-from api.index import get_config, analyze
-from api.index import AnalyzeRequest
 
 # Load env
 load_dotenv()
 
+from api.notion import fetch_children_list, get_db_schema
+from api.examples_index import get_examples
+from api.ai import analyze_text_with_ai
+from api.config import DEFAULT_SYSTEM_PROMPT
+
 async def verify():
     print("--- 1. Verifying Environment ---")
     if not os.environ.get("NOTION_API_KEY"):
         print("FAIL: NOTION_API_KEY missing")
         return
+    root_page_id = os.environ.get("NOTION_ROOT_PAGE_ID")
+    if not root_page_id:
+        print("FAIL: NOTION_ROOT_PAGE_ID missing")
+        return
     print("OK: Env vars detected")
 
-    print("\n--- 2. Verifying /api/config ---")
+    print("\n--- 2. Verifying targets under root page ---")
     try:
-        config_res = await get_config()
-        print(f"OK: Config fetched: {len(config_res['configs'])} apps found")
-        if len(config_res['configs']) > 0:
-            app_config = config_res['configs'][0]
-            print(f"    Target App: {app_config['name']}")
-        else:
-            print("WARN: No apps found in config DB")
+        blocks = await fetch_children_list(root_page_id)
+        databases = [b for b in blocks if b.get("type") == "child_database"]
+        print(f"OK: {len(blocks)} blocks, {len(databases)} databases found")
+        if not databases:
+            print("WARN: No databases found under root page")
             return
+        target_db_id = databases[0]["id"]
+        print(f"    Target DB: {databases[0]['child_database'].get('title')}")
     except Exception as e:
-        print(f"FAIL: /api/config error: {e}")
+        print(f"FAIL: target listing error: {e}")
         return
 
-    print("\n--- 3. Verifying /api/analyze (Dry Run) ---")
+    print("\n--- 3. Verifying analyze (Dry Run) ---")
     # We will try to analyze a simple text
     try:
-        req = AnalyzeRequest(
-            text="テスト: 明日の10時に会議",
-            target_db_id=app_config['target_db_id'],
-            system_prompt=app_config['system_prompt']
+        schema = await get_db_schema(target_db_id)
+        examples = await get_examples(target_db_id, "テスト: 明日の10時に会議")
+        # Note: This calls the AI provider and Notion.
+        res = await analyze_text_with_ai(
+            "テスト: 明日の10時に会議",
+            schema,
+            examples,
+            DEFAULT_SYSTEM_PROMPT
         )
-        # Note: This calls Gemini and Notion.
-        res = await analyze(req)
+        if "error" in res:
+            print(f"FAIL: analyze error: {res['error']}")
+            return
         print("OK: Analysis successful")
         print("    Properties generated:")
         for k, v in res["properties"].items():
             print(f"    - {k}: {v}")
-            
+
     except Exception as e:
-        print(f"FAIL: /api/analyze error: {e}")
+        print(f"FAIL: analyze error: {e}")
 
 if __name__ == "__main__":
     asyncio.run(verify())